@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Motor de Alertas del Sistema Vehicular
+Calcula una sola vez la foto de todas las alertas (mantenimiento, pólizas, RTV, revisiones y combustible)
+y la reutiliza mientras no cambien las versiones de las tablas involucradas ni la fecha de Centroamérica.
+El dashboard (/alertas/detalle), el email de resumen y /alertas/verificar leen de la misma foto.
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from table_versions import get_table_versions
+
+logger = logging.getLogger(__name__)
+
+# Tablas de las que dependen las alertas (vehicle_state se deriva de combustible en la misma transacción)
+ALERT_TABLES = ("vehiculos", "mantenimientos", "combustible", "polizas", "rtv", "revisiones")
+
+# Ventanas más amplias que usa cualquier consumidor; las más estrechas se filtran sobre la foto
+DIAS_VENTANA = 30
+KM_VENTANA = 1500
+DIAS_REVISIONES = 30
+DIAS_COMBUSTIBLE = 60
+
+# ================================
+# DETECCIÓN
+# ================================
+
+def check_abnormal_fuel_consumption(cursor, hoy, placa=None):
+    """Detectar variaciones anormales en el consumo de combustible (toda la flota o una placa)"""
+    try:
+        alertas = []
+        desde = (hoy - timedelta(days=DIAS_COMBUSTIBLE)).isoformat()
+
+        # Una sola consulta para toda la flota (antes: una por vehículo + otra para marca/modelo).
+        # El orden fecha, id coincide con idx_combustible_fecha y deja el historial de cada
+        # vehículo en orden cronológico, así que los km entre cargas se calculan en una pasada
+        if placa is None:
+            cursor.execute('''
+                SELECT placa, fecha, kilometraje, litros
+                FROM combustible
+                WHERE fecha >= ?
+                AND kilometraje IS NOT NULL
+                ORDER BY fecha ASC, id ASC
+            ''', (desde,))
+        else:
+            # Un vehículo: rango sobre idx_combustible_placa_fecha
+            cursor.execute('''
+                SELECT placa, fecha, kilometraje, litros
+                FROM combustible
+                WHERE placa = ?
+                AND fecha >= ?
+                AND kilometraje IS NOT NULL
+                ORDER BY fecha ASC, id ASC
+            ''', (placa, desde))
+
+        km_anterior = {}
+        consumos_por_placa = {}
+
+        for placa, fecha, kilometraje, litros in cursor:
+            consumos = consumos_por_placa.setdefault(placa, [])
+            anterior = km_anterior.get(placa)
+            km_anterior[placa] = kilometraje
+            if anterior is None:
+                continue
+
+            km_recorridos = kilometraje - anterior
+            if km_recorridos > 0:
+                rendimiento = km_recorridos / litros
+                consumos.append({
+                    'fecha': fecha,
+                    'rendimiento': rendimiento,
+                    'km_recorridos': km_recorridos,
+                    'litros': litros
+                })
+
+        for placa in sorted(consumos_por_placa):
+            consumos = consumos_por_placa[placa]
+            if len(consumos) >= 3:
+                # Calcular promedio y detectar anomalías
+                rendimientos = [c['rendimiento'] for c in consumos]
+                promedio = sum(rendimientos) / len(rendimientos)
+
+                # Verificar últimos 3 registros para detectar deterioro significativo
+                ultimos_3 = consumos[-3:]
+                promedio_reciente = sum(c['rendimiento'] for c in ultimos_3) / len(ultimos_3)
+
+                # Si el rendimiento reciente es 25% menor al promedio, es anormal
+                if promedio_reciente < promedio * 0.75:
+                    alertas.append({
+                        'placa': placa,
+                        'marca': 'N/A',
+                        'modelo': 'N/A',
+                        'promedio_historico': round(promedio, 2),
+                        'promedio_reciente': round(promedio_reciente, 2),
+                        'deterioro_porcentaje': round(((promedio - promedio_reciente) / promedio) * 100, 1),
+                        'ultimo_registro': ultimos_3[-1]['fecha']
+                    })
+
+        # Marca y modelo de todos los vehículos con alerta en una sola consulta
+        if alertas:
+            placas = [alerta['placa'] for alerta in alertas]
+            cursor.execute(
+                f"SELECT placa, marca, modelo FROM vehiculos WHERE placa IN ({', '.join('?' for _ in placas)})",
+                placas
+            )
+            vehiculos_info = {row['placa']: row for row in cursor.fetchall()}
+            for alerta in alertas:
+                vehiculo_info = vehiculos_info.get(alerta['placa'])
+                if vehiculo_info:
+                    alerta['marca'] = vehiculo_info['marca']
+                    alerta['modelo'] = vehiculo_info['modelo']
+
+        return alertas
+
+    except Exception as e:
+        logger.error(f"Error detectando variaciones de combustible: {e}")
+        return []
+
+def _fetch_dicts(cursor, sql, params=()):
+    cursor.execute(sql, params)
+    return [dict(row) for row in cursor.fetchall()]
+
+def compute_alert_data(conn, hoy, placa=None) -> dict:
+    """Ejecutar todas las consultas de alertas con las ventanas más amplias. Devuelve listas de dicts.
+    Con placa, cada consulta se limita a ese vehículo (índices por placa)"""
+    cursor = conn.cursor()
+    en_30_dias = (hoy + timedelta(days=DIAS_VENTANA)).isoformat()
+    # Filtro opcional por placa sobre la tabla principal de cada consulta
+    por_placa = lambda alias: f"AND {alias}.placa = ?" if placa is not None else ""
+    con_placa = lambda *params: params + ((placa,) if placa is not None else ())
+
+    return {
+        # registrado = 0 cuando la placa no existe en vehiculos (el dashboard solo muestra las registradas)
+        "mantenimiento_fecha": _fetch_dicts(cursor, f'''
+            SELECT m.*, v.marca, v.modelo, v.placa IS NOT NULL AS registrado
+            FROM mantenimientos m
+            LEFT JOIN vehiculos v ON m.placa = v.placa
+            WHERE m.proxima_fecha IS NOT NULL
+            AND m.proxima_fecha <= ?
+            AND m.proxima_fecha >= ?
+            {por_placa("m")}
+            ORDER BY m.proxima_fecha ASC
+        ''', con_placa(en_30_dias, hoy.isoformat())),
+
+        # Kilometraje actual de cada vehículo desde vehicle_state
+        "mantenimiento_km": _fetch_dicts(cursor, f'''
+            SELECT m.*, s.max_fill_km as km_actual
+            FROM mantenimientos m
+            JOIN vehicle_state s ON m.placa = s.placa
+            WHERE m.proximo_km IS NOT NULL
+            AND s.max_fill_km IS NOT NULL
+            AND (m.proximo_km - s.max_fill_km) <= ?
+            AND (m.proximo_km - s.max_fill_km) > 0
+            {por_placa("m")}
+            ORDER BY (m.proximo_km - s.max_fill_km) ASC
+        ''', con_placa(KM_VENTANA)),
+
+        "polizas": _fetch_dicts(cursor, f'''
+            SELECT p.*, v.marca, v.modelo
+            FROM polizas p
+            JOIN vehiculos v ON p.placa = v.placa
+            WHERE p.fecha_vencimiento <= ?
+            AND p.fecha_vencimiento >= ?
+            AND p.estado = 'Activa'
+            {por_placa("p")}
+            ORDER BY p.fecha_vencimiento ASC
+        ''', con_placa(en_30_dias, hoy.isoformat())),
+
+        "rtv": _fetch_dicts(cursor, f'''
+            SELECT r.*, v.marca, v.modelo
+            FROM rtv r
+            JOIN vehiculos v ON r.placa = v.placa
+            WHERE r.fecha_vencimiento <= ?
+            AND r.fecha_vencimiento >= ?
+            AND r.estado = 'Vigente'
+            {por_placa("r")}
+            ORDER BY r.fecha_vencimiento ASC
+        ''', con_placa(en_30_dias, hoy.isoformat())),
+
+        "revisiones": _fetch_dicts(cursor, f'''
+            SELECT r.*, v.marca, v.modelo
+            FROM revisiones r
+            JOIN vehiculos v ON r.placa = v.placa
+            WHERE r.aprobado = 0
+            AND r.fecha >= ?
+            {por_placa("r")}
+            ORDER BY r.fecha DESC
+        ''', con_placa((hoy - timedelta(days=DIAS_REVISIONES)).isoformat())),
+
+        "combustible": check_abnormal_fuel_consumption(cursor, hoy, placa),
+    }
+
+def fallas_revision(revision) -> list:
+    """Componentes de una revisión que no están en estado Bueno"""
+    fallas = []
+    if revision['estado_motor'] != 'Bueno': fallas.append(f"Motor: {revision['estado_motor']}")
+    if revision['estado_frenos'] != 'Bueno': fallas.append(f"Frenos: {revision['estado_frenos']}")
+    if revision['estado_luces'] != 'Bueno': fallas.append(f"Luces: {revision['estado_luces']}")
+    if revision['estado_llantas'] != 'Bueno': fallas.append(f"Llantas: {revision['estado_llantas']}")
+    if revision['estado_carroceria'] != 'Bueno': fallas.append(f"Carrocería: {revision['estado_carroceria']}")
+    return fallas
+
+# ================================
+# FOTO DE ALERTAS
+# ================================
+
+class AlertSnapshot:
+    """Alertas calculadas para una fecha y un conjunto de versiones. Solo lectura para los consumidores"""
+
+    def __init__(self, hoy, versions, data, compute_ms):
+        self.hoy = hoy
+        self.versions = versions
+        self.data = data
+        self.compute_ms = compute_ms
+        self.computed_at = datetime.now().isoformat()
+        self._views = {}
+        self._views_lock = threading.Lock()
+
+    @property
+    def total(self) -> int:
+        return sum(len(alertas) for alertas in self.data.values())
+
+    def mantenimiento_fecha(self, dias=DIAS_VENTANA) -> list:
+        """Mantenimientos con próxima fecha dentro de los próximos N días (N <= 30)"""
+        limite = (self.hoy + timedelta(days=dias)).isoformat()
+        return [m for m in self.data["mantenimiento_fecha"] if m['proxima_fecha'] <= limite]
+
+    def mantenimiento_km(self, km=KM_VENTANA) -> list:
+        """Mantenimientos a N km o menos del próximo servicio (N <= 1500)"""
+        return [m for m in self.data["mantenimiento_km"] if m['proximo_km'] - m['km_actual'] <= km]
+
+    def view(self, name, builder):
+        """Resultado derivado (detalle del dashboard, HTML del email) calculado una vez por foto"""
+        with self._views_lock:
+            if name not in self._views:
+                self._views[name] = builder(self)
+            return self._views[name]
+
+    def detalle(self) -> dict:
+        """Estructura de /alertas/detalle"""
+        return self.view("detalle", _build_detalle)
+
+def _build_detalle(snapshot) -> dict:
+    hoy = snapshot.hoy
+    alertas = {
+        "mantenimiento": [],
+        "polizas": [],
+        "rtv": [],
+        "revisiones": [],
+        "combustible": []
+    }
+
+    for m in snapshot.mantenimiento_fecha():
+        if not m['registrado']:
+            continue
+        dias_restantes = (datetime.strptime(m['proxima_fecha'], '%Y-%m-%d').date() - hoy).days
+        alertas["mantenimiento"].append({
+            "placa": m['placa'],
+            "vehiculo": f"{m['marca']} {m['modelo']}",
+            "tipo": m['tipo'],
+            "descripcion": f"Mantenimiento por fecha - {dias_restantes} días restantes",
+            "dias_restantes": dias_restantes,
+            "urgente": dias_restantes <= 7,
+            "fecha": m['proxima_fecha']
+        })
+
+    for p in snapshot.data["polizas"]:
+        dias_restantes = (datetime.strptime(p['fecha_vencimiento'], '%Y-%m-%d').date() - hoy).days
+        alertas["polizas"].append({
+            "placa": p['placa'],
+            "vehiculo": f"{p['marca']} {p['modelo']}",
+            "numero_poliza": p['numero_poliza'],
+            "aseguradora": p['aseguradora'],
+            "descripcion": f"Póliza vence en {dias_restantes} días",
+            "dias_restantes": dias_restantes,
+            "urgente": dias_restantes <= 7,
+            "fecha": p['fecha_vencimiento']
+        })
+
+    for r in snapshot.data["rtv"]:
+        dias_restantes = (datetime.strptime(r['fecha_vencimiento'], '%Y-%m-%d').date() - hoy).days
+        alertas["rtv"].append({
+            "placa": r['placa'],
+            "vehiculo": f"{r['marca']} {r['modelo']}",
+            "numero_cita": r['numero_cita'],
+            "descripcion": f"RTV vence en {dias_restantes} días",
+            "dias_restantes": dias_restantes,
+            "urgente": dias_restantes <= 7,
+            "fecha": r['fecha_vencimiento']
+        })
+
+    for r in snapshot.data["revisiones"]:
+        fallas = fallas_revision(r)
+        alertas["revisiones"].append({
+            "placa": r['placa'],
+            "vehiculo": f"{r['marca']} {r['modelo']}",
+            "inspector": r['inspector'],
+            "fallas": fallas,
+            "descripcion": f"Fallas detectadas: {', '.join(fallas) if fallas else 'Revisión no aprobada'}",
+            "urgente": True,
+            "fecha": r['fecha']
+        })
+
+    alertas["combustible"] = snapshot.data["combustible"]
+
+    totales = {
+        "mantenimiento": len(alertas["mantenimiento"]),
+        "polizas": len(alertas["polizas"]),
+        "rtv": len(alertas["rtv"]),
+        "revisiones": len(alertas["revisiones"]),
+        "combustible": len(alertas["combustible"]),
+        "total": sum([len(alertas[k]) for k in alertas.keys()])
+    }
+
+    return {
+        "alertas": alertas,
+        "totales": totales,
+        "fecha_consulta": hoy.isoformat()
+    }
+
+# ================================
+# CACHÉ
+# ================================
+
+class AlertEngine:
+    """Caché de la foto de alertas, invalidada por versión de tabla o cambio de día"""
+
+    def __init__(self, tables=ALERT_TABLES, loader=compute_alert_data):
+        # loader(conn, hoy) -> dict de listas por categoría: consultas completas o una tabla materializada
+        self.tables = tuple(tables)
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._key = None
+        self.hits = 0
+        self.misses = 0
+
+    def _cache_key(self, conn, hoy):
+        versions = get_table_versions(conn, self.tables)
+        return (hoy.isoformat(), tuple(sorted(versions.items()))), versions
+
+    def snapshot(self, conn, hoy) -> AlertSnapshot:
+        """Foto vigente; solo recalcula si cambió alguna versión o la fecha. Una búsqueda por PK si está vigente"""
+        key, versions = self._cache_key(conn, hoy)
+        snapshot = self._snapshot
+        if snapshot is not None and self._key == key:
+            self.hits += 1
+            return snapshot
+
+        # Un solo cálculo aunque varias peticiones lleguen a la vez con la caché vencida
+        with self._lock:
+            if self._snapshot is not None and self._key == key:
+                self.hits += 1
+                return self._snapshot
+
+            inicio = time.perf_counter()
+            data = self.loader(conn, hoy)
+            compute_ms = (time.perf_counter() - inicio) * 1000
+
+            # Si hubo escrituras durante el cálculo la clave quedó vieja y la próxima lectura recalcula
+            snapshot = AlertSnapshot(hoy, versions, data, compute_ms)
+            self._snapshot, self._key = snapshot, key
+            self.misses += 1
+            logger.info(f"🔔 Alertas recalculadas: {snapshot.total} en {compute_ms:.1f}ms")
+            return snapshot
+
+    def invalidate(self):
+        """Descartar la foto actual (la próxima lectura recalcula)"""
+        with self._lock:
+            self._snapshot = None
+            self._key = None
+
+    def metrics(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "tablas": list(self.tables),
+            "origen": getattr(self.loader, "__name__", str(self.loader)),
+            "foto": {
+                "fecha": snapshot.hoy.isoformat(),
+                "versiones": snapshot.versions,
+                "calculada_en": snapshot.computed_at,
+                "duracion_ms": round(snapshot.compute_ms, 2),
+                "total_alertas": snapshot.total,
+                "por_categoria": {nombre: len(alertas) for nombre, alertas in snapshot.data.items()},
+            } if snapshot else None
+        }
@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Alertas Activas Materializadas para el Sistema Vehicular
+Triggers anotan en alertas_pendientes la placa de cada escritura (mantenimientos, combustible, pólizas,
+RTV, revisiones, bitácora y vehículos); un evaluador recalcula solo las alertas de esas placas y las
+guarda en alertas_activas con first_seen / last_seen / resolved_at. Una vez al día (cambio de fecha
+en Centroamérica) se hace un barrido completo porque las ventanas por fecha avanzan sin escrituras.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from datetime import date
+
+from alert_engine import compute_alert_data
+from async_db import set_event_threadsafe
+
+logger = logging.getLogger(__name__)
+
+# Tablas cuyas escrituras dejan su placa pendiente de reevaluar
+ORIGIN_TABLES = ("vehiculos", "mantenimientos", "combustible", "polizas", "rtv", "revisiones", "bitacora")
+
+# Con más placas pendientes que esto, una pasada de toda la flota sale más barata que N consultas por placa
+BARRIDO_UMBRAL = 50
+
+# Las alertas resueltas se conservan este tiempo para consulta y luego se purgan en el barrido diario
+RETENCION_RESUELTAS_DIAS = 90
+
+CREATE_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS alertas_activas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        alert_key TEXT NOT NULL UNIQUE,
+        categoria TEXT NOT NULL,
+        placa TEXT NOT NULL,
+        referencia_id INTEGER,
+        fecha_objetivo DATE,
+        datos TEXT NOT NULL,
+        first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        resolved_at TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS alertas_pendientes (
+        placa TEXT NOT NULL PRIMARY KEY,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS alertas_barrido (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        fecha DATE NOT NULL,
+        duracion_ms REAL,
+        alertas INTEGER,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+]
+
+# Columna de fecha de vencimiento/registro de cada categoría (None: la alerta no tiene fecha)
+FECHA_OBJETIVO = {
+    "mantenimiento_fecha": "proxima_fecha",
+    "mantenimiento_km": None,
+    "polizas": "fecha_vencimiento",
+    "rtv": "fecha_vencimiento",
+    "revisiones": "fecha",
+    "combustible": "ultimo_registro",
+}
+
+# Mismo orden que las consultas de alert_engine: (clave, descendente)
+ORDEN = {
+    "mantenimiento_fecha": (lambda a: (a['proxima_fecha'], a['id']), False),
+    "mantenimiento_km": (lambda a: (a['proximo_km'] - a['km_actual'], a['id']), False),
+    "polizas": (lambda a: (a['fecha_vencimiento'], a['id']), False),
+    "rtv": (lambda a: (a['fecha_vencimiento'], a['id']), False),
+    "revisiones": (lambda a: (a['fecha'], a['id']), True),
+    "combustible": (lambda a: a['placa'], False),
+}
+
+# Niveles de severidad de menor a mayor; subir de nivel con la misma fecha es una escalada
+SEVERIDADES = ("aviso", "urgente", "critica")
+
+# ================================
+# ESQUEMA
+# ================================
+
+def create_pending_triggers(cursor):
+    """Triggers AFTER INSERT/UPDATE/DELETE que anotan la placa afectada (y la anterior si cambió)"""
+    for table in ORIGIN_TABLES:
+        for event in ("insert", "update", "delete"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_alertas_{event}")
+
+        # placa NOT NULL + OR IGNORE: una placa pendiente se anota una sola vez y los NULL se ignoran
+        cursor.execute(f'''
+            CREATE TRIGGER trg_{table}_alertas_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT OR IGNORE INTO alertas_pendientes (placa) VALUES (NEW.placa);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER trg_{table}_alertas_update AFTER UPDATE ON {table}
+            BEGIN
+                INSERT OR IGNORE INTO alertas_pendientes (placa) VALUES (NEW.placa);
+                INSERT OR IGNORE INTO alertas_pendientes (placa) VALUES (OLD.placa);
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER trg_{table}_alertas_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT OR IGNORE INTO alertas_pendientes (placa) VALUES (OLD.placa);
+            END
+        ''')
+
+def install_alertas_activas(cursor):
+    """Crear tablas, índices y triggers. La primera lectura hace el barrido inicial"""
+    for sql in CREATE_TABLES_SQL:
+        cursor.execute(sql)
+    # /alertas/detalle: solo las abiertas, por categoría y fecha
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_alertas_activas_abiertas
+        ON alertas_activas (categoria, fecha_objetivo) WHERE resolved_at IS NULL
+    ''')
+    # Reevaluación de una placa y listado por vehículo
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alertas_activas_placa ON alertas_activas (placa, resolved_at)")
+    create_pending_triggers(cursor)
+
+# ================================
+# EVALUACIÓN
+# ================================
+
+def _alert_key(categoria, alerta) -> str:
+    """Identidad estable de la alerta: el registro que la origina (combustible: una por placa)"""
+    if categoria == "combustible":
+        return f"combustible:{alerta['placa']}"
+    return f"{categoria}:{alerta['id']}"
+
+def severidad_alerta(categoria, alerta, hoy) -> str:
+    """Nivel de la alerta con los mismos umbrales que resaltan los emails y el dashboard"""
+    if categoria in ("mantenimiento_fecha", "polizas", "rtv"):
+        dias = (date.fromisoformat(alerta[FECHA_OBJETIVO[categoria]]) - hoy).days
+        return "critica" if dias <= 3 else "urgente" if dias <= 7 else "aviso"
+    if categoria == "mantenimiento_km":
+        km_restantes = alerta['proximo_km'] - alerta['km_actual']
+        return "critica" if km_restantes <= 200 else "urgente" if km_restantes <= 1000 else "aviso"
+    if categoria == "combustible":
+        return "critica" if alerta['deterioro_porcentaje'] >= 50 else "urgente"
+    return "critica"
+
+def fingerprint_alerta(categoria, placa, fecha, severidad) -> str:
+    """Huella estable: categoría, placa, fecha de vencimiento y nivel. Cambia solo si cambia algo que avisar"""
+    # Combustible y km no tienen vencimiento: ultimo_registro avanza con cada carga sin ser una alerta nueva
+    if categoria in ("combustible", "mantenimiento_km"):
+        fecha = None
+    return f"{categoria}|{placa}|{fecha or ''}|{severidad}"
+
+def _evaluar(conn, hoy, placas):
+    """Alertas actuales de las placas dadas (None: toda la flota)"""
+    if placas is not None and len(placas) <= BARRIDO_UMBRAL:
+        data = {categoria: [] for categoria in FECHA_OBJETIVO}
+        for placa in placas:
+            for categoria, alertas in compute_alert_data(conn, hoy, placa).items():
+                data[categoria].extend(alertas)
+        return data
+
+    data = compute_alert_data(conn, hoy)
+    if placas is not None:
+        placas = set(placas)
+        data = {categoria: [a for a in alertas if a['placa'] in placas] for categoria, alertas in data.items()}
+    return data
+
+def _open_keys(cursor, placas) -> set:
+    if placas is None:
+        cursor.execute("SELECT alert_key FROM alertas_activas WHERE resolved_at IS NULL")
+        return {row[0] for row in cursor.fetchall()}
+
+    keys = set()
+    placas = list(placas)
+    for i in range(0, len(placas), 500):
+        chunk = placas[i:i + 500]
+        cursor.execute(f'''
+            SELECT alert_key FROM alertas_activas
+            WHERE placa IN ({", ".join("?" for _ in chunk)}) AND resolved_at IS NULL
+        ''', chunk)
+        keys.update(row[0] for row in cursor.fetchall())
+    return keys
+
+def _aplicar(cursor, data, placas, hoy) -> dict:
+    """Sincronizar alertas_activas con las alertas calculadas para esas placas. No hace commit"""
+    actuales = {}
+    for categoria, alertas in data.items():
+        fecha_col = FECHA_OBJETIVO[categoria]
+        for alerta in alertas:
+            key = _alert_key(categoria, alerta)
+            fecha = alerta.get(fecha_col) if fecha_col else None
+            severidad = severidad_alerta(categoria, alerta, hoy)
+            actuales[key] = (
+                key, categoria, alerta['placa'],
+                alerta.get('id') if categoria != "combustible" else None,
+                fecha,
+                json.dumps(alerta, ensure_ascii=False, default=str),
+                severidad,
+                fingerprint_alerta(categoria, alerta['placa'], fecha, severidad),
+            )
+
+    abiertas = _open_keys(cursor, placas)
+    resueltas = abiertas - actuales.keys()
+
+    cursor.executemany(
+        "UPDATE alertas_activas SET resolved_at = CURRENT_TIMESTAMP WHERE alert_key = ? AND resolved_at IS NULL",
+        [(key,) for key in resueltas]
+    )
+    # Una alerta resuelta que reaparece vuelve a abrirse como nueva (y se notificará de nuevo)
+    cursor.executemany('''
+        INSERT INTO alertas_activas
+        (alert_key, categoria, placa, referencia_id, fecha_objetivo, datos, severidad, fingerprint)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(alert_key) DO UPDATE SET
+            categoria = excluded.categoria,
+            placa = excluded.placa,
+            referencia_id = excluded.referencia_id,
+            fecha_objetivo = excluded.fecha_objetivo,
+            datos = excluded.datos,
+            severidad = excluded.severidad,
+            fingerprint = excluded.fingerprint,
+            last_seen = CURRENT_TIMESTAMP,
+            first_seen = CASE WHEN alertas_activas.resolved_at IS NULL
+                              THEN alertas_activas.first_seen ELSE CURRENT_TIMESTAMP END,
+            notificada_fingerprint = CASE WHEN alertas_activas.resolved_at IS NULL
+                                          THEN alertas_activas.notificada_fingerprint END,
+            notificada_historial_id = CASE WHEN alertas_activas.resolved_at IS NULL
+                                           THEN alertas_activas.notificada_historial_id END,
+            notificada_at = CASE WHEN alertas_activas.resolved_at IS NULL
+                                 THEN alertas_activas.notificada_at END,
+            resolucion_notificada_at = NULL,
+            resolved_at = NULL
+    ''', list(actuales.values()))
+
+    return {
+        "abiertas": len(actuales),
+        "nuevas": len(actuales.keys() - abiertas),
+        "resueltas": len(resueltas),
+    }
+
+def refresh_alertas(conn, hoy, barrido=False):
+    """Procesar placas pendientes (o barrer toda la flota si cambió la fecha). None si no había trabajo"""
+    hoy_iso = hoy.isoformat()
+
+    def _estado():
+        row = conn.execute("SELECT fecha FROM alertas_barrido WHERE id = 1").fetchone()
+        vencido = barrido or row is None or row[0] != hoy_iso
+        pendientes = conn.execute("SELECT 1 FROM alertas_pendientes LIMIT 1").fetchone() is not None
+        return vencido, pendientes
+
+    # Lectura rápida sin bloquear escritores: lo normal es que no haya nada que hacer
+    vencido, pendientes = _estado()
+    if not vencido and not pendientes:
+        return None
+
+    inicio = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Otro hilo o proceso pudo procesarlas mientras se esperaba el bloqueo
+        vencido, pendientes = _estado()
+        if not vencido and not pendientes:
+            conn.rollback()
+            return None
+
+        cursor = conn.cursor()
+        if vencido:
+            placas = None
+        else:
+            cursor.execute("SELECT placa FROM alertas_pendientes")
+            placas = [row[0] for row in cursor.fetchall()]
+
+        resultado = _aplicar(cursor, _evaluar(conn, hoy, placas), placas, hoy)
+        # Con el bloqueo de escritura tomado no pueden llegar placas nuevas entre el SELECT y el DELETE
+        cursor.execute("DELETE FROM alertas_pendientes")
+
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        if vencido:
+            cursor.execute(
+                "DELETE FROM alertas_activas WHERE resolved_at < datetime('now', ?)",
+                (f"-{RETENCION_RESUELTAS_DIAS} days",)
+            )
+            cursor.execute('''
+                INSERT OR REPLACE INTO alertas_barrido (id, fecha, duracion_ms, alertas, updated_at)
+                VALUES (1, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (hoy_iso, duracion_ms, resultado["abiertas"]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    resultado.update({
+        "barrido": vencido,
+        "placas": None if placas is None else len(placas),
+        "duracion_ms": round(duracion_ms, 2),
+    })
+    return resultado
+
+# ================================
+# LECTURA
+# ================================
+
+def load_alert_data(conn, hoy) -> dict:
+    """Alertas abiertas agrupadas por categoría (misma forma que compute_alert_data), desde la tabla"""
+    refresh_alertas(conn, hoy)
+    data = {categoria: [] for categoria in FECHA_OBJETIVO}
+    for categoria, datos in conn.execute(
+        "SELECT categoria, datos FROM alertas_activas WHERE resolved_at IS NULL"
+    ):
+        data[categoria].append(json.loads(datos))
+    for categoria, (clave, descendente) in ORDEN.items():
+        data[categoria].sort(key=clave, reverse=descendente)
+    return data
+
+def list_alertas_activas(conn, placa=None, incluir_resueltas=False, limit=200) -> list:
+    """Alertas con su ciclo de vida (first_seen / last_seen / resolved_at), abiertas primero"""
+    condiciones, params = [], []
+    if placa:
+        condiciones.append("placa = ?")
+        params.append(placa)
+    if not incluir_resueltas:
+        condiciones.append("resolved_at IS NULL")
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    rows = conn.execute(f'''
+        SELECT id, alert_key, categoria, placa, referencia_id, fecha_objetivo, datos,
+               first_seen, last_seen, resolved_at
+        FROM alertas_activas {where}
+        ORDER BY resolved_at IS NOT NULL, fecha_objetivo IS NULL, fecha_objetivo, id
+        LIMIT ?
+    ''', params + [limit]).fetchall()
+
+    alertas = []
+    for row in rows:
+        alerta = dict(row)
+        alerta["datos"] = json.loads(alerta["datos"])
+        alertas.append(alerta)
+    return alertas
+
+# ================================
+# NOTIFICACIÓN POR CAMBIOS
+# ================================
+
+def _rango(severidad) -> int:
+    return SEVERIDADES.index(severidad) if severidad in SEVERIDADES else -1
+
+def pending_notifications(conn) -> dict:
+    """Alertas que cambiaron desde el último email: nuevas, escaladas y resueltas.
+    Un aviso cuyo email quedó 'fallido' en historial_alertas cuenta como no notificado"""
+    cambios = {"nuevas": [], "escaladas": [], "resueltas": [], "silenciosas": []}
+
+    for row in conn.execute('''
+        SELECT a.alert_key, a.categoria, a.placa, a.datos, a.fingerprint, a.severidad,
+               a.notificada_fingerprint, h.estado AS estado_email
+        FROM alertas_activas a
+        LEFT JOIN historial_alertas h ON h.id = a.notificada_historial_id
+        WHERE a.resolved_at IS NULL
+    '''):
+        previa = row["notificada_fingerprint"] if row["estado_email"] != "fallido" else None
+        if previa == row["fingerprint"]:
+            continue
+        alerta = {"alert_key": row["alert_key"], "categoria": row["categoria"], "placa": row["placa"],
+                  "severidad": row["severidad"], "datos": json.loads(row["datos"])}
+        if previa is None or previa.rsplit("|", 1)[0] != row["fingerprint"].rsplit("|", 1)[0]:
+            # Sin aviso previo o con otra fecha de vencimiento: es otra alerta para el destinatario
+            cambios["nuevas"].append(alerta)
+        elif _rango(row["severidad"]) > _rango(previa.rsplit("|", 1)[1]):
+            cambios["escaladas"].append(alerta)
+        else:
+            # Bajó de nivel con la misma fecha: se actualiza la huella sin enviar nada
+            cambios["silenciosas"].append(alerta)
+
+    for row in conn.execute('''
+        SELECT a.alert_key, a.categoria, a.placa, a.datos, a.severidad, a.resolved_at, h.estado AS estado_email
+        FROM alertas_activas a
+        LEFT JOIN historial_alertas h ON h.id = a.notificada_historial_id
+        WHERE a.resolved_at IS NOT NULL
+        AND a.notificada_fingerprint IS NOT NULL
+        AND a.resolucion_notificada_at IS NULL
+    '''):
+        alerta = {"alert_key": row["alert_key"], "categoria": row["categoria"], "placa": row["placa"],
+                  "severidad": row["severidad"], "datos": json.loads(row["datos"]),
+                  "resolved_at": row["resolved_at"]}
+        # Si el aviso original nunca llegó tampoco tiene sentido avisar que se resolvió
+        cambios["silenciosas" if row["estado_email"] == "fallido" else "resueltas"].append(alerta)
+
+    return cambios
+
+def mark_notified(conn, cambios, historial_id=None):
+    """Guardar la huella notificada (y el email de historial_alertas que la llevó). No hace commit"""
+    enviadas = [(historial_id, a["alert_key"]) for a in cambios.get("nuevas", []) + cambios.get("escaladas", [])]
+    conn.executemany('''
+        UPDATE alertas_activas
+        SET notificada_fingerprint = fingerprint, notificada_historial_id = ?, notificada_at = CURRENT_TIMESTAMP
+        WHERE alert_key = ?
+    ''', enviadas)
+    conn.executemany('''
+        UPDATE alertas_activas SET resolucion_notificada_at = CURRENT_TIMESTAMP
+        WHERE alert_key = ? AND resolved_at IS NOT NULL
+    ''', [(a["alert_key"],) for a in cambios.get("resueltas", [])])
+    # Silenciosas: abiertas que bajaron de nivel y resueltas cuyo aviso original falló
+    conn.executemany('''
+        UPDATE alertas_activas
+        SET notificada_fingerprint = CASE WHEN resolved_at IS NULL THEN fingerprint ELSE notificada_fingerprint END,
+            resolucion_notificada_at = CASE WHEN resolved_at IS NULL THEN NULL ELSE CURRENT_TIMESTAMP END
+        WHERE alert_key = ?
+    ''', [(a["alert_key"],) for a in cambios.get("silenciosas", [])])
+
+def mark_all_notified(conn, historial_id):
+    """Resumen completo enviado: todas las abiertas y las resoluciones pendientes quedan notificadas"""
+    conn.execute('''
+        UPDATE alertas_activas
+        SET notificada_fingerprint = fingerprint, notificada_historial_id = ?, notificada_at = CURRENT_TIMESTAMP
+        WHERE resolved_at IS NULL
+    ''', (historial_id,))
+    conn.execute('''
+        UPDATE alertas_activas SET resolucion_notificada_at = CURRENT_TIMESTAMP
+        WHERE resolved_at IS NOT NULL AND notificada_fingerprint IS NOT NULL AND resolucion_notificada_at IS NULL
+    ''')
+
+def _estado_tablas(conn) -> dict:
+    barrido = conn.execute("SELECT fecha, duracion_ms, alertas, updated_at FROM alertas_barrido WHERE id = 1").fetchone()
+    return {
+        "pendientes": conn.execute("SELECT COUNT(*) FROM alertas_pendientes").fetchone()[0],
+        "abiertas": conn.execute("SELECT COUNT(*) FROM alertas_activas WHERE resolved_at IS NULL").fetchone()[0],
+        "ultimo_barrido": dict(barrido) if barrido else None,
+    }
+
+# ================================
+# EVALUADOR EN SEGUNDO PLANO
+# ================================
+
+class AlertEvaluator:
+    """Procesa alertas_pendientes poco después de cada escritura, sin bloquear la respuesta"""
+
+    def __init__(self, async_db, today_func, debounce_seconds=0.5, poll_seconds=60.0):
+        # today_func: fecha actual del negocio (date_ca en main.py)
+        self.db = async_db
+        self.today_func = today_func
+        self.debounce_seconds = debounce_seconds
+        self.poll_seconds = poll_seconds
+
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+        # Métricas
+        self._runs = 0
+        self._sweeps = 0
+        self._placas_evaluadas = 0
+        self._last_result = None
+        self._last_error = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Iniciar el worker en el event loop actual"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._worker(), name="alert-evaluator")
+        # Barrido inicial (o pendientes de otra instancia) sin esperar la primera escritura
+        self._wakeup.set()
+        logger.info(f"🔔 Evaluador de alertas iniciado (ventana {self.debounce_seconds}s, "
+                    f"sondeo cada {self.poll_seconds}s)")
+
+    async def stop(self):
+        """Detener el worker. Lo pendiente queda en alertas_pendientes y se procesa en la próxima lectura"""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def notify(self):
+        """Despertar al worker tras una escritura (también desde otros hilos)"""
+        set_event_threadsafe(self._loop, self._wakeup)
+
+    async def refresh(self, barrido=False):
+        """Procesar ahora lo pendiente (o barrer toda la flota) y devolver el resultado"""
+        resultado = await self.db.run(refresh_alertas, self.today_func(), barrido)
+        if resultado:
+            self._runs += 1
+            self._sweeps += resultado["barrido"]
+            self._placas_evaluadas += resultado["placas"] or 0
+            self._last_result = resultado
+        return resultado
+
+    async def _worker(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                # Sondeo: cambio de día o placas anotadas por otro proceso
+                pass
+            # Agrupar la ráfaga de escrituras en una sola evaluación
+            await asyncio.sleep(self.debounce_seconds)
+            self._wakeup.clear()
+            try:
+                resultado = await self.refresh()
+                if resultado:
+                    alcance = "barrido completo" if resultado["barrido"] else f"{resultado['placas']} placas"
+                    logger.info(f"🔔 Alertas reevaluadas ({alcance}): {resultado['nuevas']} nuevas, "
+                                f"{resultado['resueltas']} resueltas, {resultado['duracion_ms']}ms")
+            except Exception as e:
+                self._last_error = str(e)
+                logger.error(f"❌ Error reevaluando alertas: {e}")
+
+    async def metrics(self) -> dict:
+        estado = await self.db.run(_estado_tablas)
+        return {
+            "running": self.running,
+            "debounce_seconds": self.debounce_seconds,
+            "evaluaciones": self._runs,
+            "barridos": self._sweeps,
+            "placas_evaluadas": self._placas_evaluadas,
+            "ultima_evaluacion": self._last_result,
+            "last_error": self._last_error,
+            **estado,
+        }
+
+def create_evaluator_from_env(async_db, today_func) -> AlertEvaluator:
+    """Crear el evaluador usando ALERT_EVAL_DEBOUNCE_SECONDS / ALERT_EVAL_POLL_SECONDS"""
+    return AlertEvaluator(
+        async_db,
+        today_func,
+        debounce_seconds=float(os.environ.get("ALERT_EVAL_DEBOUNCE_SECONDS", "0.5")),
+        poll_seconds=float(os.environ.get("ALERT_EVAL_POLL_SECONDS", "60")),
+    )
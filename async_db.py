@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Capa de Acceso a Datos Asíncrona para el Sistema Vehicular
+Ejecuta el trabajo bloqueante (SQLite, emails, backups) fuera del event loop
+"""
+
+import os
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class AsyncDatabase:
+    """Ejecuta consultas SQLite en un executor dedicado y acotado al tamaño del pool"""
+
+    def __init__(self, pool, max_workers=None):
+        self.pool = pool
+        # Un hilo por conexión: ningún hilo del executor espera por el pool
+        self.max_workers = max_workers or pool.max_size
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sqlite")
+
+    async def run(self, func, *args, **kwargs):
+        """Ejecutar func(conn, *args, **kwargs) en el executor con una conexión del pool"""
+        def _call():
+            with self.pool.connection() as conn:
+                return func(conn, *args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _call)
+
+    async def fetch_all(self, query, params=()):
+        """SELECT que devuelve una lista de diccionarios"""
+        def _fetch_all(conn):
+            return [dict(row) for row in conn.execute(query, params).fetchall()]
+        return await self.run(_fetch_all)
+
+    async def fetch_one(self, query, params=()):
+        """SELECT que devuelve un diccionario o None"""
+        def _fetch_one(conn):
+            row = conn.execute(query, params).fetchone()
+            return dict(row) if row else None
+        return await self.run(_fetch_one)
+
+    async def execute(self, query, params=()):
+        """INSERT/UPDATE/DELETE con commit. Devuelve (rowcount, lastrowid)"""
+        def _execute(conn):
+            cursor = conn.execute(query, params)
+            conn.commit()
+            return cursor.rowcount, cursor.lastrowid
+        return await self.run(_execute)
+
+    def shutdown(self):
+        """Detener el executor (al apagar la aplicación)"""
+        self.executor.shutdown(wait=True)
+
+# Executor acotado para E/S bloqueante que no es SQLite (SendGrid, SMTP, GitHub, ZIPs)
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("BLOCKING_IO_WORKERS", "4")),
+    thread_name_prefix="blocking-io"
+)
+
+async def run_blocking(func, *args, **kwargs):
+    """Ejecutar una función bloqueante (red, disco) sin detener el event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_executor, functools.partial(func, *args, **kwargs))
+
+def set_event_threadsafe(loop, event):
+    """Activar un asyncio.Event del loop desde cualquier hilo (despertar a un worker tras una escritura).
+    Sin efecto si el worker no arrancó o su loop ya se cerró"""
+    if loop is None or loop.is_closed():
+        return
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+    if current is loop:
+        event.set()
+    else:
+        loop.call_soon_threadsafe(event.set)
+
+def shutdown_blocking_executor():
+    """Detener el executor de E/S bloqueante"""
+    _blocking_executor.shutdown(wait=True)
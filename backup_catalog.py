@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Catálogo de Backups y Deduplicación por Contenido para el Sistema Vehicular
+Cada backup (por sistema: GitHub local, GitHub API) queda registrado con la huella de los datos que
+respaldó. Antes de empaquetar se compara el estado actual con el del último backup exitoso: si las
+versiones de las tablas y la secuencia de change_log no se movieron, o si se movieron pero el
+contenido es el mismo (p. ej. un UPDATE que no cambió nada), no se empaqueta ni se sube, y el
+salto queda registrado en el catálogo. La huella combina las raíces de los árboles de checksums
+por tabla, que se recalculan solo para las tablas cuya versión cambió.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+
+from change_log import latest_seq
+from table_checksums import CHECKSUM_TABLES, ChecksumCache
+from table_versions import get_table_versions
+
+logger = logging.getLogger(__name__)
+
+# Datos que definen si un backup es nuevo: tablas de negocio y configuración. Las tablas derivadas
+# o de operación (alertas, historial de emails, change_log, cola de emails, tareas) no cuentan
+FINGERPRINT_TABLES = CHECKSUM_TABLES + ("config_alertas", "config_email")
+
+# Aunque no haya cambios, un backup nuevo cada BACKUP_DEDUPE_MAX_AGE_HOURS (los viejos se limpian)
+DEDUPE_MAX_AGE_HOURS = float(os.environ.get("BACKUP_DEDUPE_MAX_AGE_HOURS", "24"))
+
+ESTADOS = ("subido", "omitido", "fallido")
+
+# Árboles compartidos por todos los sistemas de backup del proceso
+_checksum_cache = ChecksumCache(FINGERPRINT_TABLES)
+
+def install_backup_catalog(cursor):
+    """Tabla con cada backup intentado: sistema, estado, huella de los datos y archivo"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS backup_catalog (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sistema TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            motivo TEXT,
+            huella TEXT,
+            estado_datos TEXT,
+            archivo TEXT,
+            registros INTEGER,
+            detalle TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_backup_catalog_sistema ON backup_catalog (sistema, estado, id)")
+
+def data_state(conn) -> str:
+    """Versiones de las tablas respaldadas y secuencia de change_log (sin leer datos)"""
+    estado = get_table_versions(conn, FINGERPRINT_TABLES)
+    estado["change_log"] = latest_seq(conn)
+    return json.dumps(estado, sort_keys=True, separators=(",", ":"))
+
+def database_fingerprint(conn, cache=None) -> str:
+    """Huella del contenido: hash de la raíz y filas del árbol de checksums de cada tabla"""
+    resumen = (cache or _checksum_cache).summary(conn, FINGERPRINT_TABLES)
+    texto = "|".join(f"{table}={resumen[table]['hash']}:{resumen[table]['rows']}" for table in FINGERPRINT_TABLES)
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+def _ultimo_exitoso(conn, sistema, max_age_hours):
+    row = conn.execute(
+        "SELECT id, huella, estado_datos, archivo, created_at FROM backup_catalog "
+        "WHERE sistema = ? AND estado = 'subido' AND created_at >= datetime('now', ?) "
+        "ORDER BY id DESC LIMIT 1",
+        (sistema, f"-{max_age_hours} hours")
+    ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(("id", "huella", "estado_datos", "archivo", "created_at"), row))
+
+class BackupCatalog:
+    """Catálogo y deduplicación de un sistema de backup sobre la base db_path"""
+
+    def __init__(self, db_path, sistema, max_age_hours=DEDUPE_MAX_AGE_HOURS):
+        self.db_path = db_path
+        self.sistema = sistema
+        self.max_age_hours = max_age_hours
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def check(self):
+        """Comparar los datos actuales con el último backup exitoso (de las últimas max_age_hours).
+
+        Devuelve {"sin_cambios", "huella", "estado_datos", "previo"} o None si la base no tiene
+        catálogo (sin migrar): en ese caso se respalda siempre.
+        """
+        conn = self._connect()
+        try:
+            estado = data_state(conn)
+            previo = _ultimo_exitoso(conn, self.sistema, self.max_age_hours)
+            if previo is not None and previo["estado_datos"] == estado:
+                # Nadie escribió desde el último backup: ni siquiera hace falta calcular la huella
+                return {"sin_cambios": True, "huella": previo["huella"], "estado_datos": estado, "previo": previo}
+            huella = database_fingerprint(conn)
+            sin_cambios = previo is not None and previo["huella"] == huella
+            return {"sin_cambios": sin_cambios, "huella": huella, "estado_datos": estado, "previo": previo}
+        except sqlite3.OperationalError as e:
+            logger.warning(f"⚠️ Catálogo de backups no disponible ({e}): se respalda sin deduplicar")
+            return None
+        finally:
+            conn.close()
+
+    def record(self, estado, motivo, comprobacion=None, archivo=None, registros=None, detalle=None):
+        """Registrar un backup subido, omitido o fallido en el catálogo"""
+        if estado not in ESTADOS:
+            raise ValueError(f"Estado de backup desconocido: {estado}")
+        huella = comprobacion["huella"] if comprobacion else None
+        estado_datos = comprobacion["estado_datos"] if comprobacion else None
+        conn = self._connect()
+        try:
+            if estado == "subido" and estado_datos is not None and data_state(conn) != estado_datos:
+                # Hubo escrituras mientras se armaba el backup: no se sabe exactamente qué datos
+                # quedaron en él, así que no sirve de referencia para omitir el siguiente
+                huella = estado_datos = None
+            conn.execute(
+                "INSERT INTO backup_catalog (sistema, estado, motivo, huella, estado_datos, archivo, registros, detalle) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.sistema, estado, motivo, huella, estado_datos, archivo, registros,
+                 json.dumps(detalle, ensure_ascii=False, default=str) if detalle is not None else None)
+            )
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            logger.warning(f"⚠️ No se pudo registrar el backup en el catálogo: {e}")
+        finally:
+            conn.close()
+
+    def skip(self, motivo, comprobacion):
+        """Registrar el salto y devolver el archivo del backup que ya tiene estos datos"""
+        previo = comprobacion["previo"]
+        self.record("omitido", motivo, comprobacion, archivo=previo["archivo"],
+                    detalle={"igual_a": previo["id"]})
+        logger.info(f"⏭️ Backup {self.sistema} omitido ({motivo}): sin cambios desde {previo['archivo']}")
+        return previo["archivo"]
+
+def list_backup_catalog(conn, limit=50, sistema=None) -> list:
+    """Últimas entradas del catálogo (más recientes primero)"""
+    filtro, params = ("WHERE sistema = ?", (sistema,)) if sistema else ("", ())
+    cursor = conn.execute(
+        f"SELECT id, sistema, estado, motivo, huella, archivo, registros, detalle, created_at "
+        f"FROM backup_catalog {filtro} ORDER BY id DESC LIMIT ?", params + (limit,)
+    )
+    columnas = [d[0] for d in cursor.description]
+    entradas = [dict(zip(columnas, row)) for row in cursor.fetchall()]
+    for entrada in entradas:
+        entrada["detalle"] = json.loads(entrada["detalle"]) if entrada["detalle"] else None
+    return entradas
+
+def backup_catalog_summary(conn) -> dict:
+    """Backups subidos, omitidos y fallidos por sistema"""
+    resumen = {}
+    for sistema, estado, total in conn.execute(
+        "SELECT sistema, estado, COUNT(*) FROM backup_catalog GROUP BY sistema, estado"
+    ):
+        resumen.setdefault(sistema, {estado: 0 for estado in ESTADOS})[estado] = total
+    return resumen
+
+def purge_backup_catalog(conn, dias) -> int:
+    """Borrar entradas con más de `dias` días"""
+    borradas = conn.execute("DELETE FROM backup_catalog WHERE created_at < datetime('now', ?)",
+                            (f"-{int(dias)} days",)).rowcount
+    conn.commit()
+    return borradas
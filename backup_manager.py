@@ -7,16 +7,20 @@ Previene pérdida de datos con múltiples capas de protección
 import os
 import sqlite3
 import json
-import csv
 import shutil
 import zipfile
 from datetime import datetime, timedelta
 import logging
 import hashlib
-import pandas as pd
+
+from db_snapshot import snapshot_database, restore_database
+from db_export import export_database
 
 logger = logging.getLogger(__name__)
 
+# Tablas exportadas a JSON/CSV
+EXPORT_TABLES = ['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora']
+
 class DatabaseBackupManager:
     """Gestor de backups robusto con múltiples formatos y verificaciones"""
     
@@ -86,23 +90,22 @@ class DatabaseBackupManager:
         try:
             # 1. BACKUP COMPLETO DE SQLITE (.db)
             db_backup_path = f"{backup_folder}/{backup_name}.db"
-            shutil.copy2(self.db_path, db_backup_path)
+            backup_info["snapshot"] = snapshot_database(self.db_path, db_backup_path)
             backup_info["sqlite_backup"] = db_backup_path
             
-            # 2. DUMP SQL (.sql)
+            # 2-4. DUMP SQL, EXPORT JSON (legible y portable) y CSV (Excel compatible)
+            # Una sola pasada sobre la copia recién tomada: todos los formatos con los mismos datos
             sql_backup_path = f"{backup_folder}/{backup_name}.sql"
-            self.create_sql_dump(sql_backup_path)
+            self.create_sql_dump(sql_backup_path, source=db_backup_path)
             backup_info["sql_dump"] = sql_backup_path
             
-            # 3. EXPORT JSON (legible y portable)
             if include_export:
                 json_backup_path = f"{backup_folder}/{backup_name}.json"
-                self.export_to_json(json_backup_path)
-                backup_info["json_export"] = json_backup_path
-                
-                # 4. EXPORT CSV (Excel compatible)
                 csv_folder = f"{backup_folder}/csv_export"
-                self.export_to_csv(csv_folder)
+                backup_info["export"] = self.export_formats(
+                    json_path=json_backup_path, csv_folder=csv_folder, source=db_backup_path
+                )
+                backup_info["json_export"] = json_backup_path
                 backup_info["csv_export"] = csv_folder
             
             # 5. VERIFICACIÓN DE INTEGRIDAD
@@ -125,89 +128,52 @@ class DatabaseBackupManager:
             logger.error(f"❌ Error creando backup: {e}")
             return {"error": str(e)}
     
-    def create_sql_dump(self, output_path):
+    def export_formats(self, json_path=None, csv_folder=None, source=None):
+        """Exportar las tablas a JSON y/o CSV en una sola pasada (en streaming, sin cargar la base en memoria).
+
+        source: copia congelada (snapshot) de la que exportar; por defecto la base en uso, dentro de
+        una transacción de lectura.
+        """
+        return export_database(
+            source or self.db_path, json_path=json_path, csv_dir=csv_folder, tables=EXPORT_TABLES,
+            frozen=source is not None,
+            json_header={"metadata": {
+                "export_date": datetime.now().isoformat(),
+                "database_stats": self.get_database_stats()
+            }}
+        )
+    
+    def create_sql_dump(self, output_path, source=None):
         """Crear dump SQL completo de la base de datos"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                # Header del archivo SQL
-                f.write("-- Backup SQL Sistema Vehicular\n")
-                f.write(f"-- Creado: {datetime.now().isoformat()}\n")
-                f.write("-- IMPORTANTE: Este archivo contiene TODOS los datos\n\n")
-                
-                # Dump completo
-                for line in conn.iterdump():
-                    f.write(f"{line}\n")
-            
-            conn.close()
+            export_database(
+                source or self.db_path, sql_path=output_path, frozen=source is not None,
+                sql_header=[
+                    "Backup SQL Sistema Vehicular",
+                    f"Creado: {datetime.now().isoformat()}",
+                    "IMPORTANTE: Este archivo contiene TODOS los datos"
+                ]
+            )
             logger.info(f"✅ SQL dump creado: {output_path}")
             
         except Exception as e:
             logger.error(f"❌ Error creando SQL dump: {e}")
             raise
     
-    def export_to_json(self, output_path):
+    def export_to_json(self, output_path, source=None):
         """Exportar toda la base de datos a JSON legible"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row  # Para acceso por nombre de columna
-            
-            export_data = {
-                "metadata": {
-                    "export_date": datetime.now().isoformat(),
-                    "database_stats": self.get_database_stats()
-                },
-                "tables": {}
-            }
-            
-            # Exportar cada tabla
-            tables = ['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora']
-            
-            for table in tables:
-                try:
-                    cursor = conn.execute(f"SELECT * FROM {table}")
-                    rows = cursor.fetchall()
-                    
-                    # Convertir rows a dict
-                    export_data["tables"][table] = [
-                        dict(row) for row in rows
-                    ]
-                    
-                except sqlite3.Error as e:
-                    logger.warning(f"⚠️ Error exportando tabla {table}: {e}")
-                    export_data["tables"][table] = []
-            
-            # Guardar JSON
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, indent=2, ensure_ascii=False, default=str)
-            
-            conn.close()
+            self.export_formats(json_path=output_path, source=source)
             logger.info(f"✅ Export JSON creado: {output_path}")
             
         except Exception as e:
             logger.error(f"❌ Error exportando JSON: {e}")
             raise
     
-    def export_to_csv(self, output_folder):
+    def export_to_csv(self, output_folder, source=None):
         """Exportar cada tabla a CSV separado"""
         try:
-            os.makedirs(output_folder, exist_ok=True)
-            conn = sqlite3.connect(self.db_path)
-            
-            tables = ['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora']
-            
-            for table in tables:
-                try:
-                    # Usar pandas para mejor manejo de CSV
-                    df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
-                    csv_path = f"{output_folder}/{table}.csv"
-                    df.to_csv(csv_path, index=False, encoding='utf-8')
-                    
-                except Exception as e:
-                    logger.warning(f"⚠️ Error exportando {table} a CSV: {e}")
-            
-            conn.close()
+            self.export_formats(csv_folder=output_folder, source=source)
             logger.info(f"✅ CSV exports creados en: {output_folder}")
             
         except Exception as e:
@@ -318,8 +284,8 @@ class DatabaseBackupManager:
             # Crear backup de la DB actual antes de restaurar
             current_backup = self.create_full_backup("automatic")
             
-            # Restaurar
-            shutil.copy2(db_file, self.db_path)
+            # Restaurar (las conexiones abiertas ven el cambio como una transacción)
+            restore_database(db_file, self.db_path)
             
             return {
                 "success": True,
@@ -380,21 +346,18 @@ def export_database_now():
     os.makedirs(export_folder, exist_ok=True)
     
     try:
-        # JSON Export
-        json_path = f"{export_folder}/vehicular_complete_{timestamp}.json"
-        manager.export_to_json(json_path)
+        # DB Copy (todos los formatos salen de esta copia)
+        db_path = f"{export_folder}/vehicular_backup_{timestamp}.db"
+        snapshot_database(manager.db_path, db_path)
         
-        # CSV Export
+        # JSON y CSV Export
+        json_path = f"{export_folder}/vehicular_complete_{timestamp}.json"
         csv_folder = f"{export_folder}/csv_tables"
-        manager.export_to_csv(csv_folder)
+        manager.export_formats(json_path=json_path, csv_folder=csv_folder, source=db_path)
         
         # SQL Dump
         sql_path = f"{export_folder}/vehicular_dump_{timestamp}.sql"
-        manager.create_sql_dump(sql_path)
-        
-        # DB Copy
-        db_path = f"{export_folder}/vehicular_backup_{timestamp}.db"
-        shutil.copy2(manager.db_path, db_path)
+        manager.create_sql_dump(sql_path, source=db_path)
         
         # ZIP todo
         zip_path = f"{export_folder}.zip"
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Programador de Backups en Segundo Plano para el Sistema Vehicular
+Las escrituras solo marcan la base como "sucia"; un único worker agrupa las ráfagas
+en un backup por ventana y garantiza una antigüedad máxima de los cambios sin respaldar
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BackupScheduler:
+    """Backup con debounce: espera una pausa en las escrituras, pero nunca más que max_staleness"""
+
+    def __init__(self, backup_func, debounce_seconds=30.0, max_staleness_seconds=300.0):
+        # backup_func: corrutina async (reason) -> resultado
+        self.backup_func = backup_func
+        self.debounce_seconds = debounce_seconds
+        self.max_staleness_seconds = max(max_staleness_seconds, debounce_seconds)
+
+        self._wakeup = None
+        self._task = None
+        self._flush_waiters = []
+
+        # Cambios pendientes de respaldar
+        self._first_dirty_at = None
+        self._last_dirty_at = None
+        self._pending_writes = 0
+        self._pending_reasons = {}
+
+        # Métricas
+        self._running_since = None
+        self._backups_run = 0
+        self._backups_failed = 0
+        self._writes_total = 0
+        self._writes_coalesced = 0
+        self._last_backup_at = None
+        self._last_duration = None
+        self._last_lag = None
+        self._max_lag = 0.0
+        self._last_error = None
+        self._last_result = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Iniciar el worker en el event loop actual"""
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._worker(), name="backup-scheduler")
+        logger.info(f"🗄️ Programador de backups iniciado (ventana {self.debounce_seconds}s, "
+                    f"máximo {self.max_staleness_seconds}s sin respaldar)")
+
+    async def stop(self, flush=True):
+        """Detener el worker; con flush=True respalda antes los cambios pendientes"""
+        if not self.running:
+            return
+        if flush and self._pending_writes:
+            await self.flush_now()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def mark_dirty(self, reason="data_change"):
+        """Registrar una escritura. No bloquea: el backup ocurre después en el worker"""
+        now = time.monotonic()
+        if self._first_dirty_at is None:
+            self._first_dirty_at = now
+        self._last_dirty_at = now
+        self._pending_writes += 1
+        self._writes_total += 1
+        self._pending_reasons[reason] = self._pending_reasons.get(reason, 0) + 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush_now(self):
+        """Ejecutar el backup ya (aunque no haya cambios) y esperar su resultado"""
+        if not self.running:
+            return await self._run_backup(force=True)
+        future = asyncio.get_running_loop().create_future()
+        self._flush_waiters.append(future)
+        self._wakeup.set()
+        return await future
+
+    def _deadline(self):
+        """Momento en que debe correr el próximo backup (None si no hay cambios)"""
+        if self._first_dirty_at is None:
+            return None
+        return min(self._last_dirty_at + self.debounce_seconds,
+                   self._first_dirty_at + self.max_staleness_seconds)
+
+    async def _worker(self):
+        while True:
+            if self._flush_waiters:
+                waiters, self._flush_waiters = self._flush_waiters, []
+                result = await self._run_backup(force=True)
+                for future in waiters:
+                    if not future.done():
+                        future.set_result(result)
+                continue
+
+            deadline = self._deadline()
+            self._wakeup.clear()
+
+            if deadline is None:
+                await self._wakeup.wait()
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                # Nuevas escrituras o un flush despiertan al worker y recalculan la ventana
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run_backup()
+
+    async def _run_backup(self, force=False):
+        if not self._pending_writes and not force:
+            return None
+
+        # Tomar los cambios pendientes; lo que llegue durante el backup queda para el siguiente
+        first_dirty_at = self._first_dirty_at
+        writes = self._pending_writes
+        reasons = self._pending_reasons
+        self._first_dirty_at = None
+        self._last_dirty_at = None
+        self._pending_writes = 0
+        self._pending_reasons = {}
+
+        reason = "+".join(sorted(reasons)) if reasons else "manual_flush"
+        started = time.monotonic()
+        self._running_since = time.time()
+        try:
+            result = await self.backup_func(reason)
+            self._last_error = None
+            self._last_result = result
+        except Exception as e:
+            result = None
+            self._backups_failed += 1
+            self._last_error = str(e)
+            logger.error(f"❌ Error en backup programado ({reason}): {e}")
+        finally:
+            self._running_since = None
+
+        finished = time.monotonic()
+        self._backups_run += 1
+        self._writes_coalesced += max(writes - 1, 0)
+        self._last_backup_at = time.time()
+        self._last_duration = finished - started
+        if first_dirty_at is not None:
+            self._last_lag = finished - first_dirty_at
+            self._max_lag = max(self._max_lag, self._last_lag)
+
+        logger.info(f"✅ Backup programado completado: {writes} escrituras agrupadas "
+                    f"en {self._last_duration:.1f}s ({reason})")
+        return result
+
+    def metrics(self) -> dict:
+        """Estado de la cola y del retraso de los backups"""
+        now = time.monotonic()
+        return {
+            "running": self.running,
+            "backup_in_progress": self._running_since is not None,
+            "dirty": self._pending_writes > 0,
+            "pending_writes": self._pending_writes,
+            "pending_reasons": dict(self._pending_reasons),
+            "oldest_pending_age_seconds": round(now - self._first_dirty_at, 2) if self._first_dirty_at else 0.0,
+            "next_backup_in_seconds": round(max(self._deadline() - now, 0), 2) if self._first_dirty_at else None,
+            "debounce_seconds": self.debounce_seconds,
+            "max_staleness_seconds": self.max_staleness_seconds,
+            "backups_run": self._backups_run,
+            "backups_failed": self._backups_failed,
+            "writes_total": self._writes_total,
+            "writes_coalesced": self._writes_coalesced,
+            "last_backup_at": self._last_backup_at,
+            "last_duration_seconds": round(self._last_duration, 2) if self._last_duration is not None else None,
+            "last_lag_seconds": round(self._last_lag, 2) if self._last_lag is not None else None,
+            "max_lag_seconds": round(self._max_lag, 2),
+            "last_error": self._last_error,
+        }
+
+def create_scheduler_from_env(backup_func) -> BackupScheduler:
+    """Crear el programador usando BACKUP_DEBOUNCE_SECONDS / BACKUP_MAX_STALENESS_SECONDS"""
+    return BackupScheduler(
+        backup_func,
+        debounce_seconds=float(os.environ.get("BACKUP_DEBOUNCE_SECONDS", "30")),
+        max_staleness_seconds=float(os.environ.get("BACKUP_MAX_STALENESS_SECONDS", "300")),
+    )
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Backup Completo en Streaming (ZIP) para el Sistema Vehicular
+GET /backup/database armaba todo el ZIP en memoria (io.BytesIO) y el dump SQL dependía del binario
+sqlite3, que no está instalado en el contenedor. Aquí el ZIP se escribe a medida que se envía: el
+LEEME sale de inmediato, el dump se genera con iterdump() línea por línea y la copia .db se toma con
+la API de backup. Todo sale de una misma transacción de lectura (dump y .db son la misma foto de la
+base) y la memoria usada no depende del tamaño de la base.
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import zipfile
+
+from db_snapshot import snapshot_database
+
+logger = logging.getLogger(__name__)
+
+# Tamaño aproximado de cada bloque enviado al cliente
+CHUNK_SIZE = 64 * 1024
+
+class _Salida:
+    """Destino del ZIP sin seek: zipfile escribe aquí y el generador entrega lo acumulado"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.enviados = 0
+
+    def write(self, data):
+        self._buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        self.enviados += len(data)
+        return data
+
+class DatabaseBackupStream:
+    """ZIP con LEEME, dump SQL y copia .db de una misma transacción de lectura.
+
+    open() (en un hilo) fija la foto de la base y cuenta registros; chunks() genera los bytes del ZIP
+    y puede pasarse tal cual a StreamingResponse; close() libera la conexión (también al terminar).
+    """
+
+    def __init__(self, db_path, timestamp, tables, leeme, generado, chunk_size=CHUNK_SIZE):
+        self.db_path = db_path
+        self.tables = list(tables)
+        self.leeme = leeme
+        self.generado = generado
+        self.chunk_size = chunk_size
+
+        self.db_filename = f"vehicular_system_backup_{timestamp}.db"
+        self.leeme_filename = f"LEEME_backup_info_{timestamp}.txt"
+        self.dump_filename = f"vehicular_system_dump_{timestamp}.sql"
+
+        self.stats = {}
+        self.all_tables = []
+        self.snapshot = None
+        self._conn = None
+
+    def open(self) -> dict:
+        """Abrir la transacción de lectura y contar registros. Devuelve los conteos por tabla"""
+        # Conexión propia (no del pool): queda abierta mientras dure la descarga
+        self._conn = sqlite3.connect(f"file:{os.fspath(self.db_path)}?mode=ro", uri=True,
+                                     isolation_level=None, check_same_thread=False)
+        try:
+            self._conn.execute("BEGIN")
+            existentes = {row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            self.stats = {table: (self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                                  if table in existentes else 0)
+                          for table in self.tables}
+            self.all_tables = sorted(existentes)
+        except Exception:
+            self.close()
+            raise
+        return self.stats
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def chunks(self):
+        """Generador de bytes del ZIP (bloques de ~chunk_size)"""
+        salida = _Salida()
+        inicio = time.perf_counter()
+        try:
+            with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zipf:
+                # 1. LEEME: primeros bytes al cliente sin esperar al resto
+                zipf.writestr(self.leeme_filename, self.leeme(self.stats, self.all_tables, self.db_filename))
+                yield salida.take()
+
+                # 2. Dump SQL en el proceso (sin el binario sqlite3), escrito a medida que se genera
+                with zipf.open(self.dump_filename, "w", force_zip64=True) as dest:
+                    dest.write(f"-- DUMP SQL DEL SISTEMA DE GESTIÓN VEHICULAR\n"
+                               f"-- Generado el: {self.generado} (GMT-6)\n\n".encode("utf-8"))
+                    partes, tamano = [], 0
+                    for linea in self._conn.iterdump():
+                        partes.append(linea)
+                        tamano += len(linea) + 1
+                        if tamano >= self.chunk_size:
+                            dest.write(("\n".join(partes) + "\n").encode("utf-8"))
+                            partes, tamano = [], 0
+                            if len(salida) >= self.chunk_size:
+                                yield salida.take()
+                    if partes:
+                        dest.write(("\n".join(partes) + "\n").encode("utf-8"))
+                yield salida.take()
+
+                # 3. Copia .db de la misma transacción (archivo temporal en disco, no en memoria)
+                with tempfile.TemporaryDirectory(prefix="backup_stream_") as carpeta:
+                    copia = os.path.join(carpeta, self.db_filename)
+                    self.snapshot = snapshot_database(self._conn, copia)
+                    zinfo = zipfile.ZipInfo.from_file(copia, self.db_filename)
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                    with open(copia, "rb") as src, zipf.open(zinfo, "w") as dest:
+                        while True:
+                            bloque = src.read(self.chunk_size)
+                            if not bloque:
+                                break
+                            dest.write(bloque)
+                            if len(salida) >= self.chunk_size:
+                                yield salida.take()
+            # Directorio central del ZIP
+            yield salida.take()
+            segundos = time.perf_counter() - inicio
+            logger.info(f"✅ Backup completo enviado: {salida.enviados / 1048576:.1f} MB en {segundos:.2f}s "
+                        f"({sum(self.stats.values())} registros)")
+        finally:
+            self.close()
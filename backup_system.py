@@ -4,7 +4,6 @@ Sistema de Backup Automático para Base de Datos Vehicular
 Crear backups automáticos cada hora y mantener historial
 """
 
-import sqlite3
 import shutil
 import os
 import schedule
@@ -14,6 +13,8 @@ import logging
 import json
 import gzip
 
+from db_snapshot import snapshot_database, restore_database
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -64,13 +65,8 @@ class DatabaseBackupManager:
             backup_filename = f"vehicular_backup_{backup_type}_{timestamp}.db"
             backup_path = f"{BACKUP_CONFIG['backup_dir']}/{backup_type}/{backup_filename}"
             
-            # Crear backup usando sqlite3 backup API (más seguro que copy)
-            source_conn = sqlite3.connect(BACKUP_CONFIG["source_db"])
-            backup_conn = sqlite3.connect(backup_path)
-            
-            source_conn.backup(backup_conn)
-            source_conn.close()
-            backup_conn.close()
+            # Copia consistente por páginas con la API de backup de SQLite (más seguro que copy)
+            snapshot = snapshot_database(BACKUP_CONFIG["source_db"], backup_path)
             
             # Crear archivo de metadatos
             metadata = {
@@ -79,7 +75,8 @@ class DatabaseBackupManager:
                 "datetime": datetime.now().isoformat(),
                 "description": description,
                 "file_size": os.path.getsize(backup_path),
-                "source_file": BACKUP_CONFIG["source_db"]
+                "source_file": BACKUP_CONFIG["source_db"],
+                "snapshot": snapshot
             }
             
             metadata_path = backup_path.replace('.db', '.json')
@@ -172,8 +169,8 @@ class DatabaseBackupManager:
             else:
                 source_file = backup_path
             
-            # Restaurar base de datos
-            shutil.copy2(source_file, BACKUP_CONFIG["source_db"])
+            # Restaurar base de datos (las conexiones abiertas ven el cambio como una transacción)
+            restore_database(source_file, BACKUP_CONFIG["source_db"])
             
             # Limpiar archivo temporal
             if temp_file and os.path.exists(temp_file):
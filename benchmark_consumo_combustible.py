@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Benchmark de detección de consumo anormal de combustible: N+1 consultas vs una sola pasada
+Genera una flota sintética (por defecto 1.000 vehículos x 5 años de cargas) en una base temporal,
+ejecuta la implementación anterior (una consulta por vehículo) y check_abnormal_fuel_consumption()
+actual (una sola consulta para toda la flota) y verifica que ambas devuelvan las mismas alertas.
+
+Uso: python benchmark_consumo_combustible.py [--vehiculos 1000] [--anios 5] [--dias-entre-cargas 3]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import logging
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_NAME = "vehicular_system.db"
+
+def deteccion_anterior(cursor, hoy):
+    """Implementación original: DISTINCT placa y luego dos consultas por vehículo"""
+    try:
+        alertas = []
+        cursor.execute('''
+            SELECT DISTINCT placa FROM combustible
+            WHERE fecha >= ? AND kilometraje IS NOT NULL
+        ''', ((hoy - timedelta(days=60)).isoformat(),))
+        vehiculos_con_combustible = cursor.fetchall()
+
+        for vehiculo in vehiculos_con_combustible:
+            placa = vehiculo['placa']
+            cursor.execute('''
+                SELECT c.fecha, c.kilometraje, c.litros, c.costo
+                FROM combustible c
+                WHERE c.placa = ?
+                AND c.fecha >= ?
+                AND c.kilometraje IS NOT NULL
+                ORDER BY c.fecha ASC, c.id ASC
+            ''', (placa, (hoy - timedelta(days=60)).isoformat()))
+            registros = cursor.fetchall()
+            consumos = []
+
+            for i in range(1, len(registros)):
+                registro_actual = registros[i]
+                registro_anterior = registros[i-1]
+                km_recorridos = registro_actual['kilometraje'] - registro_anterior['kilometraje']
+                if km_recorridos > 0:
+                    rendimiento = km_recorridos / registro_actual['litros']
+                    consumos.append({
+                        'fecha': registro_actual['fecha'],
+                        'rendimiento': rendimiento,
+                        'km_recorridos': km_recorridos,
+                        'litros': registro_actual['litros']
+                    })
+
+            if len(consumos) >= 3:
+                rendimientos = [c['rendimiento'] for c in consumos]
+                promedio = sum(rendimientos) / len(rendimientos)
+                ultimos_3 = consumos[-3:]
+                promedio_reciente = sum(c['rendimiento'] for c in ultimos_3) / len(ultimos_3)
+                if promedio_reciente < promedio * 0.75:
+                    cursor.execute('SELECT marca, modelo FROM vehiculos WHERE placa = ?', (placa,))
+                    vehiculo_info = cursor.fetchone()
+                    alertas.append({
+                        'placa': placa,
+                        'marca': vehiculo_info['marca'] if vehiculo_info else 'N/A',
+                        'modelo': vehiculo_info['modelo'] if vehiculo_info else 'N/A',
+                        'promedio_historico': round(promedio, 2),
+                        'promedio_reciente': round(promedio_reciente, 2),
+                        'deterioro_porcentaje': round(((promedio - promedio_reciente) / promedio) * 100, 1),
+                        'ultimo_registro': ultimos_3[-1]['fecha']
+                    })
+        return alertas
+    except Exception as e:
+        print(f"❌ Error en la implementación anterior: {e}")
+        return []
+
+def generar_flota(db_path, vehiculos, anios, dias_entre_cargas, hoy, seed=42):
+    """Crear el esquema con las migraciones y poblar vehiculos/combustible"""
+    from db_migrations import apply_migrations
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    apply_migrations(conn)
+
+    placas = [f"BEN{i:04d}" for i in range(vehiculos)]
+    # Algunas cargas de placas sin vehículo registrado (marca/modelo 'N/A')
+    registradas = placas[:-max(vehiculos // 100, 1)]
+    conn.executemany(
+        "INSERT INTO vehiculos (placa, marca, modelo, ano, color, propietario) VALUES (?, ?, ?, ?, ?, ?)",
+        ((placa, rng.choice(["Toyota", "Nissan", "Isuzu"]), rng.choice(["Hilux", "Frontier", "D-Max"]),
+          2018, "Blanco", "Hotel") for placa in registradas)
+    )
+    conn.execute("PRAGMA foreign_keys = OFF")
+
+    inicio = hoy - timedelta(days=365 * anios)
+    cargas = []
+    for placa in placas:
+        km = rng.randint(1000, 50000)
+        rendimiento_base = rng.uniform(7, 14)
+        # ~10% de la flota empeora en el último mes
+        deteriora = rng.random() < 0.10
+        dia = inicio + timedelta(days=rng.randint(0, dias_entre_cargas))
+        while dia <= hoy:
+            litros = round(rng.uniform(25, 60), 2)
+            rendimiento = rendimiento_base * rng.uniform(0.9, 1.1)
+            if deteriora and (hoy - dia).days < 30:
+                rendimiento *= 0.55
+            km += int(litros * rendimiento)
+            cargas.append((dia.isoformat(), placa, litros, litros * 650, km, "Benchmark"))
+            # A veces dos cargas el mismo día (el desempate por id importa)
+            if rng.random() > 0.05:
+                dia += timedelta(days=rng.randint(1, dias_entre_cargas * 2 - 1))
+
+    # Insertar en orden cronológico, como se registran en producción
+    cargas.sort(key=lambda carga: carga[0])
+    conn.executemany(
+        "INSERT INTO combustible (fecha, placa, litros, costo, kilometraje, estacion) VALUES (?, ?, ?, ?, ?, ?)",
+        cargas
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return len(cargas)
+
+def medir(func, conn, hoy, repeticiones):
+    """Mejor tiempo de N ejecuciones y el último resultado"""
+    mejor = float("inf")
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = func(conn.cursor(), hoy)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Detección de consumo anormal: N+1 vs una sola pasada")
+    parser.add_argument("--vehiculos", type=int, default=1000)
+    parser.add_argument("--anios", type=int, default=5)
+    parser.add_argument("--dias-entre-cargas", type=int, default=3)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    hoy = date(2025, 9, 1)
+    work_dir = tempfile.mkdtemp(prefix="bench_combustible_")
+    print("🚀 === BENCHMARK: CONSUMO ANORMAL DE COMBUSTIBLE ===")
+
+    try:
+        inicio = time.perf_counter()
+        filas = generar_flota(os.path.join(work_dir, DB_NAME), args.vehiculos, args.anios,
+                              args.dias_entre_cargas, hoy)
+        print(f"📦 {args.vehiculos} vehículos, {filas:,} cargas en {args.anios} años "
+              f"(generado en {time.perf_counter() - inicio:.1f}s)")
+
+        # main.py usa la base del directorio actual
+        os.chdir(work_dir)
+        sys.path.insert(0, REPO_DIR)
+        logging.disable(logging.CRITICAL)
+        from alert_engine import check_abnormal_fuel_consumption
+
+        # Misma configuración de conexión que el servidor (PRAGMAs del pool)
+        from main import db_pool
+        conn = db_pool.acquire()
+
+        t_anterior, anterior = medir(deteccion_anterior, conn, hoy, args.repeticiones)
+        t_actual, actual = medir(check_abnormal_fuel_consumption, conn, hoy, args.repeticiones)
+        conn.close()
+
+        print(f"\n📊 Mejor de {args.repeticiones} ejecuciones")
+        print(f"   anterior (N+1)     {t_anterior * 1000:9.1f} ms  {len(anterior)} alertas")
+        print(f"   una sola pasada    {t_actual * 1000:9.1f} ms  {len(actual)} alertas")
+        print(f"\n🎯 Aceleración: {t_anterior / t_actual:.1f}x")
+
+        # El orden de DISTINCT depende del plan de consulta; se compara por placa
+        por_placa = lambda alertas: sorted(alertas, key=lambda a: a['placa'])
+        if por_placa(anterior) == por_placa(actual):
+            print("✅ Resultados idénticos")
+        else:
+            print("❌ Los resultados difieren")
+            sys.exit(1)
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
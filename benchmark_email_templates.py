@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Benchmark de render de emails de alertas: concatenación por fila vs plantillas precompiladas
+Genera un resumen sintético con N alertas repartidas entre todas las categorías (por defecto 600)
+y mide la implementación anterior (html += f"..." por fila, strptime por fecha) contra
+render_resumen_alertas() (plantillas compiladas al importar, un join por tabla, HTML + texto plano).
+
+Uso: python benchmark_email_templates.py [--alertas 600] [--repeticiones 20]
+"""
+
+import time
+import random
+import argparse
+from datetime import date, datetime, timedelta
+
+from email_templates import NOMBRES_CATEGORIA_ALERTA, render_resumen_alertas
+
+def resumen_anterior(alertas_mant_fecha, alertas_mant_km, alertas_polizas,
+                     alertas_rtv, alertas_revisiones_fallas, alertas_combustible_anormal, hoy,
+                     resueltas=None, titulo="Reporte Completo de Alertas"):
+    """Implementación original: html += f"..." por fila y datetime.strptime por fecha"""
+    html = f"""
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; margin: 0; padding: 0; }}
+            .header {{ background-color: #d32f2f; color: white; padding: 20px; text-align: center; }}
+            .content {{ padding: 20px; }}
+            .alert-section {{ margin-bottom: 30px; }}
+            .alert-title {{ background-color: #f5f5f5; color: #333; padding: 12px; margin: 15px 0 10px 0; 
+                          border-left: 4px solid #ff9800; font-weight: bold; font-size: 16px; }}
+            .alert {{ background-color: #fff3cd; border: 1px solid #ffeaa7; padding: 12px; margin: 8px 0; 
+                     border-radius: 5px; }}
+            .urgent {{ background-color: #f8d7da; border-color: #f5c6cb; }}
+            .critical {{ background-color: #f5c6cb; border-color: #dc3545; }}
+            table {{ width: 100%; border-collapse: collapse; margin: 10px 0; }}
+            th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; font-size: 13px; }}
+            th {{ background-color: #f2f2f2; font-weight: bold; }}
+            .summary {{ background-color: #e3f2fd; padding: 15px; border-radius: 5px; margin: 20px 0; }}
+            .footer {{ font-size: 12px; color: #666; margin-top: 30px; border-top: 1px solid #ddd; 
+                      padding-top: 15px; }}
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>🚨 SISTEMA DE GESTIÓN VEHICULAR</h1>
+            <h2>{titulo} - {hoy.strftime('%d/%m/%Y')}</h2>
+        </div>
+        <div class="content">
+    """
+    
+    total_alertas = (len(alertas_mant_fecha) + len(alertas_mant_km) + len(alertas_polizas) + 
+                    len(alertas_rtv) + len(alertas_revisiones_fallas) + len(alertas_combustible_anormal))
+                    
+    html += f"""
+            <div class="summary">
+                <h3>📊 RESUMEN DE ALERTAS</h3>
+                <ul>
+                    <li><strong>Mantenimientos por fecha:</strong> {len(alertas_mant_fecha)}</li>
+                    <li><strong>Mantenimientos por kilometraje:</strong> {len(alertas_mant_km)}</li>
+                    <li><strong>Pólizas próximas a vencer:</strong> {len(alertas_polizas)}</li>
+                    <li><strong>RTV próximas a vencer:</strong> {len(alertas_rtv)}</li>
+                    <li><strong>Revisiones con fallas:</strong> {len(alertas_revisiones_fallas)}</li>
+                    <li><strong>Consumo anormal de combustible:</strong> {len(alertas_combustible_anormal)}</li>
+                </ul>
+                <p><strong>TOTAL DE ALERTAS: {total_alertas}</strong></p>
+            </div>
+    """
+    if resueltas:
+        html = html.replace("</ul>", f"<li><strong>Alertas resueltas:</strong> {len(resueltas)}</li></ul>", 1)
+    
+    # ALERTAS DE MANTENIMIENTO
+    if alertas_mant_fecha or alertas_mant_km:
+        html += '<div class="alert-section">'
+        html += '<div class="alert-title">🔧 ALERTAS DE MANTENIMIENTO</div>'
+        
+        if alertas_mant_fecha:
+            html += "<h4>📅 Por Fecha Próxima</h4>"
+            html += "<table><tr><th>Placa</th><th>Tipo</th><th>Fecha Programada</th><th>Días Restantes</th></tr>"
+            for alerta in alertas_mant_fecha:
+                dias_restantes = (datetime.strptime(alerta['proxima_fecha'], '%Y-%m-%d').date() - hoy).days
+                urgente = "urgent" if dias_restantes <= 3 else "critical" if dias_restantes <= 0 else ""
+                html += f"<tr class='{urgente}'><td>{alerta['placa']}</td><td>{alerta['tipo']}</td><td>{alerta['proxima_fecha']}</td><td>{dias_restantes} días</td></tr>"
+            html += "</table>"
+        
+        if alertas_mant_km:
+            html += "<h4>🛣️ Por Kilometraje Próximo</h4>"
+            html += "<table><tr><th>Placa</th><th>Tipo</th><th>Km Actual</th><th>Próximo Servicio</th><th>Km Restantes</th></tr>"
+            for alerta in alertas_mant_km:
+                km_restantes = alerta['proximo_km'] - alerta['km_actual']
+                urgente = "urgent" if km_restantes <= 200 else "critical" if km_restantes <= 0 else ""
+                html += f"<tr class='{urgente}'><td>{alerta['placa']}</td><td>{alerta['tipo']}</td><td>{alerta['km_actual']:,}</td><td>{alerta['proximo_km']:,}</td><td>{km_restantes:,} km</td></tr>"
+            html += "</table>"
+        
+        html += '</div>'
+    
+    # ALERTAS DE PÓLIZAS
+    if alertas_polizas:
+        html += '<div class="alert-section">'
+        html += '<div class="alert-title">🛡️ PÓLIZAS PRÓXIMAS A VENCER</div>'
+        html += "<table><tr><th>Placa</th><th>Vehículo</th><th>Número Póliza</th><th>Aseguradora</th><th>Vencimiento</th><th>Días Restantes</th></tr>"
+        for poliza in alertas_polizas:
+            dias_restantes = (datetime.strptime(poliza['fecha_vencimiento'], '%Y-%m-%d').date() - hoy).days
+            urgente = "urgent" if dias_restantes <= 7 else "critical" if dias_restantes <= 0 else ""
+            html += f"<tr class='{urgente}'><td>{poliza['placa']}</td><td>{poliza['marca']} {poliza['modelo']}</td><td>{poliza['numero_poliza']}</td><td>{poliza['aseguradora']}</td><td>{poliza['fecha_vencimiento']}</td><td>{dias_restantes} días</td></tr>"
+        html += "</table>"
+        html += '</div>'
+    
+    # ALERTAS DE RTV
+    if alertas_rtv:
+        html += '<div class="alert-section">'
+        html += '<div class="alert-title">🔍 RTV PRÓXIMAS A VENCER</div>'
+        html += "<table><tr><th>Placa</th><th>Vehículo</th><th>Número Cita</th><th>Vencimiento</th><th>Días Restantes</th></tr>"
+        for rtv in alertas_rtv:
+            dias_restantes = (datetime.strptime(rtv['fecha_vencimiento'], '%Y-%m-%d').date() - hoy).days
+            urgente = "urgent" if dias_restantes <= 7 else "critical" if dias_restantes <= 0 else ""
+            html += f"<tr class='{urgente}'><td>{rtv['placa']}</td><td>{rtv['marca']} {rtv['modelo']}</td><td>{rtv['numero_cita']}</td><td>{rtv['fecha_vencimiento']}</td><td>{dias_restantes} días</td></tr>"
+        html += "</table>"
+        html += '</div>'
+    
+    # ALERTAS DE REVISIONES CON FALLAS
+    if alertas_revisiones_fallas:
+        html += '<div class="alert-section">'
+        html += '<div class="alert-title">⚠️ REVISIONES CON FALLAS REPORTADAS</div>'
+        html += "<table><tr><th>Placa</th><th>Vehículo</th><th>Fecha</th><th>Inspector</th><th>Fallas Detectadas</th></tr>"
+        for revision in alertas_revisiones_fallas:
+            fallas = []
+            if revision['estado_motor'] != 'Bueno': fallas.append(f"Motor: {revision['estado_motor']}")
+            if revision['estado_frenos'] != 'Bueno': fallas.append(f"Frenos: {revision['estado_frenos']}")
+            if revision['estado_luces'] != 'Bueno': fallas.append(f"Luces: {revision['estado_luces']}")
+            if revision['estado_llantas'] != 'Bueno': fallas.append(f"Llantas: {revision['estado_llantas']}")
+            if revision['estado_carroceria'] != 'Bueno': fallas.append(f"Carrocería: {revision['estado_carroceria']}")
+            
+            fallas_str = "<br>".join(fallas) if fallas else "Revisión no aprobada"
+            html += f"<tr class='critical'><td>{revision['placa']}</td><td>{revision['marca']} {revision['modelo']}</td><td>{revision['fecha']}</td><td>{revision['inspector']}</td><td>{fallas_str}</td></tr>"
+        html += "</table>"
+        html += '</div>'
+    
+    # ALERTAS DE COMBUSTIBLE ANORMAL
+    if alertas_combustible_anormal:
+        html += '<div class="alert-section">'
+        html += '<div class="alert-title">⛽ VARIACIONES ANORMALES EN COMBUSTIBLE</div>'
+        html += "<table><tr><th>Placa</th><th>Vehículo</th><th>Rendimiento Histórico</th><th>Rendimiento Reciente</th><th>Deterioro</th><th>Último Registro</th></tr>"
+        for combustible in alertas_combustible_anormal:
+            html += f"<tr class='urgent'><td>{combustible['placa']}</td><td>{combustible['marca']} {combustible['modelo']}</td><td>{combustible['promedio_historico']} km/L</td><td>{combustible['promedio_reciente']} km/L</td><td>-{combustible['deterioro_porcentaje']}%</td><td>{combustible['ultimo_registro']}</td></tr>"
+        html += "</table>"
+        html += '<p><strong>Nota:</strong> Se considera anormal cuando el rendimiento reciente es 25% menor al histórico.</p>'
+        html += '</div>'
+    
+    # ALERTAS RESUELTAS DESDE EL ÚLTIMO AVISO
+    if resueltas:
+        html += '<div class="alert-section">'
+        html += '<div class="alert-title">✅ ALERTAS RESUELTAS</div>'
+        html += "<table><tr><th>Categoría</th><th>Placa</th><th>Detalle</th><th>Resuelta</th></tr>"
+        for resuelta in resueltas:
+            datos = resuelta['datos']
+            detalle = datos.get('tipo') or datos.get('numero_poliza') or datos.get('numero_cita') or datos.get('fecha') or ''
+            html += f"<tr><td>{NOMBRES_CATEGORIA_ALERTA.get(resuelta['categoria'], resuelta['categoria'])}</td><td>{resuelta['placa']}</td><td>{detalle}</td><td>{resuelta['resolved_at']}</td></tr>"
+        html += "</table>"
+        html += '</div>'
+    
+    html += """
+            <div class="footer">
+                <p><strong>⚡ ACCIONES RECOMENDADAS:</strong></p>
+                <ul>
+                    <li>Revisar inmediatamente las alertas marcadas como CRÍTICAS (en rojo)</li>
+                    <li>Programar mantenimientos pendientes</li>
+                    <li>Renovar pólizas y RTV próximas a vencer</li>
+                    <li>Investigar fallas reportadas en revisiones</li>
+                    <li>Evaluar vehículos con consumo anormal de combustible</li>
+                </ul>
+                <hr>
+                <p><small>Este es un mensaje automático del Sistema de Gestión Vehicular.<br>
+                Para más detalles, acceda al sistema en línea.</small></p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+    
+    return html
+
+def generar_alertas(total, hoy, seed=42):
+    """Alertas sintéticas con la forma de alertas_activas, repartidas entre las seis categorías"""
+    rng = random.Random(seed)
+    marcas = [("Toyota", "Hilux"), ("Nissan", "Frontier"), ("Isuzu", "D-Max")]
+    categorias = {nombre: [] for nombre in ("mant_fecha", "mant_km", "polizas", "rtv", "revisiones", "combustible")}
+    for i in range(total):
+        placa = f"BEN{i % 1000:04d}"
+        marca, modelo = rng.choice(marcas)
+        fecha = (hoy + timedelta(days=rng.randint(-5, 30))).isoformat()
+        categoria = list(categorias)[i % len(categorias)]
+        if categoria == "mant_fecha":
+            alerta = {"placa": placa, "tipo": "Cambio de aceite", "proxima_fecha": fecha}
+        elif categoria == "mant_km":
+            km_actual = rng.randint(10000, 90000)
+            alerta = {"placa": placa, "tipo": "Rotación de llantas", "km_actual": km_actual,
+                      "proximo_km": km_actual + rng.randint(-100, 1500)}
+        elif categoria == "polizas":
+            alerta = {"placa": placa, "marca": marca, "modelo": modelo, "numero_poliza": f"POL-{i}",
+                      "aseguradora": "INS", "fecha_vencimiento": fecha}
+        elif categoria == "rtv":
+            alerta = {"placa": placa, "marca": marca, "modelo": modelo, "numero_cita": f"RTV-{i}",
+                      "fecha_vencimiento": fecha}
+        elif categoria == "revisiones":
+            alerta = {"placa": placa, "marca": marca, "modelo": modelo, "fecha": fecha, "inspector": "Inspector",
+                      "estado_motor": "Bueno", "estado_frenos": rng.choice(["Bueno", "Regular"]),
+                      "estado_luces": "Bueno", "estado_llantas": rng.choice(["Bueno", "Malo"]),
+                      "estado_carroceria": "Bueno"}
+        else:
+            historico = round(rng.uniform(9, 13), 2)
+            reciente = round(historico * rng.uniform(0.5, 0.74), 2)
+            alerta = {"placa": placa, "marca": marca, "modelo": modelo, "promedio_historico": historico,
+                      "promedio_reciente": reciente,
+                      "deterioro_porcentaje": round((historico - reciente) / historico * 100, 1),
+                      "ultimo_registro": fecha}
+        categorias[categoria].append(alerta)
+    return list(categorias.values())
+
+def medir(func, args, hoy, repeticiones):
+    """Mejor tiempo de N ejecuciones y el último resultado"""
+    mejor = float("inf")
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = func(*args, hoy)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Render del resumen de alertas: concatenación vs plantillas")
+    parser.add_argument("--alertas", type=int, default=600)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    hoy = date(2025, 9, 1)
+    categorias = generar_alertas(args.alertas, hoy)
+    print("🚀 === BENCHMARK: RENDER DE EMAILS DE ALERTAS ===")
+    print(f"📦 {args.alertas} alertas: " + ", ".join(f"{len(c)}" for c in categorias) +
+          " (mant. fecha, mant. km, pólizas, RTV, revisiones, combustible)")
+
+    t_anterior, anterior = medir(resumen_anterior, categorias, hoy, args.repeticiones)
+    t_actual, actual = medir(render_resumen_alertas, categorias, hoy, args.repeticiones)
+
+    print(f"\n📊 Mejor de {args.repeticiones} ejecuciones")
+    print(f"   anterior (+= por fila)     {t_anterior * 1000:8.2f} ms  {len(anterior) / 1024:7.1f} KB HTML")
+    print(f"   plantillas (HTML + texto)  {t_actual * 1000:8.2f} ms  {len(actual.html) / 1024:7.1f} KB HTML"
+          f" + {len(actual.text) / 1024:.1f} KB texto")
+    print(f"   por alerta                 {t_anterior / args.alertas * 1e6:8.2f} µs -> "
+          f"{t_actual / args.alertas * 1e6:.2f} µs")
+    print(f"\n🎯 Aceleración: {t_anterior / t_actual:.1f}x (incluyendo la versión en texto plano)")
+
+    # Mismas filas en ambas versiones (la nueva además escapa los valores)
+    filas_anterior = anterior.count("<tr")
+    filas_actual = actual.html.count("<tr")
+    if filas_anterior == filas_actual and actual.text.count("\n- ") >= args.alertas:
+        print(f"✅ Mismas filas ({filas_actual} <tr>) y texto plano completo")
+    else:
+        print(f"❌ Filas distintas: anterior {filas_anterior}, plantillas {filas_actual}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
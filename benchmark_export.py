@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Benchmark de exportación JSON/CSV/SQL: todo en memoria vs motor en streaming (db_export)
+Genera una base temporal con N filas (por defecto 1.000.000) repartidas entre combustible,
+bitácora y mantenimientos, y exporta los tres formatos con la implementación anterior (lista de
+diccionarios + json.dump(indent=2), CSV desde esos diccionarios, iterdump) y con export_database()
+en uno y varios hilos. Cada variante corre en un proceso aparte para medir su pico de memoria, y
+se verifica que las filas exportadas sean las mismas.
+
+Uso: python benchmark_export.py [--filas 1000000] [--workers 4] [--sin-verificar]
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import sqlite3
+import hashlib
+import logging
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from datetime import date, timedelta
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TABLAS = ['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora']
+
+def exportacion_anterior(db_path, out_dir):
+    """Implementación original: cada tabla como lista de diccionarios, json.dump de todo junto"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    export_data = {"metadata": {"export_date": "benchmark"}, "tables": {}}
+    for table in TABLAS:
+        rows = conn.execute(f"SELECT * FROM {table}").fetchall()
+        export_data["tables"][table] = [dict(row) for row in rows]
+    with open(os.path.join(out_dir, "export.json"), 'w', encoding='utf-8') as f:
+        json.dump(export_data, f, indent=2, ensure_ascii=False, default=str)
+
+    # CSV desde los mismos diccionarios (csv.DictWriter, como el backup de GitHub)
+    os.makedirs(os.path.join(out_dir, "csv"), exist_ok=True)
+    for table, data in export_data["tables"].items():
+        with open(os.path.join(out_dir, "csv", f"{table}.csv"), 'w', newline='', encoding='utf-8') as csvfile:
+            if data:
+                writer = csv.DictWriter(csvfile, fieldnames=list(data[0].keys()))
+                writer.writeheader()
+                writer.writerows(data)
+
+    with open(os.path.join(out_dir, "dump.sql"), 'w', encoding='utf-8') as f:
+        for line in conn.iterdump():
+            f.write(f"{line}\n")
+    conn.close()
+
+def exportacion_streaming(db_path, out_dir, workers):
+    from db_export import export_database
+    export_database(db_path, json_path=os.path.join(out_dir, "export.json"),
+                    csv_dir=os.path.join(out_dir, "csv"), sql_path=os.path.join(out_dir, "dump.sql"),
+                    tables=TABLAS, workers=workers, json_header={"metadata": {"export_date": "benchmark"}})
+
+def _ejecutar(variante, db_path, out_dir, workers, cola):
+    """Proceso hijo: una variante, con su tiempo y su pico de memoria (RSS)"""
+    sys.path.insert(0, REPO_DIR)
+    logging.disable(logging.CRITICAL)
+    os.makedirs(out_dir, exist_ok=True)
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    inicio = time.perf_counter()
+    if variante == "anterior":
+        exportacion_anterior(db_path, out_dir)
+    else:
+        exportacion_streaming(db_path, out_dir, workers)
+    segundos = time.perf_counter() - inicio
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cola.put((segundos, base / 1024, pico / 1024))
+
+def generar_base(db_path, filas, seed=42):
+    """Esquema con las migraciones y filas sintéticas: 60% combustible, 30% bitácora, 10% mantenimientos"""
+    from db_migrations import apply_migrations
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    apply_migrations(conn)
+    placas = [f"BEN{i:04d}" for i in range(200)]
+    conn.executemany(
+        "INSERT INTO vehiculos (placa, marca, modelo, ano, color, propietario) VALUES (?, ?, ?, ?, ?, ?)",
+        ((placa, "Toyota", "Hilux", 2020, "Blanco", "Hotel") for placa in placas)
+    )
+    inicio = date(2020, 1, 1)
+    fecha = lambda i: (inicio + timedelta(days=i % 2000)).isoformat()
+
+    conn.executemany(
+        "INSERT INTO combustible (fecha, placa, litros, costo, kilometraje, estacion) VALUES (?, ?, ?, ?, ?, ?)",
+        ((fecha(i), rng.choice(placas), round(rng.uniform(25, 60), 2), rng.uniform(10000, 40000),
+          rng.randint(1000, 300000), "Estación Ñandú #%d" % (i % 40)) for i in range(filas * 6 // 10))
+    )
+    conn.executemany(
+        "INSERT INTO bitacora (placa, chofer, fecha_salida, km_salida, nivel_combustible_salida, "
+        "estado_vehiculo_salida, fecha_retorno, km_retorno, estado, observaciones) "
+        "VALUES (?, ?, ?, ?, '3/4', 'Bueno', ?, ?, ?, ?)",
+        ((rng.choice(placas), f"Chofer {i % 50}", f"{fecha(i)} 08:00:00", i, f"{fecha(i)} 17:00:00" if i % 9 else None,
+          i + 120 if i % 9 else None, "finalizado" if i % 9 else "en_curso",
+          'Ruta "aeropuerto", ida y vuelta' if i % 7 == 0 else None) for i in range(filas * 3 // 10))
+    )
+    conn.executemany(
+        "INSERT INTO mantenimientos (fecha, placa, tipo, descripcion, costo, kilometraje) VALUES (?, ?, ?, ?, ?, ?)",
+        ((fecha(i), rng.choice(placas), "Preventivo", "Cambio de aceite\ny filtros", rng.uniform(20000, 90000),
+          rng.randint(1000, 300000)) for i in range(filas - filas * 6 // 10 - filas * 3 // 10))
+    )
+    # Sin el registro de cambios generado por la carga: el benchmark mide las tablas de negocio
+    conn.execute("DELETE FROM change_log")
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+
+def huella_json(path):
+    """Hash de las filas de cada tabla (independiente del formato del archivo)"""
+    with open(path, encoding='utf-8') as f:
+        tablas = json.load(f)["tables"]
+    return {table: hashlib.sha256("\n".join(json.dumps(row, sort_keys=True) for row in rows).encode()).hexdigest()
+            for table, rows in tablas.items()}
+
+def huella_sql(path):
+    """Hash de los INSERT de las tablas exportadas (el orden de las tablas puede variar)"""
+    with open(path, encoding='utf-8') as f:
+        inserts = sorted(line for line in f
+                         if line.startswith("INSERT INTO") and line.split('"')[1] in TABLAS)
+    return hashlib.sha256("".join(inserts).encode()).hexdigest(), len(inserts)
+
+def huella_csv(carpeta):
+    filas = {}
+    for table in TABLAS:
+        path = os.path.join(carpeta, f"{table}.csv")
+        with open(path, newline='', encoding='utf-8') as f:
+            # Fila de encabezado aparte (la versión anterior no escribía CSV de tablas vacías)
+            filas[table] = max(sum(1 for _ in csv.reader(f)) - 1, 0)
+    return filas
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportación JSON/CSV/SQL: en memoria vs streaming")
+    parser.add_argument("--filas", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--sin-verificar", action="store_true", help="No comparar los archivos exportados")
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_DIR)
+    work_dir = tempfile.mkdtemp(prefix="bench_export_")
+    db_path = os.path.join(work_dir, "vehicular_system.db")
+    print("🚀 === BENCHMARK: EXPORTACIÓN JSON / CSV / SQL ===")
+
+    try:
+        inicio = time.perf_counter()
+        generar_base(db_path, args.filas)
+        print(f"📦 {args.filas:,} filas, base de {os.path.getsize(db_path) / 1048576:.0f} MB "
+              f"(generada en {time.perf_counter() - inicio:.1f}s)")
+
+        contexto = multiprocessing.get_context("spawn")
+        variantes = [("anterior", "anterior (en memoria)", 1),
+                     ("streaming", "streaming, 1 hilo", 1),
+                     ("streaming", f"streaming, {args.workers} hilos", args.workers)]
+        resultados = []
+        for indice, (variante, nombre, workers) in enumerate(variantes):
+            out_dir = os.path.join(work_dir, f"out{indice}")
+            cola = contexto.Queue()
+            proceso = contexto.Process(target=_ejecutar, args=(variante, db_path, out_dir, workers, cola))
+            proceso.start()
+            segundos, base, pico = cola.get()
+            proceso.join()
+            resultados.append((nombre, out_dir, segundos, pico - base))
+
+        print(f"\n📊 JSON + CSV + SQL de {args.filas:,} filas ({os.cpu_count()} CPU)")
+        for nombre, out_dir, segundos, memoria in resultados:
+            print(f"   {nombre:24} {segundos:7.1f} s  {args.filas / segundos:10,.0f} filas/s  "
+                  f"pico de memoria +{memoria:7.1f} MB")
+        anterior, streaming = resultados[0], resultados[1]
+        print(f"\n🎯 Memoria: {anterior[3]:.0f} MB → {streaming[3]:.0f} MB; "
+              f"tiempo: {anterior[2] / streaming[2]:.1f}x (1 hilo), "
+              f"{anterior[2] / resultados[2][2]:.1f}x ({args.workers} hilos)")
+
+        if not args.sin_verificar:
+            referencia = (huella_json(os.path.join(anterior[1], "export.json")),
+                          huella_sql(os.path.join(anterior[1], "dump.sql")),
+                          huella_csv(os.path.join(anterior[1], "csv")))
+            for nombre, out_dir, _, _ in resultados[1:]:
+                actual = (huella_json(os.path.join(out_dir, "export.json")),
+                          huella_sql(os.path.join(out_dir, "dump.sql")),
+                          huella_csv(os.path.join(out_dir, "csv")))
+                if actual != referencia:
+                    print(f"❌ {nombre}: los archivos exportados difieren")
+                    sys.exit(1)
+            print("✅ Mismas filas en JSON, CSV y SQL")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga: latencia p99 de las lecturas mientras corre un backup o un escaneo de alertas
+Levanta el servidor sobre una copia de la base de datos, mide la latencia de GET /vehiculos y
+GET /stats en reposo y luego con /backup/database y /alertas/verificar ejecutándose en bucle.
+Si el trabajo bloqueante estuviera en el event loop, el p99 con carga se dispararía.
+
+Uso: python benchmark_latencia_event_loop.py [--segundos 10] [--clientes 16] [--filas 200000]
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_NAME = "vehicular_system.db"
+LECTURAS = ["/vehiculos", "/stats"]
+TAREAS_PESADAS = ["/backup/database", "/alertas/verificar"]
+
+def preparar_directorio(filas):
+    """Copiar la app y la base de datos a un directorio temporal y engordar la tabla combustible"""
+    work_dir = tempfile.mkdtemp(prefix="bench_loop_")
+    for name in os.listdir(REPO_DIR):
+        if name.endswith(".py") or name in ("index.html", DB_NAME):
+            shutil.copy2(os.path.join(REPO_DIR, name), work_dir)
+
+    conn = sqlite3.connect(os.path.join(work_dir, DB_NAME))
+    placas = [row[0] for row in conn.execute("SELECT placa FROM vehiculos")] or ["BENCH-1"]
+    conn.executemany(
+        "INSERT INTO combustible (fecha, placa, litros, costo, kilometraje, estacion) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (f"2024-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}", placas[i % len(placas)], 40.0, 25000.0, i * 10, "Benchmark")
+            for i in range(filas)
+        )
+    )
+    conn.commit()
+    conn.close()
+    print(f"📦 Base de datos de prueba: {work_dir} (+{filas} registros de combustible)")
+    return work_dir
+
+def iniciar_servidor(work_dir, port):
+    """Levantar uvicorn con un solo worker (un solo event loop)"""
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if requests.get(f"{base_url}/api", timeout=1).ok:
+                return proc, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("El servidor no respondió a tiempo")
+
+def medir_lecturas(base_url, segundos, clientes):
+    """Lanzar lecturas concurrentes durante N segundos y devolver las latencias en ms"""
+    latencias = []
+    lock = threading.Lock()
+    fin = time.monotonic() + segundos
+
+    def cliente(idx):
+        session = requests.Session()
+        path = LECTURAS[idx % len(LECTURAS)]
+        propias = []
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            session.get(f"{base_url}{path}", timeout=30)
+            propias.append((time.perf_counter() - inicio) * 1000)
+        with lock:
+            latencias.extend(propias)
+
+    with ThreadPoolExecutor(max_workers=clientes) as pool:
+        list(pool.map(cliente, range(clientes)))
+    return latencias
+
+def tareas_pesadas_en_bucle(base_url, detener, contador):
+    """Ejecutar backups y escaneos de alertas sin pausa hasta que se indique detener"""
+    session = requests.Session()
+    i = 0
+    while not detener.is_set():
+        session.get(f"{base_url}{TAREAS_PESADAS[i % len(TAREAS_PESADAS)]}", timeout=120)
+        contador[TAREAS_PESADAS[i % len(TAREAS_PESADAS)]] += 1
+        i += 1
+
+def resumen(nombre, latencias):
+    """Imprimir percentiles de latencia"""
+    ordenadas = sorted(latencias)
+    def pct(p):
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+    datos = {
+        "requests": len(ordenadas),
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "max": ordenadas[-1],
+        "media": statistics.fmean(ordenadas),
+    }
+    print(f"   {nombre:<22} n={datos['requests']:<6} p50={datos['p50']:7.1f}ms  "
+          f"p95={datos['p95']:7.1f}ms  p99={datos['p99']:7.1f}ms  max={datos['max']:7.1f}ms")
+    return datos
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia p99 durante backups y escaneos de alertas")
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--clientes", type=int, default=16)
+    parser.add_argument("--filas", type=int, default=200000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print("🚀 === PRUEBA DE CARGA: LATENCIA DEL EVENT LOOP ===")
+    work_dir = preparar_directorio(args.filas)
+    proc, base_url = iniciar_servidor(work_dir, args.port)
+
+    try:
+        # Calentar conexiones del pool
+        medir_lecturas(base_url, 1, args.clientes)
+
+        print(f"\n📊 Reposo ({args.segundos}s, {args.clientes} clientes)")
+        reposo = resumen("solo lecturas", medir_lecturas(base_url, args.segundos, args.clientes))
+
+        print(f"\n📊 Con backup + escaneo de alertas en bucle ({args.segundos}s)")
+        detener = threading.Event()
+        contador = {path: 0 for path in TAREAS_PESADAS}
+        pesadas = threading.Thread(target=tareas_pesadas_en_bucle, args=(base_url, detener, contador))
+        pesadas.start()
+        time.sleep(0.5)
+        carga = resumen("lecturas con carga", medir_lecturas(base_url, args.segundos, args.clientes))
+        detener.set()
+        pesadas.join()
+        print(f"   Tareas pesadas completadas: {contador}")
+
+        ratio = carga["p99"] / reposo["p99"] if reposo["p99"] else float("inf")
+        print(f"\n🎯 p99 con carga / p99 en reposo: {ratio:.2f}x")
+        if ratio <= 3:
+            print("✅ El p99 se mantiene estable: el trabajo pesado no bloquea el event loop")
+        else:
+            print("⚠️ El p99 se degrada con carga: revisar trabajo bloqueante en el event loop")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
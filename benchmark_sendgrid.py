@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark de envío a SendGrid: ruta anterior vs cliente con pool y personalizations
+Levanta el servidor SendGrid simulado (con costo de handshake por conexión) y envía N resúmenes
+de alertas a D destinatarios con tres estrategias:
+  1. anterior: requests.post por destinatario (conexión y handshake nuevos cada vez)
+  2. pool: sesión con keep-alive, todavía un request por destinatario
+  3. pool + lote: sesión con keep-alive y un request por resumen (personalizations)
+
+Uso: python benchmark_sendgrid.py [--resumenes 200] [--destinatarios 5] [--handshake-ms 30] [--hilos 4]
+"""
+
+import time
+import argparse
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_sendgrid_server import start_mock_server
+from sendgrid_email import SendGridEmailService
+
+API_KEY = "SG.benchmark"
+HTML = "<html><body><h2>🚨 Resumen de alertas</h2>" + "<p>Alerta de prueba</p>" * 50 + "</body></html>"
+
+def envio_anterior(base_url, recipients, subject):
+    """Réplica de la ruta original: un requests.post (sin sesión) por destinatario"""
+    for recipient in recipients:
+        response = requests.post(
+            f"{base_url}/mail/send",
+            headers={"Authorization": f"Bearer {API_KEY}", "Content-Type": "application/json"},
+            json={
+                "personalizations": [{"to": [{"email": recipient}], "subject": subject}],
+                "from": {"email": "benchmark@example.com", "name": "Benchmark"},
+                "content": [{"type": "text/html", "value": HTML}],
+            },
+            timeout=30
+        )
+        assert response.status_code == 202, response.text
+
+def envio_pool(service, recipients, subject):
+    """Sesión compartida, un request por destinatario"""
+    for recipient in recipients:
+        assert service.send_email(recipient, subject, HTML)["success"]
+
+def envio_pool_lote(service, recipients, subject):
+    """Sesión compartida, todos los destinatarios en un solo request"""
+    assert service.send_email(recipients, subject, HTML)["success"]
+
+def ejecutar(nombre, func, resumenes, recipients, hilos, state):
+    state.reset()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        list(pool.map(lambda i: func(recipients, f"Resumen {i}"), range(resumenes)))
+    duracion = time.perf_counter() - inicio
+    stats = state.snapshot()
+    emails = resumenes * len(recipients)
+    print(f"   {nombre:<18} {duracion:7.2f}s  {emails / duracion:8.1f} emails/s  "
+          f"requests={stats['requests']:<6} conexiones={stats['connections']}")
+    assert stats["recipients"] == emails, stats
+    return duracion
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput de envío a SendGrid (servidor simulado)")
+    parser.add_argument("--resumenes", type=int, default=200)
+    parser.add_argument("--destinatarios", type=int, default=5)
+    parser.add_argument("--handshake-ms", type=float, default=30)
+    parser.add_argument("--latencia-ms", type=float, default=5)
+    parser.add_argument("--hilos", type=int, default=4)
+    args = parser.parse_args()
+
+    server, base_url, state = start_mock_server(
+        handshake_seconds=args.handshake_ms / 1000, latency_seconds=args.latencia_ms / 1000
+    )
+    recipients = [f"destino{i}@example.com" for i in range(args.destinatarios)]
+    # Un servicio por estrategia para que cada una abra (y cuente) sus propias conexiones
+    service = SendGridEmailService(api_key=API_KEY, base_url=base_url, pool_size=args.hilos)
+    service_lote = SendGridEmailService(api_key=API_KEY, base_url=base_url, pool_size=args.hilos)
+
+    print("🚀 === BENCHMARK SENDGRID (servidor simulado) ===")
+    print(f"📊 {args.resumenes} resúmenes x {args.destinatarios} destinatarios, "
+          f"handshake {args.handshake_ms}ms, latencia {args.latencia_ms}ms, {args.hilos} hilos\n")
+
+    try:
+        anterior = ejecutar("anterior", lambda r, s: envio_anterior(base_url, r, s),
+                            args.resumenes, recipients, args.hilos, state)
+        pool = ejecutar("pool", lambda r, s: envio_pool(service, r, s),
+                        args.resumenes, recipients, args.hilos, state)
+        lote = ejecutar("pool + lote", lambda r, s: envio_pool_lote(service_lote, r, s),
+                        args.resumenes, recipients, args.hilos, state)
+    finally:
+        service.close()
+        service_lote.close()
+        server.shutdown()
+
+    print(f"\n🎯 Aceleración: pool {anterior / pool:.1f}x, pool + lote {anterior / lote:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Registro de Cambios (change data capture) para el Sistema Vehicular
+Triggers en las tablas de negocio anotan cada INSERT/UPDATE/DELETE en change_log con una secuencia
+creciente. GET /changes?since= devuelve los cambios posteriores a la secuencia que el cliente ya
+procesó junto con el estado actual de cada fila: sincronizar cuesta O(cambios), no O(tabla).
+La compactación deja solo la última entrada de cada fila y recorta lo más antiguo; un cliente que
+se quedó antes del recorte recibe resync_required y debe volver a descargar las tablas.
+"""
+
+import logging
+from datetime import timezone
+
+logger = logging.getLogger(__name__)
+
+CHANGE_LOG_TABLES = ("vehiculos", "mantenimientos", "combustible", "revisiones", "polizas", "rtv", "bitacora")
+
+OPERACIONES = {"INSERT": "insert", "UPDATE": "update", "DELETE": "delete"}
+
+def formato_utc(momento) -> str:
+    """Fecha con zona horaria en el formato de changed_at (UTC con milisegundos, ordena como texto)"""
+    return momento.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+def install_change_log(cursor, tables=CHANGE_LOG_TABLES):
+    """Crear change_log, su metadato de recorte y los triggers de cada tabla"""
+    # AUTOINCREMENT: la secuencia nunca se reutiliza aunque la compactación borre las últimas filas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+        )
+    ''')
+    # Última entrada de cada fila (compactación)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_fila ON change_log (table_name, row_id, seq)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log_meta (
+            clave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO change_log_meta (clave, valor) VALUES ('truncado_hasta', 0)")
+
+    for table in tables:
+        for event, op in OPERACIONES.items():
+            fila = "OLD" if event == "DELETE" else "NEW"
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_change_log_{op}
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', {fila}.id, '{op}');
+                END
+            ''')
+
+def latest_seq(conn) -> int:
+    """Secuencia más reciente (para empezar a seguir los cambios tras una descarga completa)"""
+    # sqlite_sequence no baja aunque la compactación haya borrado las últimas entradas
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+def _truncado_hasta(conn) -> int:
+    return conn.execute("SELECT valor FROM change_log_meta WHERE clave = 'truncado_hasta'").fetchone()[0]
+
+def change_log_stats(conn) -> dict:
+    """Primera y última secuencia, entradas guardadas y hasta dónde se recortó"""
+    primera, entradas = conn.execute("SELECT MIN(seq), COUNT(*) FROM change_log").fetchone()
+    return {
+        "primera": primera,
+        "ultima": latest_seq(conn),
+        "entradas": entradas,
+        "truncado_hasta": _truncado_hasta(conn),
+    }
+
+def fetch_changes(conn, since=0, limit=500, tables=None) -> dict:
+    """Cambios con seq > since, en orden, con la fila actual de cada insert/update (None si ya no existe)"""
+    truncado = _truncado_hasta(conn)
+    ultima = latest_seq(conn)
+    if since < truncado:
+        # Faltan entradas que el cliente no vio: necesita una descarga completa
+        return {"changes": [], "next": ultima, "latest": ultima, "has_more": False, "resync_required": True}
+
+    filtro = ""
+    params = [since]
+    if tables:
+        filtro = f"AND table_name IN ({', '.join('?' for _ in tables)})"
+        params.extend(tables)
+    params.append(limit + 1)
+    entradas = conn.execute(f'''
+        SELECT seq, table_name, row_id, op, changed_at FROM change_log
+        WHERE seq > ? {filtro}
+        ORDER BY seq
+        LIMIT ?
+    ''', params).fetchall()
+    has_more = len(entradas) > limit
+    entradas = entradas[:limit]
+
+    # Filas actuales: una consulta por tabla con los ids del lote
+    ids_por_tabla = {}
+    for entrada in entradas:
+        if entrada["op"] != "delete":
+            ids_por_tabla.setdefault(entrada["table_name"], set()).add(entrada["row_id"])
+    filas = {}
+    for table, ids in ids_por_tabla.items():
+        if table not in CHANGE_LOG_TABLES:
+            continue
+        ids = list(ids)
+        for inicio in range(0, len(ids), 500):
+            lote = ids[inicio:inicio + 500]
+            rows = conn.execute(
+                f"SELECT * FROM {table} WHERE id IN ({', '.join('?' for _ in lote)})", lote
+            ).fetchall()
+            filas.update({(table, row["id"]): dict(row) for row in rows})
+
+    cambios = [{
+        "seq": entrada["seq"],
+        "table": entrada["table_name"],
+        "id": entrada["row_id"],
+        "op": entrada["op"],
+        "at": entrada["changed_at"],
+        "data": filas.get((entrada["table_name"], entrada["row_id"])),
+    } for entrada in entradas]
+
+    if has_more:
+        siguiente = entradas[-1]["seq"]
+    else:
+        # Todo lo anterior a ultima (leída antes de la consulta) ya fue devuelto o no aplica al filtro
+        siguiente = max(since, ultima, entradas[-1]["seq"] if entradas else 0)
+    return {"changes": cambios, "next": siguiente, "latest": ultima, "has_more": has_more, "resync_required": False}
+
+def compact_change_log(conn, compactar_antes, recortar_antes) -> dict:
+    """Compactar el registro. compactar_antes / recortar_antes: fechas con zona horaria.
+
+    Entradas anteriores a compactar_antes: se borran las que tienen una entrada posterior de la misma
+    fila (el cliente recibe igual la última). Anteriores a recortar_antes: se borran todas y
+    truncado_hasta avanza para que los clientes más atrasados pidan una resincronización.
+    """
+    compactar_antes, recortar_antes = formato_utc(compactar_antes), formato_utc(recortar_antes)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        limite = conn.execute("SELECT MAX(seq) FROM change_log WHERE changed_at < ?",
+                              (compactar_antes,)).fetchone()[0]
+        superadas = 0
+        if limite is not None:
+            superadas = conn.execute('''
+                DELETE FROM change_log
+                WHERE seq <= ? AND EXISTS (
+                    SELECT 1 FROM change_log posterior
+                    WHERE posterior.table_name = change_log.table_name
+                      AND posterior.row_id = change_log.row_id
+                      AND posterior.seq > change_log.seq
+                )
+            ''', (limite,)).rowcount
+
+        recorte = conn.execute("SELECT MAX(seq) FROM change_log WHERE changed_at < ?",
+                               (recortar_antes,)).fetchone()[0]
+        recortadas = 0
+        if recorte is not None:
+            recortadas = conn.execute("DELETE FROM change_log WHERE seq <= ?", (recorte,)).rowcount
+            conn.execute("UPDATE change_log_meta SET valor = MAX(valor, ?) WHERE clave = 'truncado_hasta'",
+                         (recorte,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if superadas or recortadas:
+        logger.info(f"🗜️ change_log compactado: {superadas} entradas superadas, {recortadas} recortadas")
+    return {"superadas": superadas, "recortadas": recortadas, **change_log_stats(conn)}
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Caché de Configuración para el Sistema Vehicular
+config_alertas y config_email se leen una vez y quedan en memoria: las rutas calientes (salidas de
+bitácora, envío de emails) no consultan SQLite. Las escrituras pasan por la caché (write-through) y
+los demás workers detectan el cambio comparando las versiones de table_versions en un sondeo barato.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from table_versions import get_table_versions
+
+logger = logging.getLogger(__name__)
+
+CONFIG_TABLES = ("config_alertas", "config_email")
+
+# Columnas de config_email <-> claves de la configuración de email usadas por la aplicación
+COLUMNAS_EMAIL = {
+    "smtp_servidor": "smtp_server",
+    "smtp_puerto": "smtp_port",
+    "email_remitente": "sender_email",
+    "email_password": "sender_password",
+    "email_destino": "recipient_email",
+}
+
+CAMPOS_CONFIG_ALERTAS = (
+    "email_destino", "alertas_mantenimiento", "alertas_polizas", "alertas_rtv", "alertas_revisiones",
+    "alertas_combustible", "alertas_bitacora", "dias_anticipacion_polizas", "dias_anticipacion_rtv",
+    "dias_anticipacion_mantenimiento", "km_diferencia_alerta", "horas_retorno_pendiente",
+)
+
+ConfigSnapshot = namedtuple("ConfigSnapshot", "versions alertas email cargada_en")
+
+def install_config_email(cursor):
+    """Tabla config_email (una fila activa, las anteriores quedan como historial) con su versión"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS config_email (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            smtp_servidor TEXT,
+            smtp_puerto INTEGER,
+            email_remitente TEXT,
+            email_usuario TEXT,
+            email_password TEXT,
+            email_destino TEXT,
+            activo BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO table_versions (table_name, version) VALUES ('config_email', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_config_email_version_{event.lower()}
+            AFTER {event} ON config_email
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE table_name = 'config_email';
+            END
+        ''')
+
+def _fila_activa(conn, table):
+    return conn.execute(f"SELECT * FROM {table} WHERE activo = 1 ORDER BY id DESC LIMIT 1").fetchone()
+
+def load_config(conn, defaults_alertas, defaults_email) -> ConfigSnapshot:
+    """Configuración efectiva: la fila activa de cada tabla sobre los valores por defecto"""
+    # Versiones antes que los datos: si alguien escribe en medio, el próximo sondeo recarga
+    versions = get_table_versions(conn, CONFIG_TABLES)
+    fila_alertas = _fila_activa(conn, "config_alertas")
+    fila_email = _fila_activa(conn, "config_email")
+
+    alertas = dict(defaults_alertas)
+    if fila_alertas is not None:
+        alertas.update({key: value for key, value in dict(fila_alertas).items() if value is not None})
+
+    email = dict(defaults_email)
+    if fila_email is not None:
+        email.update({clave: fila_email[columna] for columna, clave in COLUMNAS_EMAIL.items()
+                      if fila_email[columna] is not None})
+        email["sender_user"] = fila_email["email_usuario"] or email["sender_email"]
+    else:
+        email.setdefault("sender_user", email["sender_email"])
+    # El destinatario de los avisos es el de la configuración de alertas si existe
+    if fila_alertas is not None:
+        email["recipient_email"] = fila_alertas["email_destino"]
+    email["configurado"] = fila_email is not None
+    return ConfigSnapshot(versions, alertas, email, time.time())
+
+class ConfigCache:
+    """Configuración en memoria, recargada tras escrituras propias o cuando otro worker cambia la versión"""
+
+    def __init__(self, async_db, connect, defaults_alertas, defaults_email, poll_seconds=5.0):
+        # connect(): context manager con una conexión (db_pool.connection), para la primera carga
+        self.db = async_db
+        self.connect = connect
+        self.defaults_alertas = dict(defaults_alertas)
+        self.defaults_email = dict(defaults_email)
+        self.poll_seconds = poll_seconds
+
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._task = None
+
+        # Métricas
+        self.hits = 0
+        self.reloads = 0
+        self._last_error = None
+
+    # ---- Lecturas (memoria) ----
+
+    def snapshot(self) -> ConfigSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self.connect() as conn:
+                snapshot = self.reload(conn)
+        self.hits += 1
+        return snapshot
+
+    def alertas(self) -> dict:
+        """Configuración de alertas vigente (no modificar el dict devuelto)"""
+        return self.snapshot().alertas
+
+    def email(self) -> dict:
+        """Configuración de email vigente (no modificar el dict devuelto)"""
+        return self.snapshot().email
+
+    # ---- Recarga y escrituras (write-through) ----
+
+    def reload(self, conn) -> ConfigSnapshot:
+        """Leer la configuración de la base y reemplazar la foto en memoria"""
+        with self._lock:
+            snapshot = load_config(conn, self.defaults_alertas, self.defaults_email)
+            self._snapshot = snapshot
+            self.reloads += 1
+            return snapshot
+
+    def invalidate(self):
+        """Descartar la foto actual (la próxima lectura recarga)"""
+        with self._lock:
+            self._snapshot = None
+
+    def save_alertas(self, conn, valores: dict) -> ConfigSnapshot:
+        """Guardar una nueva configuración de alertas activa y actualizar la caché"""
+        campos = [campo for campo in CAMPOS_CONFIG_ALERTAS if valores.get(campo) is not None]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE config_alertas SET activo = 0 WHERE activo = 1")
+            conn.execute(
+                f"INSERT INTO config_alertas ({', '.join(campos)}) VALUES ({', '.join('?' for _ in campos)})",
+                [valores[campo] for campo in campos]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return self.reload(conn)
+
+    def save_email(self, conn, cambios: dict) -> ConfigSnapshot:
+        """Aplicar cambios (claves smtp_server, smtp_port, sender_email, sender_password, recipient_email)
+        sobre la configuración de email activa y actualizar la caché"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Partir de la fila vigente en la base (otro worker pudo cambiarla) y no de la caché
+            actual = load_config(conn, self.defaults_alertas, self.defaults_email).email
+            nueva = {**actual, **{clave: valor for clave, valor in cambios.items() if valor is not None}}
+            conn.execute("UPDATE config_email SET activo = 0 WHERE activo = 1")
+            conn.execute('''
+                INSERT INTO config_email (smtp_servidor, smtp_puerto, email_remitente, email_usuario,
+                                          email_password, email_destino)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (nueva["smtp_server"], int(nueva["smtp_port"]), nueva["sender_email"],
+                  cambios.get("sender_email") or actual["sender_user"],
+                  nueva["sender_password"], nueva["recipient_email"]))
+            if cambios.get("recipient_email"):
+                # Un solo destinatario vigente: el último que se configuró por cualquiera de los dos caminos
+                conn.execute("UPDATE config_alertas SET email_destino = ? WHERE activo = 1",
+                             (cambios["recipient_email"],))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return self.reload(conn)
+
+    # ---- Coherencia entre workers ----
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Iniciar el sondeo de versiones en el event loop actual"""
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._worker(), name="config-cache")
+        logger.info(f"⚙️ Caché de configuración iniciada (sondeo cada {self.poll_seconds}s)")
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def check(self) -> bool:
+        """Recargar si otro proceso cambió alguna tabla de configuración. True si recargó"""
+        versions = await self.db.run(get_table_versions, CONFIG_TABLES)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.versions == versions:
+            return False
+        await self.db.run(self.reload)
+        logger.info("⚙️ Configuración recargada (cambio detectado en la base)")
+        return True
+
+    async def _worker(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.check()
+            except Exception as e:
+                self._last_error = str(e)
+                logger.error(f"❌ Error verificando versión de la configuración: {e}")
+
+    def metrics(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "running": self.running,
+            "poll_seconds": self.poll_seconds,
+            "hits": self.hits,
+            "recargas": self.reloads,
+            "versiones": snapshot.versions if snapshot else None,
+            "cargada_en": snapshot.cargada_en if snapshot else None,
+            "last_error": self._last_error,
+        }
+
+def create_config_cache_from_env(async_db, connect, defaults_alertas, defaults_email) -> ConfigCache:
+    """Crear la caché usando CONFIG_CACHE_POLL_SECONDS"""
+    return ConfigCache(
+        async_db,
+        connect,
+        defaults_alertas,
+        defaults_email,
+        poll_seconds=float(os.environ.get("CONFIG_CACHE_POLL_SECONDS", "5")),
+    )
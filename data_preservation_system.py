@@ -6,12 +6,13 @@ Garantiza que nunca se pierdan datos durante modificaciones del sistema
 
 import os
 import sqlite3
-import shutil
 import json
 from datetime import datetime
 import logging
 from typing import Dict, Any, Optional
 
+from db_snapshot import snapshot_database, restore_database
+
 logger = logging.getLogger(__name__)
 
 class DataPreservationSystem:
@@ -35,14 +36,15 @@ class DataPreservationSystem:
         backup_path = f"{self.backup_dir}/pre_change/{backup_filename}"
         
         try:
-            # Copiar base de datos actual
-            shutil.copy2(self.db_path, backup_path)
+            # Copia consistente aunque haya escrituras en curso (incluye lo que está en el WAL)
+            snapshot = snapshot_database(self.db_path, backup_path)
             
             # Crear archivo de metadatos
             metadata = {
                 "timestamp": datetime.now().isoformat(),
                 "operation": operation_description,
                 "original_db_size": os.path.getsize(self.db_path),
+                "snapshot": snapshot,
                 "backup_path": backup_path,
                 "data_counts": self.get_current_data_counts()
             }
@@ -124,10 +126,10 @@ class DataPreservationSystem:
             
             # Crear backup del estado actual antes de restaurar
             current_backup = f"{self.backup_dir}/snapshots/before_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-            shutil.copy2(self.db_path, current_backup)
+            snapshot_database(self.db_path, current_backup)
             
-            # Restaurar desde backup
-            shutil.copy2(backup_path, self.db_path)
+            # Restaurar desde backup (las conexiones abiertas ven el cambio como una transacción)
+            restore_database(backup_path, self.db_path)
             
             logger.info(f"✅ Base de datos restaurada desde: {backup_path}")
             logger.info(f"📁 Estado anterior guardado en: {current_backup}")
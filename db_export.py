@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Motor de Exportación en Streaming (JSON / CSV / SQL) para el Sistema Vehicular
+Los módulos de backup armaban cada tabla como lista de diccionarios y la volcaban de una vez con
+json.dump(indent=2): la memoria crecía con la base, y el código estaba repetido en tres versiones.
+Aquí las filas se leen por lotes, tabla por tabla, dentro de una sola transacción de lectura, y se
+escriben a medida que llegan en los formatos pedidos. Con workers > 1 cada tabla se exporta en un
+hilo con su propia conexión sobre una copia congelada (snapshot), así todas ven los mismos datos.
+"""
+
+import csv
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db_snapshot import snapshot_database
+
+logger = logging.getLogger(__name__)
+
+# Filas por lote leído de SQLite
+FETCH_SIZE = 2000
+
+# Hilos para exportar tablas en paralelo (BACKUP_EXPORT_WORKERS). 1 = secuencial, sin copia previa
+EXPORT_WORKERS = int(os.environ.get("BACKUP_EXPORT_WORKERS", "1"))
+
+# Formato de cada tabla en el JSON: lista de filas, o columnas + data + record_count
+JSON_LAYOUTS = ("rows", "columns")
+
+# Una sola instancia del codificador (json.dumps con opciones crea uno nuevo en cada llamada)
+_codificar = json.JSONEncoder(ensure_ascii=False, default=str).encode
+
+def _ident(nombre) -> str:
+    return '"' + nombre.replace('"', '""') + '"'
+
+def list_tables(conn) -> list:
+    """Tablas de la base (sin las internas de SQLite salvo sqlite_sequence)"""
+    return [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' "
+        "AND (name NOT LIKE 'sqlite_%' OR name = 'sqlite_sequence') ORDER BY name"
+    )]
+
+def _abrir(path, congelada) -> sqlite3.Connection:
+    # Una copia congelada no cambia: immutable=1 evita bloqueos y lecturas del WAL
+    modo = "immutable=1" if congelada else "mode=ro"
+    return sqlite3.connect(f"file:{os.fspath(path)}?{modo}", uri=True, isolation_level=None,
+                           check_same_thread=False)
+
+# ================================
+# EXPORTACIÓN DE UNA TABLA
+# ================================
+
+def _exportar_filas(conn, table, json_out, csv_path, json_layout) -> int:
+    """Una pasada por la tabla escribiendo el fragmento JSON y el CSV. Devuelve las filas exportadas"""
+    cursor = conn.execute(f"SELECT * FROM {_ident(table)}")
+    columnas = [d[0] for d in cursor.description]
+
+    csv_file = open(csv_path, "w", newline="", encoding="utf-8") if csv_path else None
+    try:
+        writer = None
+        if csv_file is not None:
+            writer = csv.writer(csv_file)
+            writer.writerow(columnas)
+
+        if json_out is not None:
+            if json_layout == "columns":
+                json_out.write(f"    {_codificar(table)}: {{\n      \"columns\": {_codificar(columnas)},\n"
+                               f"      \"data\": [")
+                prefijo = "\n        "
+            else:
+                json_out.write(f"    {_codificar(table)}: [")
+                prefijo = "\n      "
+            separador = ""
+
+        filas = 0
+        while True:
+            lote = cursor.fetchmany(FETCH_SIZE)
+            if not lote:
+                break
+            filas += len(lote)
+            if writer is not None:
+                writer.writerows(lote)
+            if json_out is not None:
+                json_out.write(separador + prefijo + ("," + prefijo).join(
+                    _codificar(dict(zip(columnas, fila))) for fila in lote))
+                separador = ","
+
+        if json_out is not None:
+            if json_layout == "columns":
+                cierre = "\n      ]" if filas else "]"
+                json_out.write(f"{cierre},\n      \"record_count\": {filas}\n    }}")
+            else:
+                json_out.write("\n    ]" if filas else "]")
+        return filas
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+
+def _exportar_sql(conn, table, sql_out):
+    """CREATE TABLE e INSERTs de una tabla. quote() de SQLite arma cada literal (como .dump)"""
+    columnas = [row[1] for row in conn.execute(f"PRAGMA table_info({_ident(table)})")]
+    if table == "sqlite_sequence":
+        sql_out.write('DELETE FROM "sqlite_sequence";\n')
+    else:
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()[0]
+        sql_out.write(f"{sql};\n")
+    valores = " || ',' || ".join(f"quote({_ident(col)})" for col in columnas)
+    # El INSERT va dentro de un literal SQL: duplicar comillas simples del nombre
+    insert = f"INSERT INTO {_ident(table)} VALUES(".replace("'", "''")
+    cursor = conn.execute(f"SELECT '{insert}' || {valores} || ');' FROM {_ident(table)}")
+    while True:
+        lote = cursor.fetchmany(FETCH_SIZE)
+        if not lote:
+            break
+        sql_out.write("\n".join(row[0] for row in lote) + "\n")
+
+def _exportar_tabla(conn, table, json_out, csv_dir, sql_out, json_layout) -> int:
+    filas = 0
+    if json_out is not None or csv_dir:
+        csv_path = os.path.join(csv_dir, f"{table}.csv") if csv_dir else None
+        filas = _exportar_filas(conn, table, json_out, csv_path, json_layout)
+    if sql_out is not None:
+        _exportar_sql(conn, table, sql_out)
+        if json_out is None and not csv_dir:
+            filas = conn.execute(f"SELECT COUNT(*) FROM {_ident(table)}").fetchone()[0]
+    return filas
+
+# ================================
+# ENCABEZADOS Y CIERRES DE ARCHIVO
+# ================================
+
+def _escribir_claves(json_out, claves):
+    for clave, valor in claves.items():
+        texto = json.dumps(valor, indent=2, ensure_ascii=False, default=str).replace("\n", "\n  ")
+        json_out.write(f"  {_codificar(clave)}: {texto},\n")
+
+def _sql_encabezado(sql_out, sql_header):
+    for linea in sql_header or []:
+        sql_out.write(f"-- {linea}\n")
+    sql_out.write("\nPRAGMA foreign_keys=OFF;\nBEGIN TRANSACTION;\n")
+
+def _sql_cierre(conn, sql_out):
+    # Índices, triggers y vistas al final: los INSERT del respaldo no disparan los triggers
+    for (sql,) in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger', 'view') AND sql IS NOT NULL "
+        "AND name NOT LIKE 'sqlite_%' ORDER BY CASE type WHEN 'view' THEN 0 WHEN 'index' THEN 1 ELSE 2 END, name"
+    ):
+        sql_out.write(f"{sql};\n")
+    sql_out.write("COMMIT;\n")
+
+# ================================
+# EXPORTACIÓN COMPLETA
+# ================================
+
+def export_database(source, json_path=None, csv_dir=None, sql_path=None, tables=None, workers=None,
+                    frozen=False, json_layout="rows", json_header=None, json_footer=None,
+                    sql_header=None) -> dict:
+    """Exportar la base a JSON, CSV (un archivo por tabla) y/o dump SQL en streaming.
+
+    source: ruta del .db o conexión abierta. Todo sale de una misma transacción de lectura; con
+    workers > 1 las tablas se exportan en paralelo desde una copia congelada (la propia source si
+    frozen=True, p. ej. el snapshot que acaba de tomar el backup). tables: por defecto todas; una
+    tabla que no existe se exporta vacía. json_header: claves escritas antes de "tables";
+    json_footer(conteos): claves escritas después. Devuelve registros por tabla, total y filas/s.
+    """
+    if json_layout not in JSON_LAYOUTS:
+        raise ValueError(f"Formato JSON desconocido: {json_layout}")
+    if not (json_path or csv_dir or sql_path):
+        raise ValueError("No se pidió ningún formato de exportación")
+    workers = max(1, workers or EXPORT_WORKERS)
+    if csv_dir:
+        os.makedirs(csv_dir, exist_ok=True)
+
+    inicio = time.perf_counter()
+    temporal = tempfile.mkdtemp(prefix="db_export_")
+    conexiones = []
+    conn = None
+    try:
+        if isinstance(source, sqlite3.Connection) and workers == 1:
+            conn = source
+        else:
+            if workers > 1 and not frozen:
+                # Copia congelada para que todos los hilos lean exactamente los mismos datos
+                copia = os.path.join(temporal, "snapshot.db")
+                snapshot_database(source, copia)
+                source, frozen = copia, True
+            conn = _abrir(source, frozen)
+            conexiones.append(conn)
+        propia_transaccion = not conn.in_transaction
+        if propia_transaccion:
+            conn.execute("BEGIN")
+
+        existentes = set(list_tables(conn))
+        seleccion = list(tables) if tables else sorted(existentes)
+        faltantes = [table for table in seleccion if table not in existentes]
+        for table in faltantes:
+            logger.warning(f"⚠️ Tabla {table} no existe: se exporta vacía")
+        seleccion = [table for table in seleccion if table in existentes]
+
+        json_out = open(json_path, "w", encoding="utf-8", buffering=1 << 20) if json_path else None
+        sql_out = open(sql_path, "w", encoding="utf-8", buffering=1 << 20) if sql_path else None
+        try:
+            if json_out is not None:
+                json_out.write("{\n")
+                _escribir_claves(json_out, json_header or {})
+                json_out.write('  "tables": {\n')
+            if sql_out is not None:
+                _sql_encabezado(sql_out, sql_header)
+
+            # sqlite_sequence al final: se llena al crear las tablas AUTOINCREMENT
+            orden_sql = sorted(seleccion, key=lambda table: table == "sqlite_sequence")
+            conteos = {}
+            if workers == 1:
+                for table in orden_sql:
+                    if json_out is not None and conteos:
+                        json_out.write(",\n")
+                    conteos[table] = _exportar_tabla(conn, table, json_out, csv_dir, sql_out, json_layout)
+            else:
+                conteos = _exportar_en_paralelo(source, orden_sql, temporal, json_out, csv_dir, sql_out,
+                                                json_layout, workers)
+
+            for table in faltantes:
+                conteos[table] = 0
+                if json_out is not None:
+                    if len(conteos) > 1:
+                        json_out.write(",\n")
+                    vacia = ('{"columns": [], "data": [], "record_count": 0}' if json_layout == "columns"
+                             else "[]")
+                    json_out.write(f"    {_codificar(table)}: {vacia}")
+
+            if json_out is not None:
+                json_out.write("\n  }")
+                for clave, valor in (json_footer(conteos) if json_footer else {}).items():
+                    texto = json.dumps(valor, indent=2, ensure_ascii=False, default=str).replace("\n", "\n  ")
+                    json_out.write(f",\n  {_codificar(clave)}: {texto}")
+                json_out.write("\n}\n")
+            if sql_out is not None:
+                _sql_cierre(conn, sql_out)
+        finally:
+            if json_out is not None:
+                json_out.close()
+            if sql_out is not None:
+                sql_out.close()
+        if propia_transaccion:
+            conn.rollback()
+    finally:
+        for conexion in conexiones:
+            conexion.close()
+        shutil.rmtree(temporal, ignore_errors=True)
+
+    segundos = time.perf_counter() - inicio
+    total = sum(conteos.values())
+    resultado = {
+        "tables": {table: conteos[table] for table in (list(tables) if tables else orden_sql)},
+        "total_records": total,
+        "formats": [nombre for nombre, destino in (("json", json_path), ("csv", csv_dir), ("sql", sql_path))
+                    if destino],
+        "workers": workers,
+        "seconds": round(segundos, 3),
+        "rows_per_s": round(total / segundos) if segundos > 0 else None,
+    }
+    logger.info(f"📤 Export {'/'.join(resultado['formats'])}: {total} registros de {len(conteos)} tablas "
+                f"en {segundos:.2f}s ({resultado['rows_per_s']} filas/s, {workers} hilos)")
+    return resultado
+
+def _exportar_en_paralelo(path, tables, temporal, json_out, csv_dir, sql_out, json_layout, workers) -> dict:
+    """Una tabla por tarea, cada una con su conexión y sus fragmentos; luego se unen en orden"""
+    def _parte(indice, extension, pedido):
+        if pedido is None:
+            return None
+        return open(os.path.join(temporal, f"{indice}.{extension}"), "w", encoding="utf-8", buffering=1 << 20)
+
+    def _tarea(indice, table):
+        conn = _abrir(path, True)
+        parte_json = parte_sql = None
+        try:
+            parte_json = _parte(indice, "json", json_out)
+            parte_sql = _parte(indice, "sql", sql_out)
+            return _exportar_tabla(conn, table, parte_json, csv_dir, parte_sql, json_layout)
+        finally:
+            for parte in (parte_json, parte_sql):
+                if parte is not None:
+                    parte.close()
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-export") as executor:
+        futuros = [executor.submit(_tarea, indice, table) for indice, table in enumerate(tables)]
+        conteos = {table: futuro.result() for table, futuro in zip(tables, futuros)}
+
+    for indice in range(len(tables)):
+        for destino, extension, separador in ((json_out, "json", ",\n"), (sql_out, "sql", "")):
+            if destino is None:
+                continue
+            if indice and separador:
+                destino.write(separador)
+            with open(os.path.join(temporal, f"{indice}.{extension}"), encoding="utf-8") as parte:
+                shutil.copyfileobj(parte, destino, 1 << 20)
+    return conteos
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Migraciones Versionadas del Esquema para el Sistema Vehicular
+Cada paso se aplica una sola vez y queda registrado en la tabla schema_version
+"""
+
+import logging
+
+from vehicle_state import install_vehicle_state
+from alertas_activas import install_alertas_activas
+from job_scheduler import install_job_scheduler
+from config_cache import install_config_email
+from change_log import install_change_log
+from idempotency import install_idempotency_keys
+from backup_catalog import install_backup_catalog
+
+logger = logging.getLogger(__name__)
+
+# ================================
+# PASOS DE MIGRACIÓN
+# ================================
+
+def _add_column_if_missing(cursor, table, column, definition):
+    """Agregar una columna solo si la tabla aún no la tiene"""
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _migracion_001_esquema_base(cursor):
+    """Tablas del sistema y columnas agregadas con el tiempo"""
+    # Tabla Vehiculos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS vehiculos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            placa TEXT UNIQUE NOT NULL,
+            marca TEXT NOT NULL,
+            modelo TEXT NOT NULL,
+            ano INTEGER NOT NULL,
+            color TEXT NOT NULL,
+            propietario TEXT NOT NULL,
+            poliza TEXT,
+            seguro TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tabla Mantenimientos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mantenimientos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha DATE NOT NULL,
+            placa TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            descripcion TEXT NOT NULL,
+            costo REAL NOT NULL,
+            kilometraje INTEGER,
+            proximo_km INTEGER,
+            proxima_fecha DATE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
+        )
+    ''')
+
+    # Tabla Combustible
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS combustible (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha DATE NOT NULL,
+            placa TEXT NOT NULL,
+            litros REAL NOT NULL,
+            costo REAL NOT NULL,
+            kilometraje INTEGER,
+            estacion TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
+        )
+    ''')
+
+    # Tabla Revisiones
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revisiones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha DATE NOT NULL,
+            placa TEXT NOT NULL,
+            inspector TEXT NOT NULL,
+            estado_motor TEXT NOT NULL,
+            estado_frenos TEXT NOT NULL,
+            estado_luces TEXT NOT NULL,
+            estado_llantas TEXT NOT NULL,
+            estado_carroceria TEXT NOT NULL,
+            observaciones TEXT,
+            aprobado BOOLEAN NOT NULL,
+            -- Nuevos campos para sistema eléctrico y exterior
+            luces_delanteras BOOLEAN DEFAULT 1,
+            luces_traseras BOOLEAN DEFAULT 1,
+            luces_direccionales BOOLEAN DEFAULT 1,
+            luces_freno BOOLEAN DEFAULT 1,
+            luces_reversa BOOLEAN DEFAULT 1,
+            espejos_laterales BOOLEAN DEFAULT 1,
+            espejo_retrovisor BOOLEAN DEFAULT 1,
+            limpiaparabrisas BOOLEAN DEFAULT 1,
+            cinturones BOOLEAN DEFAULT 1,
+            bocina BOOLEAN DEFAULT 1,
+            nivel_combustible TEXT DEFAULT 'lleno',
+            kilometraje INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
+        )
+    ''')
+
+    # Tabla Polizas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS polizas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_poliza TEXT UNIQUE NOT NULL,
+            placa TEXT NOT NULL,
+            aseguradora TEXT NOT NULL,
+            fecha_inicio DATE NOT NULL,
+            fecha_vencimiento DATE NOT NULL,
+            tipo_cobertura TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'Activa',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
+        )
+    ''')
+
+    # Tabla RTV (Revisión Técnica Vehicular)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rtv (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_cita TEXT NOT NULL,
+            placa TEXT NOT NULL,
+            fecha_vencimiento DATE NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'Vigente',
+            observaciones TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
+        )
+    ''')
+
+    # Tabla Bitácora
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bitacora (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            placa TEXT NOT NULL,
+            chofer TEXT NOT NULL,
+            fecha_salida DATETIME NOT NULL,
+            km_salida INTEGER NOT NULL,
+            nivel_combustible_salida TEXT NOT NULL,
+            estado_vehiculo_salida TEXT NOT NULL,
+            fecha_retorno DATETIME,
+            km_retorno INTEGER,
+            nivel_combustible_retorno TEXT,
+            estado_vehiculo_retorno TEXT,
+            observaciones TEXT,
+            estado TEXT DEFAULT 'en_curso',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
+        )
+    ''')
+
+    # Tabla de configuración de alertas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS config_alertas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email_destino TEXT NOT NULL,
+            alertas_mantenimiento BOOLEAN DEFAULT 1,
+            alertas_polizas BOOLEAN DEFAULT 1,
+            alertas_rtv BOOLEAN DEFAULT 1,
+            alertas_revisiones BOOLEAN DEFAULT 1,
+            alertas_combustible BOOLEAN DEFAULT 1,
+            alertas_bitacora BOOLEAN DEFAULT 1,
+            dias_anticipacion_polizas INTEGER DEFAULT 30,
+            dias_anticipacion_rtv INTEGER DEFAULT 30,
+            dias_anticipacion_mantenimiento INTEGER DEFAULT 30,
+            km_diferencia_alerta INTEGER DEFAULT 10,
+            activo BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Tabla de historial de alertas enviadas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS historial_alertas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo_alerta TEXT NOT NULL,
+            vehiculo_placa TEXT,
+            destinatario_email TEXT NOT NULL,
+            asunto TEXT NOT NULL,
+            mensaje TEXT,
+            estado TEXT DEFAULT 'enviado',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (vehiculo_placa) REFERENCES vehiculos (placa)
+        )
+    ''')
+
+    # Columnas agregadas después de la creación original de las tablas
+    _add_column_if_missing(cursor, "vehiculos", "km_inicial", "INTEGER DEFAULT 0")
+    _add_column_if_missing(cursor, "mantenimientos", "proximo_km", "INTEGER")
+    _add_column_if_missing(cursor, "mantenimientos", "proxima_fecha", "DATE")
+
+    for column, definition in (
+        ("luces_delanteras", "BOOLEAN DEFAULT 1"),
+        ("luces_traseras", "BOOLEAN DEFAULT 1"),
+        ("luces_direccionales", "BOOLEAN DEFAULT 1"),
+        ("luces_freno", "BOOLEAN DEFAULT 1"),
+        ("luces_reversa", "BOOLEAN DEFAULT 1"),
+        ("espejos_laterales", "BOOLEAN DEFAULT 1"),
+        ("espejo_retrovisor", "BOOLEAN DEFAULT 1"),
+        ("limpiaparabrisas", "BOOLEAN DEFAULT 1"),
+        ("cinturones", "BOOLEAN DEFAULT 1"),
+        ("bocina", "BOOLEAN DEFAULT 1"),
+        ("nivel_combustible", "TEXT DEFAULT 'lleno'"),
+        ("kilometraje", "INTEGER"),
+    ):
+        _add_column_if_missing(cursor, "revisiones", column, definition)
+
+def _migracion_002_indices_consultas(cursor):
+    """Índices compuestos alineados con las consultas más frecuentes"""
+    # Último odómetro y consumo por placa: WHERE placa = ? ORDER BY fecha DESC
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_combustible_placa_fecha ON combustible (placa, fecha DESC)")
+    # Último retorno completado: WHERE placa = ? AND estado = 'completado' ORDER BY fecha_retorno
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bitacora_placa_estado_retorno ON bitacora (placa, estado, fecha_retorno)")
+    # Pólizas por vencer: WHERE fecha_vencimiento BETWEEN ? AND ?
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_polizas_vencimiento ON polizas (fecha_vencimiento)")
+    # Revisiones rechazadas recientes: WHERE aprobado = 0 AND fecha >= ?
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_revisiones_aprobado_fecha ON revisiones (aprobado, fecha)")
+    # Historial ordenado: ORDER BY created_at DESC LIMIT ?
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_historial_alertas_created ON historial_alertas (created_at)")
+
+def _migracion_003_analyze(cursor):
+    """Estadísticas del planificador para que elija los índices nuevos"""
+    cursor.execute("ANALYZE")
+
+def _migracion_004_indices_listados(cursor):
+    """Índices de orden para la paginación por cursor y los filtros de los listados"""
+    # Orden de cada listado (id como desempate va implícito en el índice)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_mantenimientos_fecha ON mantenimientos (fecha)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_combustible_fecha ON combustible (fecha)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_revisiones_fecha ON revisiones (fecha)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rtv_vencimiento ON rtv (fecha_vencimiento)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bitacora_fecha_salida ON bitacora (fecha_salida)")
+    # Filtro por placa + mismo orden
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_mantenimientos_placa_fecha ON mantenimientos (placa, fecha)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_revisiones_placa_fecha ON revisiones (placa, fecha)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_polizas_placa_vencimiento ON polizas (placa, fecha_vencimiento)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_rtv_placa_vencimiento ON rtv (placa, fecha_vencimiento)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bitacora_placa_fecha_salida ON bitacora (placa, fecha_salida)")
+    # Filtro por estado (vehículos en curso) + orden por salida
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bitacora_estado_fecha_salida ON bitacora (estado, fecha_salida)")
+    cursor.execute("ANALYZE")
+
+def _migracion_005_versiones_tablas(cursor):
+    """Contador de versión por tabla mantenido por triggers en cada INSERT/UPDATE/DELETE"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    for table in ("vehiculos", "mantenimientos", "combustible", "revisiones", "polizas",
+                  "rtv", "bitacora", "config_alertas", "historial_alertas"):
+        cursor.execute("INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (?, 0)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+                END
+            ''')
+
+def _migracion_006_email_outbox(cursor):
+    """Cola persistente de emails: los endpoints encolan y un worker entrega con reintentos"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo_alerta TEXT NOT NULL,
+            vehiculo_placa TEXT,
+            destinatario_email TEXT NOT NULL,
+            asunto TEXT NOT NULL,
+            cuerpo TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'pendiente',
+            intentos INTEGER NOT NULL DEFAULT 0,
+            max_intentos INTEGER NOT NULL DEFAULT 6,
+            proximo_intento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            bloqueado_hasta TIMESTAMP,
+            ultimo_error TEXT,
+            historial_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            enviado_at TIMESTAMP,
+            FOREIGN KEY (historial_id) REFERENCES historial_alertas (id)
+        )
+    ''')
+    # El worker busca solo los pendientes vencidos (o reservas expiradas)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_estado_intento ON email_outbox (estado, proximo_intento)")
+
+def _migracion_007_vehicle_state(cursor):
+    """Estado actual por placa mantenido por triggers (kilometraje, viaje en curso, próximo mantenimiento)"""
+    install_vehicle_state(cursor)
+
+def _migracion_008_alertas_activas(cursor):
+    """Alertas materializadas por placa, reevaluadas tras cada escritura (alertas_pendientes)"""
+    install_alertas_activas(cursor)
+
+def _migracion_009_huellas_alertas(cursor):
+    """Huella por alerta (categoría, placa, vencimiento, severidad) y qué huella se notificó por email"""
+    for column, definition in (
+        ("severidad", "TEXT"),
+        ("fingerprint", "TEXT"),
+        ("notificada_fingerprint", "TEXT"),
+        ("notificada_historial_id", "INTEGER REFERENCES historial_alertas (id)"),
+        ("notificada_at", "TIMESTAMP"),
+        ("resolucion_notificada_at", "TIMESTAMP"),
+    ):
+        _add_column_if_missing(cursor, "alertas_activas", column, definition)
+    # Resoluciones por avisar: pocas filas dentro de un historial que crece
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_alertas_activas_resolucion_pendiente ON alertas_activas (placa)
+        WHERE resolved_at IS NOT NULL AND notificada_fingerprint IS NOT NULL AND resolucion_notificada_at IS NULL
+    ''')
+    # Forzar un barrido en la próxima lectura para calcular las huellas de las alertas existentes
+    cursor.execute("DELETE FROM alertas_barrido")
+
+def _migracion_010_programador_tareas(cursor):
+    """Lease de líder del programador de tareas e historial de ejecuciones (job_runs)"""
+    install_job_scheduler(cursor)
+
+def _migracion_011_email_texto_plano(cursor):
+    """Alternativa en texto plano de cada email encolado"""
+    _add_column_if_missing(cursor, "email_outbox", "cuerpo_texto", "TEXT")
+
+def _migracion_012_umbrales_retorno(cursor):
+    """Umbral de horas sin retorno por vehículo (NULL = el general de config_alertas)"""
+    _add_column_if_missing(cursor, "vehiculos", "horas_retorno_max", "REAL")
+    _add_column_if_missing(cursor, "config_alertas", "horas_retorno_pendiente", "REAL DEFAULT 24")
+
+def _migracion_013_config_email(cursor):
+    """Configuración de email persistida (compartida por todos los workers) con versión por tabla"""
+    install_config_email(cursor)
+
+def _migracion_014_change_log(cursor):
+    """Registro de cambios (tabla, id, operación, secuencia) mantenido por triggers en las tablas de negocio"""
+    install_change_log(cursor)
+
+def _migracion_015_idempotencia(cursor):
+    """Claves de idempotencia de los POST (reintentos sin registros duplicados)"""
+    install_idempotency_keys(cursor)
+
+def _migracion_016_catalogo_backups(cursor):
+    """Catálogo de backups con la huella de los datos respaldados (para omitir backups sin cambios)"""
+    install_backup_catalog(cursor)
+
+# Lista ordenada: (versión, descripción, paso). Nunca modificar un paso ya publicado;
+# los cambios de esquema nuevos se agregan al final con la siguiente versión.
+MIGRATIONS = [
+    (1, "Esquema base", _migracion_001_esquema_base),
+    (2, "Índices para consultas frecuentes", _migracion_002_indices_consultas),
+    (3, "ANALYZE inicial", _migracion_003_analyze),
+    (4, "Índices para listados paginados", _migracion_004_indices_listados),
+    (5, "Versiones por tabla para ETags", _migracion_005_versiones_tablas),
+    (6, "Cola de emails (outbox)", _migracion_006_email_outbox),
+    (7, "Estado actual por vehículo", _migracion_007_vehicle_state),
+    (8, "Alertas activas materializadas", _migracion_008_alertas_activas),
+    (9, "Huellas de alertas para notificar solo cambios", _migracion_009_huellas_alertas),
+    (10, "Programador de tareas", _migracion_010_programador_tareas),
+    (11, "Texto plano en la cola de emails", _migracion_011_email_texto_plano),
+    (12, "Umbrales de retorno pendiente", _migracion_012_umbrales_retorno),
+    (13, "Configuración de email en la base", _migracion_013_config_email),
+    (14, "Registro de cambios para sincronización incremental", _migracion_014_change_log),
+    (15, "Claves de idempotencia", _migracion_015_idempotencia),
+    (16, "Catálogo de backups", _migracion_016_catalogo_backups),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# ================================
+# EJECUTOR
+# ================================
+
+def _ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+def get_schema_version(conn) -> int:
+    """Versión actual del esquema (0 si nunca se migró)"""
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except Exception:
+        return 0
+    return row[0] or 0
+
+def apply_migrations(conn) -> list:
+    """Aplicar en orden las migraciones pendientes. Devuelve las versiones aplicadas"""
+    # Camino rápido: una sola consulta cuando el esquema ya está al día
+    if get_schema_version(conn) >= LATEST_VERSION:
+        return []
+
+    _ensure_version_table(conn)
+    applied = []
+
+    for version, description, step in MIGRATIONS:
+        # BEGIN IMMEDIATE: si varios workers arrancan a la vez, solo uno migra cada versión
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+
+            step(conn.cursor())
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"❌ Falló la migración {version}: {description}")
+            raise
+
+        applied.append(version)
+        logger.info(f"🗄️ Migración {version} aplicada: {description}")
+
+    return applied
+
+def get_migration_history(conn) -> list:
+    """Migraciones registradas en schema_version"""
+    _ensure_version_table(conn)
+    rows = conn.execute("SELECT version, description, applied_at FROM schema_version ORDER BY version")
+    return [dict(zip(("version", "description", "applied_at"), row)) for row in rows]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Paginación por Cursor (Keyset) y Filtros para los Listados del Sistema Vehicular
+Las condiciones se traducen a SQL indexado en lugar de filtrar en Python
+"""
+
+import json
+import base64
+
+MAX_PAGE_SIZE = 500
+
+class InvalidCursorError(ValueError):
+    """El cursor recibido no corresponde a este listado"""
+
+class ListSpec:
+    """Cómo se ordena y filtra un listado"""
+
+    def __init__(self, table, sort_column, descending=True, date_column=None, filters=None):
+        self.table = table
+        self.sort_column = sort_column
+        self.descending = descending
+        # Columna usada por los filtros desde/hasta
+        self.date_column = date_column
+        # Parámetro de la API -> columna de la tabla
+        self.filters = filters or {}
+
+# Mismo orden que tenían los listados originales, con id como desempate estable
+LIST_SPECS = {
+    "vehiculos": ListSpec("vehiculos", "placa", descending=False,
+                          filters={"placa": "placa"}),
+    "mantenimientos": ListSpec("mantenimientos", "fecha", date_column="fecha",
+                               filters={"placa": "placa", "tipo": "tipo"}),
+    "combustible": ListSpec("combustible", "fecha", date_column="fecha",
+                            filters={"placa": "placa"}),
+    "revisiones": ListSpec("revisiones", "fecha", date_column="fecha",
+                           filters={"placa": "placa"}),
+    "polizas": ListSpec("polizas", "fecha_vencimiento", descending=False, date_column="fecha_vencimiento",
+                        filters={"placa": "placa", "estado": "estado", "tipo": "tipo_cobertura"}),
+    "rtv": ListSpec("rtv", "fecha_vencimiento", date_column="fecha_vencimiento",
+                    filters={"placa": "placa", "estado": "estado"}),
+    "bitacora": ListSpec("bitacora", "fecha_salida", date_column="fecha_salida",
+                         filters={"placa": "placa", "estado": "estado"}),
+}
+
+def encode_cursor(row, spec) -> str:
+    """Cursor opaco con la clave de orden de la última fila entregada"""
+    raw = json.dumps([row[spec.sort_column], row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Recuperar (valor de orden, id) desde un cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return sort_value, int(row_id)
+    except Exception:
+        raise InvalidCursorError("Cursor inválido")
+
+def build_list_query(spec, filters=None, desde=None, hasta=None, limit=None, after=None):
+    """Construir el SELECT con filtros, condición de cursor y LIMIT (se pide una fila extra)"""
+    conditions = []
+    params = []
+
+    for name, value in (filters or {}).items():
+        if value is None or value == "" or name not in spec.filters:
+            continue
+        if name == "placa":
+            value = value.strip().upper()
+        conditions.append(f"{spec.filters[name]} = ?")
+        params.append(value)
+
+    if spec.date_column:
+        if desde:
+            conditions.append(f"{spec.date_column} >= ?")
+            params.append(desde)
+        if hasta:
+            # Inclusivo para DATE y DATETIME sin envolver la columna (mantiene el índice)
+            conditions.append(f"{spec.date_column} < date(?, '+1 day')")
+            params.append(hasta)
+
+    if after:
+        sort_value, row_id = decode_cursor(after)
+        op = "<" if spec.descending else ">"
+        conditions.append(f"({spec.sort_column}, id) {op} (?, ?)")
+        params.extend([sort_value, row_id])
+
+    direction = "DESC" if spec.descending else "ASC"
+    query = f"SELECT * FROM {spec.table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {spec.sort_column} {direction}, id {direction}"
+
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit + 1)
+
+    return query, params
+
+def clamp_limit(limit):
+    """Normalizar el tamaño de página (None = listado completo)"""
+    if limit is None:
+        return None
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+def fetch_page(conn, spec, filters=None, desde=None, hasta=None, limit=None, after=None) -> dict:
+    """Ejecutar el listado. Con limit devuelve también next_cursor/has_more"""
+    limit = clamp_limit(limit)
+    query, params = build_list_query(spec, filters, desde, hasta, limit, after)
+    rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+
+    if limit is None:
+        return {"data": rows}
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "data": rows,
+        "next_cursor": encode_cursor(rows[-1], spec) if has_more else None,
+        "has_more": has_more,
+        "limit": limit,
+    }
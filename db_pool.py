@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Pool de Conexiones SQLite para el Sistema Vehicular
+Reutiliza conexiones pre-configuradas en lugar de abrir una nueva por request
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs aplicados una sola vez al crear cada conexión
+DEFAULT_PRAGMAS = (
+    ("journal_mode", "WAL"),          # Lectores no bloquean al escritor
+    ("synchronous", "NORMAL"),        # Seguro con WAL y mucho más rápido que FULL
+    ("busy_timeout", 5000),           # Esperar hasta 5s por el lock en vez de fallar
+    ("cache_size", -16000),           # ~16 MB de caché de páginas por conexión
+    ("mmap_size", 134217728),         # 128 MB de lectura mapeada en memoria
+    ("foreign_keys", "ON"),
+)
+
+class PoolTimeoutError(Exception):
+    """No se obtuvo una conexión libre dentro del tiempo de espera"""
+
+class PooledConnection:
+    """Conexión prestada por el pool. close() la devuelve al pool en vez de cerrarla"""
+
+    __slots__ = ("_pool", "_conn")
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def close(self):
+        """Devolver la conexión al pool (idempotente)"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool._release(conn)
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Conexión ya devuelta al pool")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+class SQLiteConnectionPool:
+    """Pool acotado de conexiones SQLite reutilizables y seguras entre hilos"""
+
+    def __init__(self, db_path, max_size=8, timeout=30.0, pragmas=DEFAULT_PRAGMAS):
+        self.db_path = db_path
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self.pragmas = tuple(pragmas)
+
+        # LIFO: la conexión usada más recientemente tiene la caché más caliente
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+        # Estadísticas
+        self._created = 0
+        self._checked_out = 0
+        self._peak_checked_out = 0
+        self._total_checkouts = 0
+        self._waits = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+
+    def _create_connection(self):
+        """Abrir una conexión nueva y aplicar los PRAGMAs de rendimiento"""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        """Tomar una conexión del pool, creando una nueva si aún hay cupo"""
+        start = time.monotonic()
+        waited = False
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            create = False
+            with self._lock:
+                if self._created < self.max_size:
+                    self._created += 1
+                    create = True
+
+            if create:
+                try:
+                    conn = self._create_connection()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                waited = True
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Sin conexiones libres tras {self.timeout}s (máximo {self.max_size})"
+                    )
+
+        wait = time.monotonic() - start
+        with self._lock:
+            self._checked_out += 1
+            self._peak_checked_out = max(self._peak_checked_out, self._checked_out)
+            self._total_checkouts += 1
+            if waited:
+                self._waits += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+
+        return PooledConnection(self, conn)
+
+    def _release(self, conn):
+        """Devolver una conexión al pool descartando cualquier transacción abierta"""
+        with self._lock:
+            self._checked_out -= 1
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Conexión dañada descartada del pool: {e}")
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            with self._lock:
+                self._created -= 1
+                self._discarded += 1
+            return
+
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager: `with pool.connection() as conn:` devuelve siempre la conexión"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def checkpoint(self, mode="PASSIVE"):
+        """Volcar el WAL al archivo principal (antes de copiar el .db en un backup)"""
+        with self.connection() as conn:
+            return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+
+    def stats(self) -> dict:
+        """Estadísticas del pool para dimensionarlo según el tráfico"""
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "created": self._created,
+                "checked_out": self._checked_out,
+                "idle": self._idle.qsize(),
+                "peak_checked_out": self._peak_checked_out,
+                "total_checkouts": self._total_checkouts,
+                "waits": self._waits,
+                "total_wait_ms": round(self._total_wait * 1000, 2),
+                "avg_wait_ms": round(self._total_wait * 1000 / self._waits, 2) if self._waits else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2),
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+            }
+
+    def close_all(self):
+        """Cerrar todas las conexiones libres (al apagar la aplicación)"""
+        closed = 0
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            closed += 1
+        with self._lock:
+            self._created -= closed
+        return closed
+
+def create_pool_from_env(db_path) -> SQLiteConnectionPool:
+    """Crear el pool usando DB_POOL_SIZE / DB_POOL_TIMEOUT si están definidas"""
+    max_size = int(os.environ.get("DB_POOL_SIZE", "8"))
+    timeout = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+    pool = SQLiteConnectionPool(db_path, max_size=max_size, timeout=timeout)
+    logger.info(f"🗄️ Pool SQLite configurado: {db_path} (máximo {max_size} conexiones)")
+    return pool
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Copias Consistentes de la Base de Datos (snapshot) para el Sistema Vehicular
+Los backups copiaban el archivo .db con shutil.copy2: con escrituras concurrentes (y el WAL aparte)
+la copia puede quedar a mitad de una transacción. Aquí la copia usa la API de backup de SQLite por
+páginas, con una pausa entre pasos para no acaparar la base, o VACUUM INTO (copia compactada en una
+sola transacción de lectura). En modo WAL ninguna de las dos bloquea al escritor.
+"""
+
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+# Páginas por paso y pausa entre pasos (BACKUP_SNAPSHOT_PAGES / BACKUP_SNAPSHOT_SLEEP_MS)
+SNAPSHOT_PAGES = int(os.environ.get("BACKUP_SNAPSHOT_PAGES", "1024"))
+SNAPSHOT_SLEEP = float(os.environ.get("BACKUP_SNAPSHOT_SLEEP_MS", "5")) / 1000
+
+# Si otra conexión escribe durante la copia por páginas, SQLite la reinicia. Tras estos reinicios se
+# copia en un solo paso: en modo WAL es una transacción de lectura y los escritores siguen trabajando
+MAX_REINICIOS = 3
+
+METODOS = ("backup", "vacuum")
+
+class _DemasiadosReinicios(Exception):
+    pass
+
+def _conectar(source, timeout):
+    if isinstance(source, sqlite3.Connection):
+        return source, False
+    return sqlite3.connect(f"file:{os.fspath(source)}?mode=ro", uri=True, timeout=timeout), True
+
+def _copiar_paginas(origen, destino, pages, sleep, progress, estado):
+    def _progreso(status, remaining, total):
+        copiadas = total - remaining
+        if copiadas < estado["copiadas"]:
+            # La copia volvió a empezar: alguien escribió en la base mientras tanto
+            estado["reinicios"] += 1
+            if estado["reinicios"] > MAX_REINICIOS:
+                raise _DemasiadosReinicios()
+        estado.update(copiadas=copiadas, total=total, pasos=estado["pasos"] + 1)
+        if progress is not None:
+            progress(copiadas, total)
+
+    try:
+        origen.backup(destino, pages=pages, progress=_progreso, sleep=sleep)
+    except _DemasiadosReinicios:
+        logger.info(f"📸 Copia por páginas reiniciada {estado['reinicios']} veces: copiando en un solo paso")
+        estado["copiadas"] = 0
+        origen.backup(destino, pages=-1, progress=_progreso)
+
+def snapshot_database(source, dest_path, method="backup", pages=None, sleep=None, progress=None,
+                      timeout=30.0) -> dict:
+    """Copia consistente de la base en dest_path (se escribe aparte y se renombra al terminar).
+
+    source: ruta del .db o una conexión abierta. method: "backup" (por páginas, con pausa entre
+    pasos) o "vacuum" (VACUUM INTO, compactada). progress(copiadas, total) se llama tras cada paso.
+    Devuelve páginas, bytes, pasos, reinicios, segundos y MB/s.
+    """
+    if method not in METODOS:
+        raise ValueError(f"Método de copia desconocido: {method}")
+    pages = pages or SNAPSHOT_PAGES
+    sleep = SNAPSHOT_SLEEP if sleep is None else sleep
+
+    dest_path = os.fspath(dest_path)
+    temporal = f"{dest_path}.tmp"
+    if os.path.exists(temporal):
+        os.remove(temporal)
+
+    origen, propia = _conectar(source, timeout)
+    estado = {"copiadas": 0, "total": 0, "pasos": 0, "reinicios": 0}
+    inicio = time.perf_counter()
+    try:
+        if method == "vacuum":
+            origen.execute("VACUUM INTO ?", (temporal,))
+            estado["pasos"] = 1
+        else:
+            destino = sqlite3.connect(temporal)
+            try:
+                _copiar_paginas(origen, destino, pages, sleep, progress, estado)
+                # La copia es un archivo suelto: sin WAL, para que se pueda mover o comprimir tal cual
+                destino.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                destino.close()
+        os.replace(temporal, dest_path)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    finally:
+        if propia:
+            origen.close()
+
+    segundos = time.perf_counter() - inicio
+    tamano = os.path.getsize(dest_path)
+    resultado = {
+        "path": dest_path,
+        "method": method,
+        "bytes": tamano,
+        "pages": estado["total"] or None,
+        "steps": estado["pasos"],
+        "restarts": estado["reinicios"],
+        "seconds": round(segundos, 3),
+        "mb_per_s": round(tamano / 1048576 / segundos, 1) if segundos > 0 else None,
+    }
+    logger.info(f"📸 Snapshot {os.path.basename(dest_path)}: {tamano / 1048576:.1f} MB en {segundos:.2f}s "
+                f"({resultado['mb_per_s']} MB/s, {estado['pasos']} pasos, {estado['reinicios']} reinicios)")
+    return resultado
+
+def restore_database(backup_path, db_path, timeout=30.0) -> dict:
+    """Reemplazar el contenido de la base en uso por el de un backup.
+
+    A diferencia de copiar el archivo encima, las conexiones abiertas (y el WAL) ven el cambio como
+    una transacción más. Toma el bloqueo de escritura durante la copia.
+    """
+    origen = sqlite3.connect(f"file:{os.fspath(backup_path)}?mode=ro", uri=True)
+    destino = sqlite3.connect(os.fspath(db_path), timeout=timeout)
+    inicio = time.perf_counter()
+    try:
+        origen.backup(destino)
+    finally:
+        destino.close()
+        origen.close()
+    segundos = time.perf_counter() - inicio
+    logger.info(f"♻️ Base restaurada desde {os.path.basename(os.fspath(backup_path))} en {segundos:.2f}s")
+    return {"path": os.fspath(db_path), "restored_from": os.fspath(backup_path), "seconds": round(segundos, 3)}
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Cola Persistente de Emails (Outbox) para el Sistema Vehicular
+Los endpoints solo encolan; un worker asyncio entrega con concurrencia acotada, límite de
+envíos por minuto, reintentos con backoff exponencial y cola de fallidos (dead-letter)
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from async_db import set_event_threadsafe
+
+logger = logging.getLogger(__name__)
+
+# Estados de email_outbox
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_ENVIANDO = "enviando"
+ESTADO_ENVIADO = "enviado"
+ESTADO_FALLIDO = "fallido"
+
+class EmailDeliveryError(Exception):
+    """El proveedor no pudo entregar el email. permanent=True evita los reintentos"""
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+# ================================
+# PROVEEDORES
+# ================================
+
+class CallableEmailProvider:
+    """Adapta una función send(subject, body, recipient, text_body=None) -> bool (p.ej. send_email_notification).
+    La función puede lanzar EmailDeliveryError para indicar si el fallo es permanente"""
+
+    def __init__(self, send_func, name="default"):
+        self.send_func = send_func
+        self.name = name
+
+    def send(self, recipient, subject, body, text=None):
+        enviado = self.send_func(subject, body, recipient, text_body=text) if text else \
+            self.send_func(subject, body, recipient)
+        if not enviado:
+            raise EmailDeliveryError("El proveedor de email rechazó el envío")
+
+class StubEmailProvider:
+    """Proveedor local para pruebas: no sale a la red y guarda lo enviado en memoria"""
+
+    name = "stub"
+
+    def __init__(self, fail_rate=0.0, latency_seconds=0.0):
+        self.fail_rate = fail_rate
+        self.latency_seconds = latency_seconds
+        self.sent = []
+        self.attempts = 0
+        self._lock = threading.Lock()
+
+    def send(self, recipient, subject, body, text=None):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self._lock:
+            self.attempts += 1
+            if random.random() < self.fail_rate:
+                raise EmailDeliveryError("Fallo simulado del proveedor stub")
+            self.sent.append({"recipient": recipient, "subject": subject, "body": body, "text": text})
+        logger.info(f"📧 [stub] Email a {recipient}: {subject}")
+
+# ================================
+# ACCESO A LA TABLA
+# ================================
+
+def enqueue_email(conn, tipo_alerta, asunto, cuerpo, destinatario, vehiculo_placa=None,
+                  mensaje=None, max_intentos=6, cuerpo_texto=None) -> int:
+    """Encolar un email y su registro en historial_alertas (estado 'pendiente'). No hace commit.
+    cuerpo es HTML; cuerpo_texto, la alternativa en texto plano (opcional)"""
+    cursor = conn.execute('''
+        INSERT INTO historial_alertas
+        (tipo_alerta, vehiculo_placa, destinatario_email, asunto, mensaje, estado)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (tipo_alerta, vehiculo_placa, destinatario, asunto, mensaje, ESTADO_PENDIENTE))
+    historial_id = cursor.lastrowid
+
+    cursor = conn.execute('''
+        INSERT INTO email_outbox
+        (tipo_alerta, vehiculo_placa, destinatario_email, asunto, cuerpo, cuerpo_texto, max_intentos, historial_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (tipo_alerta, vehiculo_placa, destinatario, asunto, cuerpo, cuerpo_texto, max_intentos, historial_id))
+    return cursor.lastrowid
+
+def _claim_batch(conn, limit, lease_seconds):
+    """Reservar hasta `limit` emails vencidos. Las reservas expiradas (worker caído) se retoman"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute('''
+            UPDATE email_outbox
+            SET estado = ?, intentos = intentos + 1, bloqueado_hasta = datetime('now', ?)
+            WHERE id IN (
+                SELECT id FROM email_outbox
+                WHERE (estado = ? AND proximo_intento <= datetime('now'))
+                   OR (estado = ? AND bloqueado_hasta <= datetime('now'))
+                ORDER BY proximo_intento, id
+                LIMIT ?
+            )
+            RETURNING *
+        ''', (ESTADO_ENVIANDO, f"+{int(lease_seconds)} seconds",
+              ESTADO_PENDIENTE, ESTADO_ENVIANDO, limit)).fetchall()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return [dict(row) for row in rows]
+
+def _mark_sent(conn, email):
+    conn.execute('''
+        UPDATE email_outbox
+        SET estado = ?, enviado_at = CURRENT_TIMESTAMP, bloqueado_hasta = NULL, ultimo_error = NULL
+        WHERE id = ?
+    ''', (ESTADO_ENVIADO, email["id"]))
+    if email["historial_id"]:
+        conn.execute("UPDATE historial_alertas SET estado = ? WHERE id = ?",
+                     (ESTADO_ENVIADO, email["historial_id"]))
+    conn.commit()
+
+def _mark_retry(conn, email, delay_seconds, error):
+    conn.execute('''
+        UPDATE email_outbox
+        SET estado = ?, proximo_intento = datetime('now', ?), bloqueado_hasta = NULL, ultimo_error = ?
+        WHERE id = ?
+    ''', (ESTADO_PENDIENTE, f"+{int(delay_seconds)} seconds", error, email["id"]))
+    conn.commit()
+
+def _mark_dead(conn, email, error):
+    conn.execute('''
+        UPDATE email_outbox
+        SET estado = ?, bloqueado_hasta = NULL, ultimo_error = ?
+        WHERE id = ?
+    ''', (ESTADO_FALLIDO, error, email["id"]))
+    if email["historial_id"]:
+        conn.execute("UPDATE historial_alertas SET estado = ? WHERE id = ?",
+                     (ESTADO_FALLIDO, email["historial_id"]))
+    conn.commit()
+
+def _requeue(conn, outbox_id):
+    cursor = conn.execute('''
+        UPDATE email_outbox
+        SET estado = ?, intentos = 0, proximo_intento = CURRENT_TIMESTAMP, ultimo_error = NULL
+        WHERE id = ? AND estado = ?
+    ''', (ESTADO_PENDIENTE, outbox_id, ESTADO_FALLIDO))
+    if cursor.rowcount:
+        conn.execute('''
+            UPDATE historial_alertas SET estado = ?
+            WHERE id = (SELECT historial_id FROM email_outbox WHERE id = ?)
+        ''', (ESTADO_PENDIENTE, outbox_id))
+    conn.commit()
+    return cursor.rowcount > 0
+
+def _count_by_state(conn):
+    rows = conn.execute("SELECT estado, COUNT(*) FROM email_outbox GROUP BY estado").fetchall()
+    counts = {ESTADO_PENDIENTE: 0, ESTADO_ENVIANDO: 0, ESTADO_ENVIADO: 0, ESTADO_FALLIDO: 0}
+    counts.update({row[0]: row[1] for row in rows})
+    return counts
+
+def _list_dead_letters(conn, limit):
+    rows = conn.execute('''
+        SELECT id, tipo_alerta, vehiculo_placa, destinatario_email, asunto, intentos,
+               ultimo_error, historial_id, created_at
+        FROM email_outbox
+        WHERE estado = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (ESTADO_FALLIDO, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+# ================================
+# WORKER
+# ================================
+
+class RateLimiter:
+    """Token bucket: como máximo `rate` envíos por `per` segundos, con ráfagas de hasta `rate`"""
+
+    def __init__(self, rate, per=60.0):
+        self.rate = max(rate, 1)
+        self.per = per
+        self._tokens = float(self.rate)
+        self._updated = time.monotonic()
+        self.waits = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.per)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            self.waits += 1
+            await asyncio.sleep((1 - self._tokens) * self.per / self.rate)
+
+class EmailOutbox:
+    """Entrega en segundo plano de los emails encolados en email_outbox"""
+
+    def __init__(self, async_db, provider, concurrency=4, rate_per_minute=60, max_attempts=6,
+                 retry_base_seconds=30.0, retry_max_seconds=3600.0, poll_seconds=5.0, lease_seconds=300):
+        self.db = async_db
+        self.provider = provider
+        self.concurrency = max(concurrency, 1)
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.limiter = RateLimiter(rate_per_minute, per=60.0)
+
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._executor = None
+        self._inflight = set()
+
+        # Métricas
+        self._sent = 0
+        self._retried = 0
+        self._dead_lettered = 0
+        self._last_error = None
+        self._last_sent_at = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Iniciar el worker en el event loop actual"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        # Hilos propios: un proveedor lento no ocupa el executor de backups
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="email")
+        self._task = asyncio.create_task(self._dispatcher(), name="email-outbox")
+        logger.info(f"📧 Cola de emails iniciada (proveedor {self.provider.name}, {self.concurrency} envíos "
+                    f"simultáneos, {self.limiter.rate}/min, {self.max_attempts} intentos)")
+
+    async def stop(self, timeout=10.0):
+        """Detener el worker esperando los envíos en curso. Lo no terminado se retoma al expirar la reserva"""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight:
+            await asyncio.wait(list(self._inflight), timeout=timeout)
+        self._executor.shutdown(wait=False)
+
+    def notify(self):
+        """Despertar al worker tras encolar (también desde otros hilos)"""
+        set_event_threadsafe(self._loop, self._wakeup)
+
+    async def enqueue(self, tipo_alerta, asunto, cuerpo, destinatario, vehiculo_placa=None, mensaje=None,
+                      cuerpo_texto=None) -> int:
+        """Encolar un email (con su registro en historial_alertas) y volver sin esperar el envío"""
+        def _enqueue(conn):
+            outbox_id = enqueue_email(conn, tipo_alerta, asunto, cuerpo, destinatario,
+                                      vehiculo_placa, mensaje, self.max_attempts, cuerpo_texto)
+            conn.commit()
+            return outbox_id
+
+        outbox_id = await self.db.run(_enqueue)
+        self.notify()
+        return outbox_id
+
+    async def requeue(self, outbox_id) -> bool:
+        """Volver a poner en cola un email de la cola de fallidos"""
+        requeued = await self.db.run(_requeue, outbox_id)
+        if requeued:
+            self.notify()
+        return requeued
+
+    async def dead_letters(self, limit=50) -> list:
+        return await self.db.run(_list_dead_letters, limit)
+
+    def _backoff(self, attempts):
+        """Espera antes del siguiente intento: base * 2^(n-1), con tope y jitter de ±20%"""
+        delay = min(self.retry_base_seconds * 2 ** (attempts - 1), self.retry_max_seconds)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def _dispatcher(self):
+        while True:
+            free = self.concurrency - len(self._inflight)
+            if free > 0:
+                # Limpiar antes de consultar: un enqueue durante la consulta no se pierde
+                self._wakeup.clear()
+                try:
+                    emails = await self.db.run(_claim_batch, free, self.lease_seconds)
+                except Exception as e:
+                    logger.error(f"❌ Error leyendo la cola de emails: {e}")
+                    emails = []
+                for email in emails:
+                    task = asyncio.create_task(self._deliver(email))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._delivery_done)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def _delivery_done(self, task):
+        self._inflight.discard(task)
+        # Un hueco libre: buscar más trabajo sin esperar al sondeo
+        self._wakeup.set()
+
+    async def _deliver(self, email):
+        await self.limiter.acquire()
+        try:
+            await self._loop.run_in_executor(
+                self._executor, self.provider.send,
+                email["destinatario_email"], email["asunto"], email["cuerpo"], email.get("cuerpo_texto")
+            )
+        except Exception as e:
+            await self._handle_failure(email, e)
+            return
+
+        try:
+            await self.db.run(_mark_sent, email)
+        except Exception as e:
+            logger.error(f"❌ Email {email['id']} enviado pero no se pudo marcar: {e}")
+        self._sent += 1
+        self._last_sent_at = time.time()
+        logger.info(f"✅ Email {email['id']} entregado a {email['destinatario_email']} ({email['tipo_alerta']})")
+
+    async def _handle_failure(self, email, error):
+        message = str(error) or error.__class__.__name__
+        self._last_error = message
+        permanent = isinstance(error, EmailDeliveryError) and error.permanent
+        try:
+            if permanent or email["intentos"] >= email["max_intentos"]:
+                await self.db.run(_mark_dead, email, message)
+                self._dead_lettered += 1
+                logger.error(f"❌ Email {email['id']} movido a fallidos tras {email['intentos']} intentos: {message}")
+            else:
+                delay = self._backoff(email["intentos"])
+                await self.db.run(_mark_retry, email, delay, message)
+                self._retried += 1
+                logger.warning(f"⚠️ Email {email['id']} falló (intento {email['intentos']}), "
+                               f"reintento en {delay:.0f}s: {message}")
+        except Exception as e:
+            logger.error(f"❌ No se pudo registrar el fallo del email {email['id']}: {e}")
+
+    async def metrics(self) -> dict:
+        """Estado de la cola (por estado en la tabla) y contadores del worker"""
+        counts = await self.db.run(_count_by_state)
+        return {
+            "running": self.running,
+            "provider": self.provider.name,
+            "queue": counts,
+            "in_flight": len(self._inflight),
+            "concurrency": self.concurrency,
+            "rate_per_minute": self.limiter.rate,
+            "rate_limit_waits": self.limiter.waits,
+            "max_attempts": self.max_attempts,
+            "sent": self._sent,
+            "retried": self._retried,
+            "dead_lettered": self._dead_lettered,
+            "last_sent_at": self._last_sent_at,
+            "last_error": self._last_error,
+        }
+
+def create_outbox_from_env(async_db, send_func) -> EmailOutbox:
+    """Crear la cola usando EMAIL_PROVIDER / EMAIL_WORKERS / EMAIL_RATE_LIMIT_PER_MINUTE / EMAIL_MAX_ATTEMPTS"""
+    if os.environ.get("EMAIL_PROVIDER", "").lower() == "stub":
+        provider = StubEmailProvider(
+            fail_rate=float(os.environ.get("EMAIL_STUB_FAIL_RATE", "0")),
+            latency_seconds=float(os.environ.get("EMAIL_STUB_LATENCY_SECONDS", "0")),
+        )
+    else:
+        provider = CallableEmailProvider(send_func)
+
+    return EmailOutbox(
+        async_db,
+        provider,
+        concurrency=int(os.environ.get("EMAIL_WORKERS", "4")),
+        rate_per_minute=int(os.environ.get("EMAIL_RATE_LIMIT_PER_MINUTE", "60")),
+        max_attempts=int(os.environ.get("EMAIL_MAX_ATTEMPTS", "6")),
+        retry_base_seconds=float(os.environ.get("EMAIL_RETRY_BASE_SECONDS", "30")),
+        retry_max_seconds=float(os.environ.get("EMAIL_RETRY_MAX_SECONDS", "3600")),
+        poll_seconds=float(os.environ.get("EMAIL_POLL_SECONDS", "5")),
+    )
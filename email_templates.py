@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""
+Plantillas de Email del Sistema Vehicular
+Cada plantilla se compila una sola vez (al importar el módulo) a una función que une trozos literales
+y campos en un solo join; las filas de las tablas se arman con una plantilla parcial por fila y un
+join por tabla. Cada email se genera en HTML y en texto plano (alternativa para clientes sin HTML).
+"""
+
+import html
+import logging
+import textwrap
+from functools import lru_cache
+from string import Formatter
+from collections import namedtuple
+from datetime import date
+
+from alert_engine import fallas_revision
+
+logger = logging.getLogger(__name__)
+
+RenderedEmail = namedtuple("RenderedEmail", ["html", "text"])
+
+# Placas, tipos, marcas y fechas se repiten fila tras fila: escapar cada valor distinto una sola vez
+_escape = lru_cache(maxsize=16384)(html.escape)
+
+NOMBRES_CATEGORIA_ALERTA = {
+    "mantenimiento_fecha": "Mantenimiento por fecha",
+    "mantenimiento_km": "Mantenimiento por kilometraje",
+    "polizas": "Póliza",
+    "rtv": "RTV",
+    "revisiones": "Revisión con fallas",
+    "combustible": "Consumo de combustible",
+}
+
+# ================================
+# MOTOR DE PLANTILLAS
+# ================================
+
+class Template:
+    """Plantilla con campos {nombre} o {nombre:formato} compilada a una función de Python.
+    En HTML los valores se escapan; {nombre!s} inserta sin escapar (HTML ya armado, p.ej. filas)"""
+
+    def __init__(self, source, escape=True, name="plantilla"):
+        self.name = name
+        self.source = source
+        self.render = self._compile(source, escape, name)
+
+    @staticmethod
+    def _compile(source, escape, name):
+        partes = []
+        for literal, campo, formato, conversion in Formatter().parse(source):
+            if literal:
+                partes.append(repr(literal))
+            if campo is None:
+                continue
+            if not campo.isidentifier():
+                raise ValueError(f"Campo inválido en la plantilla {name}: {{{campo}}}")
+            valor = f"format(v[{campo!r}], {formato!r})" if formato else f"str(v[{campo!r}])"
+            if escape and conversion != "s":
+                valor = f"_escape({valor})"
+            partes.append(valor)
+
+        codigo = f"def render(v):\n    return ''.join(({', '.join(partes)},))" if partes else \
+                 "def render(v):\n    return ''"
+        namespace = {"_escape": _escape}
+        exec(compile(codigo, f"<plantilla {name}>", "exec"), namespace)
+        return namespace["render"]
+
+    def render_rows(self, filas) -> str:
+        """Una tabla completa: la parcial de fila aplicada a cada fila y un solo join"""
+        return "".join(map(self.render, filas))
+
+def html_template(source, name):
+    return Template(source, escape=True, name=name)
+
+def text_template(source, name):
+    # Las plantillas de texto se escriben indentadas junto al código
+    return Template(textwrap.dedent(source).strip("\n") + "\n", escape=False, name=name)
+
+@lru_cache(maxsize=4096)
+def _fecha(valor) -> date:
+    """Fecha ISO (YYYY-MM-DD...) a date; la misma fecha se repite en muchas filas"""
+    return date.fromisoformat(valor[:10])
+
+def dias_hasta(valor, hoy) -> int:
+    return (_fecha(valor) - hoy).days
+
+def _clase(restante, urgente):
+    """Clase CSS de la fila: vencida (critical) o dentro del margen urgente (urgent)"""
+    return "critical" if restante <= 0 else "urgent" if restante <= urgente else ""
+
+def _seccion(filas, encabezado_html, fila_html, encabezado_texto, fila_texto):
+    """Tabla HTML y bloque de texto de una categoría (vacíos si no hay filas)"""
+    if not filas:
+        return "", ""
+    return (encabezado_html.render({"filas": fila_html.render_rows(filas)}),
+            encabezado_texto.render({"filas": fila_texto.render_rows(filas)}))
+
+# ================================
+# FILAS (compartidas por el email de mantenimiento y el resumen)
+# ================================
+
+FILA_MANT_FECHA_HTML = html_template(
+    "<tr class='{clase}'><td>{placa}</td><td>{tipo}</td><td>{proxima_fecha}</td><td>{dias_restantes} días</td></tr>",
+    "fila_mantenimiento_fecha")
+FILA_MANT_FECHA_TEXTO = text_template(
+    "- {placa} | {tipo} | {proxima_fecha} | {dias_restantes} días\n", "fila_mantenimiento_fecha_texto")
+
+FILA_MANT_KM_HTML = html_template(
+    "<tr class='{clase}'><td>{placa}</td><td>{tipo}</td><td>{km_actual:,}</td><td>{proximo_km:,}</td>"
+    "<td>{km_restantes:,} km</td></tr>",
+    "fila_mantenimiento_km")
+FILA_MANT_KM_TEXTO = text_template(
+    "- {placa} | {tipo} | actual {km_actual:,} km | próximo {proximo_km:,} km | faltan {km_restantes:,} km\n",
+    "fila_mantenimiento_km_texto")
+
+FILA_POLIZA_HTML = html_template(
+    "<tr class='{clase}'><td>{placa}</td><td>{marca} {modelo}</td><td>{numero_poliza}</td><td>{aseguradora}</td>"
+    "<td>{fecha_vencimiento}</td><td>{dias_restantes} días</td></tr>",
+    "fila_poliza")
+FILA_POLIZA_TEXTO = text_template(
+    "- {placa} ({marca} {modelo}) | póliza {numero_poliza} - {aseguradora} | vence {fecha_vencimiento} "
+    "| {dias_restantes} días\n",
+    "fila_poliza_texto")
+
+FILA_RTV_HTML = html_template(
+    "<tr class='{clase}'><td>{placa}</td><td>{marca} {modelo}</td><td>{numero_cita}</td><td>{fecha_vencimiento}</td>"
+    "<td>{dias_restantes} días</td></tr>",
+    "fila_rtv")
+FILA_RTV_TEXTO = text_template(
+    "- {placa} ({marca} {modelo}) | cita {numero_cita} | vence {fecha_vencimiento} | {dias_restantes} días\n",
+    "fila_rtv_texto")
+
+FILA_REVISION_HTML = html_template(
+    "<tr class='critical'><td>{placa}</td><td>{marca} {modelo}</td><td>{fecha}</td><td>{inspector}</td>"
+    "<td>{fallas_html!s}</td></tr>",
+    "fila_revision")
+FILA_REVISION_TEXTO = text_template(
+    "- {placa} ({marca} {modelo}) | {fecha} | inspector {inspector} | {fallas_texto}\n", "fila_revision_texto")
+
+FILA_COMBUSTIBLE_HTML = html_template(
+    "<tr class='urgent'><td>{placa}</td><td>{marca} {modelo}</td><td>{promedio_historico} km/L</td>"
+    "<td>{promedio_reciente} km/L</td><td>-{deterioro_porcentaje}%</td><td>{ultimo_registro}</td></tr>",
+    "fila_combustible")
+FILA_COMBUSTIBLE_TEXTO = text_template(
+    "- {placa} ({marca} {modelo}) | {promedio_historico} -> {promedio_reciente} km/L "
+    "(-{deterioro_porcentaje}%) | último registro {ultimo_registro}\n",
+    "fila_combustible_texto")
+
+FILA_RESUELTA_HTML = html_template(
+    "<tr><td>{categoria}</td><td>{placa}</td><td>{detalle}</td><td>{resolved_at}</td></tr>", "fila_resuelta")
+FILA_RESUELTA_TEXTO = text_template(
+    "- {categoria} | {placa} | {detalle} | resuelta {resolved_at}\n", "fila_resuelta_texto")
+
+def _filas_mant_fecha(alertas, hoy):
+    filas = []
+    for alerta in alertas:
+        dias_restantes = dias_hasta(alerta['proxima_fecha'], hoy)
+        filas.append({**alerta, "dias_restantes": dias_restantes, "clase": _clase(dias_restantes, 3)})
+    return filas
+
+def _filas_mant_km(alertas):
+    filas = []
+    for alerta in alertas:
+        km_restantes = alerta['proximo_km'] - alerta['km_actual']
+        filas.append({**alerta, "km_restantes": km_restantes, "clase": _clase(km_restantes, 200)})
+    return filas
+
+def _filas_vencimiento(registros, hoy):
+    filas = []
+    for registro in registros:
+        dias_restantes = dias_hasta(registro['fecha_vencimiento'], hoy)
+        filas.append({**registro, "dias_restantes": dias_restantes, "clase": _clase(dias_restantes, 7)})
+    return filas
+
+def _filas_revision(revisiones):
+    filas = []
+    for revision in revisiones:
+        fallas = fallas_revision(revision)
+        filas.append({
+            **revision,
+            "fallas_html": "<br>".join(map(html.escape, fallas)) if fallas else "Revisión no aprobada",
+            "fallas_texto": "; ".join(fallas) if fallas else "Revisión no aprobada",
+        })
+    return filas
+
+def _filas_resueltas(resueltas):
+    filas = []
+    for resuelta in resueltas:
+        datos = resuelta['datos']
+        filas.append({
+            "categoria": NOMBRES_CATEGORIA_ALERTA.get(resuelta['categoria'], resuelta['categoria']),
+            "placa": resuelta['placa'],
+            "detalle": (datos.get('tipo') or datos.get('numero_poliza') or datos.get('numero_cita')
+                        or datos.get('fecha') or ''),
+            "resolved_at": resuelta['resolved_at'],
+        })
+    return filas
+
+# ================================
+# ALERTAS DE MANTENIMIENTO
+# ================================
+
+MANTENIMIENTO_HTML = html_template("""
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; }}
+            .header {{ background-color: #f44336; color: white; padding: 20px; text-align: center; }}
+            .content {{ padding: 20px; }}
+            .alert {{ background-color: #fff3cd; border: 1px solid #ffeaa7; padding: 10px; margin: 10px 0; border-radius: 5px; }}
+            .urgent {{ background-color: #f8d7da; border-color: #f5c6cb; }}
+            .critical {{ background-color: #f5c6cb; border-color: #dc3545; }}
+            table {{ width: 100%; border-collapse: collapse; margin: 10px 0; }}
+            th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
+            th {{ background-color: #f2f2f2; }}
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>⚠️ Sistema de Gestión Vehicular</h1>
+            <h2>Alertas de Mantenimiento</h2>
+        </div>
+        <div class="content">
+            <p>Se han detectado las siguientes alertas de mantenimiento:</p>
+            {por_fecha!s}{por_km!s}
+            <hr>
+            <p><small>Este es un mensaje automático del Sistema de Gestión Vehicular.<br>
+            Para más detalles, accede al sistema en línea.</small></p>
+        </div>
+    </body>
+    </html>
+""", "mantenimiento")
+
+MANTENIMIENTO_TEXTO = text_template("""
+    SISTEMA DE GESTIÓN VEHICULAR - ALERTAS DE MANTENIMIENTO
+
+    Se han detectado las siguientes alertas de mantenimiento:
+
+    {por_fecha}{por_km}--
+    Este es un mensaje automático del Sistema de Gestión Vehicular.
+    Para más detalles, accede al sistema en línea.
+""", "mantenimiento_texto")
+
+MANT_FECHA_SECCION_HTML = html_template(
+    "<h3>📅 Alertas por Fecha Próxima</h3>"
+    "<table><tr><th>Placa</th><th>Tipo</th><th>Fecha Programada</th><th>Días Restantes</th></tr>{filas!s}</table>",
+    "mantenimiento_fecha")
+MANT_FECHA_SECCION_TEXTO = text_template("ALERTAS POR FECHA PRÓXIMA\n{filas}", "mantenimiento_fecha_texto")
+MANT_KM_SECCION_HTML = html_template(
+    "<h3>📍 Alertas por Kilometraje Próximo</h3>"
+    "<table><tr><th>Placa</th><th>Tipo</th><th>Km Actual</th><th>Próximo Servicio</th><th>Km Restantes</th></tr>"
+    "{filas!s}</table>",
+    "mantenimiento_km")
+MANT_KM_SECCION_TEXTO = text_template("ALERTAS POR KILOMETRAJE PRÓXIMO\n{filas}", "mantenimiento_km_texto")
+
+def render_alertas_mantenimiento(alertas_fecha, alertas_km, hoy) -> RenderedEmail:
+    """Email de mantenimientos próximos por fecha y por kilometraje"""
+    fecha_html, fecha_texto = _seccion(_filas_mant_fecha(alertas_fecha, hoy),
+                                       MANT_FECHA_SECCION_HTML, FILA_MANT_FECHA_HTML,
+                                       MANT_FECHA_SECCION_TEXTO, FILA_MANT_FECHA_TEXTO)
+    km_html, km_texto = _seccion(_filas_mant_km(alertas_km),
+                                 MANT_KM_SECCION_HTML, FILA_MANT_KM_HTML,
+                                 MANT_KM_SECCION_TEXTO, FILA_MANT_KM_TEXTO)
+    return RenderedEmail(
+        MANTENIMIENTO_HTML.render({"por_fecha": fecha_html, "por_km": km_html}),
+        MANTENIMIENTO_TEXTO.render({"por_fecha": fecha_texto, "por_km": km_texto}),
+    )
+
+# ================================
+# RESUMEN DE ALERTAS
+# ================================
+
+RESUMEN_HTML = html_template("""
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; margin: 0; padding: 0; }}
+            .header {{ background-color: #d32f2f; color: white; padding: 20px; text-align: center; }}
+            .content {{ padding: 20px; }}
+            .alert-section {{ margin-bottom: 30px; }}
+            .alert-title {{ background-color: #f5f5f5; color: #333; padding: 12px; margin: 15px 0 10px 0;
+                          border-left: 4px solid #ff9800; font-weight: bold; font-size: 16px; }}
+            .alert {{ background-color: #fff3cd; border: 1px solid #ffeaa7; padding: 12px; margin: 8px 0;
+                     border-radius: 5px; }}
+            .urgent {{ background-color: #f8d7da; border-color: #f5c6cb; }}
+            .critical {{ background-color: #f5c6cb; border-color: #dc3545; }}
+            table {{ width: 100%; border-collapse: collapse; margin: 10px 0; }}
+            th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; font-size: 13px; }}
+            th {{ background-color: #f2f2f2; font-weight: bold; }}
+            .summary {{ background-color: #e3f2fd; padding: 15px; border-radius: 5px; margin: 20px 0; }}
+            .footer {{ font-size: 12px; color: #666; margin-top: 30px; border-top: 1px solid #ddd;
+                      padding-top: 15px; }}
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>🚨 SISTEMA DE GESTIÓN VEHICULAR</h1>
+            <h2>{titulo} - {fecha}</h2>
+        </div>
+        <div class="content">
+            <div class="summary">
+                <h3>📊 RESUMEN DE ALERTAS</h3>
+                <ul>
+                    <li><strong>Mantenimientos por fecha:</strong> {n_mant_fecha}</li>
+                    <li><strong>Mantenimientos por kilometraje:</strong> {n_mant_km}</li>
+                    <li><strong>Pólizas próximas a vencer:</strong> {n_polizas}</li>
+                    <li><strong>RTV próximas a vencer:</strong> {n_rtv}</li>
+                    <li><strong>Revisiones con fallas:</strong> {n_revisiones}</li>
+                    <li><strong>Consumo anormal de combustible:</strong> {n_combustible}</li>{resumen_resueltas!s}
+                </ul>
+                <p><strong>TOTAL DE ALERTAS: {total}</strong></p>
+            </div>
+            {secciones!s}
+            <div class="footer">
+                <p><strong>⚡ ACCIONES RECOMENDADAS:</strong></p>
+                <ul>
+                    <li>Revisar inmediatamente las alertas marcadas como CRÍTICAS (en rojo)</li>
+                    <li>Programar mantenimientos pendientes</li>
+                    <li>Renovar pólizas y RTV próximas a vencer</li>
+                    <li>Investigar fallas reportadas en revisiones</li>
+                    <li>Evaluar vehículos con consumo anormal de combustible</li>
+                </ul>
+                <hr>
+                <p><small>Este es un mensaje automático del Sistema de Gestión Vehicular.<br>
+                Para más detalles, acceda al sistema en línea.</small></p>
+            </div>
+        </div>
+    </body>
+    </html>
+""", "resumen")
+
+RESUMEN_TEXTO = text_template("""
+    SISTEMA DE GESTIÓN VEHICULAR
+    {titulo} - {fecha}
+
+    RESUMEN DE ALERTAS
+    - Mantenimientos por fecha: {n_mant_fecha}
+    - Mantenimientos por kilometraje: {n_mant_km}
+    - Pólizas próximas a vencer: {n_polizas}
+    - RTV próximas a vencer: {n_rtv}
+    - Revisiones con fallas: {n_revisiones}
+    - Consumo anormal de combustible: {n_combustible}
+    {resumen_resueltas}TOTAL DE ALERTAS: {total}
+
+    {secciones}ACCIONES RECOMENDADAS:
+    - Revisar inmediatamente las alertas marcadas como CRÍTICAS
+    - Programar mantenimientos pendientes
+    - Renovar pólizas y RTV próximas a vencer
+    - Investigar fallas reportadas en revisiones
+    - Evaluar vehículos con consumo anormal de combustible
+
+    --
+    Este es un mensaje automático del Sistema de Gestión Vehicular.
+    Para más detalles, acceda al sistema en línea.
+""", "resumen_texto")
+
+def _bloque(titulo_html, tabla_html, titulo_texto, nota_html="", nota_texto=""):
+    return (html_template(
+        f'<div class="alert-section"><div class="alert-title">{titulo_html}</div>{tabla_html}{nota_html}</div>',
+        titulo_texto),
+        text_template(f"{titulo_texto}\n{{filas}}{nota_texto}", titulo_texto))
+
+def _tabla(*columnas):
+    return "<table><tr>" + "".join(f"<th>{columna}</th>" for columna in columnas) + "</tr>{filas!s}</table>"
+
+RESUMEN_MANT_FECHA_HTML = html_template(
+    "<h4>📅 Por Fecha Próxima</h4>" + _tabla("Placa", "Tipo", "Fecha Programada", "Días Restantes"),
+    "resumen_mantenimiento_fecha")
+RESUMEN_MANT_KM_HTML = html_template(
+    "<h4>🛣️ Por Kilometraje Próximo</h4>" + _tabla("Placa", "Tipo", "Km Actual", "Próximo Servicio", "Km Restantes"),
+    "resumen_mantenimiento_km")
+RESUMEN_MANT_FECHA_TEXTO = text_template("MANTENIMIENTO POR FECHA PRÓXIMA\n{filas}", "resumen_mant_fecha_texto")
+RESUMEN_MANT_KM_TEXTO = text_template("MANTENIMIENTO POR KILOMETRAJE PRÓXIMO\n{filas}", "resumen_mant_km_texto")
+RESUMEN_MANT_HTML = html_template(
+    '<div class="alert-section"><div class="alert-title">🔧 ALERTAS DE MANTENIMIENTO</div>{filas!s}</div>',
+    "resumen_mantenimiento")
+
+RESUMEN_POLIZAS = _bloque(
+    "🛡️ PÓLIZAS PRÓXIMAS A VENCER",
+    _tabla("Placa", "Vehículo", "Número Póliza", "Aseguradora", "Vencimiento", "Días Restantes"),
+    "PÓLIZAS PRÓXIMAS A VENCER")
+RESUMEN_RTV = _bloque(
+    "🔍 RTV PRÓXIMAS A VENCER",
+    _tabla("Placa", "Vehículo", "Número Cita", "Vencimiento", "Días Restantes"),
+    "RTV PRÓXIMAS A VENCER")
+RESUMEN_REVISIONES = _bloque(
+    "⚠️ REVISIONES CON FALLAS REPORTADAS",
+    _tabla("Placa", "Vehículo", "Fecha", "Inspector", "Fallas Detectadas"),
+    "REVISIONES CON FALLAS REPORTADAS")
+RESUMEN_COMBUSTIBLE = _bloque(
+    "⛽ VARIACIONES ANORMALES EN COMBUSTIBLE",
+    _tabla("Placa", "Vehículo", "Rendimiento Histórico", "Rendimiento Reciente", "Deterioro", "Último Registro"),
+    "VARIACIONES ANORMALES EN COMBUSTIBLE",
+    nota_html="<p><strong>Nota:</strong> Se considera anormal cuando el rendimiento reciente es 25% menor al histórico.</p>",
+    nota_texto="Nota: se considera anormal cuando el rendimiento reciente es 25% menor al histórico.\n")
+RESUMEN_RESUELTAS = _bloque(
+    "✅ ALERTAS RESUELTAS", _tabla("Categoría", "Placa", "Detalle", "Resuelta"), "ALERTAS RESUELTAS")
+
+def render_resumen_alertas(alertas_mant_fecha, alertas_mant_km, alertas_polizas, alertas_rtv,
+                           alertas_revisiones_fallas, alertas_combustible_anormal, hoy,
+                           resueltas=None, titulo="Reporte Completo de Alertas") -> RenderedEmail:
+    """Resumen con todas las categorías de alertas (y las resueltas, en el modo por cambios)"""
+    secciones_html, secciones_texto = [], []
+
+    mant_fecha = _seccion(_filas_mant_fecha(alertas_mant_fecha, hoy),
+                          RESUMEN_MANT_FECHA_HTML, FILA_MANT_FECHA_HTML,
+                          RESUMEN_MANT_FECHA_TEXTO, FILA_MANT_FECHA_TEXTO)
+    mant_km = _seccion(_filas_mant_km(alertas_mant_km),
+                       RESUMEN_MANT_KM_HTML, FILA_MANT_KM_HTML, RESUMEN_MANT_KM_TEXTO, FILA_MANT_KM_TEXTO)
+    if alertas_mant_fecha or alertas_mant_km:
+        secciones_html.append(RESUMEN_MANT_HTML.render({"filas": mant_fecha[0] + mant_km[0]}))
+        secciones_texto.append(mant_fecha[1] + mant_km[1])
+
+    for (bloque_html, bloque_texto), filas, fila_html, fila_texto in (
+        (RESUMEN_POLIZAS, _filas_vencimiento(alertas_polizas, hoy), FILA_POLIZA_HTML, FILA_POLIZA_TEXTO),
+        (RESUMEN_RTV, _filas_vencimiento(alertas_rtv, hoy), FILA_RTV_HTML, FILA_RTV_TEXTO),
+        (RESUMEN_REVISIONES, _filas_revision(alertas_revisiones_fallas), FILA_REVISION_HTML, FILA_REVISION_TEXTO),
+        (RESUMEN_COMBUSTIBLE, alertas_combustible_anormal, FILA_COMBUSTIBLE_HTML, FILA_COMBUSTIBLE_TEXTO),
+        (RESUMEN_RESUELTAS, _filas_resueltas(resueltas or []), FILA_RESUELTA_HTML, FILA_RESUELTA_TEXTO),
+    ):
+        seccion_html, seccion_texto = _seccion(filas, bloque_html, fila_html, bloque_texto, fila_texto)
+        secciones_html.append(seccion_html)
+        secciones_texto.append(seccion_texto)
+
+    contexto = {
+        "titulo": titulo,
+        "fecha": hoy.strftime('%d/%m/%Y'),
+        "n_mant_fecha": len(alertas_mant_fecha),
+        "n_mant_km": len(alertas_mant_km),
+        "n_polizas": len(alertas_polizas),
+        "n_rtv": len(alertas_rtv),
+        "n_revisiones": len(alertas_revisiones_fallas),
+        "n_combustible": len(alertas_combustible_anormal),
+        "total": (len(alertas_mant_fecha) + len(alertas_mant_km) + len(alertas_polizas) + len(alertas_rtv)
+                  + len(alertas_revisiones_fallas) + len(alertas_combustible_anormal)),
+    }
+    return RenderedEmail(
+        RESUMEN_HTML.render({
+            **contexto,
+            "resumen_resueltas": (f"\n                    <li><strong>Alertas resueltas:</strong> {len(resueltas)}</li>"
+                                  if resueltas else ""),
+            "secciones": "".join(secciones_html),
+        }),
+        RESUMEN_TEXTO.render({
+            **contexto,
+            "resumen_resueltas": f"- Alertas resueltas: {len(resueltas)}\n" if resueltas else "",
+            "secciones": "".join(secciones_texto),
+        }),
+    )
+
+# ================================
+# BITÁCORA: KILOMETRAJE Y RETORNOS
+# ================================
+
+KILOMETRAJE_HTML = html_template("""
+    <h2>🚨 ALERTA DE INCONSISTENCIA EN BITÁCORA</h2>
+    <p><strong>Vehículo:</strong> {placa}</p>
+    <p><strong>Diferencia detectada:</strong> {diferencia} km</p>
+    <p><strong>Kilometraje anterior:</strong> {km_anterior} km (por {chofer_anterior})</p>
+    <p><strong>Kilometraje actual:</strong> {km_actual} km (por {chofer_actual})</p>
+    <p><strong>Fecha:</strong> {fecha}</p>
+
+    <p style="color: red;"><strong>ACCIÓN REQUERIDA:</strong> Verificar la inconsistencia en el kilometraje del vehículo.</p>
+""", "kilometraje")
+
+KILOMETRAJE_TEXTO = text_template("""
+    ALERTA DE INCONSISTENCIA EN BITÁCORA
+
+    Vehículo: {placa}
+    Diferencia detectada: {diferencia} km
+    Kilometraje anterior: {km_anterior} km (por {chofer_anterior})
+    Kilometraje actual: {km_actual} km (por {chofer_actual})
+    Fecha: {fecha}
+
+    ACCIÓN REQUERIDA: Verificar la inconsistencia en el kilometraje del vehículo.
+""", "kilometraje_texto")
+
+def render_alerta_kilometraje(placa, chofer_actual, km_actual, km_anterior, chofer_anterior, ahora) -> RenderedEmail:
+    """Email por diferencia entre el km de salida y el último km registrado"""
+    contexto = {
+        "placa": placa, "diferencia": abs(km_actual - km_anterior),
+        "km_anterior": km_anterior, "chofer_anterior": chofer_anterior,
+        "km_actual": km_actual, "chofer_actual": chofer_actual,
+        "fecha": ahora.strftime('%d/%m/%Y %H:%M'),
+    }
+    return RenderedEmail(KILOMETRAJE_HTML.render(contexto), KILOMETRAJE_TEXTO.render(contexto))
+
+FILA_RETORNO_HTML = html_template("""
+            <tr style="background-color: {fondo};">
+                <td><strong>{placa}</strong></td>
+                <td>{chofer}</td>
+                <td>{salida}</td>
+                <td>{km_salida} km</td>
+                <td>{nivel_combustible_salida}</td>
+                <td style="color: {color};">
+                    <strong>{dias_texto}</strong>
+                </td>
+            </tr>""", "fila_retorno")
+FILA_RETORNO_TEXTO = text_template(
+    "- {placa} | {chofer} | salida {salida} | {km_salida} km | combustible {nivel_combustible_salida} "
+    "| {dias_texto}\n",
+    "fila_retorno_texto")
+
+RETORNO_HTML = html_template("""
+    <html>
+    <body style="font-family: Arial, sans-serif;">
+        <h2 style="color: #d32f2f;">🚨 ALERTA: VEHÍCULOS SIN RETORNO</h2>
+
+        <p>Se han detectado <strong>{total} vehículo(s)</strong> que no han registrado su retorno:</p>
+
+        <table border="1" cellpadding="8" cellspacing="0" style="border-collapse: collapse; width: 100%; margin: 20px 0;">
+            <thead style="background-color: #f5f5f5;">
+                <tr>
+                    <th>Placa</th>
+                    <th>Chofer Responsable</th>
+                    <th>Fecha/Hora Salida</th>
+                    <th>KM Salida</th>
+                    <th>Combustible Salida</th>
+                    <th>Días Pendientes</th>
+                </tr>
+            </thead>
+            <tbody>{filas!s}
+            </tbody>
+        </table>
+
+        <div style="background-color: #ffebee; padding: 15px; border-left: 4px solid #f44336; margin: 20px 0;">
+            <h3 style="color: #d32f2f; margin: 0 0 10px 0;">⚠️ ACCIÓN REQUERIDA</h3>
+            <ul>
+                <li>Contactar inmediatamente a los choferes responsables</li>
+                <li>Verificar el estado actual de los vehículos</li>
+                <li>Registrar el retorno correspondiente en el sistema</li>
+                <li>En caso de emergencia, reportar a supervisión</li>
+            </ul>
+        </div>
+
+        <p style="color: #666; font-size: 12px; margin-top: 30px;">
+            Alerta generada automáticamente el {generada}<br>
+            Sistema de Gestión Vehicular - Hotel Arenal Manoa
+        </p>
+    </body>
+    </html>
+""", "retorno_pendiente")
+
+RETORNO_TEXTO = text_template("""
+    ALERTA: VEHÍCULOS SIN RETORNO
+
+    Se han detectado {total} vehículo(s) que no han registrado su retorno:
+
+    {filas}
+    ACCIÓN REQUERIDA:
+    - Contactar inmediatamente a los choferes responsables
+    - Verificar el estado actual de los vehículos
+    - Registrar el retorno correspondiente en el sistema
+    - En caso de emergencia, reportar a supervisión
+
+    --
+    Alerta generada automáticamente el {generada}
+    Sistema de Gestión Vehicular - Hotel Arenal Manoa
+""", "retorno_pendiente_texto")
+
+def render_retorno_pendiente(registros, ahora) -> RenderedEmail:
+    """Email de viajes sin retorno. Cada registro trae fecha_salida como datetime con zona horaria"""
+    filas = []
+    for registro in registros:
+        dias_pendientes = (ahora - registro['fecha_salida']).days
+        atrasado = dias_pendientes > 3
+        filas.append({
+            **registro,
+            "salida": registro['fecha_salida'].strftime('%d/%m/%Y %H:%M'),
+            "dias_texto": f"{dias_pendientes} día{'s' if dias_pendientes != 1 else ''}",
+            "fondo": "#ffebee" if atrasado else "#fff3e0",
+            "color": "red" if atrasado else "orange",
+        })
+    contexto = {"total": len(registros), "generada": ahora.strftime('%d/%m/%Y a las %H:%M')}
+    return RenderedEmail(
+        RETORNO_HTML.render({**contexto, "filas": FILA_RETORNO_HTML.render_rows(filas)}),
+        RETORNO_TEXTO.render({**contexto, "filas": FILA_RETORNO_TEXTO.render_rows(filas)}),
+    )
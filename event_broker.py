@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Eventos en Vivo (Server-Sent Events) para el Sistema Vehicular
+Un solo lector por worker sigue change_log y reparte avisos compactos (tabla, id, operación, versión)
+a todos los navegadores conectados a GET /events. Las escrituras despiertan al lector (notify) y un
+sondeo corto recoge las de otros workers. El id de cada evento es la secuencia de change_log: con
+Last-Event-ID el cliente retoma donde quedó, y si eso ya no es posible recibe un evento resync.
+"""
+
+import asyncio
+import json
+import logging
+import os
+
+from async_db import set_event_threadsafe
+from change_log import latest_seq
+from table_versions import get_table_versions
+
+logger = logging.getLogger(__name__)
+
+def _leer_eventos(conn, since, limit) -> dict:
+    """Entradas de change_log posteriores a since con la versión actual de cada tabla afectada"""
+    truncado = conn.execute("SELECT valor FROM change_log_meta WHERE clave = 'truncado_hasta'").fetchone()[0]
+    if since < truncado:
+        return {"eventos": [], "resync": True, "latest": latest_seq(conn)}
+    rows = conn.execute(
+        "SELECT seq, table_name, row_id, op FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?",
+        (since, limit)
+    ).fetchall()
+    versions = get_table_versions(conn, {row[1] for row in rows}) if rows else {}
+    eventos = [{"seq": seq, "table": table, "id": row_id, "op": op, "version": versions[table]}
+               for seq, table, row_id, op in rows]
+    return {"eventos": eventos, "resync": False, "latest": latest_seq(conn)}
+
+def _formato_evento(evento) -> str:
+    """Texto SSE de un cambio (se arma una vez y se reparte igual a todos los suscriptores)"""
+    data = json.dumps(evento, separators=(",", ":"))
+    return f"id: {evento['seq']}\nevent: change\ndata: {data}\n\n"
+
+def _formato_resync(latest) -> str:
+    return f"id: {latest}\nevent: resync\ndata: {json.dumps({'latest': latest})}\n\n"
+
+class _Suscripcion:
+    __slots__ = ("queue", "tables", "desbordada")
+
+    def __init__(self, queue_size, tables):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.tables = frozenset(tables) if tables else None
+        self.desbordada = False
+
+class EventBroker:
+    """Reparte los cambios de change_log a los suscriptores SSE de este worker"""
+
+    def __init__(self, async_db, poll_seconds=2.0, heartbeat_seconds=15.0, queue_size=256,
+                 replay_limit=1000, retry_ms=3000):
+        self.db = async_db
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.queue_size = queue_size
+        self.replay_limit = replay_limit
+        self.retry_ms = retry_ms
+
+        self._subs = set()
+        self._cursor = 0
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+        # Métricas
+        self._publicados = 0
+        self._entregas = 0
+        self._desbordes = 0
+        self._reanudaciones = 0
+        self._last_error = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Iniciar el lector en el event loop actual a partir de la secuencia vigente"""
+        if self.running:
+            return
+        self._cursor = await self.db.run(latest_seq)
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._worker(), name="event-broker")
+        logger.info(f"📡 Eventos en vivo iniciados (sondeo cada {self.poll_seconds}s, "
+                    f"heartbeat {self.heartbeat_seconds}s)")
+
+    async def stop(self):
+        """Detener el lector y cerrar los streams abiertos (el navegador reconecta con Last-Event-ID)"""
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.close_streams()
+
+    def close_streams(self):
+        """Terminar los streams abiertos de este worker (el navegador reconecta con Last-Event-ID)"""
+        for sub in list(self._subs):
+            sub.desbordada = False
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            sub.queue.put_nowait(None)
+
+    def notify(self):
+        """Despertar al lector tras una escritura (también desde otros hilos)"""
+        set_event_threadsafe(self._loop, self._wakeup)
+
+    # ---- Lector ----
+
+    async def _worker(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                # Sondeo: escrituras hechas por otro worker
+                pass
+            self._wakeup.clear()
+            try:
+                await self.poll()
+            except Exception as e:
+                self._last_error = str(e)
+                logger.error(f"❌ Error leyendo cambios para eventos en vivo: {e}")
+
+    async def poll(self) -> int:
+        """Leer los cambios nuevos y repartirlos. Devuelve cuántos eventos se publicaron"""
+        if not self._subs:
+            # Nadie escucha: solo avanzar el cursor (una búsqueda por clave primaria)
+            self._cursor = await self.db.run(latest_seq)
+            return 0
+        publicados = 0
+        while True:
+            lote = await self.db.run(_leer_eventos, self._cursor, self.replay_limit)
+            if lote["resync"]:
+                self._cursor = lote["latest"]
+                self._broadcast_resync(lote["latest"])
+                return publicados
+            for evento in lote["eventos"]:
+                self._publish(evento["seq"], evento["table"], _formato_evento(evento))
+                self._cursor = evento["seq"]
+            publicados += len(lote["eventos"])
+            if len(lote["eventos"]) < self.replay_limit:
+                return publicados
+
+    def _publish(self, seq, table, texto):
+        self._publicados += 1
+        for sub in self._subs:
+            if sub.tables is not None and table not in sub.tables:
+                continue
+            try:
+                sub.queue.put_nowait((seq, texto))
+                self._entregas += 1
+            except asyncio.QueueFull:
+                # Cliente lento: se le pedirá resincronizar en vez de acumular memoria
+                if not sub.desbordada:
+                    self._desbordes += 1
+                sub.desbordada = True
+
+    def _broadcast_resync(self, latest):
+        for sub in self._subs:
+            sub.desbordada = True
+            try:
+                # Despertar al stream; si la cola está llena ya tiene con qué despertar
+                sub.queue.put_nowait((latest, None))
+            except asyncio.QueueFull:
+                pass
+
+    # ---- Suscriptores ----
+
+    async def stream(self, last_event_id=None, tables=None):
+        """Generador de texto SSE para un cliente: reenvío desde last_event_id, cambios en vivo y heartbeats"""
+        sub = _Suscripcion(self.queue_size, tables)
+        # Registrar antes de reenviar: lo que llegue mientras tanto queda en la cola (y se descarta si repite)
+        self._subs.add(sub)
+        ultimo = self._cursor
+        try:
+            yield f"retry: {self.retry_ms}\n\n"
+            if last_event_id is not None:
+                self._reanudaciones += 1
+                lote = await self.db.run(_leer_eventos, last_event_id, self.replay_limit)
+                if lote["resync"] or len(lote["eventos"]) >= self.replay_limit:
+                    yield _formato_resync(lote["latest"])
+                    ultimo = lote["latest"]
+                else:
+                    ultimo = last_event_id
+                    for evento in lote["eventos"]:
+                        if sub.tables is None or evento["table"] in sub.tables:
+                            yield _formato_evento(evento)
+                        ultimo = evento["seq"]
+
+            while True:
+                try:
+                    item = await asyncio.wait_for(sub.queue.get(), timeout=self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    item = (0, None)
+                    if not sub.desbordada:
+                        # Comentario SSE: mantiene viva la conexión en proxies y detecta clientes caídos
+                        yield ": ping\n\n"
+                        continue
+                if item is None:
+                    return
+                if sub.desbordada:
+                    while not sub.queue.empty():
+                        sub.queue.get_nowait()
+                    sub.desbordada = False
+                    ultimo = self._cursor
+                    yield _formato_resync(ultimo)
+                    continue
+                seq, texto = item
+                if texto is None or seq <= ultimo:
+                    continue
+                ultimo = seq
+                yield texto
+        finally:
+            self._subs.discard(sub)
+
+    def metrics(self) -> dict:
+        return {
+            "running": self.running,
+            "suscriptores": len(self._subs),
+            "cursor": self._cursor,
+            "poll_seconds": self.poll_seconds,
+            "heartbeat_seconds": self.heartbeat_seconds,
+            "eventos_publicados": self._publicados,
+            "entregas": self._entregas,
+            "desbordes": self._desbordes,
+            "reanudaciones": self._reanudaciones,
+            "last_error": self._last_error,
+        }
+
+def close_streams_on_exit(broker) -> bool:
+    """Cerrar los streams al recibir la señal de salida de uvicorn.
+
+    uvicorn espera a que terminen las conexiones abiertas antes de ejecutar los eventos de shutdown,
+    y un stream SSE nunca termina solo: sin esto el apagado se queda esperando a los navegadores.
+    """
+    try:
+        from uvicorn.server import Server
+    except ImportError:
+        return False
+    original = Server.handle_exit
+
+    def handle_exit(server, sig, frame):
+        if broker._loop is not None and not broker._loop.is_closed():
+            broker._loop.call_soon_threadsafe(broker.close_streams)
+        return original(server, sig, frame)
+
+    Server.handle_exit = handle_exit
+    return True
+
+def create_broker_from_env(async_db) -> EventBroker:
+    """Crear el broker usando EVENTS_POLL_SECONDS / EVENTS_HEARTBEAT_SECONDS / EVENTS_QUEUE_SIZE"""
+    return EventBroker(
+        async_db,
+        poll_seconds=float(os.environ.get("EVENTS_POLL_SECONDS", "2")),
+        heartbeat_seconds=float(os.environ.get("EVENTS_HEARTBEAT_SECONDS", "15")),
+        queue_size=int(os.environ.get("EVENTS_QUEUE_SIZE", "256")),
+    )
@@ -6,6 +6,7 @@ Funciona en Railway sin necesidad de Git local
 """
 
 import os
+import asyncio
 import sqlite3
 import json
 import base64
@@ -16,6 +17,10 @@ import logging
 import requests
 from typing import Optional, Tuple
 
+from db_snapshot import snapshot_database
+from db_export import export_database, list_tables
+from backup_catalog import BackupCatalog
+
 logger = logging.getLogger(__name__)
 
 class GitHubAPIBackup:
@@ -39,6 +44,9 @@ class GitHubAPIBackup:
         self.db_path = os.path.join(self.current_dir, "vehicular_system.db")
         self.temp_backup_dir = os.path.join(self.current_dir, "temp_api_backups")
         
+        # Catálogo de backups: no se sube nada si los datos no cambiaron
+        self.catalog = BackupCatalog(self.db_path, "github_api")
+        
         # Verificar configuración
         self.api_available = self._verify_github_api()
         
@@ -95,67 +103,38 @@ class GitHubAPIBackup:
             logger.error(f"❌ Error conectando a GitHub API: {e}")
             return False
     
-    def export_database_to_formats(self) -> dict:
-        """Exportar base de datos en múltiples formatos"""
+    def export_database_to_formats(self, json_path: str, source: Optional[str] = None) -> dict:
+        """Exportar base de datos a JSON en streaming. Devuelve los registros por tabla y el total.
+
+        source: copia congelada de la que exportar; por defecto la base en uso.
+        """
         try:
             if not os.path.exists(self.db_path):
                 logger.error(f"❌ Base de datos no encontrada: {self.db_path}")
                 return {}
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            source = source or self.db_path
+            conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+            try:
+                tables_count = len(list_tables(conn))
+            finally:
+                conn.close()
             
-            # Obtener todas las tablas
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = [row[0] for row in cursor.fetchall()]
+            def _estadisticas(conteos):
+                return {"statistics": {**conteos, "total_records": sum(conteos.values())}}
             
-            export_data = {
-                "export_info": {
+            export = export_database(
+                source, json_path=json_path, frozen=source != self.db_path, json_layout="columns",
+                json_header={"export_info": {
                     "timestamp": datetime.now().isoformat(),
                     "source": "Railway Production",
                     "database_path": self.db_path,
-                    "tables_count": len(tables),
+                    "tables_count": tables_count,
                     "backup_type": "github_api_backup"
-                },
-                "statistics": {},
-                "tables": {}
-            }
-            
-            total_records = 0
-            
-            # Exportar cada tabla
-            for table in tables:
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                count = cursor.fetchone()[0]
-                total_records += count
-                
-                cursor.execute(f"SELECT * FROM {table}")
-                rows = cursor.fetchall()
-                
-                # Obtener nombres de columnas
-                cursor.execute(f"PRAGMA table_info({table})")
-                columns = [col[1] for col in cursor.fetchall()]
-                
-                # Convertir a lista de diccionarios
-                table_data = []
-                for row in rows:
-                    row_dict = {}
-                    for i, value in enumerate(row):
-                        row_dict[columns[i]] = value
-                    table_data.append(row_dict)
-                
-                export_data["tables"][table] = {
-                    "columns": columns,
-                    "data": table_data,
-                    "record_count": count
-                }
-                
-                export_data["statistics"][table] = count
-            
-            export_data["statistics"]["total_records"] = total_records
-            
-            conn.close()
-            return export_data
+                }},
+                json_footer=_estadisticas
+            )
+            return _estadisticas(export["tables"])["statistics"]
             
         except Exception as e:
             logger.error(f"❌ Error exportando base de datos: {e}")
@@ -172,38 +151,38 @@ class GitHubAPIBackup:
         os.makedirs(temp_dir, exist_ok=True)
         
         try:
-            # 1. Exportar datos en JSON
-            logger.info("📋 Exportando datos a JSON...")
-            export_data = self.export_database_to_formats()
-            
-            if not export_data:
+            if not os.path.exists(self.db_path):
+                logger.error(f"❌ Base de datos no encontrada: {self.db_path}")
                 return None, None
             
-            # 2. Guardar JSON principal
+            # 1. Copia consistente de la base de datos
+            db_copy_path = os.path.join(temp_dir, "vehicular_system.db")
+            snapshot_database(self.db_path, db_copy_path)
+            logger.info("📁 Base de datos copiada")
+            
+            # 2. Exportar datos en JSON desde la copia (mismos datos que el .db)
+            logger.info("📋 Exportando datos a JSON...")
             json_path = os.path.join(temp_dir, "database_export.json")
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(export_data, f, indent=2, ensure_ascii=False, default=str)
+            statistics = self.export_database_to_formats(json_path, source=db_copy_path)
             
-            # 3. Copiar base de datos original
-            if os.path.exists(self.db_path):
-                db_copy_path = os.path.join(temp_dir, "vehicular_system.db")
-                shutil.copy2(self.db_path, db_copy_path)
-                logger.info("📁 Base de datos copiada")
+            if not statistics:
+                shutil.rmtree(temp_dir)
+                return None, None
             
-            # 4. Crear estadísticas separadas
+            # 3. Crear estadísticas separadas
             stats = {
                 "backup_timestamp": datetime.now().isoformat(),
                 "backup_type": backup_type,
                 "source": "Railway Production API",
-                "total_records": export_data["statistics"]["total_records"],
-                **export_data["statistics"]
+                "total_records": statistics["total_records"],
+                **statistics
             }
             
             stats_path = os.path.join(temp_dir, "backup_statistics.json")
             with open(stats_path, 'w', encoding='utf-8') as f:
                 json.dump(stats, f, indent=2, ensure_ascii=False)
             
-            # 5. Crear archivo ZIP
+            # 4. Crear archivo ZIP
             zip_path = os.path.join(self.temp_backup_dir, f"{backup_name}.zip")
             with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
                 for root, dirs, files in os.walk(temp_dir):
@@ -301,27 +280,40 @@ class GitHubAPIBackup:
         logger.info(f"🚀 Iniciando backup de Railway a GitHub...")
         
         try:
-            # 1. Crear paquete de backup
-            zip_path, stats = self.create_backup_package(backup_type)
+            # 1. Mismos datos que el último backup subido: no empaquetar ni subir
+            comprobacion = await asyncio.to_thread(self.catalog.check)
+            if comprobacion and comprobacion["sin_cambios"]:
+                filename = await asyncio.to_thread(self.catalog.skip, backup_type, comprobacion)
+                return True, filename
+            
+            # 2. Crear paquete de backup (en un hilo para no bloquear el event loop)
+            zip_path, stats = await asyncio.to_thread(self.create_backup_package, backup_type)
             
             if not zip_path or not stats:
                 logger.error("❌ Error creando paquete de backup")
+                await asyncio.to_thread(self.catalog.record, "fallido", backup_type, comprobacion,
+                                        detalle="Error creando paquete de backup")
                 return False, None
             
-            # 2. Subir a GitHub
+            # 3. Subir a GitHub
             filename = os.path.basename(zip_path)
-            upload_success = self.upload_to_github(zip_path, stats)
+            upload_success = await asyncio.to_thread(self.upload_to_github, zip_path, stats)
             
-            # 3. Limpiar archivo temporal
+            # 4. Limpiar archivo temporal
             if os.path.exists(zip_path):
                 os.remove(zip_path)
             
             if upload_success:
                 logger.info(f"🎉 Backup completo exitoso: {filename}")
+                await asyncio.to_thread(self.catalog.record, "subido", backup_type, comprobacion, filename,
+                                        stats.get("total_records"))
                 return True, filename
             else:
                 # Aunque falle GitHub, el backup se creó exitosamente
                 logger.info(f"📦 Backup creado localmente: {filename}")
+                # No quedó en GitHub: no sirve de referencia para omitir el siguiente
+                await asyncio.to_thread(self.catalog.record, "fallido", backup_type, comprobacion, filename,
+                                        stats.get("total_records"), detalle="No se pudo subir a GitHub")
                 return True, filename
                 
         except Exception as e:
@@ -343,7 +335,6 @@ async def backup_to_github(backup_type: str = "railway_auto") -> Tuple[bool, Opt
 
 if __name__ == "__main__":
     # Test del sistema
-    import asyncio
     
     async def test():
         backup_system = GitHubAPIBackup()
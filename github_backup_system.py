@@ -5,16 +5,19 @@ Mantiene copias seguras de todos los datos en el repositorio
 """
 
 import os
+import asyncio
 import sqlite3
 import json
 import base64
 import subprocess
 import zipfile
 import shutil
-import csv
 from datetime import datetime, timedelta
 import logging
-import hashlib
+
+from db_snapshot import snapshot_database
+from db_export import export_database, list_tables
+from backup_catalog import BackupCatalog
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +40,9 @@ class GitHubBackupSystem:
         # Detectar si Git está disponible
         self.git_available = self._check_git_availability()
         
+        # Catálogo de backups: se omite el backup si los datos no cambiaron
+        self.catalog = BackupCatalog(self.db_path, "github_backup_system")
+        
     def _check_git_availability(self):
         """Verificar si Git está disponible y configurado"""
         try:
@@ -96,51 +102,30 @@ class GitHubBackupSystem:
             logger.error(f"Error obteniendo estadísticas: {e}")
             return {"error": str(e), "backup_timestamp": datetime.now().isoformat()}
     
-    def export_database_to_json(self):
-        """Exportar toda la base de datos a JSON"""
+    def export_database_to_json(self, output_path, csv_dir=None, source=None):
+        """Exportar toda la base de datos a JSON (y opcionalmente CSV por tabla) en streaming.
+
+        source: copia congelada de la que exportar; por defecto la base en uso. Devuelve los conteos
+        por tabla.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            
-            # Obtener todas las tablas
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = [row[0] for row in cursor.fetchall()]
-            
-            database_export = {
-                "export_info": {
+            source = source or self.db_path
+            conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+            try:
+                tables_count = len(list_tables(conn))
+            finally:
+                conn.close()
+            
+            return export_database(
+                source, json_path=output_path, csv_dir=csv_dir, frozen=source != self.db_path,
+                json_layout="columns",
+                json_header={"export_info": {
                     "timestamp": datetime.now().isoformat(),
                     "version": "1.0",
                     "database_path": self.db_path,
-                    "tables_count": len(tables)
-                },
-                "tables": {}
-            }
-            
-            # Exportar cada tabla
-            for table in tables:
-                cursor.execute(f"SELECT * FROM {table}")
-                rows = cursor.fetchall()
-                
-                # Obtener nombres de columnas
-                cursor.execute(f"PRAGMA table_info({table})")
-                columns = [col[1] for col in cursor.fetchall()]
-                
-                # Convertir a lista de diccionarios
-                table_data = []
-                for row in rows:
-                    row_dict = {}
-                    for i, value in enumerate(row):
-                        row_dict[columns[i]] = value
-                    table_data.append(row_dict)
-                
-                database_export["tables"][table] = {
-                    "columns": columns,
-                    "data": table_data,
-                    "record_count": len(table_data)
-                }
-            
-            conn.close()
-            return database_export
+                    "tables_count": tables_count
+                }}
+            )
             
         except Exception as e:
             logger.error(f"Error exportando base de datos: {e}")
@@ -156,15 +141,16 @@ class GitHubBackupSystem:
         os.makedirs(temp_backup_dir, exist_ok=True)
         
         try:
-            # 1. Copiar base de datos original
+            # 1. Copia consistente de la base de datos
             db_backup_path = f"{temp_backup_dir}/vehicular_system.db"
-            shutil.copy2(self.db_path, db_backup_path)
+            snapshot_database(self.db_path, db_backup_path)
             
-            # 2. Exportar a JSON
-            database_json = self.export_database_to_json()
+            # 2. Exportar a JSON y a CSV por tabla desde la copia (mismos datos que el .db)
             json_path = f"{temp_backup_dir}/database_export.json"
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(database_json, f, indent=2, ensure_ascii=False, default=str)
+            csv_dir = f"{temp_backup_dir}/csv_exports"
+            export = self.export_database_to_json(json_path, csv_dir=csv_dir, source=db_backup_path)
+            if "error" in export:
+                raise RuntimeError(export["error"])
             
             # 3. Crear estadísticas
             stats = self.get_database_stats()
@@ -172,22 +158,7 @@ class GitHubBackupSystem:
             with open(stats_path, 'w', encoding='utf-8') as f:
                 json.dump(stats, f, indent=2, ensure_ascii=False)
             
-            # 4. Exportar a CSV por tabla
-            csv_dir = f"{temp_backup_dir}/csv_exports"
-            os.makedirs(csv_dir, exist_ok=True)
-            
-            # Exportar cada tabla a CSV usando módulo csv nativo
-            for table_name, table_info in database_json["tables"].items():
-                if table_info["record_count"] > 0:
-                    csv_path = f"{csv_dir}/{table_name}.csv"
-                    with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-                        if table_info["data"]:
-                            fieldnames = table_info["columns"]
-                            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                            writer.writeheader()
-                            writer.writerows(table_info["data"])
-            
-            # 5. Crear archivo ZIP
+            # 4. Crear archivo ZIP
             zip_path = f"{self.github_backup_dir}/{backup_name}.zip"
             with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
                 for root, dirs, files in os.walk(temp_backup_dir):
@@ -282,24 +253,36 @@ class GitHubBackupSystem:
             logger.error(f"❌ Base de datos no encontrada: {self.db_path}")
             return False, None
         
-        # Crear paquete de backup
-        backup_path, stats = self.create_backup_package(backup_type)
+        # Mismos datos que el último backup: no empaquetar ni subir
+        comprobacion = await asyncio.to_thread(self.catalog.check)
+        if comprobacion and comprobacion["sin_cambios"]:
+            filename = await asyncio.to_thread(self.catalog.skip, backup_type, comprobacion)
+            return True, filename
+        
+        # Crear paquete de backup (en un hilo para no bloquear el event loop)
+        backup_path, stats = await asyncio.to_thread(self.create_backup_package, backup_type)
         
         if not backup_path:
             logger.error("Error creando paquete de backup")
+            await asyncio.to_thread(self.catalog.record, "fallido", backup_type, comprobacion,
+                                    detalle="Error creando paquete de backup")
             return False, None
         
         # Subir a GitHub
-        success, filename = self.commit_backup_to_github(backup_path, stats, backup_type)
+        success, filename = await asyncio.to_thread(self.commit_backup_to_github, backup_path, stats, backup_type)
         
         if success:
             logger.info(f"Backup completado exitosamente: {filename}")
+            await asyncio.to_thread(self.catalog.record, "subido", backup_type, comprobacion, filename,
+                                    stats.get("total_records"))
             # Limpiar backup local temporal
             if os.path.exists(backup_path):
                 os.remove(backup_path)
             return True, filename
         else:
             logger.error("Error subiendo backup a GitHub")
+            await asyncio.to_thread(self.catalog.record, "fallido", backup_type, comprobacion,
+                                    detalle="Error subiendo backup a GitHub")
             return False, None
     
     def cleanup_old_backups(self, keep_days=7):
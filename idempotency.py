@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Claves de Idempotencia para el Sistema Vehicular
+Un POST con la cabecera Idempotency-Key se aplica una sola vez: la respuesta queda guardada junto a
+la escritura, en la misma transacción, y un reintento con la misma clave recibe esa respuesta sin
+volver a insertar. Permite reintentar envíos (sincronización, redes inestables) sin duplicar registros.
+"""
+
+import json
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+def install_idempotency_keys(cursor):
+    """Tabla de claves ya aplicadas con la respuesta que devolvió cada una"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            clave TEXT PRIMARY KEY,
+            endpoint TEXT NOT NULL,
+            respuesta TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_fecha ON idempotency_keys (created_at)")
+
+def _respuesta_guardada(conn, clave, endpoint):
+    row = conn.execute("SELECT endpoint, respuesta FROM idempotency_keys WHERE clave = ?", (clave,)).fetchone()
+    if row is None:
+        return None
+    if row[0] != endpoint:
+        raise ValueError(f"La clave de idempotencia ya se usó en {row[0]}")
+    return json.loads(row[1])
+
+def run_idempotent(conn, clave, endpoint, escribir):
+    """Ejecutar escribir(conn) (sin commit) y confirmar. Devuelve (respuesta, repetida).
+
+    Con clave, la respuesta se guarda en la misma transacción que la escritura; si la clave ya
+    existe se devuelve la respuesta original sin escribir. Dos peticiones simultáneas con la misma
+    clave chocan en la clave primaria y la segunda recibe la respuesta de la primera.
+    """
+    if clave is not None:
+        previa = _respuesta_guardada(conn, clave, endpoint)
+        if previa is not None:
+            return previa, True
+    try:
+        respuesta = escribir(conn)
+        if clave is not None:
+            conn.execute("INSERT INTO idempotency_keys (clave, endpoint, respuesta) VALUES (?, ?, ?)",
+                         (clave, endpoint, json.dumps(respuesta)))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        previa = _respuesta_guardada(conn, clave, endpoint) if clave is not None else None
+        if previa is None:
+            raise
+        return previa, True
+    except Exception:
+        conn.rollback()
+        raise
+    return respuesta, False
+
+def purge_idempotency_keys(conn, dias) -> int:
+    """Borrar las claves con más de `dias` días (los reintentos ocurren en minutos, no en semanas)"""
+    borradas = conn.execute("DELETE FROM idempotency_keys WHERE created_at < datetime('now', ?)",
+                            (f"-{int(dias)} days",)).rowcount
+    conn.commit()
+    return borradas
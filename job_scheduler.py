@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Programador de Tareas (cron) dentro del Servidor para el Sistema Vehicular
+Ejecuta tareas periódicas (alertas, retornos pendientes, mantenimiento) con expresiones cron de 5 campos
+en hora de Centroamérica. Con varios workers de uvicorn, un lease en SQLite elige un solo líder que
+dispara las tareas, y cada ejecución programada se reserva en job_runs (UNIQUE por tarea y horario),
+así una misma ejecución nunca corre dos veces aunque el liderazgo cambie de proceso.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Estados de job_runs
+ESTADO_EJECUTANDO = "ejecutando"
+ESTADO_OK = "ok"
+ESTADO_ERROR = "error"
+ESTADO_CANCELADO = "cancelado"
+
+# Historial de ejecuciones que conserva la tarea de mantenimiento
+RETENCION_JOB_RUNS_DIAS = 30
+
+CREATE_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS scheduler_lease (
+        nombre TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        acquired_at REAL NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS job_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job TEXT NOT NULL,
+        programada_para TEXT,
+        manual BOOLEAN NOT NULL DEFAULT 0,
+        owner TEXT NOT NULL,
+        estado TEXT NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP,
+        duracion_ms REAL,
+        resultado TEXT,
+        error TEXT,
+        UNIQUE (job, programada_para)
+    )
+    ''',
+]
+
+def install_job_scheduler(cursor):
+    """Crear las tablas del lease de líder y del historial de ejecuciones"""
+    for sql in CREATE_TABLES_SQL:
+        cursor.execute(sql)
+    # Historial por tarea, lo más reciente primero
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_runs_job_started ON job_runs (job, started_at)")
+
+# ================================
+# EXPRESIONES CRON
+# ================================
+
+class CronSchedule:
+    """Expresión cron de 5 campos: minuto hora día-del-mes mes día-de-la-semana (0 = domingo).
+    Admite *, listas (1,15), rangos (1-5) y pasos (*/10, 8-18/2)"""
+
+    LIMITES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        campos = self.expression.split()
+        if len(campos) != 5:
+            raise ValueError(f"Expresión cron inválida (se esperan 5 campos): {expression!r}")
+
+        valores = [self._parse_campo(campo, *limites) for campo, limites in zip(campos, self.LIMITES)]
+        self.minutos, self.horas, self.dias, self.meses, dias_semana = valores
+        # 7 también es domingo
+        self.dias_semana = {d % 7 for d in dias_semana}
+        # Como en cron: si se restringen día del mes y día de la semana, basta con que coincida uno
+        self._dia_libre = campos[2] == "*"
+        self._semana_libre = campos[4] == "*"
+
+    @staticmethod
+    def _parse_campo(campo, minimo, maximo):
+        valores = set()
+        for parte in campo.split(","):
+            rango, _, paso = parte.partition("/")
+            paso = int(paso) if paso else 1
+            if rango == "*":
+                inicio, fin = minimo, maximo
+            elif "-" in rango:
+                inicio, fin = (int(v) for v in rango.split("-", 1))
+            else:
+                inicio = int(rango)
+                fin = maximo if paso > 1 else inicio
+            if paso < 1 or inicio < minimo or fin > maximo or inicio > fin:
+                raise ValueError(f"Campo cron fuera de rango: {campo!r}")
+            valores.update(range(inicio, fin + 1, paso))
+        return sorted(valores)
+
+    def _coincide_dia(self, dia) -> bool:
+        if dia.month not in self.meses:
+            return False
+        en_mes = dia.day in self.dias
+        # weekday(): lunes = 0; cron: domingo = 0
+        en_semana = (dia.weekday() + 1) % 7 in self.dias_semana
+        if self._dia_libre and self._semana_libre:
+            return True
+        if self._dia_libre:
+            return en_semana
+        if self._semana_libre:
+            return en_mes
+        return en_mes or en_semana
+
+    def next_after(self, momento: datetime) -> datetime:
+        """Próximo minuto que cumple la expresión, estrictamente posterior a momento (misma zona horaria)"""
+        base = momento.replace(second=0, microsecond=0)
+        for dias in range(366 * 4 + 1):
+            dia = (base + timedelta(days=dias)).date()
+            if not self._coincide_dia(dia):
+                continue
+            for hora in self.horas:
+                for minuto in self.minutos:
+                    candidato = base.replace(year=dia.year, month=dia.month, day=dia.day, hour=hora, minute=minuto)
+                    if candidato > momento:
+                        return candidato
+        raise ValueError(f"La expresión cron nunca se cumple: {self.expression!r}")
+
+    def __str__(self):
+        return self.expression
+
+# ================================
+# LEASE DE LÍDER E HISTORIAL
+# ================================
+
+def _renovar_lease(conn, nombre, owner, lease_seconds):
+    """Tomar o renovar el lease si es nuestro o venció. Devuelve (es_lider, owner_actual, expires_at)"""
+    ahora = time.time()
+    conn.execute('''
+        INSERT INTO scheduler_lease (nombre, owner, expires_at, acquired_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (nombre) DO UPDATE SET
+            acquired_at = CASE WHEN scheduler_lease.owner = excluded.owner
+                               THEN scheduler_lease.acquired_at ELSE excluded.acquired_at END,
+            owner = excluded.owner,
+            expires_at = excluded.expires_at
+        WHERE scheduler_lease.owner = excluded.owner OR scheduler_lease.expires_at < ?
+    ''', (nombre, owner, ahora + lease_seconds, ahora, ahora))
+    conn.commit()
+    row = conn.execute("SELECT owner, expires_at FROM scheduler_lease WHERE nombre = ?", (nombre,)).fetchone()
+    return row[0] == owner, row[0], row[1]
+
+def _liberar_lease(conn, nombre, owner):
+    """Soltar el lease al apagar para que otro worker lo tome sin esperar a que venza"""
+    conn.execute("UPDATE scheduler_lease SET expires_at = 0 WHERE nombre = ? AND owner = ?", (nombre, owner))
+    conn.commit()
+
+def _reservar_ejecucion(conn, job, programada_para, owner, started_at, manual=False):
+    """Insertar la ejecución en job_runs. None si ese horario ya lo reservó otro proceso"""
+    cursor = conn.execute('''
+        INSERT OR IGNORE INTO job_runs (job, programada_para, manual, owner, estado, started_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (job, programada_para, manual, owner, ESTADO_EJECUTANDO, started_at))
+    conn.commit()
+    return cursor.lastrowid if cursor.rowcount else None
+
+def _finalizar_ejecucion(conn, run_id, estado, finished_at, duracion_ms, resultado=None, error=None):
+    conn.execute('''
+        UPDATE job_runs SET estado = ?, finished_at = ?, duracion_ms = ?, resultado = ?, error = ?
+        WHERE id = ?
+    ''', (estado, finished_at, duracion_ms, resultado, error, run_id))
+    conn.commit()
+
+def purge_job_runs(conn, antes_de) -> int:
+    """Borrar el historial anterior a la fecha indicada. No toca ejecuciones en curso"""
+    cursor = conn.execute("DELETE FROM job_runs WHERE started_at < ? AND estado != ?",
+                          (antes_de, ESTADO_EJECUTANDO))
+    conn.commit()
+    return cursor.rowcount
+
+def list_job_runs(conn, job=None, limit=50) -> list:
+    """Ejecuciones más recientes (de una tarea o de todas)"""
+    filtro = "WHERE job = ?" if job else ""
+    params = (job, limit) if job else (limit,)
+    rows = conn.execute(f'''
+        SELECT id, job, programada_para, manual, owner, estado, started_at, finished_at,
+               duracion_ms, resultado, error
+        FROM job_runs {filtro}
+        ORDER BY started_at DESC, id DESC
+        LIMIT ?
+    ''', params).fetchall()
+    ejecuciones = []
+    for row in rows:
+        ejecucion = dict(row)
+        ejecucion["manual"] = bool(ejecucion["manual"])
+        if ejecucion["resultado"]:
+            ejecucion["resultado"] = json.loads(ejecucion["resultado"])
+        ejecuciones.append(ejecucion)
+    return ejecuciones
+
+def _estadisticas_jobs(conn, nombre_lease) -> dict:
+    """Duraciones y resultado de la última ejecución por tarea (sobre el historial retenido)"""
+    rows = conn.execute('''
+        SELECT job, COUNT(*) AS ejecuciones,
+               SUM(estado = 'error') AS errores,
+               ROUND(AVG(duracion_ms), 1) AS duracion_promedio_ms,
+               MAX(duracion_ms) AS duracion_max_ms,
+               MAX(started_at) AS ultima_ejecucion
+        FROM job_runs GROUP BY job
+    ''').fetchall()
+    por_job = {row["job"]: dict(row) for row in rows}
+    ultimas = conn.execute('''
+        SELECT job, estado, duracion_ms, error FROM job_runs r
+        WHERE id = (SELECT id FROM job_runs WHERE job = r.job ORDER BY started_at DESC, id DESC LIMIT 1)
+    ''').fetchall()
+    for row in ultimas:
+        por_job[row["job"]].update(ultimo_estado=row["estado"], ultima_duracion_ms=row["duracion_ms"],
+                                   ultimo_error=row["error"])
+    lease = conn.execute("SELECT owner, expires_at, acquired_at FROM scheduler_lease WHERE nombre = ?",
+                         (nombre_lease,)).fetchone()
+    return {"jobs": por_job, "lease": dict(lease) if lease else None}
+
+# ================================
+# PROGRAMADOR
+# ================================
+
+class Job:
+    """Tarea registrada: nombre, expresión cron y corrutina sin argumentos que devuelve un resultado JSON"""
+
+    def __init__(self, nombre, cron, func, descripcion=""):
+        self.nombre = nombre
+        self.schedule = CronSchedule(cron)
+        self.func = func
+        self.descripcion = descripcion
+        self.proxima = None
+        self.task = None
+
+    @property
+    def ejecutando(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+class JobScheduler:
+    """Dispara las tareas registradas en su horario; solo el worker que tiene el lease ejecuta"""
+
+    def __init__(self, async_db, now_func, lease_seconds=60.0, enabled=True, lease_name="scheduler"):
+        # now_func: hora actual del negocio con zona horaria (now_ca en main.py)
+        self.db = async_db
+        self.now_func = now_func
+        self.lease_seconds = lease_seconds
+        self.enabled = enabled
+        self.lease_name = lease_name
+        # Un horario perdido (p.ej. el líder murió) se recupera si el nuevo líder llega dentro de este margen
+        self.max_retraso_seconds = max(lease_seconds * 2, 60.0)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs = {}
+
+        self._task = None
+        self._es_lider = False
+        self._lider_desde = None
+
+        # Métricas
+        self._disparos = 0
+        self._omitidas = 0
+        self._last_error = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def add_job(self, nombre, cron, func, descripcion=""):
+        """Registrar una tarea. SCHEDULER_CRON_<NOMBRE> cambia su horario; "off" la desactiva"""
+        cron = os.environ.get(f"SCHEDULER_CRON_{nombre.upper()}", cron)
+        if cron.strip().lower() == "off":
+            logger.info(f"⏰ Tarea {nombre} desactivada por configuración")
+            return None
+        job = Job(nombre, cron, func, descripcion)
+        self.jobs[nombre] = job
+        return job
+
+    def start(self):
+        """Iniciar el bucle en el event loop actual"""
+        if self.running or not self.enabled:
+            return
+        ahora = self.now_func()
+        for job in self.jobs.values():
+            job.proxima = job.schedule.next_after(ahora)
+        self._task = asyncio.create_task(self._worker(), name="job-scheduler")
+        logger.info(f"⏰ Programador de tareas iniciado ({len(self.jobs)} tareas, lease {self.lease_seconds}s, "
+                    f"worker {self.owner})")
+
+    async def stop(self):
+        """Detener el bucle, cancelar las tareas en curso y soltar el lease"""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        en_curso = [job.task for job in self.jobs.values() if job.ejecutando]
+        for task in en_curso:
+            task.cancel()
+        await asyncio.gather(*en_curso, return_exceptions=True)
+
+        if self._es_lider:
+            try:
+                await self.db.run(_liberar_lease, self.lease_name, self.owner)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo liberar el lease del programador: {e}")
+            self._es_lider = False
+
+    async def _worker(self):
+        # Renovar bastante antes de que venza para no perder el liderazgo por un tick lento
+        intervalo_renovacion = self.lease_seconds / 3
+        while True:
+            try:
+                es_lider, _, _ = await self.db.run(_renovar_lease, self.lease_name, self.owner, self.lease_seconds)
+                if es_lider != self._es_lider:
+                    self._lider_desde = self.now_func().isoformat() if es_lider else None
+                    logger.info(f"⏰ Worker {self.owner} {'es ahora' if es_lider else 'dejó de ser'} "
+                                "líder del programador")
+                self._es_lider = es_lider
+                if es_lider:
+                    await self._disparar_vencidas()
+                else:
+                    # Seguir el calendario sin ejecutar, para tomar el horario vigente si el líder cae
+                    ahora = self.now_func()
+                    for job in self.jobs.values():
+                        self._avanzar(job, ahora)
+            except Exception as e:
+                self._last_error = str(e)
+                logger.error(f"❌ Error en el programador de tareas: {e}")
+
+            espera = intervalo_renovacion
+            if self._es_lider and self.jobs:
+                proxima = min(job.proxima for job in self.jobs.values())
+                espera = min(espera, max((proxima - self.now_func()).total_seconds(), 0.05))
+            await asyncio.sleep(espera)
+
+    @staticmethod
+    def _avanzar(job, ahora):
+        """Último horario vencido de la tarea (None si no hay) y la próxima pasa al primer horario futuro.
+        Sin recuperación de atrasos: de varios horarios vencidos solo cuenta el más reciente"""
+        if job.proxima > ahora:
+            return None
+        programada = job.proxima
+        siguiente = job.schedule.next_after(programada)
+        while siguiente <= ahora:
+            programada, siguiente = siguiente, job.schedule.next_after(siguiente)
+        job.proxima = siguiente
+        return programada
+
+    async def _disparar_vencidas(self):
+        ahora = self.now_func()
+        for job in self.jobs.values():
+            programada = self._avanzar(job, ahora)
+            if programada is None:
+                continue
+
+            retraso = (ahora - programada).total_seconds()
+            if retraso > self.max_retraso_seconds:
+                self._omitidas += 1
+                logger.warning(f"⏰ {job.nombre}: horario {programada.isoformat()} perdido ({retraso:.0f}s tarde)")
+                continue
+            if job.ejecutando:
+                self._omitidas += 1
+                logger.warning(f"⏰ {job.nombre}: la ejecución anterior sigue en curso, se omite {programada.isoformat()}")
+                continue
+
+            run_id = await self.db.run(_reservar_ejecucion, job.nombre, programada.isoformat(),
+                                       self.owner, ahora.isoformat())
+            if run_id is None:
+                # Otro worker ya la ejecutó (cambio de líder justo en el horario)
+                continue
+            self._disparos += 1
+            job.task = asyncio.create_task(self._ejecutar(job, run_id), name=f"job-{job.nombre}")
+
+    async def _ejecutar(self, job, run_id):
+        inicio = time.perf_counter()
+        estado, resultado, error = ESTADO_OK, None, None
+        try:
+            resultado = json.dumps(await job.func(), default=str, ensure_ascii=False)
+            logger.info(f"⏰ Tarea {job.nombre} completada en {(time.perf_counter() - inicio) * 1000:.0f}ms")
+        except asyncio.CancelledError:
+            estado, error = ESTADO_CANCELADO, "Servidor detenido durante la ejecución"
+            raise
+        except Exception as e:
+            estado, error = ESTADO_ERROR, str(e)
+            logger.error(f"❌ Tarea {job.nombre} falló: {e}")
+        finally:
+            duracion_ms = round((time.perf_counter() - inicio) * 1000, 1)
+            try:
+                await self.db.run(_finalizar_ejecucion, run_id, estado, self.now_func().isoformat(),
+                                  duracion_ms, resultado, error)
+            except Exception as e:
+                logger.error(f"❌ No se pudo registrar la ejecución {run_id} de {job.nombre}: {e}")
+        return {"id": run_id, "estado": estado, "duracion_ms": duracion_ms, "error": error}
+
+    async def run_now(self, nombre):
+        """Ejecutar una tarea ya (manual), en este worker, y esperar el resultado. KeyError si no existe"""
+        job = self.jobs[nombre]
+        if job.ejecutando:
+            raise RuntimeError(f"La tarea {nombre} ya está en ejecución")
+        run_id = await self.db.run(_reservar_ejecucion, nombre, None, self.owner,
+                                   self.now_func().isoformat(), True)
+        job.task = asyncio.create_task(self._ejecutar(job, run_id), name=f"job-{nombre}")
+        return await asyncio.shield(job.task)
+
+    async def history(self, job=None, limit=50) -> list:
+        return await self.db.run(list_job_runs, job, limit)
+
+    async def metrics(self) -> dict:
+        estadisticas = await self.db.run(_estadisticas_jobs, self.lease_name)
+        lease = estadisticas["lease"]
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "worker": self.owner,
+            "es_lider": self._es_lider,
+            "lider_desde": self._lider_desde,
+            "lider_actual": lease["owner"] if lease and lease["expires_at"] > time.time() else None,
+            "lease_seconds": self.lease_seconds,
+            "disparos": self._disparos,
+            "omitidas": self._omitidas,
+            "last_error": self._last_error,
+            "tareas": [
+                {
+                    "nombre": job.nombre,
+                    "descripcion": job.descripcion,
+                    "cron": str(job.schedule),
+                    "proxima_ejecucion": job.proxima.isoformat() if job.proxima else None,
+                    "ejecutando": job.ejecutando,
+                    **{k: v for k, v in estadisticas["jobs"].get(job.nombre, {}).items() if k != "job"},
+                }
+                for job in self.jobs.values()
+            ],
+        }
+
+def create_job_scheduler_from_env(async_db, now_func) -> JobScheduler:
+    """Crear el programador usando SCHEDULER_ENABLED / SCHEDULER_LEASE_SECONDS"""
+    return JobScheduler(
+        async_db,
+        now_func,
+        lease_seconds=float(os.environ.get("SCHEDULER_LEASE_SECONDS", "60")),
+        enabled=os.environ.get("SCHEDULER_ENABLED", "true").lower() == "true",
+    )
@@ -4,18 +4,42 @@ Sistema de Gestión Vehicular - Backend API
 FastAPI Backend para reemplazar Google Sheets
 """
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, AfterValidator
+from typing import Annotated, List, Optional, Dict, Any
 import sqlite3
 import json
 from datetime import datetime, date, timedelta, timezone
 import os
 import logging
 import asyncio
+from db_pool import create_pool_from_env
+from async_db import AsyncDatabase, run_blocking, shutdown_blocking_executor
+from db_migrations import apply_migrations, get_schema_version, get_migration_history
+from db_pagination import LIST_SPECS, InvalidCursorError, fetch_page
+from table_versions import get_table_versions, build_etag, etag_matches
+from backup_scheduler import create_scheduler_from_env
+from email_outbox import EmailDeliveryError, create_outbox_from_env, enqueue_email
+from vehicle_state import get_vehicle_state, rebuild_vehicle_state
+from alert_engine import AlertEngine, ALERT_TABLES
+from job_scheduler import create_job_scheduler_from_env, purge_job_runs, RETENCION_JOB_RUNS_DIAS
+from retornos_pendientes import config_retornos, find_retornos_pendientes, get_viajes_en_curso
+from config_cache import create_config_cache_from_env
+from change_log import CHANGE_LOG_TABLES, fetch_changes, compact_change_log
+from event_broker import create_broker_from_env, close_streams_on_exit
+from idempotency import MAX_KEY_LENGTH, run_idempotent, purge_idempotency_keys
+from table_checksums import CHECKSUM_TABLES, TREE_HEIGHT, BUCKET_BITS, MAX_DEPTH, ChecksumCache
+from backup_stream import DatabaseBackupStream
+from backup_catalog import list_backup_catalog, backup_catalog_summary, purge_backup_catalog
+from retornos_pendientes import parse_fecha_salida as _parse_fecha_salida
+from email_templates import (render_alertas_mantenimiento, render_resumen_alertas, render_alerta_kilometraje,
+                             render_retorno_pendiente)
+from alertas_activas import (create_evaluator_from_env, load_alert_data, refresh_alertas, list_alertas_activas,
+                             pending_notifications, mark_notified, mark_all_notified, ORDEN as ORDEN_ALERTAS)
 
 # Configurar zona horaria de Centroamérica (GMT-6)
 CENTRAL_AMERICA_TZ = timezone(timedelta(hours=-6))
@@ -89,6 +113,44 @@ except Exception as e:
 # Crear aplicación FastAPI
 app = FastAPI(title="Sistema de Gestión Vehicular", version="1.0.0")
 
+# Listados y agregados con ETag: ruta -> tablas de las que depende la respuesta
+ETAG_ROUTES = {
+    "/vehiculos": ("vehiculos",),
+    "/mantenimientos": ("mantenimientos",),
+    "/combustible": ("combustible",),
+    "/revisiones": ("revisiones",),
+    "/polizas": ("polizas",),
+    "/rtv": ("rtv",),
+    "/bitacora": ("bitacora",),
+    "/stats": ("vehiculos", "mantenimientos", "combustible", "revisiones"),
+    "/alertas/detalle": ("vehiculos", "mantenimientos", "polizas", "rtv", "revisiones", "combustible"),
+    "/config/alertas": ("config_alertas",),
+    "/historial/alertas": ("historial_alertas",),
+    "/alertas/activas": ALERT_TABLES,
+}
+
+# Registrado antes que CORS para que las respuestas 304 también pasen por CORSMiddleware
+@app.middleware("http")
+async def etag_condicional(request: Request, call_next):
+    """GET condicional: 304 sin consultar las tablas si sus versiones no cambiaron"""
+    tables = ETAG_ROUTES.get(request.url.path)
+    if request.method != "GET" or tables is None:
+        return await call_next(request)
+    
+    versions = await async_db.run(get_table_versions, tables)
+    # Las fechas entran al ETag porque /stats y /alertas/detalle dependen del día
+    etag = build_etag(versions, request.url.path, request.url.query,
+                      date_ca().isoformat(), datetime.now(timezone.utc).date().isoformat())
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -104,8 +166,14 @@ app.mount("/static", StaticFiles(directory="."), name="static")
 # Base de datos SQLite
 DATABASE_PATH = "vehicular_system.db"
 
-# Configuración de Email
-EMAIL_CONFIG = {
+# Pool de conexiones pre-configuradas (WAL, busy_timeout, caché) compartido por todos los endpoints
+db_pool = create_pool_from_env(DATABASE_PATH)
+
+# Capa asíncrona: el SQLite bloqueante corre en un executor acotado, no en el event loop
+async_db = AsyncDatabase(db_pool)
+
+# Configuración de Email por defecto (la vigente se guarda en config_email y se lee de config_cache)
+EMAIL_CONFIG_DEFAULT = {
     "smtp_server": "smtp.gmail.com",
     "smtp_port": 587,
     "sender_email": "sistema.vehicular@arenalmanoa.com",  # CAMBIAR por su email real
@@ -137,244 +205,59 @@ EMAIL_PROVIDERS = {
     }
 }
 
+# Horas sin registrar el retorno si config_alertas no tiene umbral (cada vehículo puede fijar el suyo)
+RETORNO_PENDIENTE_HORAS = float(os.environ.get("RETORNO_PENDIENTE_HORAS", "24"))
+
+# Configuración de alertas si todavía no se guardó ninguna (km_diferencia_alerta: DEFAULT de la tabla)
+CONFIG_ALERTAS_DEFAULT = {
+    "email_destino": EMAIL_CONFIG_DEFAULT["recipient_email"],
+    "alertas_mantenimiento": True,
+    "alertas_polizas": True,
+    "alertas_rtv": True,
+    "alertas_revisiones": True,
+    "alertas_combustible": True,
+    "alertas_bitacora": True,
+    "dias_anticipacion_polizas": 30,
+    "dias_anticipacion_rtv": 30,
+    "dias_anticipacion_mantenimiento": 30,
+    "km_diferencia_alerta": 10,
+    "horas_retorno_pendiente": RETORNO_PENDIENTE_HORAS
+}
+
+# Configuración en memoria: se carga una vez, las escrituras la actualizan y un sondeo de
+# table_versions la mantiene al día entre workers
+config_cache = create_config_cache_from_env(async_db, db_pool.connection,
+                                            CONFIG_ALERTAS_DEFAULT, EMAIL_CONFIG_DEFAULT)
+
 def init_database():
-    """Inicializar base de datos con todas las tablas"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    # Tabla Vehiculos
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS vehiculos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            placa TEXT UNIQUE NOT NULL,
-            marca TEXT NOT NULL,
-            modelo TEXT NOT NULL,
-            ano INTEGER NOT NULL,
-            color TEXT NOT NULL,
-            propietario TEXT NOT NULL,
-            poliza TEXT,
-            seguro TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Tabla Mantenimientos
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS mantenimientos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fecha DATE NOT NULL,
-            placa TEXT NOT NULL,
-            tipo TEXT NOT NULL,
-            descripcion TEXT NOT NULL,
-            costo REAL NOT NULL,
-            kilometraje INTEGER,
-            proximo_km INTEGER,
-            proxima_fecha DATE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
-        )
-    ''')
-    
-    # Agregar columnas si no existen (para migración)
-    try:
-        cursor.execute('ALTER TABLE mantenimientos ADD COLUMN proximo_km INTEGER')
-    except:
-        pass
-    try:
-        cursor.execute('ALTER TABLE mantenimientos ADD COLUMN proxima_fecha DATE')
-    except:
-        pass
-    
-    # Tabla Combustible
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS combustible (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fecha DATE NOT NULL,
-            placa TEXT NOT NULL,
-            litros REAL NOT NULL,
-            costo REAL NOT NULL,
-            kilometraje INTEGER,
-            estacion TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
-        )
-    ''')
-    
-    # Tabla Revisiones
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS revisiones (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fecha DATE NOT NULL,
-            placa TEXT NOT NULL,
-            inspector TEXT NOT NULL,
-            estado_motor TEXT NOT NULL,
-            estado_frenos TEXT NOT NULL,
-            estado_luces TEXT NOT NULL,
-            estado_llantas TEXT NOT NULL,
-            estado_carroceria TEXT NOT NULL,
-            observaciones TEXT,
-            aprobado BOOLEAN NOT NULL,
-            -- Nuevos campos para sistema eléctrico y exterior
-            luces_delanteras BOOLEAN DEFAULT 1,
-            luces_traseras BOOLEAN DEFAULT 1,
-            luces_direccionales BOOLEAN DEFAULT 1,
-            luces_freno BOOLEAN DEFAULT 1,
-            luces_reversa BOOLEAN DEFAULT 1,
-            espejos_laterales BOOLEAN DEFAULT 1,
-            espejo_retrovisor BOOLEAN DEFAULT 1,
-            limpiaparabrisas BOOLEAN DEFAULT 1,
-            cinturones BOOLEAN DEFAULT 1,
-            bocina BOOLEAN DEFAULT 1,
-            nivel_combustible TEXT DEFAULT 'lleno',
-            kilometraje INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
-        )
-    ''')
+    """Inicializar base de datos aplicando solo las migraciones pendientes del esquema"""
+    with db_connection() as conn:
+        applied = apply_migrations(conn)
+        version = get_schema_version(conn)
     
-    # Tabla Polizas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS polizas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            numero_poliza TEXT UNIQUE NOT NULL,
-            placa TEXT NOT NULL,
-            aseguradora TEXT NOT NULL,
-            fecha_inicio DATE NOT NULL,
-            fecha_vencimiento DATE NOT NULL,
-            tipo_cobertura TEXT NOT NULL,
-            estado TEXT NOT NULL DEFAULT 'Activa',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
-        )
-    ''')
-    
-    # Tabla RTV (Revisión Técnica Vehicular)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS rtv (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            numero_cita TEXT NOT NULL,
-            placa TEXT NOT NULL,
-            fecha_vencimiento DATE NOT NULL,
-            estado TEXT NOT NULL DEFAULT 'Vigente',
-            observaciones TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
-        )
-    ''')
-    
-    # Tabla Bitácora
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS bitacora (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            placa TEXT NOT NULL,
-            chofer TEXT NOT NULL,
-            fecha_salida DATETIME NOT NULL,
-            km_salida INTEGER NOT NULL,
-            nivel_combustible_salida TEXT NOT NULL,
-            estado_vehiculo_salida TEXT NOT NULL,
-            fecha_retorno DATETIME,
-            km_retorno INTEGER,
-            nivel_combustible_retorno TEXT,
-            estado_vehiculo_retorno TEXT,
-            observaciones TEXT,
-            estado TEXT DEFAULT 'en_curso',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (placa) REFERENCES vehiculos (placa)
-        )
-    ''')
-    
-    # Tabla de configuración de alertas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS config_alertas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email_destino TEXT NOT NULL,
-            alertas_mantenimiento BOOLEAN DEFAULT 1,
-            alertas_polizas BOOLEAN DEFAULT 1,
-            alertas_rtv BOOLEAN DEFAULT 1,
-            alertas_revisiones BOOLEAN DEFAULT 1,
-            alertas_combustible BOOLEAN DEFAULT 1,
-            alertas_bitacora BOOLEAN DEFAULT 1,
-            dias_anticipacion_polizas INTEGER DEFAULT 30,
-            dias_anticipacion_rtv INTEGER DEFAULT 30,
-            dias_anticipacion_mantenimiento INTEGER DEFAULT 30,
-            km_diferencia_alerta INTEGER DEFAULT 10,
-            activo BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Tabla de historial de alertas enviadas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS historial_alertas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tipo_alerta TEXT NOT NULL,
-            vehiculo_placa TEXT,
-            destinatario_email TEXT NOT NULL,
-            asunto TEXT NOT NULL,
-            mensaje TEXT,
-            estado TEXT DEFAULT 'enviado',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (vehiculo_placa) REFERENCES vehiculos (placa)
-        )
-    ''')
-    
-    # Agregar nuevas columnas a la tabla revisiones si no existen
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN luces_delanteras BOOLEAN DEFAULT 1")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN luces_traseras BOOLEAN DEFAULT 1")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN luces_direccionales BOOLEAN DEFAULT 1")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN luces_freno BOOLEAN DEFAULT 1")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN luces_reversa BOOLEAN DEFAULT 1")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN espejos_laterales BOOLEAN DEFAULT 1")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN espejo_retrovisor BOOLEAN DEFAULT 1")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN limpiaparabrisas BOOLEAN DEFAULT 1")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN cinturones BOOLEAN DEFAULT 1")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN bocina BOOLEAN DEFAULT 1")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN nivel_combustible TEXT DEFAULT 'lleno'")
-    except:
-        pass
-    try:
-        cursor.execute("ALTER TABLE revisiones ADD COLUMN kilometraje INTEGER")
-    except:
-        pass
-    
-    conn.commit()
-    conn.close()
-    logger.info("Base de datos inicializada correctamente")
+    if applied:
+        logger.info(f"Base de datos migrada a la versión {version} (aplicadas: {applied})")
+    else:
+        logger.info(f"Base de datos al día (esquema versión {version})")
 
 # Modelos Pydantic
+
+# Placa de un registro asociado a un vehículo: se guarda como en vehiculos (sin espacios, en
+# mayúsculas), si no la clave foránea la rechaza aunque el vehículo exista
+Placa = Annotated[str, AfterValidator(lambda placa: placa.strip().upper())]
+
+# Fecha/hora ISO 8601 enviada por el cliente (p. ej. al importar viajes de otra base). Se guarda en
+# hora de Centroamérica, como now_ca(): las fechas se comparan y ordenan como texto (sin zona = GMT-6)
+FechaHora = Annotated[str, AfterValidator(
+    lambda valor: _parse_fecha_salida(valor, CENTRAL_AMERICA_TZ).astimezone(CENTRAL_AMERICA_TZ).isoformat())]
+
+# Detalle cuando la placa no corresponde a ningún vehículo (clave foránea a vehiculos)
+VEHICULO_NO_REGISTRADO = "Vehículo no registrado"
+
+def es_error_vehiculo(error: sqlite3.IntegrityError) -> bool:
+    """Si el IntegrityError viene de la clave foránea a vehiculos (y no de un UNIQUE)"""
+    return "FOREIGN KEY" in str(error)
+
 class VehiculoCreate(BaseModel):
     placa: str
     marca: str
@@ -385,6 +268,7 @@ class VehiculoCreate(BaseModel):
     poliza: Optional[str] = None
     seguro: Optional[str] = None
     km_inicial: Optional[int] = 0
+    horas_retorno_max: Optional[float] = None
 
 class VehiculoUpdate(BaseModel):
     marca: Optional[str] = None
@@ -395,10 +279,11 @@ class VehiculoUpdate(BaseModel):
     poliza: Optional[str] = None
     seguro: Optional[str] = None
     km_inicial: Optional[int] = None
+    horas_retorno_max: Optional[float] = None  # 0 = usar el umbral general
 
 class MantenimientoCreate(BaseModel):
     fecha: str
-    placa: str
+    placa: Placa
     tipo: str
     descripcion: str
     costo: float
@@ -408,7 +293,7 @@ class MantenimientoCreate(BaseModel):
 
 class CombustibleCreate(BaseModel):
     fecha: str
-    placa: str
+    placa: Placa
     litros: float
     costo: float
     kilometraje: Optional[int] = None
@@ -416,7 +301,7 @@ class CombustibleCreate(BaseModel):
 
 class RevisionCreate(BaseModel):
     fecha: str
-    placa: str
+    placa: Placa
     inspector: str
     estado_motor: str
     estado_frenos: str
@@ -441,7 +326,7 @@ class RevisionCreate(BaseModel):
 
 class PolizaCreate(BaseModel):
     numero_poliza: str
-    placa: str
+    placa: Placa
     aseguradora: str
     fecha_inicio: str
     fecha_vencimiento: str
@@ -450,24 +335,26 @@ class PolizaCreate(BaseModel):
 
 class RTVCreate(BaseModel):
     numero_cita: str
-    placa: str
+    placa: Placa
     fecha_vencimiento: str
     estado: Optional[str] = "Vigente"
     observaciones: Optional[str] = None
 
 class BitacoraSalida(BaseModel):
-    placa: str
+    placa: Placa
     chofer: str
     km_salida: int
     nivel_combustible_salida: str
     estado_vehiculo_salida: str
     observaciones: Optional[str] = None
+    fecha_salida: Optional[FechaHora] = None  # Por defecto, la hora en que se registra
 
 class BitacoraRetorno(BaseModel):
     km_retorno: int
     nivel_combustible_retorno: str
     estado_vehiculo_retorno: str
     observaciones: Optional[str] = None
+    fecha_retorno: Optional[FechaHora] = None  # Por defecto, la hora en que se registra
 
 class ConfigAlertas(BaseModel):
     email_destino: str
@@ -481,500 +368,225 @@ class ConfigAlertas(BaseModel):
     dias_anticipacion_rtv: Optional[int] = 30
     dias_anticipacion_mantenimiento: Optional[int] = 30
     km_diferencia_alerta: Optional[int] = 1
+    horas_retorno_pendiente: Optional[float] = 24
 
 # Utilidades de base de datos
 def get_db_connection():
-    """Obtener conexión a la base de datos"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def send_email_notification(subject: str, body: str, recipient: str = None):
-    """Enviar notificación por email - Compatible con SendGrid y SMTP"""
+    """Obtener conexión del pool (conn.close() la devuelve al pool)"""
+    return db_pool.acquire()
+
+def db_connection():
+    """Context manager que toma una conexión del pool y la devuelve siempre, incluso con errores"""
+    return db_pool.connection()
+
+def _error_sendgrid(result) -> EmailDeliveryError:
+    """Un 4xx de SendGrid (petición rechazada: remitente, destinatario, API key) no se arregla reintentando;
+    los 5xx, 408, 429 y errores de red sí"""
+    status = result.get("status_code") or 0
+    permanente = 400 <= status < 500 and status not in (408, 429)
+    return EmailDeliveryError(f"SendGrid: {result['error']}", permanent=permanente)
+
+def _error_smtp(error) -> EmailDeliveryError:
+    """Autenticación, remitente o destinatarios rechazados y respuestas 5xx son permanentes;
+    conexión, timeout o desconexión del servidor se reintentan"""
+    permanente = isinstance(error, (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused,
+                                    smtplib.SMTPSenderRefused)) or \
+        (isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500)
+    return EmailDeliveryError(f"SMTP: {error}", permanent=permanente)
+
+def send_email_notification(subject: str, body: str, recipient: str = None, text_body: str = None):
+    """Enviar notificación por email - Compatible con SendGrid y SMTP. text_body: alternativa en texto plano.
+
+    Devuelve True si se entregó; si no, lanza EmailDeliveryError (permanent=True si reintentar no sirve)
+    para que la cola de emails decida entre reintento y fallido.
+    """
+    email_config = config_cache.email()
+    recipient = recipient or email_config["recipient_email"]
+    # Varios destinatarios separados por coma: una sola llamada a la API
+    recipients = [email.strip() for email in recipient.split(",") if email.strip()]
+    
+    if EMAIL_METHOD == "SENDGRID":
+        # Usar SendGrid API (funciona en Railway)
+        result = send_system_email(recipients, subject, body, text_body)
+        if not result["success"]:
+            logger.error(f"❌ Error SendGrid: {result['error']}")
+            raise _error_sendgrid(result)
+        logger.info(f"✅ Email automático SendGrid enviado a {recipient}")
+        return True
+    
+    # Fallback SMTP (puede no funcionar en Railway)
+    if not email_config.get("sender_password"):
+        logger.warning("Email SMTP no configurado - usar SendGrid")
+        raise EmailDeliveryError("Email SMTP no configurado")
+    
+    # multipart/alternative: el cliente muestra la última parte que sepa mostrar (HTML)
+    msg = MIMEMultipart('alternative') if text_body else MIMEMultipart()
+    msg['From'] = email_config["sender_email"]
+    msg['To'] = ", ".join(recipients)
+    msg['Subject'] = subject
+    
+    if text_body:
+        msg.attach(MIMEText(text_body, 'plain'))
+    msg.attach(MIMEText(body, 'html'))
+    
     try:
-        recipient = recipient or EMAIL_CONFIG.get("recipient_email", "contabilidad2@arenalmanoa.com")
-        
-        if EMAIL_METHOD == "SENDGRID":
-            # Usar SendGrid API (funciona en Railway)
-            result = send_system_email(recipient, subject, body)
-            if result["success"]:
-                logger.info(f"✅ Email automático SendGrid enviado a {recipient}")
-                return True
-            else:
-                logger.error(f"❌ Error SendGrid: {result['error']}")
-                return False
-        else:
-            # Fallback SMTP (puede no funcionar en Railway)  
-            if not EMAIL_CONFIG.get("sender_password"):
-                logger.warning("Email SMTP no configurado - usar SendGrid")
-                return False
-                
-            msg = MIMEMultipart()
-            msg['From'] = EMAIL_CONFIG["sender_email"]
-            msg['To'] = recipient
-            msg['Subject'] = subject
-            
-            msg.attach(MIMEText(body, 'html'))
-        
-        try:
-            server = smtplib.SMTP(EMAIL_CONFIG["smtp_server"], EMAIL_CONFIG["smtp_port"])
+        with smtplib.SMTP(email_config["smtp_server"], email_config["smtp_port"], timeout=30) as server:
             server.starttls()
-            server.login(EMAIL_CONFIG["sender_email"], EMAIL_CONFIG["sender_password"])
-            text = msg.as_string()
-            server.sendmail(EMAIL_CONFIG["sender_email"], recipient, text)
-            server.quit()
-            logger.info(f"✅ Email enviado exitosamente a {recipient}")
-        except Exception as smtp_error:
-            logger.warning(f"⚠️ SMTP no disponible en Railway: {smtp_error}")
-            logger.info(f"📧 Email simulado enviado a: {recipient}")
-            logger.info(f"📋 Asunto: {subject}")
-            # No lanzar error, simular envío exitoso
-        
-        logger.info(f"Email enviado exitosamente a {recipient}")
-        return True
-    except Exception as e:
-        logger.error(f"Error enviando email: {e}")
-        return False
+            server.login(email_config["sender_user"], email_config["sender_password"])
+            server.sendmail(email_config["sender_email"], recipients, msg.as_string())
+    except (smtplib.SMTPException, OSError) as smtp_error:
+        logger.error(f"❌ Error SMTP enviando a {recipient}: {smtp_error}")
+        raise _error_smtp(smtp_error)
+    
+    logger.info(f"✅ Email enviado exitosamente a {recipient}")
+    return True
+
+# Los endpoints encolan en email_outbox; un worker entrega con send_email_notification (o el stub)
+email_outbox = create_outbox_from_env(async_db, send_email_notification)
+
+# Foto de alertas compartida por /alertas/detalle, /alertas/verificar y los emails de resumen,
+# leída de la tabla materializada alertas_activas (el evaluador la mantiene al día por placa)
+alert_engine = AlertEngine(loader=load_alert_data)
+alert_evaluator = create_evaluator_from_env(async_db, date_ca)
+
+# Avisos de cambios para GET /events (SSE): un lector de change_log por worker, reparto en memoria
+event_broker = create_broker_from_env(async_db)
+close_streams_on_exit(event_broker)
+
+# Árboles de hashes por tabla para GET /checksums (se recalculan solo cuando cambia la versión)
+checksum_cache = ChecksumCache()
 
 def check_maintenance_alerts():
     """Verificar alertas de mantenimiento y enviar notificaciones"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Obtener mantenimientos con alertas próximas
-        hoy = date_ca()
-        en_7_dias = hoy + timedelta(days=7)
-        
-        # Alertas por fecha
-        cursor.execute('''
-            SELECT * FROM mantenimientos 
-            WHERE proxima_fecha IS NOT NULL 
-            AND proxima_fecha <= ? 
-            AND proxima_fecha >= ?
-            ORDER BY proxima_fecha ASC
-        ''', (en_7_dias.isoformat(), hoy.isoformat()))
-        
-        alertas_fecha = cursor.fetchall()
-        
-        # Alertas por kilometraje (necesitamos el km actual de cada vehículo)
-        cursor.execute('''
-            SELECT m.*, c.kilometraje as km_actual
-            FROM mantenimientos m
-            LEFT JOIN (
-                SELECT placa, MAX(kilometraje) as kilometraje
-                FROM combustible 
-                WHERE kilometraje IS NOT NULL
-                GROUP BY placa
-            ) c ON m.placa = c.placa
-            WHERE m.proximo_km IS NOT NULL 
-            AND c.kilometraje IS NOT NULL
-            AND (m.proximo_km - c.kilometraje) <= 1000
-            AND (m.proximo_km - c.kilometraje) > 0
-            ORDER BY (m.proximo_km - c.kilometraje) ASC
-        ''')
-        
-        alertas_km = cursor.fetchall()
-        
-        if alertas_fecha or alertas_km:
-            # Generar email de alertas
-            subject = f"\u26a0\ufe0f Alertas de Mantenimiento - {hoy.strftime('%d/%m/%Y')}"
-            body = generate_alert_email_body(alertas_fecha, alertas_km)
-            send_email_notification(subject, body)
+        with db_connection() as conn:
+            # Ventanas de 7 días / 1000 km filtradas sobre la foto compartida del motor de alertas
+            hoy = date_ca()
+            snapshot = alert_engine.snapshot(conn, hoy)
+            alertas_fecha = snapshot.mantenimiento_fecha(dias=7)
+            alertas_km = snapshot.mantenimiento_km(km=1000)
+        
+            if alertas_fecha or alertas_km:
+                # Generar email de alertas
+                subject = f"\u26a0\ufe0f Alertas de Mantenimiento - {hoy.strftime('%d/%m/%Y')}"
+                email = snapshot.view("email_mantenimiento",
+                                      lambda s: generate_alert_email_body(alertas_fecha, alertas_km, s.hoy))
+                enqueue_email(conn, "Mantenimiento", subject, email.html, config_cache.email()["recipient_email"],
+                              mensaje=f"{len(alertas_fecha) + len(alertas_km)} mantenimientos próximos",
+                              max_intentos=email_outbox.max_attempts, cuerpo_texto=email.text)
+                conn.commit()
+                email_outbox.notify()
             
-        conn.close()
         return len(alertas_fecha) + len(alertas_km)
         
     except Exception as e:
         logger.error(f"Error verificando alertas: {e}")
         return 0
 
-def generate_alert_email_body(alertas_fecha, alertas_km):
-    """Generar cuerpo del email de alertas"""
-    html = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; }}
-            .header {{ background-color: #f44336; color: white; padding: 20px; text-align: center; }}
-            .content {{ padding: 20px; }}
-            .alert {{ background-color: #fff3cd; border: 1px solid #ffeaa7; padding: 10px; margin: 10px 0; border-radius: 5px; }}
-            .urgent {{ background-color: #f8d7da; border-color: #f5c6cb; }}
-            table {{ width: 100%; border-collapse: collapse; margin: 10px 0; }}
-            th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
-            th {{ background-color: #f2f2f2; }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>\u26a0\ufe0f Sistema de Gestión Vehicular</h1>
-            <h2>Alertas de Mantenimiento</h2>
-        </div>
-        <div class="content">
-            <p>Se han detectado las siguientes alertas de mantenimiento:</p>
-    """
-    
-    if alertas_fecha:
-        html += "<h3>\ud83d\udcc5 Alertas por Fecha Próxima</h3>"
-        html += "<table><tr><th>Placa</th><th>Tipo</th><th>Fecha Programada</th><th>Días Restantes</th></tr>"
-        for alerta in alertas_fecha:
-            dias_restantes = (datetime.strptime(alerta['proxima_fecha'], '%Y-%m-%d').date() - date_ca()).days
-            urgente = "urgent" if dias_restantes <= 3 else ""
-            html += f"<tr class='{urgente}'><td>{alerta['placa']}</td><td>{alerta['tipo']}</td><td>{alerta['proxima_fecha']}</td><td>{dias_restantes} días</td></tr>"
-        html += "</table>"
-    
-    if alertas_km:
-        html += "<h3>\ud83d\udccd Alertas por Kilometraje Próximo</h3>"
-        html += "<table><tr><th>Placa</th><th>Tipo</th><th>Km Actual</th><th>Próximo Servicio</th><th>Km Restantes</th></tr>"
-        for alerta in alertas_km:
-            km_restantes = alerta['proximo_km'] - alerta['km_actual']
-            urgente = "urgent" if km_restantes <= 200 else ""
-            html += f"<tr class='{urgente}'><td>{alerta['placa']}</td><td>{alerta['tipo']}</td><td>{alerta['km_actual']:,}</td><td>{alerta['proximo_km']:,}</td><td>{km_restantes:,} km</td></tr>"
-        html += "</table>"
-    
-    html += """
-            <hr>
-            <p><small>Este es un mensaje automático del Sistema de Gestión Vehicular.<br>
-            Para más detalles, accede al sistema en línea.</small></p>
-        </div>
-    </body>
-    </html>
-    """
-    
-    return html
+def generate_alert_email_body(alertas_fecha, alertas_km, hoy=None):
+    """Generar cuerpo del email de alertas (HTML y texto plano)"""
+    return render_alertas_mantenimiento(alertas_fecha, alertas_km, hoy or date_ca())
 
-def check_all_alerts():
-    """Verificar todas las alertas del sistema y enviar notificaciones"""
+def check_all_alerts(completo=False):
+    """Verificar todas las alertas del sistema y enviar notificaciones.
+    Por defecto solo las nuevas, escaladas o resueltas desde el último email; completo=True envía el resumen entero"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        hoy = date_ca()
-        en_30_dias = hoy + timedelta(days=30)
-        en_7_dias = hoy + timedelta(days=7)
-        
-        # === ALERTAS DE MANTENIMIENTO ===
-        # Alertas por fecha
-        cursor.execute('''
-            SELECT * FROM mantenimientos 
-            WHERE proxima_fecha IS NOT NULL 
-            AND proxima_fecha <= ? 
-            AND proxima_fecha >= ?
-            ORDER BY proxima_fecha ASC
-        ''', (en_30_dias.isoformat(), hoy.isoformat()))
-        alertas_mant_fecha = cursor.fetchall()
-        
-        # Alertas por kilometraje
-        cursor.execute('''
-            SELECT m.*, c.kilometraje as km_actual
-            FROM mantenimientos m
-            LEFT JOIN (
-                SELECT placa, MAX(kilometraje) as kilometraje
-                FROM combustible 
-                WHERE kilometraje IS NOT NULL
-                GROUP BY placa
-            ) c ON m.placa = c.placa
-            WHERE m.proximo_km IS NOT NULL 
-            AND c.kilometraje IS NOT NULL
-            AND (m.proximo_km - c.kilometraje) <= 1500
-            AND (m.proximo_km - c.kilometraje) > 0
-            ORDER BY (m.proximo_km - c.kilometraje) ASC
-        ''')
-        alertas_mant_km = cursor.fetchall()
-        
-        # === ALERTAS DE PÓLIZAS VENCIDAS ===
-        cursor.execute('''
-            SELECT p.*, v.marca, v.modelo 
-            FROM polizas p 
-            JOIN vehiculos v ON p.placa = v.placa
-            WHERE p.fecha_vencimiento <= ? 
-            AND p.fecha_vencimiento >= ?
-            AND p.estado = 'Activa'
-            ORDER BY p.fecha_vencimiento ASC
-        ''', (en_30_dias.isoformat(), hoy.isoformat()))
-        alertas_polizas = cursor.fetchall()
-        
-        # === ALERTAS DE RTV VENCIDAS ===
-        cursor.execute('''
-            SELECT r.*, v.marca, v.modelo 
-            FROM rtv r 
-            JOIN vehiculos v ON r.placa = v.placa
-            WHERE r.fecha_vencimiento <= ? 
-            AND r.fecha_vencimiento >= ?
-            AND r.estado = 'Vigente'
-            ORDER BY r.fecha_vencimiento ASC
-        ''', (en_30_dias.isoformat(), hoy.isoformat()))
-        alertas_rtv = cursor.fetchall()
-        
-        # === ALERTAS DE REVISIONES CON FALLAS ===
-        cursor.execute('''
-            SELECT r.*, v.marca, v.modelo 
-            FROM revisiones r 
-            JOIN vehiculos v ON r.placa = v.placa
-            WHERE r.aprobado = 0 
-            AND r.fecha >= ?
-            ORDER BY r.fecha DESC
-        ''', ((hoy - timedelta(days=30)).isoformat(),))
-        alertas_revisiones_fallas = cursor.fetchall()
-        
-        # === ALERTAS DE VARIACIONES ANORMALES EN COMBUSTIBLE ===
-        alertas_combustible_anormal = check_abnormal_fuel_consumption(cursor, hoy)
-        
-        # Consolidar todas las alertas
-        total_alertas = (len(alertas_mant_fecha) + len(alertas_mant_km) + 
-                        len(alertas_polizas) + len(alertas_rtv) + 
-                        len(alertas_revisiones_fallas) + len(alertas_combustible_anormal))
-        
-        if total_alertas > 0:
-            # Generar email completo de alertas
-            subject = f"🚨 ALERTAS SISTEMA VEHICULAR - {hoy.strftime('%d/%m/%Y')} ({total_alertas} alertas)"
-            body = generate_comprehensive_alert_email(
-                alertas_mant_fecha, alertas_mant_km, alertas_polizas, 
-                alertas_rtv, alertas_revisiones_fallas, alertas_combustible_anormal, hoy
-            )
-            send_email_notification(subject, body)
+        with db_connection() as conn:
+            hoy = date_ca()
+            if completo:
+                return _enviar_resumen_completo(conn, hoy)
             
-        conn.close()
-        return total_alertas
+            refresh_alertas(conn, hoy)
+            # Escritura exclusiva: dos verificaciones simultáneas no envían los mismos cambios dos veces
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cambios = pending_notifications(conn)
+                avisos = len(cambios["nuevas"]) + len(cambios["escaladas"]) + len(cambios["resueltas"])
+                historial_id = None
+                
+                if avisos:
+                    # Solo se arma el HTML de las alertas que cambiaron
+                    por_categoria = {categoria: [] for categoria in ORDEN_ALERTAS}
+                    for alerta in cambios["nuevas"] + cambios["escaladas"]:
+                        por_categoria[alerta["categoria"]].append(alerta["datos"])
+                    for categoria, (clave, descendente) in ORDEN_ALERTAS.items():
+                        por_categoria[categoria].sort(key=clave, reverse=descendente)
+                    
+                    subject = (f"🚨 NOVEDADES ALERTAS - {hoy.strftime('%d/%m/%Y')} ({len(cambios['nuevas'])} nuevas, "
+                               f"{len(cambios['escaladas'])} escaladas, {len(cambios['resueltas'])} resueltas)")
+                    email = generate_comprehensive_alert_email(
+                        por_categoria["mantenimiento_fecha"], por_categoria["mantenimiento_km"],
+                        por_categoria["polizas"], por_categoria["rtv"], por_categoria["revisiones"],
+                        por_categoria["combustible"], hoy,
+                        resueltas=cambios["resueltas"], titulo="Novedades de Alertas"
+                    )
+                    outbox_id = enqueue_email(conn, "Resumen de Alertas", subject, email.html, config_cache.email()["recipient_email"],
+                                              mensaje=f"{avisos} alertas nuevas, escaladas o resueltas",
+                                              max_intentos=email_outbox.max_attempts, cuerpo_texto=email.text)
+                    historial_id = conn.execute("SELECT historial_id FROM email_outbox WHERE id = ?",
+                                                (outbox_id,)).fetchone()[0]
+                
+                mark_notified(conn, cambios, historial_id)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            
+            if avisos:
+                email_outbox.notify()
+            else:
+                logger.info("🔕 Sin alertas nuevas, escaladas ni resueltas desde el último email")
+        return avisos
         
     except Exception as e:
         logger.error(f"Error verificando alertas: {e}")
         return 0
 
-def check_abnormal_fuel_consumption(cursor, hoy):
-    """Detectar variaciones anormales en el consumo de combustible"""
-    try:
-        alertas = []
-        
-        # Obtener vehículos con registros de combustible recientes
-        cursor.execute('''
-            SELECT DISTINCT placa FROM combustible 
-            WHERE fecha >= ? AND kilometraje IS NOT NULL
-        ''', ((hoy - timedelta(days=60)).isoformat(),))
-        
-        vehiculos_con_combustible = cursor.fetchall()
-        
-        for vehiculo in vehiculos_con_combustible:
-            placa = vehiculo['placa']
-            
-            # Calcular consumo promedio de los últimos 60 días
-            cursor.execute('''
-                SELECT c.fecha, c.kilometraje, c.litros, c.costo
-                FROM combustible c
-                WHERE c.placa = ? 
-                AND c.fecha >= ? 
-                AND c.kilometraje IS NOT NULL
-                ORDER BY c.fecha ASC, c.id ASC
-            ''', (placa, (hoy - timedelta(days=60)).isoformat()))
-            
-            registros = cursor.fetchall()
-            consumos = []
-            
-            for i in range(1, len(registros)):
-                registro_actual = registros[i]
-                registro_anterior = registros[i-1]
-                
-                km_recorridos = registro_actual['kilometraje'] - registro_anterior['kilometraje']
-                if km_recorridos > 0:
-                    rendimiento = km_recorridos / registro_actual['litros']
-                    consumos.append({
-                        'fecha': registro_actual['fecha'],
-                        'rendimiento': rendimiento,
-                        'km_recorridos': km_recorridos,
-                        'litros': registro_actual['litros']
-                    })
-            
-            if len(consumos) >= 3:
-                # Calcular promedio y detectar anomalías
-                rendimientos = [c['rendimiento'] for c in consumos]
-                promedio = sum(rendimientos) / len(rendimientos)
-                
-                # Verificar últimos 3 registros para detectar deterioro significativo
-                ultimos_3 = consumos[-3:]
-                promedio_reciente = sum(c['rendimiento'] for c in ultimos_3) / len(ultimos_3)
-                
-                # Si el rendimiento reciente es 25% menor al promedio, es anormal
-                if promedio_reciente < promedio * 0.75:
-                    cursor.execute('SELECT marca, modelo FROM vehiculos WHERE placa = ?', (placa,))
-                    vehiculo_info = cursor.fetchone()
-                    
-                    alertas.append({
-                        'placa': placa,
-                        'marca': vehiculo_info['marca'] if vehiculo_info else 'N/A',
-                        'modelo': vehiculo_info['modelo'] if vehiculo_info else 'N/A',
-                        'promedio_historico': round(promedio, 2),
-                        'promedio_reciente': round(promedio_reciente, 2),
-                        'deterioro_porcentaje': round(((promedio - promedio_reciente) / promedio) * 100, 1),
-                        'ultimo_registro': ultimos_3[-1]['fecha']
-                    })
-        
-        return alertas
-        
-    except Exception as e:
-        logger.error(f"Error detectando variaciones de combustible: {e}")
-        return []
+def _enviar_resumen_completo(conn, hoy):
+    """Resumen con todas las alertas abiertas; todas quedan marcadas como notificadas"""
+    snapshot = alert_engine.snapshot(conn, hoy)
+    total_alertas = snapshot.total
+
+    if total_alertas > 0:
+        # Generar email completo de alertas (HTML y texto se arman una vez por foto)
+        subject = f"🚨 ALERTAS SISTEMA VEHICULAR - {hoy.strftime('%d/%m/%Y')} ({total_alertas} alertas)"
+        email = snapshot.view("email_completo", lambda s: generate_comprehensive_alert_email(
+            s.data["mantenimiento_fecha"], s.data["mantenimiento_km"], s.data["polizas"],
+            s.data["rtv"], s.data["revisiones"], s.data["combustible"], s.hoy
+        ))
+        outbox_id = enqueue_email(conn, "Resumen de Alertas", subject, email.html, config_cache.email()["recipient_email"],
+                                  mensaje=f"{total_alertas} alertas", max_intentos=email_outbox.max_attempts,
+                                  cuerpo_texto=email.text)
+        historial_id = conn.execute("SELECT historial_id FROM email_outbox WHERE id = ?", (outbox_id,)).fetchone()[0]
+        mark_all_notified(conn, historial_id)
+        conn.commit()
+        email_outbox.notify()
+
+    return total_alertas
 
 def generate_comprehensive_alert_email(alertas_mant_fecha, alertas_mant_km, alertas_polizas, 
-                                     alertas_rtv, alertas_revisiones_fallas, alertas_combustible_anormal, hoy):
-    """Generar email completo con todas las categorías de alertas"""
-    html = f"""
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 0; padding: 0; }}
-            .header {{ background-color: #d32f2f; color: white; padding: 20px; text-align: center; }}
-            .content {{ padding: 20px; }}
-            .alert-section {{ margin-bottom: 30px; }}
-            .alert-title {{ background-color: #f5f5f5; color: #333; padding: 12px; margin: 15px 0 10px 0; 
-                          border-left: 4px solid #ff9800; font-weight: bold; font-size: 16px; }}
-            .alert {{ background-color: #fff3cd; border: 1px solid #ffeaa7; padding: 12px; margin: 8px 0; 
-                     border-radius: 5px; }}
-            .urgent {{ background-color: #f8d7da; border-color: #f5c6cb; }}
-            .critical {{ background-color: #f5c6cb; border-color: #dc3545; }}
-            table {{ width: 100%; border-collapse: collapse; margin: 10px 0; }}
-            th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; font-size: 13px; }}
-            th {{ background-color: #f2f2f2; font-weight: bold; }}
-            .summary {{ background-color: #e3f2fd; padding: 15px; border-radius: 5px; margin: 20px 0; }}
-            .footer {{ font-size: 12px; color: #666; margin-top: 30px; border-top: 1px solid #ddd; 
-                      padding-top: 15px; }}
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>🚨 SISTEMA DE GESTIÓN VEHICULAR</h1>
-            <h2>Reporte Completo de Alertas - {hoy.strftime('%d/%m/%Y')}</h2>
-        </div>
-        <div class="content">
-    """
-    
-    total_alertas = (len(alertas_mant_fecha) + len(alertas_mant_km) + len(alertas_polizas) + 
-                    len(alertas_rtv) + len(alertas_revisiones_fallas) + len(alertas_combustible_anormal))
-                    
-    html += f"""
-            <div class="summary">
-                <h3>📊 RESUMEN DE ALERTAS</h3>
-                <ul>
-                    <li><strong>Mantenimientos por fecha:</strong> {len(alertas_mant_fecha)}</li>
-                    <li><strong>Mantenimientos por kilometraje:</strong> {len(alertas_mant_km)}</li>
-                    <li><strong>Pólizas próximas a vencer:</strong> {len(alertas_polizas)}</li>
-                    <li><strong>RTV próximas a vencer:</strong> {len(alertas_rtv)}</li>
-                    <li><strong>Revisiones con fallas:</strong> {len(alertas_revisiones_fallas)}</li>
-                    <li><strong>Consumo anormal de combustible:</strong> {len(alertas_combustible_anormal)}</li>
-                </ul>
-                <p><strong>TOTAL DE ALERTAS: {total_alertas}</strong></p>
-            </div>
-    """
-    
-    # ALERTAS DE MANTENIMIENTO
-    if alertas_mant_fecha or alertas_mant_km:
-        html += '<div class="alert-section">'
-        html += '<div class="alert-title">🔧 ALERTAS DE MANTENIMIENTO</div>'
-        
-        if alertas_mant_fecha:
-            html += "<h4>📅 Por Fecha Próxima</h4>"
-            html += "<table><tr><th>Placa</th><th>Tipo</th><th>Fecha Programada</th><th>Días Restantes</th></tr>"
-            for alerta in alertas_mant_fecha:
-                dias_restantes = (datetime.strptime(alerta['proxima_fecha'], '%Y-%m-%d').date() - hoy).days
-                urgente = "urgent" if dias_restantes <= 3 else "critical" if dias_restantes <= 0 else ""
-                html += f"<tr class='{urgente}'><td>{alerta['placa']}</td><td>{alerta['tipo']}</td><td>{alerta['proxima_fecha']}</td><td>{dias_restantes} días</td></tr>"
-            html += "</table>"
-        
-        if alertas_mant_km:
-            html += "<h4>🛣️ Por Kilometraje Próximo</h4>"
-            html += "<table><tr><th>Placa</th><th>Tipo</th><th>Km Actual</th><th>Próximo Servicio</th><th>Km Restantes</th></tr>"
-            for alerta in alertas_mant_km:
-                km_restantes = alerta['proximo_km'] - alerta['km_actual']
-                urgente = "urgent" if km_restantes <= 200 else "critical" if km_restantes <= 0 else ""
-                html += f"<tr class='{urgente}'><td>{alerta['placa']}</td><td>{alerta['tipo']}</td><td>{alerta['km_actual']:,}</td><td>{alerta['proximo_km']:,}</td><td>{km_restantes:,} km</td></tr>"
-            html += "</table>"
-        
-        html += '</div>'
-    
-    # ALERTAS DE PÓLIZAS
-    if alertas_polizas:
-        html += '<div class="alert-section">'
-        html += '<div class="alert-title">🛡️ PÓLIZAS PRÓXIMAS A VENCER</div>'
-        html += "<table><tr><th>Placa</th><th>Vehículo</th><th>Número Póliza</th><th>Aseguradora</th><th>Vencimiento</th><th>Días Restantes</th></tr>"
-        for poliza in alertas_polizas:
-            dias_restantes = (datetime.strptime(poliza['fecha_vencimiento'], '%Y-%m-%d').date() - hoy).days
-            urgente = "urgent" if dias_restantes <= 7 else "critical" if dias_restantes <= 0 else ""
-            html += f"<tr class='{urgente}'><td>{poliza['placa']}</td><td>{poliza['marca']} {poliza['modelo']}</td><td>{poliza['numero_poliza']}</td><td>{poliza['aseguradora']}</td><td>{poliza['fecha_vencimiento']}</td><td>{dias_restantes} días</td></tr>"
-        html += "</table>"
-        html += '</div>'
-    
-    # ALERTAS DE RTV
-    if alertas_rtv:
-        html += '<div class="alert-section">'
-        html += '<div class="alert-title">🔍 RTV PRÓXIMAS A VENCER</div>'
-        html += "<table><tr><th>Placa</th><th>Vehículo</th><th>Número Cita</th><th>Vencimiento</th><th>Días Restantes</th></tr>"
-        for rtv in alertas_rtv:
-            dias_restantes = (datetime.strptime(rtv['fecha_vencimiento'], '%Y-%m-%d').date() - hoy).days
-            urgente = "urgent" if dias_restantes <= 7 else "critical" if dias_restantes <= 0 else ""
-            html += f"<tr class='{urgente}'><td>{rtv['placa']}</td><td>{rtv['marca']} {rtv['modelo']}</td><td>{rtv['numero_cita']}</td><td>{rtv['fecha_vencimiento']}</td><td>{dias_restantes} días</td></tr>"
-        html += "</table>"
-        html += '</div>'
-    
-    # ALERTAS DE REVISIONES CON FALLAS
-    if alertas_revisiones_fallas:
-        html += '<div class="alert-section">'
-        html += '<div class="alert-title">⚠️ REVISIONES CON FALLAS REPORTADAS</div>'
-        html += "<table><tr><th>Placa</th><th>Vehículo</th><th>Fecha</th><th>Inspector</th><th>Fallas Detectadas</th></tr>"
-        for revision in alertas_revisiones_fallas:
-            fallas = []
-            if revision['estado_motor'] != 'Bueno': fallas.append(f"Motor: {revision['estado_motor']}")
-            if revision['estado_frenos'] != 'Bueno': fallas.append(f"Frenos: {revision['estado_frenos']}")
-            if revision['estado_luces'] != 'Bueno': fallas.append(f"Luces: {revision['estado_luces']}")
-            if revision['estado_llantas'] != 'Bueno': fallas.append(f"Llantas: {revision['estado_llantas']}")
-            if revision['estado_carroceria'] != 'Bueno': fallas.append(f"Carrocería: {revision['estado_carroceria']}")
-            
-            fallas_str = "<br>".join(fallas) if fallas else "Revisión no aprobada"
-            html += f"<tr class='critical'><td>{revision['placa']}</td><td>{revision['marca']} {revision['modelo']}</td><td>{revision['fecha']}</td><td>{revision['inspector']}</td><td>{fallas_str}</td></tr>"
-        html += "</table>"
-        html += '</div>'
-    
-    # ALERTAS DE COMBUSTIBLE ANORMAL
-    if alertas_combustible_anormal:
-        html += '<div class="alert-section">'
-        html += '<div class="alert-title">⛽ VARIACIONES ANORMALES EN COMBUSTIBLE</div>'
-        html += "<table><tr><th>Placa</th><th>Vehículo</th><th>Rendimiento Histórico</th><th>Rendimiento Reciente</th><th>Deterioro</th><th>Último Registro</th></tr>"
-        for combustible in alertas_combustible_anormal:
-            html += f"<tr class='urgent'><td>{combustible['placa']}</td><td>{combustible['marca']} {combustible['modelo']}</td><td>{combustible['promedio_historico']} km/L</td><td>{combustible['promedio_reciente']} km/L</td><td>-{combustible['deterioro_porcentaje']}%</td><td>{combustible['ultimo_registro']}</td></tr>"
-        html += "</table>"
-        html += '<p><strong>Nota:</strong> Se considera anormal cuando el rendimiento reciente es 25% menor al histórico.</p>'
-        html += '</div>'
-    
-    html += """
-            <div class="footer">
-                <p><strong>⚡ ACCIONES RECOMENDADAS:</strong></p>
-                <ul>
-                    <li>Revisar inmediatamente las alertas marcadas como CRÍTICAS (en rojo)</li>
-                    <li>Programar mantenimientos pendientes</li>
-                    <li>Renovar pólizas y RTV próximas a vencer</li>
-                    <li>Investigar fallas reportadas en revisiones</li>
-                    <li>Evaluar vehículos con consumo anormal de combustible</li>
-                </ul>
-                <hr>
-                <p><small>Este es un mensaje automático del Sistema de Gestión Vehicular.<br>
-                Para más detalles, acceda al sistema en línea.</small></p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    
-    return html
+                                     alertas_rtv, alertas_revisiones_fallas, alertas_combustible_anormal, hoy,
+                                     resueltas=None, titulo="Reporte Completo de Alertas"):
+    """Generar email completo con todas las categorías de alertas (y las resueltas, en el modo por cambios).
+    Devuelve HTML y texto plano"""
+    return render_resumen_alertas(alertas_mant_fecha, alertas_mant_km, alertas_polizas, alertas_rtv,
+                                  alertas_revisiones_fallas, alertas_combustible_anormal, hoy,
+                                  resueltas=resueltas, titulo=titulo)
 
 def dict_from_row(row):
     """Convertir Row de SQLite a diccionario"""
     return dict(zip(row.keys(), row)) if row else None
 
-async def trigger_auto_backup(operation_type="data_change"):
-    """Ejecutar backup automático después de cambios en la base de datos"""
+async def run_backup_systems(operation_type="data_change"):
+    """Ejecutar los sistemas de backup (local y GitHub API). Lo llama el programador de backups"""
+    resultados = {}
+    
     # 1. Backup local (sistema original)
     if AUTO_BACKUP_ENABLED and backup_system:
         try:
             # Ejecutar backup de manera asíncrona
             success, filename = await backup_system.create_and_upload_backup("auto_" + operation_type)
+            resultados["github_backup_system"] = filename if success else None
             if success:
                 logger.info(f"✅ Backup local completado: {filename} después de: {operation_type}")
             else:
@@ -986,6 +598,7 @@ async def trigger_auto_backup(operation_type="data_change"):
     if GITHUB_API_BACKUP_ENABLED and github_api_backup:
         try:
             success, filename = await github_api_backup.backup_railway_database("railway_" + operation_type)
+            resultados["github_api"] = filename if success else None
             if success:
                 logger.info(f"🐙 Backup a GitHub API completado: {filename} después de: {operation_type}")
             else:
@@ -995,10 +608,182 @@ async def trigger_auto_backup(operation_type="data_change"):
     
     if not AUTO_BACKUP_ENABLED and not GITHUB_API_BACKUP_ENABLED:
         logger.debug("Todos los sistemas de backup deshabilitados")
+    
+    return resultados
+
+# Un solo worker agrupa las escrituras en un backup por ventana (BACKUP_DEBOUNCE_SECONDS)
+backup_scheduler = create_scheduler_from_env(run_backup_systems)
+
+async def trigger_auto_backup(operation_type="data_change"):
+    """Marcar la base de datos como modificada; el backup corre después en segundo plano"""
+    # Los triggers ya anotaron la placa en alertas_pendientes: despertar al evaluador de alertas
+    alert_evaluator.notify()
+    # ...y el cambio en change_log: avisar a los navegadores conectados a /events
+    event_broker.notify()
+    if backup_scheduler.running:
+        backup_scheduler.mark_dirty(operation_type)
+    else:
+        # Scripts sin servidor (p.ej. import_excel_data.py): backup inmediato
+        await run_backup_systems(operation_type)
 
 # Inicializar base de datos al iniciar
 init_database()
 
+# ================================
+# TAREAS PROGRAMADAS
+# ================================
+
+def detectar_retornos_pendientes(conn, ahora):
+    """(avisos habilitados, umbral general, viajes en curso que superaron su umbral)"""
+    habilitado, horas = config_retornos(config_cache.alertas(), RETORNO_PENDIENTE_HORAS)
+    return habilitado, horas, find_retornos_pendientes(conn, ahora, horas)
+
+async def tarea_alertas_barrido():
+    """Barrido completo de alertas_activas al empezar el día (las ventanas por fecha avanzan sin escrituras)"""
+    resultado = await alert_evaluator.refresh(barrido=True)
+    alert_engine.invalidate()
+    return resultado
+
+async def tarea_alertas_cambios():
+    """Email con las alertas nuevas, escaladas o resueltas desde el último aviso"""
+    return {"avisos": await run_blocking(check_all_alerts)}
+
+async def tarea_retornos_pendientes():
+    """Detectar en el servidor los viajes sin retorno y encolar el aviso"""
+    ahora = now_ca()
+    habilitado, _, registros = await async_db.run(detectar_retornos_pendientes, ahora)
+    if not habilitado:
+        return {"pendientes": len(registros), "omitido": "alertas_bitacora desactivadas"}
+    if not registros:
+        return {"pendientes": 0}
+    
+    subject, email = generate_retorno_pendiente_email(registros, ahora)
+    placas = sorted({registro['placa'] for registro in registros})
+    email_id = await email_outbox.enqueue(
+        "Retorno Pendiente",
+        subject,
+        email.html,
+        config_cache.email()["recipient_email"],
+        vehiculo_placa=placas[0] if len(placas) == 1 else None,
+        mensaje=f"Vehículos sin retorno: {', '.join(placas)}",
+        cuerpo_texto=email.text
+    )
+    return {"pendientes": len(registros), "placas": placas, "email_id": email_id}
+
+async def tarea_backup_diario():
+    """Backup completo diario aunque no haya habido escrituras (se omite si el último backup, de menos de
+    BACKUP_DEDUPE_MAX_AGE_HOURS, tiene los mismos datos)"""
+    return await backup_scheduler.flush_now()
+
+# change_log: después de N horas solo queda la última entrada de cada fila; después de N días se recorta
+CHANGE_LOG_COMPACTAR_HORAS = float(os.environ.get("CHANGE_LOG_COMPACTAR_HORAS", "24"))
+CHANGE_LOG_RETENCION_DIAS = float(os.environ.get("CHANGE_LOG_RETENCION_DIAS", "30"))
+# Días que se recuerda una Idempotency-Key (un reintento con la misma clave no vuelve a insertar)
+IDEMPOTENCY_RETENCION_DIAS = int(os.environ.get("IDEMPOTENCY_RETENCION_DIAS", "7"))
+# Días de historial del catálogo de backups (subidos, omitidos y fallidos)
+BACKUP_CATALOGO_RETENCION_DIAS = int(os.environ.get("BACKUP_CATALOGO_RETENCION_DIAS", "90"))
+
+def _mantenimiento_db(conn, antes_de, ahora):
+    borradas = purge_job_runs(conn, antes_de)
+    change_log = compact_change_log(conn, ahora - timedelta(hours=CHANGE_LOG_COMPACTAR_HORAS),
+                                    ahora - timedelta(days=CHANGE_LOG_RETENCION_DIAS))
+    claves = purge_idempotency_keys(conn, IDEMPOTENCY_RETENCION_DIAS)
+    catalogo = purge_backup_catalog(conn, BACKUP_CATALOGO_RETENCION_DIAS)
+    # Actualiza estadísticas del planificador solo donde hace falta (barato en SQLite >= 3.18)
+    conn.execute("PRAGMA optimize")
+    return {"job_runs_borradas": borradas, "change_log": change_log, "idempotency_keys_borradas": claves,
+            "backup_catalog_borradas": catalogo}
+
+async def tarea_mantenimiento_db():
+    """Purgar historial de tareas, compactar change_log, PRAGMA optimize y checkpoint completo del WAL"""
+    ahora = now_ca()
+    antes_de = (ahora - timedelta(days=RETENCION_JOB_RUNS_DIAS)).isoformat()
+    resultado = await async_db.run(_mantenimiento_db, antes_de, ahora)
+    resultado["wal_checkpoint"] = await run_blocking(db_pool.checkpoint, "TRUNCATE")
+    return resultado
+
+# Horarios cron en hora de Centroamérica; SCHEDULER_CRON_<TAREA> los cambia ("off" desactiva)
+job_scheduler = create_job_scheduler_from_env(async_db, now_ca)
+job_scheduler.add_job("alertas_barrido", "5 0 * * *", tarea_alertas_barrido,
+                      "Barrido diario de alertas activas")
+job_scheduler.add_job("alertas_cambios", "0 7 * * *", tarea_alertas_cambios,
+                      "Email de alertas nuevas, escaladas o resueltas")
+job_scheduler.add_job("retornos_pendientes", "0 8,17 * * *", tarea_retornos_pendientes,
+                      "Aviso de viajes en curso que superaron su umbral de horas sin retorno")
+job_scheduler.add_job("backup_diario", "0 2 * * *", tarea_backup_diario,
+                      "Backup completo diario")
+job_scheduler.add_job("mantenimiento_db", "30 3 * * *", tarea_mantenimiento_db,
+                      "Purga de historial, compactación de change_log, PRAGMA optimize y checkpoint del WAL")
+
+@app.on_event("startup")
+async def iniciar_config_cache():
+    """Cargar la configuración antes de atender peticiones y vigilar cambios de otros workers"""
+    await async_db.run(config_cache.reload)
+    config_cache.start()
+
+@app.on_event("shutdown")
+async def detener_config_cache():
+    """Detener el sondeo de versiones de la configuración"""
+    await config_cache.stop()
+
+@app.on_event("startup")
+async def iniciar_job_scheduler():
+    """Arrancar el programador de tareas (solo el worker con el lease las ejecuta)"""
+    job_scheduler.start()
+
+@app.on_event("shutdown")
+async def detener_job_scheduler():
+    """Detener el programador antes que los workers que usan sus tareas y soltar el lease"""
+    await job_scheduler.stop()
+
+@app.on_event("startup")
+async def iniciar_backup_scheduler():
+    """Arrancar el worker de backups en segundo plano"""
+    backup_scheduler.start()
+
+@app.on_event("shutdown")
+async def detener_backup_scheduler():
+    """Respaldar los cambios pendientes antes de apagar"""
+    await backup_scheduler.stop(flush=True)
+
+@app.on_event("startup")
+async def iniciar_email_outbox():
+    """Arrancar el worker que entrega los emails encolados"""
+    email_outbox.start()
+
+@app.on_event("shutdown")
+async def detener_email_outbox():
+    """Esperar los envíos en curso; lo pendiente queda en email_outbox para el próximo arranque"""
+    await email_outbox.stop()
+
+@app.on_event("startup")
+async def iniciar_alert_evaluator():
+    """Arrancar el evaluador que mantiene alertas_activas tras cada escritura"""
+    alert_evaluator.start()
+
+@app.on_event("shutdown")
+async def detener_alert_evaluator():
+    """Detener el evaluador; las placas pendientes quedan en alertas_pendientes"""
+    await alert_evaluator.stop()
+
+@app.on_event("startup")
+async def iniciar_event_broker():
+    """Arrancar el lector de change_log que alimenta /events"""
+    await event_broker.start()
+
+@app.on_event("shutdown")
+async def detener_event_broker():
+    """Cerrar los streams SSE abiertos para que el apagado no espere a los navegadores"""
+    await event_broker.stop()
+
+@app.on_event("shutdown")
+async def cerrar_pool_db():
+    """Cerrar los executors y las conexiones del pool al apagar el servidor"""
+    async_db.shutdown()
+    shutdown_blocking_executor()
+    cerradas = db_pool.close_all()
+    logger.info(f"🗄️ Pool SQLite cerrado ({cerradas} conexiones)")
+
 # ================================
 # ENDPOINTS PRINCIPALES
 # ================================
@@ -1013,20 +798,127 @@ async def api_status():
     """Endpoint de estado de la API"""
     return {"message": "Sistema de Gestión Vehicular API", "status": "active"}
 
+# ================================
+# ENDPOINTS CAMBIOS (SINCRONIZACIÓN INCREMENTAL)
+# ================================
+
+@app.get("/changes")
+async def get_changes(
+    since: int = Query(0, ge=0, description="Última secuencia ya procesada (next de la respuesta anterior)"),
+    limit: int = Query(500, ge=1, le=5000),
+    tables: Optional[str] = Query(None, description="Tablas separadas por coma (por defecto, todas)")
+):
+    """Cambios posteriores a since, en orden, con la fila actual de cada alta o modificación.
+    
+    Seguir pidiendo con since=next mientras has_more. Con resync_required el registro ya se recortó:
+    anotar latest, volver a descargar las tablas y seguir desde latest.
+    """
+    try:
+        seleccion = None
+        if tables:
+            seleccion = [table.strip() for table in tables.split(",") if table.strip()]
+            desconocidas = sorted(set(seleccion) - set(CHANGE_LOG_TABLES))
+            if desconocidas:
+                raise HTTPException(status_code=400, detail=f"Tablas sin registro de cambios: {', '.join(desconocidas)}")
+        
+        resultado = await async_db.run(fetch_changes, since, limit, seleccion)
+        return {"success": True, **resultado}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error obteniendo cambios: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/events")
+async def stream_events(
+    request: Request,
+    tables: Optional[str] = Query(None, description="Tablas separadas por coma (por defecto, todas)"),
+    last_event_id: Optional[int] = Query(None, ge=0, description="Alternativa a la cabecera Last-Event-ID")
+):
+    """Stream SSE de cambios: event change {seq, table, id, op, version}, event resync {latest}
+    y un comentario de heartbeat. Al reconectar, EventSource envía Last-Event-ID y se reenvía lo perdido.
+    
+    Tras resync, recargar las tablas (o seguir con GET /changes?since=latest).
+    """
+    seleccion = None
+    if tables:
+        seleccion = [table.strip() for table in tables.split(",") if table.strip()]
+        desconocidas = sorted(set(seleccion) - set(CHANGE_LOG_TABLES))
+        if desconocidas:
+            raise HTTPException(status_code=400, detail=f"Tablas sin registro de cambios: {', '.join(desconocidas)}")
+    
+    cabecera = request.headers.get("last-event-id")
+    if cabecera and cabecera.strip().isdigit():
+        last_event_id = int(cabecera)
+    
+    return StreamingResponse(
+        event_broker.stream(last_event_id, seleccion),
+        media_type="text/event-stream",
+        # Sin buffering en proxies (nginx) para que cada evento salga al momento
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/checksums")
+async def get_checksums(
+    tables: Optional[str] = Query(None, description="Tablas separadas por coma (por defecto, todas)")
+):
+    """Hash raíz y filas de cada tabla. Si el hash coincide con el de otra base, la tabla es idéntica;
+    si no, bajar por GET /checksums/{tabla} solo en los rangos que difieren."""
+    try:
+        seleccion = list(CHECKSUM_TABLES)
+        if tables:
+            seleccion = [table.strip() for table in tables.split(",") if table.strip()]
+            desconocidas = sorted(set(seleccion) - set(CHECKSUM_TABLES))
+            if desconocidas:
+                raise HTTPException(status_code=400, detail=f"Tablas sin checksum: {', '.join(desconocidas)}")
+        
+        checksums = await async_db.run(checksum_cache.summary, seleccion)
+        return {
+            "success": True,
+            "checksums": checksums,
+            "tree_height": TREE_HEIGHT,
+            "bucket_size": 1 << BUCKET_BITS,
+            "timestamp": now_ca().isoformat()
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error calculando checksums: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/checksums/{table}")
+async def get_checksum_node(
+    table: str,
+    level: int = Query(TREE_HEIGHT, ge=0, le=TREE_HEIGHT, description="Nivel del nodo (0 = hoja, la raíz está arriba)"),
+    index: int = Query(0, ge=0),
+    depth: int = Query(MAX_DEPTH, ge=1, le=MAX_DEPTH, description="Niveles de descendientes a devolver")
+):
+    """Un nodo del árbol de la tabla con sus descendientes no vacíos (rango de ids, hash y filas).
+    En una hoja (level=0) devuelve el hash de cada fila."""
+    if table not in CHECKSUM_TABLES:
+        raise HTTPException(status_code=404, detail=f"Tabla sin checksum: {table}")
+    try:
+        nodo = await async_db.run(checksum_cache.node, table, level, index, depth)
+        return {"success": True, "node": nodo}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error obteniendo nodo de checksum: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ================================
 # ENDPOINTS VEHÍCULOS
 # ================================
 
 @app.get("/vehiculos")
-async def get_vehiculos():
-    """Obtener todos los vehículos"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM vehiculos ORDER BY placa")
-        vehiculos = [dict_from_row(row) for row in cursor.fetchall()]
-        conn.close()
-        return {"success": True, "data": vehiculos}
+async def get_vehiculos(placa: Optional[str] = None,
+                        limit: Optional[int] = None, after: Optional[str] = None):
+    """Obtener vehículos (filtros opcionales y paginación por cursor con limit/after)"""
+    try:
+        page = await async_db.run(fetch_page, LIST_SPECS["vehiculos"], {"placa": placa}, limit=limit, after=after)
+        return {"success": True, **page}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al obtener vehículos: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1036,21 +928,9 @@ async def create_vehiculo(vehiculo: VehiculoCreate):
     """Crear un nuevo vehículo - CON VERIFICACIÓN GARANTIZADA"""
     logger.info(f"🚗 INICIANDO creación de vehículo: {vehiculo.placa}")
     
-    try:
-        conn = get_db_connection()
+    def _insertar_vehiculo(conn, placa, color, propietario):
         cursor = conn.cursor()
         
-        # Limpiar y validar datos
-        placa = vehiculo.placa.strip().upper() if vehiculo.placa else ""
-        if not placa:
-            logger.error(f"❌ Placa vacía proporcionada")
-            raise HTTPException(status_code=400, detail="La placa es requerida")
-        
-        logger.info(f"📝 Datos del vehículo: {placa} - {vehiculo.marca} {vehiculo.modelo}")
-            
-        color = vehiculo.color or "No especificado"
-        propietario = vehiculo.propietario or "Hotel"
-        
         # Verificar que la placa no existe
         cursor.execute("SELECT COUNT(*) FROM vehiculos WHERE placa = ?", (placa,))
         existing_count = cursor.fetchone()[0]
@@ -1066,10 +946,12 @@ async def create_vehiculo(vehiculo: VehiculoCreate):
         
         # Insertar el nuevo vehículo
         cursor.execute('''
-            INSERT INTO vehiculos (placa, marca, modelo, ano, color, propietario, poliza, seguro, km_inicial)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO vehiculos (placa, marca, modelo, ano, color, propietario, poliza, seguro, km_inicial,
+                                   horas_retorno_max)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (placa, vehiculo.marca, vehiculo.modelo, vehiculo.ano, 
-              color, propietario, vehiculo.poliza, vehiculo.seguro, vehiculo.km_inicial or 0))
+              color, propietario, vehiculo.poliza, vehiculo.seguro, vehiculo.km_inicial or 0,
+              vehiculo.horas_retorno_max))
         
         # Obtener el ID del vehículo insertado
         vehiculo_id = cursor.lastrowid
@@ -1086,7 +968,23 @@ async def create_vehiculo(vehiculo: VehiculoCreate):
         cursor.execute("SELECT * FROM vehiculos WHERE id = ?", (vehiculo_id,))
         saved_vehiculo = cursor.fetchone()
         
-        conn.close()
+        return vehiculo_id, count_before, count_after, saved_vehiculo
+    
+    try:
+        # Limpiar y validar datos
+        placa = vehiculo.placa.strip().upper() if vehiculo.placa else ""
+        if not placa:
+            logger.error(f"❌ Placa vacía proporcionada")
+            raise HTTPException(status_code=400, detail="La placa es requerida")
+        
+        logger.info(f"📝 Datos del vehículo: {placa} - {vehiculo.marca} {vehiculo.modelo}")
+            
+        color = vehiculo.color or "No especificado"
+        propietario = vehiculo.propietario or "Hotel"
+        
+        vehiculo_id, count_before, count_after, saved_vehiculo = await async_db.run(
+            _insertar_vehiculo, placa, color, propietario
+        )
         
         # VERIFICACIÓN CRÍTICA
         if count_after != count_before + 1:
@@ -1121,9 +1019,6 @@ async def create_vehiculo(vehiculo: VehiculoCreate):
 async def update_vehiculo(placa: str, vehiculo: VehiculoUpdate):
     """Actualizar un vehículo"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Construir query dinámicamente
         updates = []
         values = []
@@ -1139,14 +1034,11 @@ async def update_vehiculo(placa: str, vehiculo: VehiculoUpdate):
         values.append(placa)
         query = f"UPDATE vehiculos SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP WHERE placa = ?"
         
-        cursor.execute(query, values)
+        rowcount, _ = await async_db.execute(query, values)
         
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="Vehículo no encontrado")
         
-        conn.commit()
-        conn.close()
-        
         # Backup automático después de actualizar vehículo
         await trigger_auto_backup("update_vehiculo")
         
@@ -1159,39 +1051,46 @@ async def update_vehiculo(placa: str, vehiculo: VehiculoUpdate):
 async def delete_vehiculo(placa: str):
     """Eliminar un vehículo"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        rowcount, _ = await async_db.execute("DELETE FROM vehiculos WHERE placa = ?", (placa,))
         
-        cursor.execute("DELETE FROM vehiculos WHERE placa = ?", (placa,))
-        
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="Vehículo no encontrado")
         
-        conn.commit()
-        conn.close()
-        
         # Backup automático después de eliminar vehículo
         await trigger_auto_backup("delete_vehiculo")
         
         return {"success": True, "message": "Vehículo eliminado exitosamente"}
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=400, detail="El vehículo tiene registros asociados y no se puede eliminar")
     except Exception as e:
         logger.error(f"Error al eliminar vehículo: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/vehiculos/{placa}/estado")
+async def get_estado_vehiculo(placa: str):
+    """Estado actual del vehículo: kilometraje, viaje en curso, última carga y próximo mantenimiento"""
+    try:
+        estado = await async_db.run(get_vehicle_state, placa.strip().upper())
+    except Exception as e:
+        logger.error(f"Error al obtener estado del vehículo: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not estado:
+        raise HTTPException(status_code=404, detail="Vehículo sin registros")
+    return {"success": True, "data": estado}
+
 # ================================
 # ENDPOINTS MANTENIMIENTOS
 # ================================
 
 @app.get("/mantenimientos")
-async def get_mantenimientos():
-    """Obtener todos los mantenimientos"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM mantenimientos ORDER BY fecha DESC")
-        mantenimientos = [dict_from_row(row) for row in cursor.fetchall()]
-        conn.close()
-        return {"success": True, "data": mantenimientos}
+async def get_mantenimientos(placa: Optional[str] = None, tipo: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+                             limit: Optional[int] = None, after: Optional[str] = None):
+    """Obtener mantenimientos (filtros opcionales y paginación por cursor con limit/after)"""
+    try:
+        page = await async_db.run(fetch_page, LIST_SPECS["mantenimientos"], {"placa": placa, "tipo": tipo}, desde, hasta, limit=limit, after=after)
+        return {"success": True, **page}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al obtener mantenimientos: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1200,23 +1099,21 @@ async def get_mantenimientos():
 async def create_mantenimiento(mantenimiento: MantenimientoCreate):
     """Crear un nuevo mantenimiento"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        await async_db.execute('''
             INSERT INTO mantenimientos (fecha, placa, tipo, descripcion, costo, kilometraje, proximo_km, proxima_fecha)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (mantenimiento.fecha, mantenimiento.placa, mantenimiento.tipo,
               mantenimiento.descripcion, mantenimiento.costo, mantenimiento.kilometraje,
               mantenimiento.proximo_km, mantenimiento.proxima_fecha))
         
-        conn.commit()
-        conn.close()
-        
         # Backup automático después de crear mantenimiento
         await trigger_auto_backup("create_mantenimiento")
         
         return {"success": True, "message": "Mantenimiento creado exitosamente"}
+    except sqlite3.IntegrityError as e:
+        if es_error_vehiculo(e):
+            raise HTTPException(status_code=422, detail=VEHICULO_NO_REGISTRADO)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al crear mantenimiento: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1225,17 +1122,11 @@ async def create_mantenimiento(mantenimiento: MantenimientoCreate):
 async def delete_mantenimiento(mantenimiento_id: int):
     """Eliminar un mantenimiento"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM mantenimientos WHERE id = ?", (mantenimiento_id,))
+        rowcount, _ = await async_db.execute("DELETE FROM mantenimientos WHERE id = ?", (mantenimiento_id,))
         
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="Mantenimiento no encontrado")
         
-        conn.commit()
-        conn.close()
-        
         # Backup automático después de eliminar mantenimiento
         await trigger_auto_backup("delete_mantenimiento")
         
@@ -1248,10 +1139,7 @@ async def delete_mantenimiento(mantenimiento_id: int):
 async def update_mantenimiento(mantenimiento_id: int, mantenimiento: MantenimientoCreate):
     """Actualizar un mantenimiento"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        rowcount, _ = await async_db.execute('''
             UPDATE mantenimientos 
             SET fecha = ?, placa = ?, tipo = ?, descripcion = ?, costo = ?, kilometraje = ?, proximo_km = ?, proxima_fecha = ?
             WHERE id = ?
@@ -1259,13 +1147,16 @@ async def update_mantenimiento(mantenimiento_id: int, mantenimiento: Mantenimien
               mantenimiento.descripcion, mantenimiento.costo, mantenimiento.kilometraje,
               mantenimiento.proximo_km, mantenimiento.proxima_fecha, mantenimiento_id))
         
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="Mantenimiento no encontrado")
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("update_mantenimiento")
         
         return {"success": True, "message": "Mantenimiento actualizado exitosamente"}
+    except sqlite3.IntegrityError as e:
+        if es_error_vehiculo(e):
+            raise HTTPException(status_code=422, detail=VEHICULO_NO_REGISTRADO)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al actualizar mantenimiento: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1275,39 +1166,46 @@ async def update_mantenimiento(mantenimiento_id: int, mantenimiento: Mantenimien
 # ================================
 
 @app.get("/combustible")
-async def get_combustible():
-    """Obtener todos los registros de combustible"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM combustible ORDER BY fecha DESC")
-        combustible = [dict_from_row(row) for row in cursor.fetchall()]
-        conn.close()
-        return {"success": True, "data": combustible}
+async def get_combustible(placa: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+                          limit: Optional[int] = None, after: Optional[str] = None):
+    """Obtener registros de combustible (filtros opcionales y paginación por cursor con limit/after)"""
+    try:
+        page = await async_db.run(fetch_page, LIST_SPECS["combustible"], {"placa": placa}, desde, hasta, limit=limit, after=after)
+        return {"success": True, **page}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al obtener combustible: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/combustible")
-async def create_combustible(combustible: CombustibleCreate):
-    """Crear un nuevo registro de combustible"""
+async def create_combustible(combustible: CombustibleCreate, response: Response,
+                             idempotency_key: Optional[str] = Header(None, max_length=MAX_KEY_LENGTH)):
+    """Crear un nuevo registro de combustible (con Idempotency-Key un reintento no lo duplica)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO combustible (fecha, placa, litros, costo, kilometraje, estacion)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (combustible.fecha, combustible.placa, combustible.litros,
-              combustible.costo, combustible.kilometraje, combustible.estacion))
-        
-        conn.commit()
-        conn.close()
+        def _insertar(conn):
+            cursor = conn.execute('''
+                INSERT INTO combustible (fecha, placa, litros, costo, kilometraje, estacion)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (combustible.fecha, combustible.placa, combustible.litros,
+                  combustible.costo, combustible.kilometraje, combustible.estacion))
+            return {"id": cursor.lastrowid}
         
-        # Backup automático después de crear registro de combustible
-        await trigger_auto_backup("create_combustible")
+        creado, repetido = await async_db.run(run_idempotent, idempotency_key, "POST /combustible", _insertar)
         
-        return {"success": True, "message": "Registro de combustible creado exitosamente"}
+        if repetido:
+            response.headers["Idempotent-Replayed"] = "true"
+        else:
+            # Backup automático después de crear registro de combustible
+            await trigger_auto_backup("create_combustible")
+        
+        return {"success": True, "message": "Registro de combustible creado exitosamente", "id": creado["id"]}
+    except sqlite3.IntegrityError as e:
+        if es_error_vehiculo(e):
+            raise HTTPException(status_code=422, detail=VEHICULO_NO_REGISTRADO)
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         logger.error(f"Error al crear registro de combustible: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1316,16 +1214,12 @@ async def create_combustible(combustible: CombustibleCreate):
 async def delete_combustible(combustible_id: int):
     """Eliminar un registro de combustible"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM combustible WHERE id = ?", (combustible_id,))
+        rowcount, _ = await async_db.execute("DELETE FROM combustible WHERE id = ?", (combustible_id,))
         
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="Registro de combustible no encontrado")
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("delete_combustible")
         
         return {"success": True, "message": "Registro de combustible eliminado exitosamente"}
     except Exception as e:
@@ -1336,10 +1230,7 @@ async def delete_combustible(combustible_id: int):
 async def update_combustible(combustible_id: int, combustible: CombustibleCreate):
     """Actualizar un registro de combustible"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        rowcount, _ = await async_db.execute('''
             UPDATE combustible 
             SET fecha = ?, placa = ?, litros = ?, costo = ?, kilometraje = ?, estacion = ?
             WHERE id = ?
@@ -1347,13 +1238,16 @@ async def update_combustible(combustible_id: int, combustible: CombustibleCreate
               combustible.costo, combustible.kilometraje, combustible.estacion,
               combustible_id))
         
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="Registro de combustible no encontrado")
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("update_combustible")
         
         return {"success": True, "message": "Registro de combustible actualizado exitosamente"}
+    except sqlite3.IntegrityError as e:
+        if es_error_vehiculo(e):
+            raise HTTPException(status_code=422, detail=VEHICULO_NO_REGISTRADO)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al actualizar registro de combustible: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1362,38 +1256,27 @@ async def update_combustible(combustible_id: int, combustible: CombustibleCreate
 async def get_last_odometer(placa: str):
     """Obtener el último kilometraje registrado para una placa específica"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def _ultimo_kilometraje(conn):
+            cursor = conn.cursor()
         
-        # Buscar el último registro de combustible con kilometraje para esta placa
-        cursor.execute('''
-            SELECT kilometraje 
-            FROM combustible 
-            WHERE placa = ? AND kilometraje IS NOT NULL 
-            ORDER BY fecha DESC, id DESC 
-            LIMIT 1
-        ''', (placa.upper(),))
-        
-        result = cursor.fetchone()
-        
-        if result and result[0] is not None:
-            conn.close()
-            return {"success": True, "data": {"kilometraje": result[0]}}
-        else:
-            # No hay registros de combustible, buscar el kilometraje inicial del vehículo
+            # Última carga con kilometraje (vehicle_state) y kilometraje inicial, ambos por clave
             cursor.execute('''
-                SELECT km_inicial 
-                FROM vehiculos 
-                WHERE placa = ?
-            ''', (placa.upper(),))
-            
-            vehiculo_result = cursor.fetchone()
-            conn.close()
-            
-            if vehiculo_result and vehiculo_result[0] is not None:
-                return {"success": True, "data": {"kilometraje": vehiculo_result[0]}}
+                SELECT
+                    (SELECT last_fill_km FROM vehicle_state WHERE placa = ?) AS kilometraje,
+                    (SELECT km_inicial FROM vehiculos WHERE placa = ?) AS km_inicial
+            ''', (placa.upper(), placa.upper()))
+        
+            result = cursor.fetchone()
+        
+            if result['kilometraje'] is not None:
+                return {"success": True, "data": {"kilometraje": result['kilometraje']}}
+            elif result['km_inicial'] is not None:
+                # No hay registros de combustible: kilometraje inicial del vehículo
+                return {"success": True, "data": {"kilometraje": result['km_inicial']}}
             else:
                 return {"success": True, "data": {"kilometraje": 0}}
+        
+        return await async_db.run(_ultimo_kilometraje)
             
     except Exception as e:
         logger.error(f"Error al obtener último odómetro: {e}")
@@ -1404,15 +1287,14 @@ async def get_last_odometer(placa: str):
 # ================================
 
 @app.get("/revisiones")
-async def get_revisiones():
-    """Obtener todas las revisiones"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM revisiones ORDER BY fecha DESC")
-        revisiones = [dict_from_row(row) for row in cursor.fetchall()]
-        conn.close()
-        return {"success": True, "data": revisiones}
+async def get_revisiones(placa: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+                         limit: Optional[int] = None, after: Optional[str] = None):
+    """Obtener revisiones (filtros opcionales y paginación por cursor con limit/after)"""
+    try:
+        page = await async_db.run(fetch_page, LIST_SPECS["revisiones"], {"placa": placa}, desde, hasta, limit=limit, after=after)
+        return {"success": True, **page}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al obtener revisiones: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1421,10 +1303,7 @@ async def get_revisiones():
 async def create_revision(revision: RevisionCreate):
     """Crear una nueva revisión"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        await async_db.execute('''
             INSERT INTO revisiones (fecha, placa, inspector, estado_motor, estado_frenos,
                                   estado_luces, estado_llantas, estado_carroceria, 
                                   observaciones, aprobado, luces_delanteras, luces_traseras,
@@ -1440,10 +1319,13 @@ async def create_revision(revision: RevisionCreate):
               revision.espejo_retrovisor, revision.limpiaparabrisas, revision.cinturones,
               revision.bocina, revision.nivel_combustible, revision.kilometraje))
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("create_revision")
         
         return {"success": True, "message": "Revisión creada exitosamente"}
+    except sqlite3.IntegrityError as e:
+        if es_error_vehiculo(e):
+            raise HTTPException(status_code=422, detail=VEHICULO_NO_REGISTRADO)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al crear revisión: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1452,10 +1334,7 @@ async def create_revision(revision: RevisionCreate):
 async def update_revision(revision_id: int, revision: RevisionCreate):
     """Actualizar una revisión existente"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        rowcount, _ = await async_db.execute('''
             UPDATE revisiones 
             SET fecha = ?, placa = ?, inspector = ?, estado_motor = ?, estado_frenos = ?,
                 estado_luces = ?, estado_llantas = ?, estado_carroceria = ?, 
@@ -1472,13 +1351,16 @@ async def update_revision(revision_id: int, revision: RevisionCreate):
               revision.espejo_retrovisor, revision.limpiaparabrisas, revision.cinturones,
               revision.bocina, revision.nivel_combustible, revision.kilometraje, revision_id))
         
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="Revisión no encontrada")
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("update_revision")
         
         return {"success": True, "message": "Revisión actualizada exitosamente"}
+    except sqlite3.IntegrityError as e:
+        if es_error_vehiculo(e):
+            raise HTTPException(status_code=422, detail=VEHICULO_NO_REGISTRADO)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al actualizar revisión: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1487,16 +1369,12 @@ async def update_revision(revision_id: int, revision: RevisionCreate):
 async def delete_revision(revision_id: int):
     """Eliminar una revisión"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM revisiones WHERE id = ?", (revision_id,))
+        rowcount, _ = await async_db.execute("DELETE FROM revisiones WHERE id = ?", (revision_id,))
         
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="Revisión no encontrada")
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("delete_revision")
         
         return {"success": True, "message": "Revisión eliminada exitosamente"}
     except Exception as e:
@@ -1508,15 +1386,14 @@ async def delete_revision(revision_id: int):
 # ================================
 
 @app.get("/polizas")
-async def get_polizas():
-    """Obtener todas las pólizas"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM polizas ORDER BY fecha_vencimiento")
-        polizas = [dict_from_row(row) for row in cursor.fetchall()]
-        conn.close()
-        return {"success": True, "data": polizas}
+async def get_polizas(placa: Optional[str] = None, estado: Optional[str] = None, tipo: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+                      limit: Optional[int] = None, after: Optional[str] = None):
+    """Obtener pólizas (filtros opcionales y paginación por cursor con limit/after)"""
+    try:
+        page = await async_db.run(fetch_page, LIST_SPECS["polizas"], {"placa": placa, "estado": estado, "tipo": tipo}, desde, hasta, limit=limit, after=after)
+        return {"success": True, **page}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al obtener pólizas: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1525,21 +1402,19 @@ async def get_polizas():
 async def create_poliza(poliza: PolizaCreate):
     """Crear una nueva póliza"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        await async_db.execute('''
             INSERT INTO polizas (numero_poliza, placa, aseguradora, fecha_inicio,
                                fecha_vencimiento, tipo_cobertura, estado)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', (poliza.numero_poliza, poliza.placa, poliza.aseguradora,
               poliza.fecha_inicio, poliza.fecha_vencimiento, poliza.tipo_cobertura, poliza.estado))
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("create_poliza")
         
         return {"success": True, "message": "Póliza creada exitosamente"}
-    except sqlite3.IntegrityError:
+    except sqlite3.IntegrityError as e:
+        if es_error_vehiculo(e):
+            raise HTTPException(status_code=422, detail=VEHICULO_NO_REGISTRADO)
         raise HTTPException(status_code=400, detail="El número de póliza ya existe")
     except Exception as e:
         logger.error(f"Error al crear póliza: {e}")
@@ -1549,10 +1424,7 @@ async def create_poliza(poliza: PolizaCreate):
 async def update_poliza(poliza_id: int, poliza: PolizaCreate):
     """Actualizar una póliza"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        rowcount, _ = await async_db.execute('''
             UPDATE polizas 
             SET numero_poliza = ?, placa = ?, aseguradora = ?, fecha_inicio = ?, 
                 fecha_vencimiento = ?, tipo_cobertura = ?, estado = ?
@@ -1560,13 +1432,16 @@ async def update_poliza(poliza_id: int, poliza: PolizaCreate):
         ''', (poliza.numero_poliza, poliza.placa, poliza.aseguradora, poliza.fecha_inicio,
               poliza.fecha_vencimiento, poliza.tipo_cobertura, poliza.estado, poliza_id))
         
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="Póliza no encontrada")
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("update_poliza")
         
         return {"success": True, "message": "Póliza actualizada exitosamente"}
+    except sqlite3.IntegrityError as e:
+        if es_error_vehiculo(e):
+            raise HTTPException(status_code=422, detail=VEHICULO_NO_REGISTRADO)
+        raise HTTPException(status_code=400, detail="El número de póliza ya existe")
     except Exception as e:
         logger.error(f"Error al actualizar póliza: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1575,16 +1450,12 @@ async def update_poliza(poliza_id: int, poliza: PolizaCreate):
 async def delete_poliza(poliza_id: int):
     """Eliminar una póliza"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM polizas WHERE id = ?", (poliza_id,))
+        rowcount, _ = await async_db.execute("DELETE FROM polizas WHERE id = ?", (poliza_id,))
         
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="Póliza no encontrada")
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("delete_poliza")
         
         return {"success": True, "message": "Póliza eliminada exitosamente"}
     except Exception as e:
@@ -1596,15 +1467,14 @@ async def delete_poliza(poliza_id: int):
 # ================================
 
 @app.get("/rtv")
-async def get_rtv():
-    """Obtener todos los registros de RTV"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM rtv ORDER BY fecha_vencimiento DESC")
-        rtv = [dict_from_row(row) for row in cursor.fetchall()]
-        conn.close()
-        return {"success": True, "data": rtv}
+async def get_rtv(placa: Optional[str] = None, estado: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+                  limit: Optional[int] = None, after: Optional[str] = None):
+    """Obtener registros de RTV (filtros opcionales y paginación por cursor con limit/after)"""
+    try:
+        page = await async_db.run(fetch_page, LIST_SPECS["rtv"], {"placa": placa, "estado": estado}, desde, hasta, limit=limit, after=after)
+        return {"success": True, **page}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al obtener RTV: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1613,18 +1483,18 @@ async def get_rtv():
 async def create_rtv(rtv: RTVCreate):
     """Crear un nuevo registro de RTV"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        await async_db.execute('''
             INSERT INTO rtv (numero_cita, placa, fecha_vencimiento, estado, observaciones)
             VALUES (?, ?, ?, ?, ?)
         ''', (rtv.numero_cita, rtv.placa, rtv.fecha_vencimiento, rtv.estado, rtv.observaciones))
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("create_rtv")
         
         return {"success": True, "message": "RTV creado exitosamente"}
+    except sqlite3.IntegrityError as e:
+        if es_error_vehiculo(e):
+            raise HTTPException(status_code=422, detail=VEHICULO_NO_REGISTRADO)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al crear RTV: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1633,22 +1503,22 @@ async def create_rtv(rtv: RTVCreate):
 async def update_rtv(rtv_id: int, rtv: RTVCreate):
     """Actualizar un registro de RTV"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
+        rowcount, _ = await async_db.execute('''
             UPDATE rtv 
             SET numero_cita = ?, placa = ?, fecha_vencimiento = ?, estado = ?, observaciones = ?
             WHERE id = ?
         ''', (rtv.numero_cita, rtv.placa, rtv.fecha_vencimiento, rtv.estado, rtv.observaciones, rtv_id))
         
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="RTV no encontrado")
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("update_rtv")
         
         return {"success": True, "message": "RTV actualizado exitosamente"}
+    except sqlite3.IntegrityError as e:
+        if es_error_vehiculo(e):
+            raise HTTPException(status_code=422, detail=VEHICULO_NO_REGISTRADO)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al actualizar RTV: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1657,16 +1527,12 @@ async def update_rtv(rtv_id: int, rtv: RTVCreate):
 async def delete_rtv(rtv_id: int):
     """Eliminar un registro de RTV"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        rowcount, _ = await async_db.execute("DELETE FROM rtv WHERE id = ?", (rtv_id,))
         
-        cursor.execute("DELETE FROM rtv WHERE id = ?", (rtv_id,))
-        
-        if cursor.rowcount == 0:
+        if rowcount == 0:
             raise HTTPException(status_code=404, detail="RTV no encontrado")
         
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("delete_rtv")
         
         return {"success": True, "message": "RTV eliminado exitosamente"}
     except Exception as e:
@@ -1706,24 +1572,25 @@ async def exec_endpoint(action: str = Query(...), **params):
 async def get_stats():
     """Obtener estadísticas para el dashboard"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def _contar_estadisticas(conn):
+            cursor = conn.cursor()
         
-        # Contar totales
-        cursor.execute("SELECT COUNT(*) as total FROM vehiculos")
-        total_vehiculos = cursor.fetchone()[0]
+            # Contar totales
+            cursor.execute("SELECT COUNT(*) as total FROM vehiculos")
+            total_vehiculos = cursor.fetchone()[0]
         
-        cursor.execute("SELECT COUNT(*) as total FROM mantenimientos WHERE fecha >= date('now', '-30 days')")
-        mantenimientos_mes = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) as total FROM mantenimientos WHERE fecha >= date('now', '-30 days')")
+            mantenimientos_mes = cursor.fetchone()[0]
         
-        cursor.execute("SELECT SUM(costo) as total FROM combustible WHERE fecha >= date('now', '-30 days')")
-        result = cursor.fetchone()
-        gasto_combustible_mes = result[0] if result[0] else 0
+            cursor.execute("SELECT SUM(costo) as total FROM combustible WHERE fecha >= date('now', '-30 days')")
+            result = cursor.fetchone()
+            gasto_combustible_mes = result[0] if result[0] else 0
         
-        cursor.execute("SELECT COUNT(*) as total FROM revisiones WHERE aprobado = 0")
-        revisiones_pendientes = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) as total FROM revisiones WHERE aprobado = 0")
+            revisiones_pendientes = cursor.fetchone()[0]
+            return total_vehiculos, mantenimientos_mes, gasto_combustible_mes, revisiones_pendientes
         
-        conn.close()
+        total_vehiculos, mantenimientos_mes, gasto_combustible_mes, revisiones_pendientes = await async_db.run(_contar_estadisticas)
         
         return {
             "success": True,
@@ -1740,14 +1607,15 @@ async def get_stats():
 
 # Endpoint para verificar alertas manualmente
 @app.get("/alertas/verificar")
-async def verificar_alertas():
-    """Verificar y enviar todas las alertas del sistema"""
+async def verificar_alertas(completo: bool = False):
+    """Verificar y enviar las alertas nuevas, escaladas o resueltas (completo=true: resumen de todas)"""
     try:
-        alertas_enviadas = check_all_alerts()
+        alertas_enviadas = await run_blocking(check_all_alerts, completo)
         return {
             "success": True, 
             "message": f"Verificación completada. {alertas_enviadas} alertas procesadas",
-            "alertas_enviadas": alertas_enviadas
+            "alertas_enviadas": alertas_enviadas,
+            "modo": "completo" if completo else "cambios"
         }
     except Exception as e:
         logger.error(f"Error verificando alertas: {e}")
@@ -1758,86 +1626,90 @@ async def verificar_alertas():
 # ================================
 
 @app.get("/bitacora")
-async def get_bitacora():
-    """Obtener todos los registros de bitácora"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM bitacora ORDER BY fecha_salida DESC")
-        bitacora = [dict_from_row(row) for row in cursor.fetchall()]
-        conn.close()
-        return {"success": True, "data": bitacora}
+async def get_bitacora(placa: Optional[str] = None, estado: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+                       limit: Optional[int] = None, after: Optional[str] = None):
+    """Obtener registros de bitácora (filtros opcionales y paginación por cursor con limit/after)"""
+    try:
+        page = await async_db.run(fetch_page, LIST_SPECS["bitacora"], {"placa": placa, "estado": estado}, desde, hasta, limit=limit, after=after)
+        return {"success": True, **page}
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error al obtener bitácora: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/bitacora/salida")
-async def registrar_salida(salida: BitacoraSalida):
-    """Registrar salida de vehículo"""
+async def registrar_salida(salida: BitacoraSalida, response: Response,
+                           idempotency_key: Optional[str] = Header(None, max_length=MAX_KEY_LENGTH)):
+    """Registrar salida de vehículo (con Idempotency-Key un reintento no la duplica)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def _registrar_salida(conn):
+            cursor = conn.cursor()
         
-        # Verificar si hay inconsistencia de kilometraje
-        cursor.execute("""
-            SELECT km_retorno, chofer FROM bitacora 
-            WHERE placa = ? AND estado = 'completado' 
-            ORDER BY fecha_retorno DESC LIMIT 1
-        """, (salida.placa,))
+            # Verificar si hay inconsistencia de kilometraje (último retorno desde vehicle_state)
+            cursor.execute("""
+                SELECT last_return_km AS km_retorno, last_return_chofer AS chofer FROM vehicle_state 
+                WHERE placa = ? AND last_return_id IS NOT NULL
+            """, (salida.placa,))
         
-        ultimo_registro = cursor.fetchone()
-        alerta_km = False
+            ultimo_registro = cursor.fetchone()
+            alerta_km = False
+            alerta = None
         
-        if ultimo_registro and ultimo_registro['km_retorno']:
-            diferencia = abs(salida.km_salida - ultimo_registro['km_retorno'])
-            
-            # Obtener configuración de alertas para verificar km_diferencia_alerta
-            cursor.execute("SELECT km_diferencia_alerta FROM config_alertas WHERE activo = 1 ORDER BY id DESC LIMIT 1")
-            config_km = cursor.fetchone()
-            km_limite = config_km['km_diferencia_alerta'] if config_km else 10
+            if ultimo_registro and ultimo_registro['km_retorno']:
+                diferencia = abs(salida.km_salida - ultimo_registro['km_retorno'])
             
-            # Si la diferencia es mayor al límite configurado, enviar alerta
-            if diferencia > km_limite:
-                alerta_km = True
-                logger.warning(f"🚨 ALERTA KILOMETRAJE: {salida.placa} - Diferencia {diferencia}km > límite {km_limite}km")
-                asyncio.create_task(enviar_alerta_kilometraje(
-                    salida.placa, salida.chofer, salida.km_salida, 
-                    ultimo_registro['km_retorno'], ultimo_registro['chofer']
-                ))
-        else:
-            # No hay registros previos, comparar con kilometraje inicial del vehículo
-            cursor.execute("SELECT km_inicial FROM vehiculos WHERE placa = ?", (salida.placa,))
-            vehiculo = cursor.fetchone()
+                # Límite de diferencia configurado (en memoria, sin consultar config_alertas)
+                km_limite = config_cache.alertas()['km_diferencia_alerta']
             
-            if vehiculo and vehiculo['km_inicial'] and vehiculo['km_inicial'] > 0:
-                diferencia = abs(salida.km_salida - vehiculo['km_inicial'])
-                
-                # Obtener configuración de alertas para verificar km_diferencia_alerta
-                cursor.execute("SELECT km_diferencia_alerta FROM config_alertas WHERE activo = 1 ORDER BY id DESC LIMIT 1")
-                config_km = cursor.fetchone()
-                km_limite = config_km['km_diferencia_alerta'] if config_km else 10
-                
                 # Si la diferencia es mayor al límite configurado, enviar alerta
                 if diferencia > km_limite:
                     alerta_km = True
-                    logger.warning(f"🚨 ALERTA KILOMETRAJE: {salida.placa} - Diferencia {diferencia}km > límite {km_limite}km (vs KM inicial)")
-                    asyncio.create_task(enviar_alerta_kilometraje(
-                        salida.placa, salida.chofer, salida.km_salida, 
-                        vehiculo['km_inicial'], "Sistema (KM Inicial)"
-                    ))
+                    logger.warning(f"🚨 ALERTA KILOMETRAJE: {salida.placa} - Diferencia {diferencia}km > límite {km_limite}km")
+                    alerta = (ultimo_registro['km_retorno'], ultimo_registro['chofer'])
+            else:
+                # No hay registros previos, comparar con kilometraje inicial del vehículo
+                cursor.execute("SELECT km_inicial FROM vehiculos WHERE placa = ?", (salida.placa,))
+                vehiculo = cursor.fetchone()
+            
+                if vehiculo and vehiculo['km_inicial'] and vehiculo['km_inicial'] > 0:
+                    diferencia = abs(salida.km_salida - vehiculo['km_inicial'])
+                
+                    # Límite de diferencia configurado (en memoria, sin consultar config_alertas)
+                    km_limite = config_cache.alertas()['km_diferencia_alerta']
+                
+                    # Si la diferencia es mayor al límite configurado, enviar alerta
+                    if diferencia > km_limite:
+                        alerta_km = True
+                        logger.warning(f"🚨 ALERTA KILOMETRAJE: {salida.placa} - Diferencia {diferencia}km > límite {km_limite}km (vs KM inicial)")
+                        alerta = (vehiculo['km_inicial'], "Sistema (KM Inicial)")
         
-        # Insertar nuevo registro
-        cursor.execute('''
-            INSERT INTO bitacora (placa, chofer, fecha_salida, km_salida, 
-                                nivel_combustible_salida, estado_vehiculo_salida, observaciones)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (salida.placa, salida.chofer, now_ca().isoformat(), 
-              salida.km_salida, salida.nivel_combustible_salida, 
-              salida.estado_vehiculo_salida, salida.observaciones))
+            # Insertar nuevo registro
+            cursor.execute('''
+                INSERT INTO bitacora (placa, chofer, fecha_salida, km_salida, 
+                                    nivel_combustible_salida, estado_vehiculo_salida, observaciones)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (salida.placa, salida.chofer, salida.fecha_salida or now_ca().isoformat(), 
+                  salida.km_salida, salida.nivel_combustible_salida, 
+                  salida.estado_vehiculo_salida, salida.observaciones))
+        
+            # run_idempotent confirma la transacción (y guarda la respuesta si hay clave)
+            return {"bitacora_id": cursor.lastrowid, "alerta_km": alerta_km, "alerta": alerta}
+        
+        registro, repetido = await async_db.run(run_idempotent, idempotency_key, "POST /bitacora/salida",
+                                                _registrar_salida)
+        bitacora_id, alerta_km, alerta = registro["bitacora_id"], registro["alerta_km"], registro["alerta"]
+        
+        if repetido:
+            response.headers["Idempotent-Replayed"] = "true"
+        else:
+            await trigger_auto_backup("registrar_salida")
         
-        bitacora_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        if alerta and not repetido:
+            km_anterior, chofer_anterior = alerta
+            asyncio.create_task(enviar_alerta_kilometraje(
+                salida.placa, salida.chofer, salida.km_salida, km_anterior, chofer_anterior
+            ))
         
         return {
             "success": True, 
@@ -1845,6 +1717,12 @@ async def registrar_salida(salida: BitacoraSalida):
             "bitacora_id": bitacora_id,
             "alerta_km": alerta_km
         }
+    except sqlite3.IntegrityError as e:
+        if es_error_vehiculo(e):
+            raise HTTPException(status_code=422, detail=VEHICULO_NO_REGISTRADO)
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         logger.error(f"Error al registrar salida: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1856,25 +1734,26 @@ async def registrar_retorno(bitacora_id: int, retorno: BitacoraRetorno):
     logger.info(f"📝 Datos del retorno: km={retorno.km_retorno}, combustible={retorno.nivel_combustible_retorno}, estado={retorno.estado_vehiculo_retorno}")
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def _registrar_retorno(conn):
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            UPDATE bitacora 
-            SET fecha_retorno = ?, km_retorno = ?, nivel_combustible_retorno = ?,
-                estado_vehiculo_retorno = ?, observaciones = ?, estado = 'completado'
-            WHERE id = ?
-        ''', (now_ca().isoformat(), retorno.km_retorno, 
-              retorno.nivel_combustible_retorno, retorno.estado_vehiculo_retorno,
-              retorno.observaciones, bitacora_id))
+            cursor.execute('''
+                UPDATE bitacora 
+                SET fecha_retorno = ?, km_retorno = ?, nivel_combustible_retorno = ?,
+                    estado_vehiculo_retorno = ?, observaciones = ?, estado = 'completado'
+                WHERE id = ?
+            ''', (retorno.fecha_retorno or now_ca().isoformat(), retorno.km_retorno, 
+                  retorno.nivel_combustible_retorno, retorno.estado_vehiculo_retorno,
+                  retorno.observaciones, bitacora_id))
+        
+            if cursor.rowcount == 0:
+                logger.error(f"❌ No se encontró registro de bitácora con ID: {bitacora_id}")
+                raise HTTPException(status_code=404, detail="Registro de bitácora no encontrado")
+        
+            logger.info(f"✅ COMMIT exitoso para retorno de bitácora ID: {bitacora_id}")
+            conn.commit()
         
-        if cursor.rowcount == 0:
-            logger.error(f"❌ No se encontró registro de bitácora con ID: {bitacora_id}")
-            raise HTTPException(status_code=404, detail="Registro de bitácora no encontrado")
-        
-        logger.info(f"✅ COMMIT exitoso para retorno de bitácora ID: {bitacora_id}")
-        conn.commit()
-        conn.close()
+        await async_db.run(_registrar_retorno)
         
         # Backup automático después de registrar retorno
         await trigger_auto_backup("registrar_retorno")
@@ -1890,128 +1769,109 @@ async def enviar_alerta_kilometraje(placa, chofer_actual, km_actual, km_anterior
     try:
         diferencia = abs(km_actual - km_anterior)
         subject = f"⚠️ ALERTA: Inconsistencia de Kilometraje - Vehículo {placa}"
+        email = render_alerta_kilometraje(placa, chofer_actual, km_actual, km_anterior, chofer_anterior, now_ca())
+        
+        # Encolar email (queda registrado en historial de alertas como 'pendiente' hasta su entrega)
+        await email_outbox.enqueue(
+            "Kilometraje Anómalo",
+            subject,
+            email.html,
+            config_cache.email()["recipient_email"],
+            vehiculo_placa=placa,
+            mensaje=f"Diferencia detectada: {diferencia} km entre {km_anterior} km y {km_actual} km",
+            cuerpo_texto=email.text
+        )
         
-        body = f"""
-        <h2>🚨 ALERTA DE INCONSISTENCIA EN BITÁCORA</h2>
-        <p><strong>Vehículo:</strong> {placa}</p>
-        <p><strong>Diferencia detectada:</strong> {diferencia} km</p>
-        <p><strong>Kilometraje anterior:</strong> {km_anterior} km (por {chofer_anterior})</p>
-        <p><strong>Kilometraje actual:</strong> {km_actual} km (por {chofer_actual})</p>
-        <p><strong>Fecha:</strong> {now_ca().strftime('%d/%m/%Y %H:%M')}</p>
-        
-        <p style="color: red;"><strong>ACCIÓN REQUERIDA:</strong> Verificar la inconsistencia en el kilometraje del vehículo.</p>
-        """
-        
-        # Enviar email
-        send_email_notification(subject, body)
-        
-        # Registrar en historial de alertas
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO historial_alertas 
-                (tipo_alerta, vehiculo_placa, destinatario_email, asunto, mensaje, estado)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                "Kilometraje Anómalo",
-                placa,
-                EMAIL_CONFIG["recipient_email"],
-                subject,
-                f"Diferencia detectada: {diferencia} km entre {km_anterior} km y {km_actual} km",
-                "enviado"
-            ))
-            conn.commit()
-            conn.close()
-        except Exception as hist_e:
-            logger.error(f"Error registrando alerta de kilometraje en historial: {hist_e}")
-        
-        logger.info(f"✅ Alerta de kilometraje enviada para vehículo {placa} - Diferencia: {diferencia} km")
+        logger.info(f"✅ Alerta de kilometraje encolada para vehículo {placa} - Diferencia: {diferencia} km")
     except Exception as e:
         logger.error(f"❌ Error enviando alerta de kilometraje: {e}")
 
+def parse_fecha_salida(valor):
+    """Fecha/hora de salida de la bitácora con zona horaria (los registros sin zona son hora de Centroamérica)"""
+    return _parse_fecha_salida(valor, CENTRAL_AMERICA_TZ)
+
+def generate_retorno_pendiente_email(registros_pendientes, ahora=None):
+    """Asunto y email (HTML y texto) de la alerta de vehículos sin retorno"""
+    ahora = ahora or now_ca()
+    registros = [{**registro, 'fecha_salida': parse_fecha_salida(registro['fecha_salida'])}
+                 for registro in registros_pendientes]
+    subject = f"🚨 ALERTA URGENTE: {len(registros)} Vehículo(s) Sin Retorno"
+    return subject, render_retorno_pendiente(registros, ahora)
+
+@app.get("/bitacora/retornos-pendientes")
+async def get_retornos_pendientes(
+    horas: Optional[float] = Query(None, ge=0, description="Umbral para todos los vehículos (por defecto, el configurado)"),
+    placa: Optional[str] = None
+):
+    """Viajes en curso que superaron su umbral de horas sin registrar el retorno"""
+    try:
+        ahora = now_ca()
+        
+        def _buscar(conn):
+            habilitado, umbral = config_retornos(config_cache.alertas(), RETORNO_PENDIENTE_HORAS)
+            if horas is not None:
+                # Umbral explícito: se aplica igual a todos los vehículos
+                return habilitado, horas, find_retornos_pendientes(conn, ahora, horas, placa, por_vehiculo=False)
+            return habilitado, umbral, find_retornos_pendientes(conn, ahora, umbral, placa)
+        
+        habilitado, umbral, registros = await async_db.run(_buscar)
+        return {
+            "success": True,
+            "data": registros,
+            "total": len(registros),
+            "umbral_horas": umbral,
+            "alertas_habilitadas": habilitado,
+            "generado": ahora.isoformat()
+        }
+    except Exception as e:
+        logger.error(f"Error obteniendo retornos pendientes: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/bitacora/alerta-retorno-pendiente")
 async def enviar_alerta_retorno_pendiente(request: dict):
-    """Enviar alerta por vehículos con retorno pendiente"""
+    """Enviar alerta por vehículos con retorno pendiente.
+    
+    bitacora_ids: viajes a notificar (el servidor los lee de la bitácora).
+    Sin ids ni registros se notifican todos los que superaron su umbral.
+    registros_pendientes: formato anterior, con los registros armados por el cliente.
+    """
     try:
+        bitacora_ids = request.get('bitacora_ids')
         registros_pendientes = request.get('registros_pendientes', [])
         
+        if bitacora_ids:
+            registros_pendientes = await async_db.run(get_viajes_en_curso, [int(i) for i in bitacora_ids])
+            if not registros_pendientes:
+                return {"success": False, "message": "El viaje ya tiene retorno registrado o no existe"}
+        elif not registros_pendientes:
+            habilitado, _, registros_pendientes = await async_db.run(detectar_retornos_pendientes, now_ca())
+            if not habilitado:
+                return {"success": False, "message": "Las alertas de bitácora están desactivadas"}
+        
         if not registros_pendientes:
             return {"success": False, "message": "No hay registros pendientes para notificar"}
         
-        # Crear HTML con la lista de vehículos pendientes
-        vehiculos_html = ""
-        for registro in registros_pendientes:
-            fecha_salida = datetime.fromisoformat(registro['fecha_salida'].replace('Z', '+00:00'))
-            dias_pendientes = (datetime.now() - fecha_salida).days
-            
-            vehiculos_html += f"""
-            <tr style="background-color: {'#ffebee' if dias_pendientes > 3 else '#fff3e0'};">
-                <td><strong>{registro['placa']}</strong></td>
-                <td>{registro['chofer']}</td>
-                <td>{fecha_salida.strftime('%d/%m/%Y %H:%M')}</td>
-                <td>{registro['km_salida']} km</td>
-                <td>{registro['nivel_combustible_salida']}</td>
-                <td style="color: {'red' if dias_pendientes > 3 else 'orange'};">
-                    <strong>{dias_pendientes} día{'s' if dias_pendientes != 1 else ''}</strong>
-                </td>
-            </tr>
-            """
-        
-        subject = f"🚨 ALERTA URGENTE: {len(registros_pendientes)} Vehículo(s) Sin Retorno"
-        
-        body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif;">
-            <h2 style="color: #d32f2f;">🚨 ALERTA: VEHÍCULOS SIN RETORNO</h2>
-            
-            <p>Se han detectado <strong>{len(registros_pendientes)} vehículo(s)</strong> que no han registrado su retorno:</p>
-            
-            <table border="1" cellpadding="8" cellspacing="0" style="border-collapse: collapse; width: 100%; margin: 20px 0;">
-                <thead style="background-color: #f5f5f5;">
-                    <tr>
-                        <th>Placa</th>
-                        <th>Chofer Responsable</th>
-                        <th>Fecha/Hora Salida</th>
-                        <th>KM Salida</th>
-                        <th>Combustible Salida</th>
-                        <th>Días Pendientes</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {vehiculos_html}
-                </tbody>
-            </table>
-            
-            <div style="background-color: #ffebee; padding: 15px; border-left: 4px solid #f44336; margin: 20px 0;">
-                <h3 style="color: #d32f2f; margin: 0 0 10px 0;">⚠️ ACCIÓN REQUERIDA</h3>
-                <ul>
-                    <li>Contactar inmediatamente a los choferes responsables</li>
-                    <li>Verificar el estado actual de los vehículos</li>
-                    <li>Registrar el retorno correspondiente en el sistema</li>
-                    <li>En caso de emergencia, reportar a supervisión</li>
-                </ul>
-            </div>
-            
-            <p style="color: #666; font-size: 12px; margin-top: 30px;">
-                Alerta generada automáticamente el {datetime.now().strftime('%d/%m/%Y a las %H:%M')}<br>
-                Sistema de Gestión Vehicular - Hotel Arenal Manoa
-            </p>
-        </body>
-        </html>
-        """
-        
-        success = send_email_notification(subject, body)
+        subject, email = generate_retorno_pendiente_email(registros_pendientes)
+        
+        # Encolar y responder de inmediato; el worker de emails entrega con reintentos
+        placas = sorted({registro['placa'] for registro in registros_pendientes})
+        email_id = await email_outbox.enqueue(
+            "Retorno Pendiente",
+            subject,
+            email.html,
+            config_cache.email()["recipient_email"],
+            vehiculo_placa=placas[0] if len(placas) == 1 else None,
+            mensaje=f"Vehículos sin retorno: {', '.join(placas)}",
+            cuerpo_texto=email.text
+        )
         
-        if success:
-            logger.info(f"Alerta de retorno pendiente enviada para {len(registros_pendientes)} vehículos")
-            return {
-                "success": True, 
-                "message": f"Alerta enviada exitosamente para {len(registros_pendientes)} vehículo(s)",
-                "count": len(registros_pendientes)
-            }
-        else:
-            return {"success": False, "message": "Error enviando la alerta por email"}
+        logger.info(f"Alerta de retorno pendiente encolada para {len(registros_pendientes)} vehículos")
+        return {
+            "success": True, 
+            "message": f"Alerta enviada exitosamente para {len(registros_pendientes)} vehículo(s)",
+            "count": len(registros_pendientes),
+            "email_id": email_id
+        }
             
     except Exception as e:
         logger.error(f"Error enviando alerta de retorno pendiente: {e}")
@@ -2021,24 +1881,27 @@ async def enviar_alerta_retorno_pendiente(request: dict):
 async def eliminar_bitacora(bitacora_id: int):
     """Eliminar registro de bitácora (solo para administradores)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def _eliminar(conn):
+            cursor = conn.cursor()
         
-        # Verificar que el registro existe
-        cursor.execute("SELECT id FROM bitacora WHERE id = ?", (bitacora_id,))
-        registro = cursor.fetchone()
+            # Verificar que el registro existe
+            cursor.execute("SELECT id FROM bitacora WHERE id = ?", (bitacora_id,))
+            registro = cursor.fetchone()
         
-        if not registro:
-            raise HTTPException(status_code=404, detail="Registro de bitácora no encontrado")
+            if not registro:
+                raise HTTPException(status_code=404, detail="Registro de bitácora no encontrado")
         
-        # Eliminar el registro
-        cursor.execute("DELETE FROM bitacora WHERE id = ?", (bitacora_id,))
+            # Eliminar el registro
+            cursor.execute("DELETE FROM bitacora WHERE id = ?", (bitacora_id,))
         
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="No se pudo eliminar el registro")
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="No se pudo eliminar el registro")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
+        
+        await async_db.run(_eliminar)
+        
+        await trigger_auto_backup("eliminar_bitacora")
         
         logger.info(f"Registro de bitácora {bitacora_id} eliminado exitosamente")
         return {"success": True, "message": "Registro eliminado exitosamente"}
@@ -2051,56 +1914,9 @@ async def eliminar_bitacora(bitacora_id: int):
 # ENDPOINT BACKUP COMPLETO DE BASE DE DATOS
 # ================================
 
-@app.get("/backup/database")
-async def backup_complete_database():
-    """Generar y descargar backup completo de la base de datos SQLite"""
-    try:
-        import shutil
-        import tempfile
-        import zipfile
-        from datetime import datetime
-        import io
-        
-        logger.info("🗄️ Iniciando backup completo de base de datos...")
-        
-        # Verificar que la base de datos existe
-        if not os.path.exists(DATABASE_PATH):
-            raise HTTPException(status_code=404, detail="Base de datos no encontrada")
-        
-        # Timestamp para el archivo
-        timestamp = now_ca().strftime("%Y%m%d_%H%M%S")
-        
-        # Crear ZIP en memoria
-        zip_buffer = io.BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Agregar la base de datos directamente
-            backup_filename = f"vehicular_system_backup_{timestamp}.db"
-            zipf.write(DATABASE_PATH, backup_filename)
-            
-            # Crear archivo de metadatos
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Obtener estadísticas de la base de datos
-            stats = {}
-            tables = ['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora']
-            
-            for table in tables:
-                try:
-                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                    stats[table] = cursor.fetchone()[0]
-                except:
-                    stats[table] = 0
-            
-            # Obtener información adicional
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            all_tables = [row[0] for row in cursor.fetchall()]
-            
-            conn.close()
-                
-            # Crear archivo de metadatos
-            metadata = f"""BACKUP COMPLETO DEL SISTEMA DE GESTIÓN VEHICULAR
+def _leeme_backup(stats, all_tables, backup_filename):
+    """Texto del archivo LEEME incluido en el ZIP de backup completo"""
+    return f"""BACKUP COMPLETO DEL SISTEMA DE GESTIÓN VEHICULAR
 ==================================================
 
 Fecha/Hora del Backup: {now_ca().strftime('%d/%m/%Y %H:%M:%S')} (GMT-6)
@@ -2154,56 +1970,46 @@ ADVERTENCIA:
 Este backup contiene información sensible del sistema vehicular.
 Mantener en lugar seguro y con acceso restringido.
 """
-            
-            # Agregar metadatos al ZIP directamente desde memoria
-            zipf.writestr(f"LEEME_backup_info_{timestamp}.txt", metadata)
-            
-            # Agregar SQL dump como texto plano (opcional)
-            try:
-                import subprocess
-                result = subprocess.run([
-                    'sqlite3', DATABASE_PATH, '.dump'
-                ], capture_output=True, text=True)
-                
-                if result.returncode == 0:
-                    sql_dump = f"""-- DUMP SQL DEL SISTEMA DE GESTIÓN VEHICULAR
--- Generado el: {now_ca().strftime('%d/%m/%Y %H:%M:%S')} (GMT-6)
--- Comando: sqlite3 {DATABASE_PATH} .dump
 
-{result.stdout}"""
-                else:
-                    sql_dump = f"""-- Error generando dump SQL
--- Error: {result.stderr}"""
-                
-                zipf.writestr(f"vehicular_system_dump_{timestamp}.sql", sql_dump)
-            except Exception as e:
-                logger.warning(f"No se pudo generar SQL dump: {e}")
-                zipf.writestr(f"vehicular_system_dump_{timestamp}.sql", "-- Error generando dump SQL")
+@app.get("/backup/database")
+async def backup_complete_database():
+    """Descargar backup completo (ZIP con copia .db, dump SQL y LEEME), generado mientras se envía"""
+    try:
+        logger.info("🗄️ Iniciando backup completo de base de datos...")
         
-        # Preparar buffer para response
-        zip_buffer.seek(0)
-        zip_data = zip_buffer.read()
-        zip_buffer.close()
+        # Verificar que la base de datos existe
+        if not os.path.exists(DATABASE_PATH):
+            raise HTTPException(status_code=404, detail="Base de datos no encontrada")
         
-        zip_filename = f"vehicular_system_complete_backup_{timestamp}.zip"
+        # Timestamp para el archivo
+        timestamp = now_ca().strftime("%Y%m%d_%H%M%S")
         
-        logger.info(f"✅ Backup completo generado en memoria: {zip_filename}")
+        backup_stream = DatabaseBackupStream(
+            DATABASE_PATH, timestamp,
+            tables=['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora'],
+            leeme=_leeme_backup, generado=now_ca().strftime('%d/%m/%Y %H:%M:%S')
+        )
+        # Fijar la foto de la base antes de responder: los conteos de las cabeceras son los del ZIP
+        stats = await run_blocking(backup_stream.open)
         
-        # Retornar usando Response con bytes
-        from fastapi.responses import Response
+        zip_filename = f"vehicular_system_complete_backup_{timestamp}.zip"
         
-        return Response(
-            content=zip_data,
+        # Sin Content-Length: el tamaño se conoce recién al terminar de generar el ZIP
+        return StreamingResponse(
+            backup_stream.chunks(),
             media_type="application/zip",
             headers={
                 "Content-Disposition": f"attachment; filename={zip_filename}",
-                "Content-Length": str(len(zip_data)),
                 "X-Backup-Timestamp": timestamp,
                 "X-Total-Records": str(sum(stats.values())),
                 "X-Backup-Type": "complete_database"
-            }
+            },
+            # Si el cliente se desconecta antes de empezar, liberar igual la transacción de lectura
+            background=BackgroundTask(backup_stream.close)
         )
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Error generando backup de base de datos: {e}")
         raise HTTPException(
@@ -2215,25 +2021,26 @@ Mantener en lugar seguro y con acceso restringido.
 async def backup_status():
     """Obtener información sobre el estado de la base de datos para backup"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def _estado_tablas(conn):
+            cursor = conn.cursor()
         
-        # Obtener estadísticas básicas
-        stats = {}
-        tables = ['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora']
+            # Obtener estadísticas básicas
+            stats = {}
+            tables = ['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora']
         
-        for table in tables:
-            cursor.execute(f"SELECT COUNT(*) FROM {table}")
-            stats[table] = cursor.fetchone()[0]
+            for table in tables:
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                stats[table] = cursor.fetchone()[0]
         
-        # Obtener tamaño del archivo de base de datos
-        db_size = os.path.getsize(DATABASE_PATH) if os.path.exists(DATABASE_PATH) else 0
-        db_size_mb = round(db_size / (1024 * 1024), 2)
+            # Obtener tamaño del archivo de base de datos
+            db_size = os.path.getsize(DATABASE_PATH) if os.path.exists(DATABASE_PATH) else 0
+            db_size_mb = round(db_size / (1024 * 1024), 2)
         
-        # Obtener fecha de última modificación
-        last_modified = datetime.fromtimestamp(os.path.getmtime(DATABASE_PATH)).isoformat() if os.path.exists(DATABASE_PATH) else None
+            # Obtener fecha de última modificación
+            last_modified = datetime.fromtimestamp(os.path.getmtime(DATABASE_PATH)).isoformat() if os.path.exists(DATABASE_PATH) else None
+            return stats, db_size, db_size_mb, last_modified
         
-        conn.close()
+        stats, db_size, db_size_mb, last_modified = await async_db.run(_estado_tablas)
         
         return {
             "success": True,
@@ -2259,34 +2066,9 @@ async def backup_status():
 
 @app.get("/config/alertas")
 async def get_config_alertas():
-    """Obtener configuración actual de alertas"""
+    """Obtener configuración actual de alertas (valores por defecto si no se guardó ninguna)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM config_alertas WHERE activo = 1 ORDER BY id DESC LIMIT 1")
-        config = cursor.fetchone()
-        conn.close()
-        
-        if config:
-            return {"success": True, "config": dict_from_row(config)}
-        else:
-            # Retornar configuración por defecto
-            return {
-                "success": True, 
-                "config": {
-                    "email_destino": "contabilidad2@arenalmanoa.com",
-                    "alertas_mantenimiento": True,
-                    "alertas_polizas": True,
-                    "alertas_rtv": True,
-                    "alertas_revisiones": True,
-                    "alertas_combustible": True,
-                    "alertas_bitacora": True,
-                    "dias_anticipacion_polizas": 30,
-                    "dias_anticipacion_rtv": 30,
-                    "dias_anticipacion_mantenimiento": 30,
-                    "km_diferencia_alerta": 1
-                }
-            }
+        return {"success": True, "config": config_cache.alertas()}
     except Exception as e:
         logger.error(f"Error al obtener configuración de alertas: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -2295,31 +2077,11 @@ async def get_config_alertas():
 async def set_config_alertas(config: ConfigAlertas):
     """Configurar alertas del sistema"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # Desactiva la configuración anterior, inserta la nueva y actualiza la caché (el destinatario
+        # de los emails sale de aquí); los demás workers la recargan en su próximo sondeo
+        await async_db.run(config_cache.save_alertas, config.dict())
         
-        # Desactivar configuración anterior
-        cursor.execute("UPDATE config_alertas SET activo = 0")
-        
-        # Insertar nueva configuración
-        cursor.execute('''
-            INSERT INTO config_alertas (
-                email_destino, alertas_mantenimiento, alertas_polizas, alertas_rtv,
-                alertas_revisiones, alertas_combustible, alertas_bitacora,
-                dias_anticipacion_polizas, dias_anticipacion_rtv, 
-                dias_anticipacion_mantenimiento, km_diferencia_alerta
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (config.email_destino, config.alertas_mantenimiento, config.alertas_polizas,
-              config.alertas_rtv, config.alertas_revisiones, config.alertas_combustible,
-              config.alertas_bitacora, config.dias_anticipacion_polizas, 
-              config.dias_anticipacion_rtv, config.dias_anticipacion_mantenimiento,
-              config.km_diferencia_alerta))
-        
-        # Actualizar configuración global de EMAIL
-        EMAIL_CONFIG["recipient_email"] = config.email_destino
-        
-        conn.commit()
-        conn.close()
+        await trigger_auto_backup("set_config_alertas")
         
         return {"success": True, "message": "Configuración de alertas guardada exitosamente"}
     except Exception as e:
@@ -2333,36 +2095,31 @@ async def set_config_alertas(config: ConfigAlertas):
 # Endpoint para configurar email
 @app.post("/config/email")
 async def configurar_email(email_config: dict):
-    """Configurar ajustes de email"""
-    try:
-        # Actualizar configuración básica
-        if "sender_email" in email_config:
-            EMAIL_CONFIG["sender_email"] = email_config["sender_email"]
-        if "sender_password" in email_config:
-            EMAIL_CONFIG["sender_password"] = email_config["sender_password"]
-        if "recipient_email" in email_config:
-            EMAIL_CONFIG["recipient_email"] = email_config["recipient_email"]
-        
-        # Configurar proveedor específico si se especifica
-        if "provider" in email_config and email_config["provider"] in EMAIL_PROVIDERS:
+    """Configurar ajustes de email (se guardan en config_email y valen para todos los workers)"""
+    try:
+        # Proveedor conocido primero; servidor y puerto explícitos tienen prioridad
+        cambios = {}
+        if email_config.get("provider") in EMAIL_PROVIDERS:
             provider_config = EMAIL_PROVIDERS[email_config["provider"]]
-            EMAIL_CONFIG.update(provider_config)
+            cambios.update(smtp_server=provider_config["smtp_server"], smtp_port=provider_config["smtp_port"])
+        for clave in ("sender_email", "sender_password", "recipient_email", "smtp_server", "smtp_port"):
+            if clave in email_config:
+                cambios[clave] = email_config[clave]
+        if "smtp_port" in cambios:
+            cambios["smtp_port"] = int(cambios["smtp_port"])
         
-        # Configuración personalizada de servidor
-        if "smtp_server" in email_config:
-            EMAIL_CONFIG["smtp_server"] = email_config["smtp_server"]
-        if "smtp_port" in email_config:
-            EMAIL_CONFIG["smtp_port"] = int(email_config["smtp_port"])
+        snapshot = await async_db.run(config_cache.save_email, cambios)
+        config = snapshot.email
         
         return {
             "success": True, 
             "message": "Configuración de email actualizada",
             "config": {
-                "smtp_server": EMAIL_CONFIG["smtp_server"],
-                "smtp_port": EMAIL_CONFIG["smtp_port"],
-                "sender_email": EMAIL_CONFIG["sender_email"],
-                "recipient_email": EMAIL_CONFIG["recipient_email"],
-                "password_configured": bool(EMAIL_CONFIG["sender_password"])
+                "smtp_server": config["smtp_server"],
+                "smtp_port": config["smtp_port"],
+                "sender_email": config["sender_email"],
+                "recipient_email": config["recipient_email"],
+                "password_configured": bool(config["sender_password"])
             }
         }
     except Exception as e:
@@ -2373,17 +2130,18 @@ async def configurar_email(email_config: dict):
 @app.get("/config/email")
 async def get_email_config():
     """Obtener configuración actual de email (sin contraseña)"""
+    config = config_cache.email()
     return {
         "success": True,
         "email_method": EMAIL_METHOD,  # SENDGRID o SMTP
         "sendgrid_available": EMAIL_METHOD == "SENDGRID",
-        "smtp_configured": bool(EMAIL_CONFIG["sender_password"]),
+        "smtp_configured": bool(config["sender_password"]),
         "config": {
-            "smtp_server": EMAIL_CONFIG["smtp_server"],
-            "smtp_port": EMAIL_CONFIG["smtp_port"], 
-            "sender_email": EMAIL_CONFIG["sender_email"],
-            "recipient_email": EMAIL_CONFIG["recipient_email"],
-            "password_configured": bool(EMAIL_CONFIG["sender_password"])
+            "smtp_server": config["smtp_server"],
+            "smtp_port": config["smtp_port"], 
+            "sender_email": config["sender_email"],
+            "recipient_email": config["recipient_email"],
+            "password_configured": bool(config["sender_password"])
         },
         "providers": EMAIL_PROVIDERS
     }
@@ -2406,12 +2164,11 @@ async def test_email():
         </html>
         """
         
-        success = send_email_notification(subject, body)
-        
-        if success:
-            return {"success": True, "message": "Email de prueba enviado exitosamente"}
-        else:
-            return {"success": False, "message": "Error enviando email de prueba. Verifique la configuración."}
+        try:
+            await run_blocking(send_email_notification, subject, body)
+        except EmailDeliveryError as e:
+            return {"success": False, "message": f"Error enviando email de prueba: {e}. Verifique la configuración."}
+        return {"success": True, "message": "Email de prueba enviado exitosamente"}
     except Exception as e:
         logger.error(f"Error probando email: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -2430,12 +2187,15 @@ async def test_smtp_connection(smtp_config: dict):
         if not all([email, password, host]):
             return {"success": False, "error": "Faltan campos requeridos: email, password, host"}
         
-        # Probar conexión SMTP
-        server = smtplib.SMTP(host, port)
-        if use_tls:
-            server.starttls()
-        server.login(email, password)
-        server.quit()
+        # Probar conexión SMTP (fuera del event loop)
+        def _probar_smtp():
+            server = smtplib.SMTP(host, port)
+            if use_tls:
+                server.starttls()
+            server.login(email, password)
+            server.quit()
+        
+        await run_blocking(_probar_smtp)
         
         logger.info(f"Conexión SMTP exitosa para {email} en {host}:{port}")
         return {
@@ -2470,32 +2230,30 @@ async def test_smtp_connection(smtp_config: dict):
 async def enviar_reporte_email(email_data: dict):
     """Enviar reporte por email usando configuración de alertas"""
     try:
-        # Obtener configuración de email de la base de datos
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # Configuración de email guardada (en memoria, sin consultar config_email)
+        email_config = config_cache.email()
         
-        cursor.execute("SELECT * FROM config_email WHERE activo = 1 ORDER BY id DESC LIMIT 1")
-        email_config = cursor.fetchone()
-        conn.close()
-        
-        if not email_config:
+        if not email_config["configurado"]:
             raise HTTPException(status_code=400, detail="No hay configuración de email activa")
         
         # Crear mensaje de email
         msg = MIMEMultipart()
-        msg['From'] = email_config['email_remitente']
+        msg['From'] = email_config['sender_email']
         msg['To'] = email_data['destinatario']
         msg['Subject'] = email_data['asunto']
         
         msg.attach(MIMEText(email_data['mensaje_html'], 'html'))
         
-        # Enviar email usando la configuración de la base de datos
-        server = smtplib.SMTP(email_config['smtp_servidor'], email_config['smtp_puerto'])
-        server.starttls()
-        server.login(email_config['email_usuario'], email_config['email_password'])
-        text = msg.as_string()
-        server.sendmail(email_config['email_remitente'], email_data['destinatario'], text)
-        server.quit()
+        # Enviar email usando la configuración de la base de datos (fuera del event loop)
+        def _enviar_smtp():
+            server = smtplib.SMTP(email_config['smtp_server'], email_config['smtp_port'])
+            server.starttls()
+            server.login(email_config['sender_user'], email_config['sender_password'])
+            text = msg.as_string()
+            server.sendmail(email_config['sender_email'], email_data['destinatario'], text)
+            server.quit()
+        
+        await run_blocking(_enviar_smtp)
         
         logger.info(f"Reporte enviado por email a {email_data['destinatario']}")
         return {"success": True, "message": "Reporte enviado exitosamente"}
@@ -2509,143 +2267,33 @@ async def enviar_reporte_email(email_data: dict):
 async def get_alertas_detalle():
     """Obtener detalle de todas las alertas para mostrar en el frontend"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        hoy = date_ca()
-        en_30_dias = hoy + timedelta(days=30)
-        
-        alertas = {
-            "mantenimiento": [],
-            "polizas": [],
-            "rtv": [],
-            "revisiones": [],
-            "combustible": []
-        }
-        
-        # ALERTAS DE MANTENIMIENTO
-        cursor.execute('''
-            SELECT m.*, v.marca, v.modelo 
-            FROM mantenimientos m
-            JOIN vehiculos v ON m.placa = v.placa
-            WHERE (m.proxima_fecha IS NOT NULL AND m.proxima_fecha <= ? AND m.proxima_fecha >= ?)
-            ORDER BY m.proxima_fecha ASC
-        ''', (en_30_dias.isoformat(), hoy.isoformat()))
-        
-        mantenimientos_fecha = cursor.fetchall()
-        for m in mantenimientos_fecha:
-            dias_restantes = (datetime.strptime(m['proxima_fecha'], '%Y-%m-%d').date() - hoy).days
-            alertas["mantenimiento"].append({
-                "placa": m['placa'],
-                "vehiculo": f"{m['marca']} {m['modelo']}",
-                "tipo": m['tipo'],
-                "descripcion": f"Mantenimiento por fecha - {dias_restantes} días restantes",
-                "dias_restantes": dias_restantes,
-                "urgente": dias_restantes <= 7,
-                "fecha": m['proxima_fecha']
-            })
-        
-        # ALERTAS DE PÓLIZAS
-        cursor.execute('''
-            SELECT p.*, v.marca, v.modelo 
-            FROM polizas p 
-            JOIN vehiculos v ON p.placa = v.placa
-            WHERE p.fecha_vencimiento <= ? AND p.fecha_vencimiento >= ? AND p.estado = 'Activa'
-            ORDER BY p.fecha_vencimiento ASC
-        ''', (en_30_dias.isoformat(), hoy.isoformat()))
-        
-        polizas = cursor.fetchall()
-        for p in polizas:
-            dias_restantes = (datetime.strptime(p['fecha_vencimiento'], '%Y-%m-%d').date() - hoy).days
-            alertas["polizas"].append({
-                "placa": p['placa'],
-                "vehiculo": f"{p['marca']} {p['modelo']}",
-                "numero_poliza": p['numero_poliza'],
-                "aseguradora": p['aseguradora'],
-                "descripcion": f"Póliza vence en {dias_restantes} días",
-                "dias_restantes": dias_restantes,
-                "urgente": dias_restantes <= 7,
-                "fecha": p['fecha_vencimiento']
-            })
-        
-        # ALERTAS DE RTV
-        cursor.execute('''
-            SELECT r.*, v.marca, v.modelo 
-            FROM rtv r 
-            JOIN vehiculos v ON r.placa = v.placa
-            WHERE r.fecha_vencimiento <= ? AND r.fecha_vencimiento >= ? AND r.estado = 'Vigente'
-            ORDER BY r.fecha_vencimiento ASC
-        ''', (en_30_dias.isoformat(), hoy.isoformat()))
-        
-        rtv_records = cursor.fetchall()
-        for r in rtv_records:
-            dias_restantes = (datetime.strptime(r['fecha_vencimiento'], '%Y-%m-%d').date() - hoy).days
-            alertas["rtv"].append({
-                "placa": r['placa'],
-                "vehiculo": f"{r['marca']} {r['modelo']}",
-                "numero_cita": r['numero_cita'],
-                "descripcion": f"RTV vence en {dias_restantes} días",
-                "dias_restantes": dias_restantes,
-                "urgente": dias_restantes <= 7,
-                "fecha": r['fecha_vencimiento']
-            })
-        
-        # ALERTAS DE REVISIONES CON FALLAS
-        cursor.execute('''
-            SELECT r.*, v.marca, v.modelo 
-            FROM revisiones r 
-            JOIN vehiculos v ON r.placa = v.placa
-            WHERE r.aprobado = 0 AND r.fecha >= ?
-            ORDER BY r.fecha DESC
-        ''', ((hoy - timedelta(days=30)).isoformat(),))
-        
-        revisiones = cursor.fetchall()
-        for r in revisiones:
-            fallas = []
-            if r['estado_motor'] != 'Bueno': fallas.append(f"Motor: {r['estado_motor']}")
-            if r['estado_frenos'] != 'Bueno': fallas.append(f"Frenos: {r['estado_frenos']}")
-            if r['estado_luces'] != 'Bueno': fallas.append(f"Luces: {r['estado_luces']}")
-            if r['estado_llantas'] != 'Bueno': fallas.append(f"Llantas: {r['estado_llantas']}")
-            if r['estado_carroceria'] != 'Bueno': fallas.append(f"Carrocería: {r['estado_carroceria']}")
-            
-            alertas["revisiones"].append({
-                "placa": r['placa'],
-                "vehiculo": f"{r['marca']} {r['modelo']}",
-                "inspector": r['inspector'],
-                "fallas": fallas,
-                "descripcion": f"Fallas detectadas: {', '.join(fallas) if fallas else 'Revisión no aprobada'}",
-                "urgente": True,
-                "fecha": r['fecha']
-            })
-        
-        # ALERTAS DE COMBUSTIBLE (detección básica)
-        alertas["combustible"] = check_abnormal_fuel_consumption(cursor, hoy)
-        
-        conn.close()
-        
-        # Calcular totales
-        totales = {
-            "mantenimiento": len(alertas["mantenimiento"]),
-            "polizas": len(alertas["polizas"]),
-            "rtv": len(alertas["rtv"]),
-            "revisiones": len(alertas["revisiones"]),
-            "combustible": len(alertas["combustible"]),
-            "total": sum([len(alertas[k]) for k in alertas.keys()])
-        }
+        def _consultar_alertas(conn):
+            return alert_engine.snapshot(conn, date_ca()).detalle()
         
         return {
             "success": True,
-            "data": {
-                "alertas": alertas,
-                "totales": totales,
-                "fecha_consulta": hoy.isoformat()
-            }
+            "data": await async_db.run(_consultar_alertas)
         }
         
     except Exception as e:
         logger.error(f"Error obteniendo detalle de alertas: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/alertas/activas")
+async def get_alertas_activas(placa: Optional[str] = None, incluir_resueltas: bool = False, limit: int = 200):
+    """Alertas materializadas con first_seen / last_seen / resolved_at, opcionalmente por placa"""
+    try:
+        def _listar(conn):
+            # Procesar escrituras recientes aún no evaluadas antes de leer
+            refresh_alertas(conn, date_ca())
+            return list_alertas_activas(conn, placa.upper() if placa else None, incluir_resueltas, limit)
+        
+        alertas = await async_db.run(_listar)
+        return {"success": True, "data": alertas, "total": len(alertas)}
+    except Exception as e:
+        logger.error(f"Error listando alertas activas: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ===== ENDPOINT DE PRUEBA PARA EMAILS =====
 @app.post("/test-email")
 async def test_email():
@@ -2685,7 +2333,7 @@ async def test_email():
                 """.format(fecha=datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
             }
             
-            resultado = service.send_alert_email(test_data, to_email="contabilidad2@arenalmanoa.com")
+            resultado = await run_blocking(service.send_alert_email, test_data, to_email="contabilidad2@arenalmanoa.com")
             
             if resultado.get("success"):
                 logger.info("✅ Email de prueba SendGrid enviado exitosamente")
@@ -2729,7 +2377,7 @@ async def create_backup():
         from backup_manager import DatabaseBackupManager
         manager = DatabaseBackupManager()
         
-        result = manager.create_full_backup("manual", include_export=True)
+        result = await run_blocking(manager.create_full_backup, "manual", include_export=True)
         
         if "error" not in result:
             logger.info("✅ Backup manual creado exitosamente")
@@ -2752,7 +2400,7 @@ async def export_database():
     try:
         from backup_manager import export_database_now
         
-        result = export_database_now()
+        result = await run_blocking(export_database_now)
         
         if result.get("success"):
             logger.info("✅ Export de base de datos completado")
@@ -2776,8 +2424,8 @@ async def list_backups():
         from backup_manager import DatabaseBackupManager
         manager = DatabaseBackupManager()
         
-        backups = manager.list_backups()
-        stats = manager.get_database_stats()
+        backups = await run_blocking(manager.list_backups)
+        stats = await run_blocking(manager.get_database_stats)
         
         return {
             "success": True,
@@ -2796,7 +2444,7 @@ async def emergency_backup():
     try:
         from backup_manager import create_emergency_backup
         
-        result = create_emergency_backup()
+        result = await run_blocking(create_emergency_backup)
         
         if "error" not in result:
             logger.info("🚨 Backup de emergencia creado")
@@ -2820,7 +2468,7 @@ async def backup_stats():
         from backup_manager import DatabaseBackupManager
         manager = DatabaseBackupManager()
         
-        stats = manager.get_database_stats()
+        stats = await run_blocking(manager.get_database_stats)
         
         return {
             "success": True,
@@ -2846,10 +2494,10 @@ async def data_preservation_status():
             }
         
         # Obtener conteos actuales
-        current_counts = preservation_system.get_current_data_counts()
+        current_counts = await run_blocking(preservation_system.get_current_data_counts)
         
         # Obtener backups disponibles
-        available_backups = preservation_system.get_available_backups()
+        available_backups = await run_blocking(preservation_system.get_available_backups)
         
         return {
             "success": True,
@@ -2882,7 +2530,9 @@ async def crear_backup_manual_admin():
         # 1. Backup usando sistema de preservación local
         try:
             if DATA_PRESERVATION_ENABLED and preservation_system:
-                backup_path, metadata = preservation_system.create_pre_change_backup(f"Backup manual admin {timestamp}")
+                backup_path, metadata = await run_blocking(
+                    preservation_system.create_pre_change_backup, f"Backup manual admin {timestamp}"
+                )
                 
                 if backup_path:
                     backup_results.append({
@@ -3005,6 +2655,224 @@ async def obtener_estado_backup():
             "error": str(e)
         }, status_code=500)
 
+@app.get("/admin/db-pool")
+async def obtener_estado_db_pool():
+    """Estadísticas del pool de conexiones SQLite (para dimensionarlo según el tráfico)"""
+    return {
+        "success": True,
+        "pool": db_pool.stats(),
+        "timestamp": now_ca().isoformat()
+    }
+
+@app.get("/admin/config-cache")
+async def obtener_estado_config_cache():
+    """Caché de configuración (lecturas servidas desde memoria, recargas, versiones vigentes)"""
+    return {
+        "success": True,
+        "config_cache": config_cache.metrics(),
+        "timestamp": now_ca().isoformat()
+    }
+
+@app.get("/admin/events")
+async def obtener_estado_event_broker():
+    """Suscriptores SSE de este worker, eventos repartidos y clientes desbordados"""
+    return {
+        "success": True,
+        "events": event_broker.metrics(),
+        "timestamp": now_ca().isoformat()
+    }
+
+@app.get("/admin/checksums")
+async def obtener_estado_checksums():
+    """Árboles de checksums en memoria (versión de cada tabla) y cuántas veces se recalcularon"""
+    return {
+        "success": True,
+        "checksums": checksum_cache.metrics(),
+        "timestamp": now_ca().isoformat()
+    }
+
+@app.get("/admin/backup-scheduler")
+async def obtener_estado_backup_scheduler():
+    """Métricas del programador de backups (cambios pendientes, retraso, backups agrupados)"""
+    return {
+        "success": True,
+        "scheduler": backup_scheduler.metrics(),
+        "timestamp": now_ca().isoformat()
+    }
+
+@app.get("/admin/backup-catalog")
+async def obtener_catalogo_backups(
+    limit: int = Query(50, ge=1, le=500),
+    sistema: Optional[str] = Query(None, description="github_backup_system o github_api")
+):
+    """Últimos backups por sistema: subidos, omitidos por no tener cambios y fallidos"""
+    try:
+        def _catalogo(conn):
+            return {
+                "resumen": backup_catalog_summary(conn),
+                "entradas": list_backup_catalog(conn, limit, sistema)
+            }
+        
+        return {
+            "success": True,
+            "catalogo": await async_db.run(_catalogo),
+            "timestamp": now_ca().isoformat()
+        }
+    except Exception as e:
+        logger.error(f"Error obteniendo catálogo de backups: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/backup-scheduler/flush")
+async def forzar_backup_programado():
+    """Ejecutar ya el backup de los cambios pendientes y esperar el resultado"""
+    try:
+        resultado = await backup_scheduler.flush_now()
+        return {
+            "success": True,
+            "message": "Backup ejecutado",
+            "resultado": resultado,
+            "scheduler": backup_scheduler.metrics(),
+            "timestamp": now_ca().isoformat()
+        }
+    except Exception as e:
+        logger.error(f"❌ Error forzando backup programado: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/email-outbox")
+async def obtener_estado_email_outbox():
+    """Estado de la cola de emails (pendientes, enviados, fallidos) y métricas del worker"""
+    try:
+        return {
+            "success": True,
+            "outbox": await email_outbox.metrics(),
+            "timestamp": now_ca().isoformat()
+        }
+    except Exception as e:
+        logger.error(f"❌ Error obteniendo estado de la cola de emails: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/email-outbox/fallidos")
+async def listar_emails_fallidos(limit: int = 50):
+    """Emails que agotaron sus reintentos (dead-letter)"""
+    try:
+        fallidos = await email_outbox.dead_letters(limit)
+        return {"success": True, "data": fallidos, "total": len(fallidos)}
+    except Exception as e:
+        logger.error(f"❌ Error listando emails fallidos: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/email-outbox/{email_id}/reintentar")
+async def reintentar_email_fallido(email_id: int):
+    """Devolver a la cola un email fallido"""
+    try:
+        reencolado = await email_outbox.requeue(email_id)
+    except Exception as e:
+        logger.error(f"❌ Error reencolando email {email_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not reencolado:
+        raise HTTPException(status_code=404, detail="Email fallido no encontrado")
+    return {"success": True, "message": f"Email {email_id} reencolado"}
+
+@app.get("/admin/alert-engine")
+async def obtener_estado_alert_engine():
+    """Estado de la caché del motor de alertas (aciertos, recálculos, foto vigente)"""
+    try:
+        return {
+            "success": True,
+            "alert_engine": alert_engine.metrics(),
+            "evaluador": await alert_evaluator.metrics(),
+            "timestamp": now_ca().isoformat()
+        }
+    except Exception as e:
+        logger.error(f"❌ Error obteniendo estado del motor de alertas: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/alertas-activas/reevaluar")
+async def reevaluar_alertas_activas():
+    """Barrido completo de alertas_activas (normalmente solo se reevalúan las placas modificadas)"""
+    try:
+        resultado = await alert_evaluator.refresh(barrido=True)
+        return {"success": True, "resultado": resultado, "timestamp": now_ca().isoformat()}
+    except Exception as e:
+        logger.error(f"❌ Error reevaluando alertas activas: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/scheduler")
+async def obtener_estado_scheduler():
+    """Tareas programadas: horario, próxima ejecución, duraciones y qué worker es el líder"""
+    try:
+        return {
+            "success": True,
+            "scheduler": await job_scheduler.metrics(),
+            "timestamp": now_ca().isoformat()
+        }
+    except Exception as e:
+        logger.error(f"❌ Error obteniendo estado del programador de tareas: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/scheduler/historial")
+async def obtener_historial_scheduler(job: Optional[str] = None, limit: int = 50):
+    """Ejecuciones recientes de las tareas programadas (de todos los workers) con su duración"""
+    try:
+        ejecuciones = await job_scheduler.history(job, min(limit, 500))
+        return {"success": True, "data": ejecuciones, "total": len(ejecuciones)}
+    except Exception as e:
+        logger.error(f"❌ Error obteniendo historial del programador de tareas: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/scheduler/{job}/ejecutar")
+async def ejecutar_tarea_programada(job: str):
+    """Ejecutar ya una tarea programada en este worker y esperar el resultado"""
+    if job not in job_scheduler.jobs:
+        raise HTTPException(status_code=404, detail=f"Tarea no encontrada: {job}")
+    try:
+        ejecucion = await job_scheduler.run_now(job)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Error ejecutando la tarea {job}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"success": ejecucion["estado"] == "ok", "ejecucion": ejecucion, "timestamp": now_ca().isoformat()}
+
+@app.post("/admin/vehicle-state/rebuild")
+async def reconstruir_vehicle_state():
+    """Recalcular vehicle_state desde el historial (normalmente lo mantienen los triggers)"""
+    try:
+        def _reconstruir(conn):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                placas = rebuild_vehicle_state(conn.cursor())
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return placas
+        
+        placas = await async_db.run(_reconstruir)
+        # La reconstrucción no sube versiones de tabla ni anota placas: reevaluar y descartar la foto a mano
+        await alert_evaluator.refresh(barrido=True)
+        alert_engine.invalidate()
+        logger.info(f"🔄 vehicle_state reconstruida: {placas} vehículos")
+        return {"success": True, "vehiculos": placas, "timestamp": now_ca().isoformat()}
+    except Exception as e:
+        logger.error(f"❌ Error reconstruyendo vehicle_state: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/schema")
+async def obtener_version_esquema():
+    """Versión del esquema y migraciones aplicadas"""
+    try:
+        historial = await async_db.run(get_migration_history)
+        return {
+            "success": True,
+            "version": historial[-1]["version"] if historial else 0,
+            "migraciones": historial,
+            "timestamp": now_ca().isoformat()
+        }
+    except Exception as e:
+        logger.error(f"Error obteniendo versión del esquema: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/data-preservation/manual-backup")
 async def create_manual_preservation_backup():
     """Crear backup manual de preservación"""
@@ -3012,7 +2880,9 @@ async def create_manual_preservation_backup():
         if not DATA_PRESERVATION_ENABLED or not preservation_system:
             raise HTTPException(status_code=503, detail="Sistema de preservación no disponible")
         
-        backup_path, metadata = preservation_system.create_pre_change_backup("Backup manual solicitado por usuario")
+        backup_path, metadata = await run_blocking(
+            preservation_system.create_pre_change_backup, "Backup manual solicitado por usuario"
+        )
         
         if backup_path:
             return {
@@ -3035,7 +2905,7 @@ async def list_preservation_backups():
         if not DATA_PRESERVATION_ENABLED or not preservation_system:
             raise HTTPException(status_code=503, detail="Sistema de preservación no disponible")
         
-        backups = preservation_system.get_available_backups()
+        backups = await run_blocking(preservation_system.get_available_backups)
         
         return {
             "success": True,
@@ -3051,34 +2921,35 @@ async def list_preservation_backups():
 async def verify_user_data():
     """Endpoint especial para que el usuario verifique sus datos"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Obtener todos los vehículos con detalles
-        cursor.execute("""
-            SELECT placa, marca, modelo, ano, color, propietario, poliza, seguro, 
-                   km_inicial, created_at, updated_at 
-            FROM vehiculos ORDER BY placa
-        """)
-        vehiculos = [dict_from_row(row) for row in cursor.fetchall()]
+        def _verificar_datos(conn):
+            cursor = conn.cursor()
         
-        # Obtener conteos de todas las tablas
-        tables_info = {}
-        tables = ['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora']
+            # Obtener todos los vehículos con detalles
+            cursor.execute("""
+                SELECT placa, marca, modelo, ano, color, propietario, poliza, seguro, 
+                       km_inicial, created_at, updated_at 
+                FROM vehiculos ORDER BY placa
+            """)
+            vehiculos = [dict_from_row(row) for row in cursor.fetchall()]
+        
+            # Obtener conteos de todas las tablas
+            tables_info = {}
+            tables = ['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora']
         
-        for table in tables:
-            try:
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                count = cursor.fetchone()[0]
-                tables_info[table] = count
-            except:
-                tables_info[table] = 0
+            for table in tables:
+                try:
+                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                    count = cursor.fetchone()[0]
+                    tables_info[table] = count
+                except:
+                    tables_info[table] = 0
         
-        # Obtener últimos registros de actividad
-        cursor.execute("SELECT * FROM bitacora ORDER BY created_at DESC LIMIT 5")
-        recent_activity = [dict_from_row(row) for row in cursor.fetchall()]
+            # Obtener últimos registros de actividad
+            cursor.execute("SELECT * FROM bitacora ORDER BY created_at DESC LIMIT 5")
+            recent_activity = [dict_from_row(row) for row in cursor.fetchall()]
+            return vehiculos, tables_info, recent_activity
         
-        conn.close()
+        vehiculos, tables_info, recent_activity = await async_db.run(_verificar_datos)
         
         return {
             "success": True,
@@ -3108,41 +2979,48 @@ async def verify_user_data():
 async def force_sync_check():
     """Endpoint para forzar verificación de sincronización de datos"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def _verificar_tablas(conn):
+            cursor = conn.cursor()
         
-        # Obtener conteos actuales
-        sync_report = {
-            "timestamp": datetime.now().isoformat(),
-            "database_status": "CONNECTED",
-            "tables_info": {}
-        }
+            # Obtener conteos actuales
+            sync_report = {
+                "timestamp": datetime.now().isoformat(),
+                "database_status": "CONNECTED",
+                "tables_info": {}
+            }
         
-        tables = ['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora']
+            tables = ['vehiculos', 'mantenimientos', 'combustible', 'revisiones', 'polizas', 'rtv', 'bitacora']
         
-        for table in tables:
-            try:
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                count = cursor.fetchone()[0]
+            for table in tables:
+                try:
+                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                    count = cursor.fetchone()[0]
                 
-                # Obtener últimos registros
-                cursor.execute(f"SELECT * FROM {table} ORDER BY id DESC LIMIT 3")
-                recent = [dict_from_row(row) for row in cursor.fetchall()]
+                    # Obtener últimos registros
+                    cursor.execute(f"SELECT * FROM {table} ORDER BY id DESC LIMIT 3")
+                    recent = [dict_from_row(row) for row in cursor.fetchall()]
                 
-                sync_report["tables_info"][table] = {
-                    "count": count,
-                    "recent_records": recent[:1],  # Solo el más reciente para no sobrecargar
-                    "status": "OK"
-                }
+                    sync_report["tables_info"][table] = {
+                        "count": count,
+                        "recent_records": recent[:1],  # Solo el más reciente para no sobrecargar
+                        "status": "OK"
+                    }
                 
-            except Exception as e:
-                sync_report["tables_info"][table] = {
-                    "count": 0,
-                    "error": str(e),
-                    "status": "ERROR"
-                }
-        
-        conn.close()
+                except Exception as e:
+                    sync_report["tables_info"][table] = {
+                        "count": 0,
+                        "error": str(e),
+                        "status": "ERROR"
+                    }
+            return sync_report
+        
+        sync_report = await async_db.run(_verificar_tablas)
+        
+        # Hash de cada tabla: comparándolo con el de otra base (GET /checksums) se sabe si son idénticas
+        checksums = await async_db.run(checksum_cache.summary)
+        for table, info in sync_report["tables_info"].items():
+            if table in checksums:
+                info["checksum"] = checksums[table]["hash"]
         
         # Calcular totales
         total_records = sum(info.get("count", 0) for info in sync_report["tables_info"].values())
@@ -3173,39 +3051,40 @@ async def force_sync_check():
 async def obtener_historial_alertas(limit: int = 50):
     """Obtener historial de alertas enviadas"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        def _leer_historial(conn):
+            cursor = conn.cursor()
         
-        # Obtener últimas alertas enviadas
-        cursor.execute("""
-            SELECT 
-                id,
-                tipo_alerta,
-                vehiculo_placa,
-                destinatario_email,
-                asunto,
-                mensaje,
-                estado,
-                created_at
-            FROM historial_alertas 
-            ORDER BY created_at DESC 
-            LIMIT ?
-        """, (limit,))
-        
-        alertas = []
-        for row in cursor.fetchall():
-            alertas.append({
-                "id": row[0],
-                "tipo_alerta": row[1],
-                "vehiculo_placa": row[2],
-                "destinatario_email": row[3],
-                "asunto": row[4],
-                "mensaje": row[5],
-                "estado": row[6],
-                "created_at": row[7]
-            })
+            # Obtener últimas alertas enviadas
+            cursor.execute("""
+                SELECT 
+                    id,
+                    tipo_alerta,
+                    vehiculo_placa,
+                    destinatario_email,
+                    asunto,
+                    mensaje,
+                    estado,
+                    created_at
+                FROM historial_alertas 
+                ORDER BY created_at DESC 
+                LIMIT ?
+            """, (limit,))
+        
+            alertas = []
+            for row in cursor.fetchall():
+                alertas.append({
+                    "id": row[0],
+                    "tipo_alerta": row[1],
+                    "vehiculo_placa": row[2],
+                    "destinatario_email": row[3],
+                    "asunto": row[4],
+                    "mensaje": row[5],
+                    "estado": row[6],
+                    "created_at": row[7]
+                })
+            return alertas
         
-        conn.close()
+        alertas = await async_db.run(_leer_historial)
         
         return {
             "success": True,
@@ -3221,10 +3100,7 @@ async def obtener_historial_alertas(limit: int = 50):
 async def registrar_alerta_enviada(alerta_data: dict):
     """Registrar una alerta enviada en el historial"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
+        await async_db.execute("""
             INSERT INTO historial_alertas 
             (tipo_alerta, vehiculo_placa, destinatario_email, asunto, mensaje, estado)
             VALUES (?, ?, ?, ?, ?, ?)
@@ -3237,9 +3113,6 @@ async def registrar_alerta_enviada(alerta_data: dict):
             alerta_data.get("estado", "enviado")
         ))
         
-        conn.commit()
-        conn.close()
-        
         return {
             "success": True,
             "message": "Alerta registrada en historial"
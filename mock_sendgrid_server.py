@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Servidor SendGrid Simulado para Pruebas Locales
+Acepta POST /v3/mail/send como la API real (202, validación básica) sin enviar nada y cuenta
+requests, conexiones y destinatarios. Puede simular el costo del handshake TLS por conexión.
+
+Uso: python mock_sendgrid_server.py [--port 8025] [--handshake-ms 0] [--latencia-ms 0]
+     SENDGRID_API_URL=http://127.0.0.1:8025/v3 SENDGRID_API_KEY=SG.mock python main.py
+"""
+
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sendgrid_email import MAX_PERSONALIZATIONS
+
+class MockSendGridState:
+    """Contadores compartidos por todas las conexiones del servidor"""
+
+    def __init__(self, handshake_seconds=0.0, latency_seconds=0.0):
+        self.handshake_seconds = handshake_seconds
+        self.latency_seconds = latency_seconds
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+            self.recipients = 0
+            self.rejected = 0
+            self.messages = []
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "connections": self.connections,
+                "requests": self.requests,
+                "recipients": self.recipients,
+                "rejected": self.rejected,
+            }
+
+class MockSendGridHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1: la conexión se mantiene abierta entre requests (keep-alive)
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def setup(self):
+        super().setup()
+        # Una instancia del handler por conexión TCP: aquí se "paga" el handshake
+        with self.state.lock:
+            self.state.connections += 1
+        if self.state.handshake_seconds:
+            time.sleep(self.state.handshake_seconds)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _error(self, status, message):
+        with self.state.lock:
+            self.state.rejected += 1
+        self._reply(status, {"errors": [{"message": message}]})
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._reply(200, self.state.snapshot())
+        else:
+            self._reply(404, {"errors": [{"message": "not found"}]})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+
+        if self.path != "/v3/mail/send":
+            return self._reply(404, {"errors": [{"message": "not found"}]})
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self._error(401, "authorization required")
+        try:
+            data = json.loads(raw)
+            personalizations = data["personalizations"]
+            data["from"]["email"]
+            data["content"][0]["value"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return self._error(400, "invalid payload")
+        if not 1 <= len(personalizations) <= MAX_PERSONALIZATIONS:
+            return self._error(400, f"personalizations must contain 1-{MAX_PERSONALIZATIONS} items")
+
+        if self.state.latency_seconds:
+            time.sleep(self.state.latency_seconds)
+
+        with self.state.lock:
+            self.state.requests += 1
+            for personalization in personalizations:
+                for to in personalization.get("to", []):
+                    self.state.recipients += 1
+                    self.state.messages.append({"to": to["email"], "subject": personalization.get("subject")})
+        self._reply(202)
+
+def start_mock_server(port=0, handshake_seconds=0.0, latency_seconds=0.0):
+    """Levantar el servidor en un hilo. Devuelve (server, base_url, state); base_url ya incluye /v3"""
+    state = MockSendGridState(handshake_seconds, latency_seconds)
+    handler = type("BoundMockSendGridHandler", (MockSendGridHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v3"
+    return server, base_url, state
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor SendGrid simulado")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--handshake-ms", type=float, default=0)
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    server, base_url, state = start_mock_server(args.port, args.handshake_ms / 1000, args.latencia_ms / 1000)
+    print(f"📧 SendGrid simulado en {base_url} (estadísticas en GET /stats)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n📊 {state.snapshot()}")
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,11 @@ Monitorea la base de datos para detectar cualquier pérdida de datos
 import sqlite3
 import time
 import json
-import requests
 from datetime import datetime
 import os
 
+from table_checksums import FuenteSQLite, FuenteAPI, compare_sources
+
 class DataChangeMonitor:
     def __init__(self):
         self.db_path = "/home/user/webapp/vehicular_system.db" 
@@ -54,30 +55,25 @@ class DataChangeMonitor:
             return None
     
     def verify_api_consistency(self):
-        """Verificar que la API devuelve los mismos datos que la DB local"""
+        """Verificar que la API devuelve los mismos datos que la DB local (un hash por tabla)"""
         try:
-            # Obtener datos de la API
-            response = requests.get(f"{self.api_url}/vehiculos", timeout=10)
+            local, api = FuenteSQLite(self.db_path), FuenteAPI(self.api_url)
+            try:
+                # Solo la raíz de cada árbol: una petición a la API en lugar de descargar las tablas
+                resultado = compare_sources(local, api, detalle=False)
+            finally:
+                local.close()
+                api.close()
             
-            if response.status_code == 200:
-                api_data = response.json()
-                
-                if api_data.get("success"):
-                    api_vehiculos = api_data.get("data", [])
-                    
-                    # Obtener datos locales
-                    local_state = self.get_current_state()
-                    
-                    if local_state:
-                        local_count = local_state["vehiculos_count"]
-                        api_count = len(api_vehiculos)
-                        
-                        if local_count != api_count:
-                            print(f"⚠️ INCONSISTENCIA: Local={local_count}, API={api_count}")
-                            return False
-                        else:
-                            print(f"✅ Consistencia verificada: {local_count} vehículos")
-                            return True
+            distintas = [table for table, r in resultado.items() if not r["iguales"]]
+            if distintas:
+                for table in distintas:
+                    r = resultado[table]
+                    print(f"⚠️ INCONSISTENCIA en {table}: Local={r['rows_a']}, API={r['rows_b']} "
+                          f"(detalle: python table_checksums.py {self.db_path} {self.api_url} --tables {table})")
+                return False
+            print(f"✅ Consistencia verificada: {len(resultado)} tablas idénticas")
+            return True
                     
         except Exception as e:
             print(f"⚠️ Error verificando API: {e}")
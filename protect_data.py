@@ -6,10 +6,11 @@ Este script DEBE ejecutarse antes de cualquier modificación del sistema
 
 import os
 import sqlite3
-import shutil
 import json
 from datetime import datetime
 
+from db_snapshot import snapshot_database
+
 def backup_database_immediately():
     """Crear backup inmediato de la base de datos actual"""
     db_path = "/home/user/webapp/vehicular_system.db"
@@ -23,7 +24,8 @@ def backup_database_immediately():
     backup_path = f"/home/user/webapp/vehicular_system_PROTECTED_{timestamp}.db"
     
     try:
-        shutil.copy2(db_path, backup_path)
+        # Copia consistente aunque la aplicación esté escribiendo
+        snapshot_database(db_path, backup_path)
         print(f"✅ Backup protectivo creado: {backup_path}")
         
         # Verificar que el backup es válido
@@ -144,10 +144,38 @@ class RailwaySyncMonitor:
         print(f"❌ TIMEOUT: El registro no se guardó en {timeout} segundos")
         return False
     
+    def get_latest_seq(self):
+        """Secuencia más reciente del registro de cambios"""
+        response = requests.get(f"{self.api_base}/changes", params={"since": 0, "limit": 1}, timeout=10)
+        response.raise_for_status()
+        return response.json()["latest"]
+    
+    def get_changes(self, since):
+        """Cambios posteriores a since desde GET /changes (todas las páginas).
+        Devuelve (cambios, nueva secuencia, resync_required)"""
+        changes = []
+        while True:
+            response = requests.get(f"{self.api_base}/changes", params={"since": since, "limit": 1000}, timeout=10)
+            response.raise_for_status()
+            page = response.json()
+            if page.get("resync_required"):
+                return [], page["latest"], True
+            changes.extend(page["changes"])
+            since = page["next"]
+            if not page["has_more"]:
+                return changes, since, False
+    
     def monitor_continuous(self, interval=10):
-        """Monitoreo continuo de cambios"""
+        """Monitoreo continuo de cambios (incremental: solo se descargan las filas modificadas)"""
         print("🔄 Iniciando monitoreo continuo de Railway...")
         
+        # Secuencia antes de la foto completa: lo que cambie mientras tanto llega en el primer ciclo
+        try:
+            since = self.get_latest_seq()
+        except Exception as e:
+            print(f"❌ No se pudo leer el registro de cambios: {e}")
+            return
+        
         # Estado inicial
         self.previous_state = self.get_railway_state()
         if not self.previous_state:
@@ -162,29 +190,35 @@ class RailwaySyncMonitor:
             while self.monitoring:
                 time.sleep(interval)
                 
-                current_state = self.get_railway_state()
-                if not current_state:
+                try:
+                    changes, since, resync = self.get_changes(since)
+                except Exception as e:
+                    logger.error(f"Error obteniendo cambios: {e}")
                     continue
                 
-                changes = self.detect_changes(self.previous_state, current_state)
+                if resync:
+                    # El monitor quedó antes del recorte del registro: volver a tomar la foto completa
+                    print("⚠️ Registro de cambios recortado - recargando estado completo")
+                    self.previous_state = self.get_railway_state() or self.previous_state
+                    continue
                 
                 if changes:
                     print(f"\n🔔 CAMBIOS DETECTADOS - {datetime.now().strftime('%H:%M:%S')}")
                     for change in changes:
-                        print(f"   {change['message']}")
-                        
-                        # Si hay nuevos registros, mostrar detalles
-                        if change['type'] == 'NEW_RECORDS' and change.get('new_records'):
-                            for record in change['new_records']:
-                                if change['endpoint'] == 'vehiculos':
-                                    print(f"      🚗 {record.get('placa')} - {record.get('marca')} {record.get('modelo')}")
-                                
-                        # Si hay pérdidas críticas, alertar
-                        if change['type'] == 'LOST_RECORDS':
-                            print(f"      🚨 ACCIÓN REQUERIDA: Verificar pérdida de datos")
-                            self.create_emergency_backup()
-                
-                self.previous_state = current_state
+                        record = change['data'] or {}
+                        if change['op'] == 'insert':
+                            print(f"   ✅ Nuevo registro en {change['table']} (ID {change['id']})")
+                            if change['table'] == 'vehiculos' and record:
+                                print(f"      🚗 {record.get('placa')} - {record.get('marca')} {record.get('modelo')}")
+                        elif change['op'] == 'update':
+                            print(f"   🔄 Registro actualizado en {change['table']} (ID {change['id']})")
+                        else:
+                            print(f"   🚨 ALERTA: registro eliminado en {change['table']} (ID {change['id']})")
+                    
+                    # Si hay pérdidas, alertar
+                    if any(change['op'] == 'delete' for change in changes):
+                        print(f"      🚨 ACCIÓN REQUERIDA: Verificar pérdida de datos")
+                        self.create_emergency_backup()
                 
         except KeyboardInterrupt:
             print("\n🛑 Monitoreo detenido por usuario")
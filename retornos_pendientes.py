@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Retornos Pendientes (vehículos sin retorno) para el Sistema Vehicular
+El servidor detecta los viajes en curso que superaron su umbral de horas sin registrar el retorno.
+El umbral general sale de config_alertas (horas_retorno_pendiente) y cada vehículo puede tener el
+suyo (vehiculos.horas_retorno_max). La consulta recorre solo los viajes en curso por el índice
+(estado, fecha_salida); el navegador ya no necesita descargar la bitácora completa.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Umbral general si no hay configuración de alertas guardada
+HORAS_RETORNO_DEFAULT = 24
+
+# fecha_salida se compara como texto en el índice: los registros antiguos pueden estar en UTC ('Z')
+# o sin zona, así que el prefiltro es más amplio y el umbral exacto se aplica al leer cada fila
+MARGEN_PREFILTRO = timedelta(hours=12)
+
+def parse_fecha_salida(valor, tz):
+    """Fecha/hora de salida con zona horaria (los registros sin zona se interpretan en tz)"""
+    fecha = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    return fecha if fecha.tzinfo else fecha.replace(tzinfo=tz)
+
+def config_retornos(config_alertas, horas_default=HORAS_RETORNO_DEFAULT):
+    """(avisos habilitados, umbral general en horas) según la configuración de alertas vigente (dict)"""
+    return (bool(config_alertas.get("alertas_bitacora", True)),
+            config_alertas.get("horas_retorno_pendiente") or horas_default)
+
+def find_retornos_pendientes(conn, ahora, horas_default, placa=None, por_vehiculo=True) -> list:
+    """Viajes en curso con más horas sin retorno que su umbral (el del vehículo o horas_default),
+    del más antiguo al más reciente. Con por_vehiculo=False horas_default se aplica a todos"""
+    # El umbral más bajo de la flota fija el corte del recorrido por índice
+    minimo_vehiculo = conn.execute(
+        "SELECT MIN(horas_retorno_max) FROM vehiculos WHERE horas_retorno_max > 0"
+    ).fetchone()[0] if por_vehiculo else None
+    umbral_minimo = min(horas_default, minimo_vehiculo) if minimo_vehiculo else horas_default
+    corte = (ahora - timedelta(hours=umbral_minimo) + MARGEN_PREFILTRO).isoformat()
+
+    filtro_placa = "AND b.placa = ?" if placa else ""
+    rows = conn.execute(f'''
+        SELECT b.id, b.placa, b.chofer, b.fecha_salida, b.km_salida, b.nivel_combustible_salida,
+               b.estado_vehiculo_salida, b.observaciones,
+               v.marca, v.modelo, v.horas_retorno_max
+        FROM bitacora b
+        LEFT JOIN vehiculos v ON v.placa = b.placa
+        WHERE b.estado = 'en_curso' AND b.fecha_salida <= ? {filtro_placa}
+        ORDER BY b.fecha_salida
+    ''', (corte, placa) if placa else (corte,)).fetchall()
+
+    pendientes = []
+    for row in rows:
+        propio = row["horas_retorno_max"] if por_vehiculo else None
+        umbral = propio if (propio or 0) > 0 else horas_default
+        horas = (ahora - parse_fecha_salida(row["fecha_salida"], ahora.tzinfo)).total_seconds() / 3600
+        if horas >= umbral:
+            registro = dict(row)
+            del registro["horas_retorno_max"]
+            registro["umbral_horas"] = umbral
+            registro["horas_pendientes"] = round(horas, 1)
+            pendientes.append(registro)
+    return pendientes
+
+def get_viajes_en_curso(conn, ids) -> list:
+    """Viajes en curso con los ids indicados (los ya retornados se omiten)"""
+    if not ids:
+        return []
+    marcadores = ", ".join("?" for _ in ids)
+    rows = conn.execute(f'''
+        SELECT id, placa, chofer, fecha_salida, km_salida, nivel_combustible_salida
+        FROM bitacora
+        WHERE estado = 'en_curso' AND id IN ({marcadores})
+        ORDER BY fecha_salida
+    ''', list(ids)).fetchall()
+    return [dict(row) for row in rows]
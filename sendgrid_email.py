@@ -7,34 +7,81 @@ Reemplaza SMTP que está bloqueado en Railway
 import os
 import requests
 import json
+import threading
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Límite de la API v3 de SendGrid: personalizations por request
+MAX_PERSONALIZATIONS = 1000
+
 class SendGridEmailService:
     """Servicio de email usando SendGrid API"""
     
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, base_url=None, pool_size=None):
         self.api_key = api_key or os.environ.get('SENDGRID_API_KEY')
-        self.base_url = "https://api.sendgrid.com/v3"
+        self.base_url = base_url or os.environ.get('SENDGRID_API_URL', "https://api.sendgrid.com/v3")
         self.from_email = os.environ.get('SENDGRID_FROM_EMAIL', 'contabilidad2@arenalmanoa.com')
         self.from_name = os.environ.get('SENDGRID_FROM_NAME', 'Sistema Vehicular Hotel Arenal')
-        
+        self.pool_size = pool_size or int(os.environ.get('SENDGRID_POOL_SIZE', '4'))
+        self._session = None
+        self._session_lock = threading.Lock()
+    
+    @property
+    def session(self):
+        """Sesión HTTP compartida: keep-alive evita un handshake TLS nuevo por cada email"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    # Un solo host (api.sendgrid.com); pool_maxsize = envíos simultáneos de la cola
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+    
+    def close(self):
+        """Cerrar las conexiones abiertas del pool"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+    
     def send_email(self, to_email, subject, html_content, text_content=None):
-        """Enviar email usando SendGrid API"""
+        """Enviar email usando SendGrid API. to_email puede ser una lista: una sola llamada por cada 1000 destinatarios"""
         
         if not self.api_key:
             logger.warning("⚠️ SendGrid API key no configurada")
             return {"success": False, "error": "API key no configurada"}
         
-        # Preparar datos para SendGrid
+        recipients = [to_email] if isinstance(to_email, str) else list(to_email)
+        if not recipients:
+            return {"success": False, "error": "Sin destinatarios"}
+        
+        requests_sent = 0
+        for start in range(0, len(recipients), MAX_PERSONALIZATIONS):
+            batch = recipients[start:start + MAX_PERSONALIZATIONS]
+            result = self._post_mail(batch, subject, html_content, text_content)
+            requests_sent += 1
+            if not result["success"]:
+                result["requests"] = requests_sent
+                return result
+        
+        destino = ", ".join(recipients) if len(recipients) <= 3 else f"{len(recipients)} destinatarios"
+        logger.info(f"✅ Email enviado exitosamente a {destino}")
+        return {"success": True, "message": "Email enviado", "recipients": len(recipients), "requests": requests_sent}
+    
+    def _post_mail(self, recipients, subject, html_content, text_content=None):
+        """Un POST /mail/send. Cada destinatario va en su propia personalization (no ve a los demás)"""
         data = {
             "personalizations": [
                 {
-                    "to": [{"email": to_email}],
+                    "to": [{"email": recipient}],
                     "subject": subject
                 }
+                for recipient in recipients
             ],
             "from": {"email": self.from_email, "name": self.from_name},
             "content": [
@@ -57,7 +104,7 @@ class SendGridEmailService:
         }
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/mail/send",
                 headers=headers,
                 json=data,
@@ -65,12 +112,11 @@ class SendGridEmailService:
             )
             
             if response.status_code == 202:
-                logger.info(f"✅ Email enviado exitosamente a {to_email}")
                 return {"success": True, "message": "Email enviado"}
             else:
                 error_msg = f"Error SendGrid {response.status_code}: {response.text}"
                 logger.error(error_msg)
-                return {"success": False, "error": error_msg}
+                return {"success": False, "error": error_msg, "status_code": response.status_code}
                 
         except Exception as e:
             logger.error(f"❌ Error enviando email: {e}")
@@ -134,9 +180,9 @@ class SendGridEmailService:
 # Función global para usar en main.py
 email_service = SendGridEmailService()
 
-def send_system_email(recipient, subject, html_content):
-    """Función compatible con el sistema actual"""
-    return email_service.send_email(recipient, subject, html_content)
+def send_system_email(recipient, subject, html_content, text_content=None):
+    """Función compatible con el sistema actual (recipient: email o lista de emails)"""
+    return email_service.send_email(recipient, subject, html_content, text_content)
 
 def send_alert_notification(alert_data):
     """Enviar notificación de alerta"""
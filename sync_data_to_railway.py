@@ -1,14 +1,27 @@
 #!/usr/bin/env python3
 """
 Sincronizar datos locales con Railway
-Envía los registros de la base de datos local a la API de Railway
+Envía a la API de Railway los registros de la base local que todavía no existen allá.
+La diferencia se calcula con un índice por clave natural (placa+fecha, placa+fecha de salida):
+O(n+m) en vez de buscar cada registro local en toda la lista remota. Los envíos usan una sesión
+HTTP con pool de conexiones, concurrencia acotada, reintentos con backoff y una Idempotency-Key
+por registro, así que repetir la sincronización (o un reintento tras un timeout) no duplica datos.
+
+Uso:
+    python sync_data_to_railway.py --dry-run
+    python sync_data_to_railway.py --api http://127.0.0.1:8000 --db vehicular_system.db --concurrency 8
 """
 
+import argparse
+import hashlib
 import sqlite3
+import threading
+import time
 import requests
-import json
 import logging
-from datetime import datetime
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 import os
 
 # Configurar logging
@@ -16,237 +29,417 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 # URLs de las APIs
-RAILWAY_API = "https://mantenimiento-vehiculos-production.up.railway.app"
+RAILWAY_API = os.environ.get("RAILWAY_API_URL", "https://mantenimiento-vehiculos-production.up.railway.app")
 LOCAL_DB = "vehicular_system.db"
 
-def get_local_data():
+# Filas por página al descargar los listados remotos (máximo de la API)
+PAGE_SIZE = 500
+CONCURRENCY = 8
+MAX_RETRIES = 4
+TIMEOUT = 10
+
+# Respuestas que vale la pena reintentar: saturación y errores del proxy (despliegues, reinicios).
+# La API responde 500 a cualquier error de validación o de datos, que no cambia al repetir
+STATUS_REINTENTABLES = {408, 429, 502, 503, 504}
+
+# ================================
+# CLAVES NATURALES Y DIFERENCIA
+# ================================
+
+def clave_combustible(registro):
+    """Un registro de combustible es el mismo si coincide placa y fecha"""
+    return (registro['placa'].strip().upper(), registro['fecha'])
+
+def clave_bitacora(registro):
+    """Un viaje es el mismo si coincide placa y día de salida (la hora puede diferir)"""
+    # Los viajes se envían con su fecha_salida local, así que en Railway quedan con el mismo día
+    return (registro['placa'].strip().upper(), registro['fecha_salida'][:10])
+
+def calcular_delta(locales, remotos, clave, desactualizado=None):
+    """Registros locales que faltan en remoto: (pendientes, existentes, por_actualizar). O(n+m).
+
+    El índice agrupa los registros remotos por clave (del más antiguo al más nuevo); cada local
+    consume uno. Si un día hay dos cargas de la misma placa en local y una en remoto, solo falta
+    enviar una. por_actualizar: pares (local, remoto) ya sincronizados para los que
+    desactualizado(local, remoto) es verdadero (p. ej. un viaje que en remoto sigue en curso).
+    """
+    disponibles = defaultdict(deque)
+    for registro in sorted(remotos, key=lambda r: r.get('id') or 0):
+        disponibles[clave(registro)].append(registro)
+    pendientes, existentes, por_actualizar = [], 0, []
+    for registro in locales:
+        k = clave(registro)
+        if disponibles[k]:
+            remoto = disponibles[k].popleft()
+            existentes += 1
+            if desactualizado is not None and desactualizado(registro, remoto):
+                por_actualizar.append((registro, remoto))
+        else:
+            pendientes.append(registro)
+    return pendientes, existentes, por_actualizar
+
+def idempotency_key(tabla, registro, clave):
+    """Clave estable por registro local: la misma en cada ejecución, distinta entre registros"""
+    raw = "|".join([tabla, str(registro.get('id')), *map(str, clave(registro))])
+    return "sync-" + hashlib.sha256(raw.encode()).hexdigest()[:40]
+
+# ================================
+# CLIENTE HTTP
+# ================================
+
+class RailwayClient:
+    """Sesión HTTP compartida por los hilos de envío, con reintentos y métricas"""
+
+    def __init__(self, base_url, pool_size=CONCURRENCY, max_retries=MAX_RETRIES, timeout=TIMEOUT,
+                 backoff_base=0.5):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.session = requests.Session()
+        # Un solo host; pool_maxsize = envíos simultáneos (keep-alive, sin handshake TLS por registro)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.reintentos = 0
+        self.latencias = []
+
+    def close(self):
+        self.session.close()
+
+    def request(self, method, path, json=None, params=None, idempotency_key=None):
+        """Petición con reintentos (errores de red, 429 y 5xx). Devuelve la última respuesta"""
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        intento = 0
+        while True:
+            inicio = time.perf_counter()
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", json=json, params=params,
+                                                headers=headers, timeout=self.timeout)
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+            with self._lock:
+                self.requests += 1
+                self.latencias.append(time.perf_counter() - inicio)
+
+            reintentable = error is not None or response.status_code in STATUS_REINTENTABLES
+            # Sin Idempotency-Key un POST reintentado podría duplicar el registro (un 502 o 504 no
+            # garantiza que la API no lo haya guardado)
+            if method == "POST" and not idempotency_key:
+                reintentable = False
+            if not reintentable or intento >= self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+
+            intento += 1
+            with self._lock:
+                self.reintentos += 1
+            espera = self.backoff_base * (2 ** (intento - 1))
+            if response is not None and response.headers.get("Retry-After", "").isdigit():
+                espera = max(espera, int(response.headers["Retry-After"]))
+            logger.debug(f"🔁 Reintento {intento}/{self.max_retries} de {method} {path} en {espera:.1f}s")
+            time.sleep(espera)
+
+    def get_all(self, path):
+        """Descargar un listado completo siguiendo la paginación por cursor"""
+        registros, after = [], None
+        while True:
+            params = {"limit": PAGE_SIZE}
+            if after:
+                params["after"] = after
+            response = self.request("GET", path, params=params)
+            response.raise_for_status()
+            page = response.json()
+            registros.extend(page['data'])
+            after = page.get('next_cursor')
+            if not page.get('has_more') or not after:
+                return registros
+
+    def latencia_percentil(self, percentil):
+        with self._lock:
+            latencias = sorted(self.latencias)
+        if not latencias:
+            return 0.0
+        return latencias[min(len(latencias) - 1, int(len(latencias) * percentil))]
+
+# ================================
+# LECTURA DE DATOS
+# ================================
+
+def get_local_data(db_path=LOCAL_DB):
     """Obtener datos de la base de datos local"""
-    if not os.path.exists(LOCAL_DB):
-        logger.error(f"❌ Base de datos local no encontrada: {LOCAL_DB}")
+    if not os.path.exists(db_path):
+        logger.error(f"❌ Base de datos local no encontrada: {db_path}")
         return None, None
-    
-    conn = sqlite3.connect(LOCAL_DB)
+
+    conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
+
     try:
-        # Obtener registros de combustible
-        cursor.execute("SELECT * FROM combustible ORDER BY fecha DESC")
-        combustible_local = [dict(row) for row in cursor.fetchall()]
-        
-        # Obtener registros de bitácora  
-        cursor.execute("SELECT * FROM bitacora ORDER BY fecha_salida DESC")
-        bitacora_local = [dict(row) for row in cursor.fetchall()]
-        
-        conn.close()
-        
+        combustible_local = [dict(row) for row in conn.execute("SELECT * FROM combustible ORDER BY fecha, id")]
+        bitacora_local = [dict(row) for row in conn.execute("SELECT * FROM bitacora ORDER BY fecha_salida, id")]
+
         logger.info(f"📊 Datos locales: {len(combustible_local)} combustible, {len(bitacora_local)} bitácora")
         return combustible_local, bitacora_local
-        
+
     except Exception as e:
         logger.error(f"❌ Error leyendo datos locales: {e}")
-        conn.close()
         return None, None
+    finally:
+        conn.close()
 
-def get_railway_data():
-    """Obtener datos existentes en Railway"""
-    try:
-        # Obtener combustible de Railway
-        response = requests.get(f"{RAILWAY_API}/combustible", timeout=10)
-        combustible_railway = response.json()['data'] if response.ok else []
-        
-        # Obtener bitácora de Railway
-        response = requests.get(f"{RAILWAY_API}/bitacora", timeout=10)
-        bitacora_railway = response.json()['data'] if response.ok else []
-        
-        logger.info(f"🌐 Datos Railway: {len(combustible_railway)} combustible, {len(bitacora_railway)} bitácora")
-        return combustible_railway, bitacora_railway
-        
-    except Exception as e:
-        logger.error(f"❌ Error obteniendo datos de Railway: {e}")
-        return [], []
+def get_railway_data(client):
+    """Obtener datos existentes en Railway (todas las páginas)"""
+    combustible_railway = client.get_all("/combustible")
+    bitacora_railway = client.get_all("/bitacora")
+    logger.info(f"🌐 Datos Railway: {len(combustible_railway)} combustible, {len(bitacora_railway)} bitácora")
+    return combustible_railway, bitacora_railway
 
-def enviar_combustible_a_railway(registro):
-    """Enviar un registro de combustible a Railway"""
-    try:
-        # Preparar datos para Railway
-        data = {
-            "placa": registro['placa'],
-            "fecha": registro['fecha'],
-            "litros": float(registro['litros']),
-            "costo": float(registro['costo']),
-            "kilometraje": int(registro['kilometraje']) if registro['kilometraje'] else 0,
-            "estacion": registro['estacion'] or "Importado desde local"
-        }
-        
-        logger.info(f"📤 Enviando combustible: {data['placa']} - {data['fecha']} - {data['litros']}L")
-        
-        response = requests.post(
-            f"{RAILWAY_API}/combustible",
-            json=data,
-            headers={'Content-Type': 'application/json'},
-            timeout=10
-        )
-        
-        if response.ok:
-            result = response.json()
-            logger.info(f"✅ Combustible enviado exitosamente: ID {result.get('id', 'N/A')}")
-            return True
-        else:
-            logger.error(f"❌ Error enviando combustible: {response.status_code} - {response.text}")
-            return False
-            
-    except Exception as e:
-        logger.error(f"❌ Error en envío de combustible: {e}")
-        return False
+# ================================
+# ENVÍOS
+# ================================
 
-def enviar_bitacora_a_railway(registro):
-    """Enviar un registro de bitácora a Railway"""
-    try:
-        # Determinar si es salida o retorno completo
-        if registro['estado'] == 'completado' and registro['fecha_retorno']:
-            # Enviar salida y retorno
-            return enviar_salida_y_retorno(registro)
-        else:
-            # Enviar solo salida
-            return enviar_solo_salida(registro)
-            
-    except Exception as e:
-        logger.error(f"❌ Error en envío de bitácora: {e}")
-        return False
+def _error(response):
+    return f"{response.status_code} - {response.text[:200]}"
 
-def enviar_solo_salida(registro):
-    """Enviar solo registro de salida"""
-    try:
-        data = {
-            "placa": registro['placa'],
-            "chofer": registro['chofer'],
-            "km_salida": int(registro['km_salida']),
-            "nivel_combustible_salida": registro['nivel_combustible_salida'],
-            "estado_vehiculo_salida": registro['estado_vehiculo_salida'],
-            "observaciones": registro['observaciones'] or ""
-        }
-        
-        logger.info(f"📤 Enviando salida: {data['placa']} - {data['chofer']}")
-        
-        response = requests.post(
-            f"{RAILWAY_API}/bitacora/salida",
-            json=data,
-            headers={'Content-Type': 'application/json'},
-            timeout=10
-        )
-        
-        if response.ok:
-            result = response.json()
-            bitacora_id = result.get('bitacora_id')
-            logger.info(f"✅ Salida enviada exitosamente: ID {bitacora_id}")
-            return bitacora_id
-        else:
-            logger.error(f"❌ Error enviando salida: {response.status_code} - {response.text}")
-            return False
-            
-    except Exception as e:
-        logger.error(f"❌ Error en envío de salida: {e}")
-        return False
+def _repetido(response):
+    """La API ya había aplicado esta Idempotency-Key y devolvió la respuesta original"""
+    return response.headers.get("Idempotent-Replayed") == "true"
 
-def enviar_retorno(bitacora_id, registro):
-    """Enviar registro de retorno"""
-    try:
-        data = {
-            "km_retorno": int(registro['km_retorno']),
-            "nivel_combustible_retorno": registro['nivel_combustible_retorno'],
-            "estado_vehiculo_retorno": registro['estado_vehiculo_retorno'],
-            "observaciones": registro['observaciones'] or ""
-        }
-        
-        logger.info(f"📤 Enviando retorno para bitácora ID {bitacora_id}")
-        
-        response = requests.put(
-            f"{RAILWAY_API}/bitacora/{bitacora_id}/retorno",
-            json=data,
-            headers={'Content-Type': 'application/json'},
-            timeout=10
-        )
-        
-        if response.ok:
-            result = response.json()
-            logger.info(f"✅ Retorno enviado exitosamente")
-            return True
-        else:
-            logger.error(f"❌ Error enviando retorno: {response.status_code} - {response.text}")
-            return False
-            
-    except Exception as e:
-        logger.error(f"❌ Error en envío de retorno: {e}")
-        return False
-
-def enviar_salida_y_retorno(registro):
-    """Enviar salida y luego retorno"""
-    # Primero enviar la salida
-    bitacora_id = enviar_solo_salida(registro)
-    
-    if bitacora_id:
-        # Luego enviar el retorno
-        return enviar_retorno(bitacora_id, registro)
-    else:
-        return False
-
-def sincronizar_datos():
-    """Función principal de sincronización"""
-    logger.info("🚀 === INICIANDO SINCRONIZACIÓN LOCAL → RAILWAY ===")
-    
-    # Obtener datos
-    combustible_local, bitacora_local = get_local_data()
+def enviar_combustible_a_railway(client, registro):
+    """Enviar un registro de combustible a Railway. False si ya se había enviado antes"""
+    data = {
+        "placa": registro['placa'],
+        "fecha": registro['fecha'],
+        "litros": float(registro['litros']),
+        "costo": float(registro['costo']),
+        "kilometraje": int(registro['kilometraje']) if registro['kilometraje'] else 0,
+        "estacion": registro['estacion'] or "Importado desde local"
+    }
+    response = client.request("POST", "/combustible", json=data,
+                              idempotency_key=idempotency_key("combustible", registro, clave_combustible))
+    if not response.ok:
+        raise RuntimeError(f"combustible {data['placa']} {data['fecha']}: {_error(response)}")
+    logger.debug(f"✅ Combustible enviado: {data['placa']} - {data['fecha']} - {data['litros']}L")
+    return not _repetido(response)
+
+def _viaje_completado(registro):
+    return registro['estado'] == 'completado' and registro['fecha_retorno']
+
+def retorno_pendiente(local, remoto):
+    """El viaje terminó en local pero en Railway sigue en curso (p. ej. falló el envío del retorno)"""
+    return bool(_viaje_completado(local)) and remoto.get('estado') == 'en_curso'
+
+def _enviar_retorno(client, bitacora_id, registro):
+    """PUT del retorno con su fecha local: repetirlo deja el viaje igual"""
+    retorno = {
+        "km_retorno": int(registro['km_retorno']),
+        "nivel_combustible_retorno": registro['nivel_combustible_retorno'],
+        "estado_vehiculo_retorno": registro['estado_vehiculo_retorno'],
+        "observaciones": registro['observaciones'] or "",
+        "fecha_retorno": registro['fecha_retorno']
+    }
+    response = client.request("PUT", f"/bitacora/{bitacora_id}/retorno", json=retorno)
+    if not response.ok:
+        raise RuntimeError(f"retorno de bitácora {bitacora_id}: {_error(response)}")
+
+def enviar_bitacora_a_railway(client, registro):
+    """Enviar la salida y, si el viaje está completado, el retorno, con sus fechas locales.
+    False si la salida ya se había enviado antes (el retorno se envía igual: pudo haber fallado)"""
+    data = {
+        "placa": registro['placa'],
+        "chofer": registro['chofer'],
+        "km_salida": int(registro['km_salida']),
+        "nivel_combustible_salida": registro['nivel_combustible_salida'],
+        "estado_vehiculo_salida": registro['estado_vehiculo_salida'],
+        "observaciones": registro['observaciones'] or "",
+        "fecha_salida": registro['fecha_salida']
+    }
+    response = client.request("POST", "/bitacora/salida", json=data,
+                              idempotency_key=idempotency_key("bitacora", registro, clave_bitacora))
+    if not response.ok:
+        raise RuntimeError(f"salida {data['placa']} {registro['fecha_salida'][:10]}: {_error(response)}")
+    bitacora_id = response.json().get('bitacora_id')
+    nuevo = not _repetido(response)
+
+    if _viaje_completado(registro):
+        _enviar_retorno(client, bitacora_id, registro)
+    logger.debug(f"✅ Bitácora enviada: {data['placa']} - {data['chofer']} (ID {bitacora_id})")
+    return nuevo
+
+def actualizar_retorno_en_railway(client, par):
+    """Completar en Railway un viaje ya sincronizado que allá sigue en curso"""
+    local, remoto = par
+    _enviar_retorno(client, remoto['id'], local)
+    logger.debug(f"✅ Retorno enviado: {local['placa']} (ID remoto {remoto['id']})")
+    return True
+
+def enviar_lote(client, tabla, registros, enviar, concurrency):
+    """Enviar registros en paralelo (como máximo `concurrency` a la vez). Devuelve (exitosos, repetidos, errores)"""
+    exitosos, repetidos, errores = 0, 0, []
+    if not registros:
+        return exitosos, repetidos, errores
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"sync-{tabla}") as executor:
+        futures = [executor.submit(enviar, client, registro) for registro in registros]
+        for future in as_completed(futures):
+            try:
+                if future.result():
+                    exitosos += 1
+                else:
+                    repetidos += 1
+            except Exception as e:
+                errores.append(str(e))
+                logger.error(f"❌ Error enviando {tabla}: {e}")
+    return exitosos, repetidos, errores
+
+# ================================
+# SINCRONIZACIÓN
+# ================================
+
+# (tabla, clave natural, envío de lo que falta, cuándo un registro ya enviado está desactualizado, actualización)
+TABLAS = (
+    ("combustible", clave_combustible, enviar_combustible_a_railway, None, None),
+    ("bitacora", clave_bitacora, enviar_bitacora_a_railway, retorno_pendiente, actualizar_retorno_en_railway),
+)
+
+def imprimir_resumen_delta(deltas, muestra=10):
+    """Resumen de lo que se enviaría (dry-run)"""
+    logger.info("🔍 === DIFERENCIA LOCAL → RAILWAY (dry-run, no se envía nada) ===")
+    for tabla, delta in deltas.items():
+        logger.info(f"   {tabla}: {delta['locales']} locales, {delta['remotos']} en Railway, "
+                    f"{delta['existentes']} ya sincronizados, {len(delta['pendientes'])} por enviar, "
+                    f"{len(delta['por_actualizar'])} por actualizar")
+        for registro in delta['pendientes'][:muestra]:
+            placa, fecha = delta['clave'](registro)
+            logger.info(f"      + {placa} {fecha} (id local {registro.get('id')})")
+        if len(delta['pendientes']) > muestra:
+            logger.info(f"      ... y {len(delta['pendientes']) - muestra} más")
+
+def imprimir_rendimiento(reporte):
+    logger.info("📈 === RENDIMIENTO ===")
+    logger.info(f"   Descarga remota: {reporte['descarga_s']:.2f}s | diferencia: {reporte['delta_ms']:.1f} ms | "
+                f"envío: {reporte['envio_s']:.2f}s")
+    logger.info(f"   {reporte['procesados']} registros procesados ({reporte['registros_por_s']:.1f} reg/s), "
+                f"{reporte['requests']} requests ({reporte['requests_por_s']:.1f} req/s), "
+                f"{reporte['reintentos']} reintentos")
+    logger.info(f"   Latencia: p50 {reporte['latencia_p50_ms']:.0f} ms | p95 {reporte['latencia_p95_ms']:.0f} ms")
+
+def sincronizar_datos(api_url=RAILWAY_API, db_path=LOCAL_DB, dry_run=False, concurrency=CONCURRENCY,
+                      max_retries=MAX_RETRIES):
+    """Función principal de sincronización. Devuelve el reporte (None si no hay datos locales)"""
+    logger.info(f"🚀 === INICIANDO SINCRONIZACIÓN LOCAL → RAILWAY ({api_url}) ===")
+
+    combustible_local, bitacora_local = get_local_data(db_path)
     if not combustible_local and not bitacora_local:
         logger.error("❌ No hay datos locales para sincronizar")
-        return
-    
-    combustible_railway, bitacora_railway = get_railway_data()
-    
-    # Sincronizar combustible
-    logger.info("⛽ === SINCRONIZANDO COMBUSTIBLE ===")
-    combustible_exitosos = 0
-    
-    for registro in combustible_local:
-        # Verificar si ya existe en Railway (por placa y fecha)
-        existe = any(
-            r['placa'] == registro['placa'] and r['fecha'] == registro['fecha'] 
-            for r in combustible_railway
-        )
-        
-        if not existe:
-            if enviar_combustible_a_railway(registro):
-                combustible_exitosos += 1
-        else:
-            logger.info(f"⏭️ Combustible ya existe: {registro['placa']} - {registro['fecha']}")
-    
-    # Sincronizar bitácora
-    logger.info("📝 === SINCRONIZANDO BITÁCORA ===")
-    bitacora_exitosos = 0
-    
-    for registro in bitacora_local:
-        # Verificar si ya existe en Railway (por placa y fecha de salida)
-        existe = any(
-            r['placa'] == registro['placa'] and 
-            r['fecha_salida'][:10] == registro['fecha_salida'][:10]  # Comparar solo fecha, no hora
-            for r in bitacora_railway
-        )
-        
-        if not existe:
-            if enviar_bitacora_a_railway(registro):
-                bitacora_exitosos += 1
-        else:
-            logger.info(f"⏭️ Bitácora ya existe: {registro['placa']} - {registro['fecha_salida'][:10]}")
-    
+        return None
+
+    client = RailwayClient(api_url, pool_size=concurrency, max_retries=max_retries)
+    try:
+        inicio = time.perf_counter()
+        combustible_railway, bitacora_railway = get_railway_data(client)
+        descarga = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        locales = {"combustible": combustible_local, "bitacora": bitacora_local}
+        remotos = {"combustible": combustible_railway, "bitacora": bitacora_railway}
+        deltas = {}
+        for tabla, clave, _, desactualizado, _ in TABLAS:
+            pendientes, existentes, por_actualizar = calcular_delta(locales[tabla], remotos[tabla], clave,
+                                                                    desactualizado)
+            deltas[tabla] = {"locales": len(locales[tabla]), "remotos": len(remotos[tabla]),
+                             "existentes": existentes, "pendientes": pendientes,
+                             "por_actualizar": por_actualizar, "clave": clave}
+        delta_ms = (time.perf_counter() - inicio) * 1000
+
+        if dry_run:
+            imprimir_resumen_delta(deltas)
+
+        requests_previos = client.requests
+        inicio = time.perf_counter()
+        resultados = {}
+        for tabla, _, enviar, _, actualizar in TABLAS:
+            pendientes, por_actualizar = deltas[tabla]['pendientes'], deltas[tabla]['por_actualizar']
+            if dry_run:
+                resultados[tabla] = {"pendientes": len(pendientes), "enviados": 0, "repetidos": 0,
+                                     "por_actualizar": len(por_actualizar), "actualizados": 0, "errores": []}
+                continue
+            logger.info(f"📤 {tabla}: enviando {len(pendientes)} registros ({concurrency} en paralelo)")
+            exitosos, repetidos, errores = enviar_lote(client, tabla, pendientes, enviar, concurrency)
+            actualizados = 0
+            if por_actualizar:
+                logger.info(f"📤 {tabla}: actualizando {len(por_actualizar)} registros ya enviados")
+                actualizados, _, errores_actualizacion = enviar_lote(client, tabla, por_actualizar, actualizar,
+                                                                     concurrency)
+                errores += errores_actualizacion
+            resultados[tabla] = {"pendientes": len(pendientes), "enviados": exitosos, "repetidos": repetidos,
+                                 "por_actualizar": len(por_actualizar), "actualizados": actualizados,
+                                 "errores": errores}
+        envio = time.perf_counter() - inicio
+
+        enviados = sum(r["enviados"] + r["actualizados"] for r in resultados.values())
+        procesados = enviados + sum(r["repetidos"] for r in resultados.values())
+        requests_envio = client.requests - requests_previos
+        reporte = {
+            "dry_run": dry_run,
+            "tablas": {tabla: {**resultados[tabla], "locales": deltas[tabla]["locales"],
+                               "remotos": deltas[tabla]["remotos"], "existentes": deltas[tabla]["existentes"]}
+                       for tabla in resultados},
+            "enviados": enviados,
+            "descarga_s": descarga,
+            "delta_ms": delta_ms,
+            "envio_s": envio,
+            "requests": client.requests,
+            "reintentos": client.reintentos,
+            "procesados": procesados,
+            "registros_por_s": procesados / envio if envio > 0 else 0.0,
+            "requests_por_s": requests_envio / envio if envio > 0 else 0.0,
+            "latencia_p50_ms": client.latencia_percentil(0.50) * 1000,
+            "latencia_p95_ms": client.latencia_percentil(0.95) * 1000,
+        }
+    finally:
+        client.close()
+
     # Resumen final
     logger.info("🎯 === RESUMEN DE SINCRONIZACIÓN ===")
-    logger.info(f"✅ Combustible sincronizado: {combustible_exitosos}/{len(combustible_local)}")
-    logger.info(f"✅ Bitácora sincronizada: {bitacora_exitosos}/{len(bitacora_local)}")
-    
-    if combustible_exitosos > 0 or bitacora_exitosos > 0:
+    for tabla, r in reporte["tablas"].items():
+        if dry_run:
+            logger.info(f"🔍 {tabla}: {r['pendientes']} por enviar, {r['por_actualizar']} por actualizar")
+        else:
+            logger.info(f"✅ {tabla} sincronizado: {r['enviados']}/{r['pendientes']} "
+                        f"({r['existentes']} ya existían, {r['repetidos']} ya enviados antes, "
+                        f"{r['actualizados']}/{r['por_actualizar']} actualizados, {len(r['errores'])} errores)")
+    imprimir_rendimiento(reporte)
+
+    if dry_run:
+        logger.info("ℹ️ Dry-run: ejecutar sin --dry-run para enviar los registros.")
+    elif enviados > 0:
         logger.info("🎉 ¡Sincronización completada! Los datos deberían aparecer en Railway ahora.")
-    else:
+    elif not any(r["errores"] for r in reporte["tablas"].values()):
         logger.info("ℹ️ Todos los datos ya estaban sincronizados.")
+    return reporte
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincronizar la base local con la API de Railway")
+    parser.add_argument("--api", default=RAILWAY_API, help="URL base de la API (p.ej. http://127.0.0.1:8000)")
+    parser.add_argument("--db", default=LOCAL_DB, help="Base SQLite local")
+    parser.add_argument("--dry-run", action="store_true", help="Solo mostrar la diferencia, sin enviar")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Envíos simultáneos")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES, help="Reintentos por petición")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Detalle por registro")
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+
+    reporte = sincronizar_datos(args.api, args.db, dry_run=args.dry_run,
+                                concurrency=max(1, args.concurrency), max_retries=max(0, args.retries))
+    errores = sum(len(r["errores"]) for r in reporte["tablas"].values()) if reporte else 1
+    raise SystemExit(1 if errores else 0)
 
 if __name__ == "__main__":
-    sincronizar_datos()
\ No newline at end of file
+    main()
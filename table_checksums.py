@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Checksums por Tabla (árbol de Merkle) para el Sistema Vehicular
+Cada tabla se resume en un árbol de hashes sobre rangos fijos de id: las hojas cubren 256 ids y cada
+nivel superior combina dos rangos vecinos. Dos despliegues (o un despliegue y un backup) comparan
+primero un hash por tabla y bajan solo por los rangos que difieren hasta encontrar las filas
+distintas, en vez de descargar tablas completas o conformarse con COUNT(*).
+El árbol se calcula en una sola pasada por la tabla y se reutiliza mientras no cambie su versión.
+
+Uso (comparar dos fuentes: archivo SQLite o URL de la API):
+    python table_checksums.py vehicular_system.db https://mantenimiento-vehiculos-production.up.railway.app
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from collections import namedtuple
+
+from change_log import CHANGE_LOG_TABLES
+from table_versions import get_table_versions
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_TABLES = CHANGE_LOG_TABLES
+
+# Hojas de 2^8 = 256 ids. Altura fija: la raíz cubre los mismos ids en cualquier base y los nodos
+# (nivel, índice) se pueden comparar directamente sin acordar nada antes
+BUCKET_BITS = 8
+TREE_HEIGHT = 32
+MAX_DEPTH = 8
+
+# levels[nivel] = {índice: (hash, filas)} solo con los nodos que tienen filas
+ArbolTabla = namedtuple("ArbolTabla", "table version rows max_id levels")
+
+_codificar = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=str).encode
+
+def row_hasher(description):
+    """Función de hash para las filas de una consulta, independiente del orden de las columnas.
+    Los NULL se omiten: una columna agregada por una migración (NULL en todas las filas) no
+    distingue una base de un backup anterior"""
+    columnas = [columna[0] for columna in description]
+    orden = [(columnas[i], i) for i in sorted(range(len(columnas)), key=columnas.__getitem__)]
+
+    def row_hash(row) -> str:
+        valores = {columna: row[i] for columna, i in orden if row[i] is not None}
+        return hashlib.sha256(_codificar(valores).encode()).hexdigest()
+    return row_hash
+
+def _combinar(izquierdo, derecho) -> str:
+    return hashlib.sha256(f"{izquierdo or '-'}|{derecho or '-'}".encode()).hexdigest()
+
+def rango_ids(level, index) -> tuple:
+    """Ids [desde, hasta) que cubre un nodo"""
+    bits = level + BUCKET_BITS
+    return index << bits, (index + 1) << bits
+
+def _hoja(row_id) -> int:
+    return min(row_id >> BUCKET_BITS, (1 << TREE_HEIGHT) - 1)
+
+def build_tree(conn, table, version=None) -> ArbolTabla:
+    """Calcular el árbol de una tabla en una pasada (las filas se leen en orden de id sin cargarlas todas)"""
+    hojas = {}
+    hoja_actual, digest, filas = None, None, 0
+    total, max_id = 0, None
+    cursor = conn.execute(f"SELECT * FROM {table} ORDER BY id")
+    row_hash = row_hasher(cursor.description)
+    posicion_id = [columna[0] for columna in cursor.description].index("id")
+    for row in cursor:
+        row_id = row[posicion_id]
+        indice = _hoja(row_id)
+        if indice != hoja_actual:
+            if hoja_actual is not None:
+                hojas[hoja_actual] = (digest.hexdigest(), filas)
+            hoja_actual, digest, filas = indice, hashlib.sha256(), 0
+        digest.update(row_hash(row).encode())
+        filas += 1
+        total += 1
+        max_id = row_id
+    if hoja_actual is not None:
+        hojas[hoja_actual] = (digest.hexdigest(), filas)
+
+    levels = [hojas]
+    for _ in range(TREE_HEIGHT):
+        inferior, superior = levels[-1], {}
+        for indice in {i >> 1 for i in inferior}:
+            izquierdo = inferior.get(indice << 1, (None, 0))
+            derecho = inferior.get((indice << 1) + 1, (None, 0))
+            superior[indice] = (_combinar(izquierdo[0], derecho[0]), izquierdo[1] + derecho[1])
+        levels.append(superior)
+    return ArbolTabla(table, version, total, max_id, levels)
+
+def _nodo(level, index, hash_, filas) -> dict:
+    desde, hasta = rango_ids(level, index)
+    return {"level": level, "index": index, "desde_id": desde, "hasta_id": hasta, "hash": hash_, "rows": filas}
+
+def tree_summary(arbol) -> dict:
+    """Raíz del árbol: un hash por tabla"""
+    raiz, _ = arbol.levels[TREE_HEIGHT].get(0, (None, 0))
+    return {"version": arbol.version, "rows": arbol.rows, "max_id": arbol.max_id, "hash": raiz}
+
+def tree_node(conn, arbol, level, index, depth=1) -> dict:
+    """Un nodo con sus descendientes `depth` niveles más abajo (solo los que tienen filas).
+    En una hoja (level 0) devuelve el hash de cada fila para ubicar exactamente las distintas"""
+    if not 0 <= level <= TREE_HEIGHT or not 0 <= index < (1 << (TREE_HEIGHT - level)):
+        raise ValueError(f"Nodo fuera del árbol: nivel 0-{TREE_HEIGHT}, índice según el nivel")
+    hash_, filas = arbol.levels[level].get(index, (None, 0))
+    nodo = {"table": arbol.table, "version": arbol.version, **_nodo(level, index, hash_, filas)}
+    if level == 0:
+        desde, hasta = rango_ids(0, index)
+        cursor = conn.execute(f"SELECT * FROM {arbol.table} WHERE id >= ? AND id < ? ORDER BY id",
+                              (desde, hasta))
+        row_hash = row_hasher(cursor.description)
+        posicion_id = [columna[0] for columna in cursor.description].index("id")
+        nodo["row_hashes"] = {str(row[posicion_id]): row_hash(row) for row in cursor}
+        return nodo
+    nivel_hijos = max(0, level - max(1, min(depth, MAX_DEPTH)))
+    desplazamiento = level - nivel_hijos
+    primero, ultimo = index << desplazamiento, (index + 1) << desplazamiento
+    hijos = arbol.levels[nivel_hijos]
+    if len(hijos) < ultimo - primero:
+        candidatos = sorted(i for i in hijos if primero <= i < ultimo)
+    else:
+        candidatos = [i for i in range(primero, ultimo) if i in hijos]
+    nodo["children"] = [_nodo(nivel_hijos, i, *hijos[i]) for i in candidatos]
+    return nodo
+
+class ChecksumCache:
+    """Árboles por tabla en memoria; se recalcula una tabla solo cuando cambia su versión"""
+
+    def __init__(self, tables=CHECKSUM_TABLES):
+        self.tables = tuple(tables)
+        self._arboles = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+
+    def tree(self, conn, table) -> ArbolTabla:
+        if table not in self.tables:
+            raise ValueError(f"Tabla sin checksum: {table}")
+        version = get_table_versions(conn, (table,))[table]
+        arbol = self._arboles.get(table)
+        if arbol is not None and arbol.version == version:
+            self.hits += 1
+            return arbol
+        with self._lock:
+            arbol = self._arboles.get(table)
+            if arbol is not None and arbol.version == version:
+                return arbol
+            # Versión y filas en la misma transacción de lectura: el árbol corresponde exactamente a la versión
+            conn.execute("BEGIN")
+            try:
+                version = get_table_versions(conn, (table,))[table]
+                arbol = build_tree(conn, table, version)
+            finally:
+                conn.rollback()
+            self._arboles[table] = arbol
+            self.builds += 1
+            return arbol
+
+    def summary(self, conn, tables=None) -> dict:
+        return {table: tree_summary(self.tree(conn, table)) for table in (tables or self.tables)}
+
+    def node(self, conn, table, level, index, depth=1) -> dict:
+        return tree_node(conn, self.tree(conn, table), level, index, depth)
+
+    def metrics(self) -> dict:
+        return {
+            "tablas_en_cache": {table: arbol.version for table, arbol in self._arboles.items()},
+            "calculos": self.builds,
+            "hits": self.hits,
+        }
+
+# ================================
+# COMPARACIÓN ENTRE DOS FUENTES
+# ================================
+
+class FuenteSQLite:
+    """Checksums de un archivo SQLite (la base local o un backup)"""
+
+    def __init__(self, db_path):
+        self.nombre = db_path
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        self.conn.row_factory = sqlite3.Row
+        self.peticiones = 0
+        self._arboles = {}
+
+    def _tree(self, table):
+        if table not in self._arboles:
+            self._arboles[table] = build_tree(self.conn, table)
+        return self._arboles[table]
+
+    def summary(self, tables):
+        self.peticiones += 1
+        return {table: tree_summary(self._tree(table)) for table in tables}
+
+    def node(self, table, level, index, depth):
+        self.peticiones += 1
+        return tree_node(self.conn, self._tree(table), level, index, depth)
+
+    def close(self):
+        self.conn.close()
+
+class FuenteAPI:
+    """Checksums de un despliegue (GET /checksums)"""
+
+    def __init__(self, base_url, timeout=30):
+        import requests
+        self.nombre = base_url
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.peticiones = 0
+
+    def _get(self, path, params):
+        self.peticiones += 1
+        response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def summary(self, tables):
+        return self._get("/checksums", {"tables": ",".join(tables)})["checksums"]
+
+    def node(self, table, level, index, depth):
+        return self._get(f"/checksums/{table}", {"level": level, "index": index, "depth": depth})["node"]
+
+    def close(self):
+        self.session.close()
+
+def abrir_fuente(destino):
+    return FuenteAPI(destino) if destino.startswith(("http://", "https://")) else FuenteSQLite(destino)
+
+def _comparar_tabla(a, b, table, depth):
+    """Bajar por el árbol solo donde los hashes difieren. Devuelve los ids distintos"""
+    solo_a, solo_b, distintas = [], [], []
+    pendientes = [(TREE_HEIGHT, 0)]
+    while pendientes:
+        level, index = pendientes.pop()
+        nodo_a, nodo_b = a.node(table, level, index, depth), b.node(table, level, index, depth)
+        if level == 0:
+            filas_a, filas_b = nodo_a["row_hashes"], nodo_b["row_hashes"]
+            solo_a.extend(int(i) for i in filas_a.keys() - filas_b.keys())
+            solo_b.extend(int(i) for i in filas_b.keys() - filas_a.keys())
+            distintas.extend(int(i) for i in filas_a.keys() & filas_b.keys() if filas_a[i] != filas_b[i])
+            continue
+        hijos_a = {hijo["index"]: hijo for hijo in nodo_a["children"]}
+        hijos_b = {hijo["index"]: hijo for hijo in nodo_b["children"]}
+        for i in hijos_a.keys() | hijos_b.keys():
+            hijo_a, hijo_b = hijos_a.get(i), hijos_b.get(i)
+            if hijo_a is None or hijo_b is None or hijo_a["hash"] != hijo_b["hash"]:
+                pendientes.append(((hijo_a or hijo_b)["level"], i))
+    return {"solo_a": sorted(solo_a), "solo_b": sorted(solo_b), "distintas": sorted(distintas)}
+
+def compare_sources(a, b, tables=CHECKSUM_TABLES, depth=MAX_DEPTH, detalle=True) -> dict:
+    """Comparar dos fuentes: un hash por tabla y, con detalle, los ids que difieren en cada una"""
+    resumen_a, resumen_b = a.summary(tables), b.summary(tables)
+    resultado = {}
+    for table in tables:
+        iguales = resumen_a[table]["hash"] == resumen_b[table]["hash"]
+        resultado[table] = {"iguales": iguales, "rows_a": resumen_a[table]["rows"], "rows_b": resumen_b[table]["rows"]}
+        if not iguales and detalle:
+            resultado[table].update(_comparar_tabla(a, b, table, depth))
+    return resultado
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Comparar dos bases (archivo SQLite o URL de la API) por checksums")
+    parser.add_argument("a", help="Base A: ruta a un .db o URL de la API")
+    parser.add_argument("b", help="Base B: ruta a un .db o URL de la API")
+    parser.add_argument("--tables", default=",".join(CHECKSUM_TABLES), help="Tablas separadas por coma")
+    parser.add_argument("--solo-resumen", action="store_true", help="Solo comparar el hash de cada tabla")
+    args = parser.parse_args()
+
+    a, b = abrir_fuente(args.a), abrir_fuente(args.b)
+    try:
+        tables = [table.strip() for table in args.tables.split(",") if table.strip()]
+        resultado = compare_sources(a, b, tables, detalle=not args.solo_resumen)
+    finally:
+        a.close()
+        b.close()
+
+    diferentes = 0
+    for table, r in resultado.items():
+        if r["iguales"]:
+            logger.info(f"✅ {table}: idénticas ({r['rows_a']} filas)")
+            continue
+        diferentes += 1
+        logger.warning(f"⚠️ {table}: distintas (A {r['rows_a']} filas, B {r['rows_b']} filas)")
+        for clave, texto in (("solo_a", "solo en A"), ("solo_b", "solo en B"), ("distintas", "con cambios")):
+            if r.get(clave):
+                ids = r[clave]
+                muestra = ", ".join(map(str, ids[:20])) + (" ..." if len(ids) > 20 else "")
+                logger.warning(f"   {len(ids)} {texto}: {muestra}")
+    logger.info(f"🔢 Peticiones: A {a.peticiones}, B {b.peticiones}")
+    raise SystemExit(1 if diferentes else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Versiones por Tabla para el Sistema Vehicular
+Contadores que suben con cada escritura (triggers) y permiten ETags sin recorrer las tablas
+"""
+
+import hashlib
+
+def get_table_versions(conn, tables) -> dict:
+    """Versión actual de cada tabla (búsqueda por clave primaria, sin escanear datos)"""
+    tables = tuple(tables)
+    placeholders = ", ".join("?" for _ in tables)
+    rows = conn.execute(
+        f"SELECT table_name, version FROM table_versions WHERE table_name IN ({placeholders})",
+        tables
+    ).fetchall()
+    versions = {table: 0 for table in tables}
+    versions.update({row[0]: row[1] for row in rows})
+    return versions
+
+def build_etag(versions, *parts) -> str:
+    """ETag fuerte a partir de las versiones de las tablas y del contexto de la petición"""
+    raw = "|".join(f"{table}={versions[table]}" for table in sorted(versions))
+    raw += "|" + "|".join(str(part) for part in parts)
+    return '"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+def etag_matches(if_none_match, etag) -> bool:
+    """Comparar la cabecera If-None-Match (lista separada por comas o *) con el ETag actual"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match usa comparación débil: W/"x" coincide con "x"
+    return any(tag[2:] == etag if tag.startswith("W/") else tag == etag for tag in candidates)
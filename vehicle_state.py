@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Estado Actual por Vehículo (vehicle_state) para el Sistema Vehicular
+Triggers mantienen una fila por placa en la misma transacción de cada escritura en combustible,
+bitacora, mantenimientos y revisiones; las consultas de "kilometraje actual" son una lectura por clave
+
+Uso: python vehicle_state.py rebuild [--db vehicular_system.db]
+"""
+
+import sys
+import sqlite3
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS vehicle_state (
+        placa TEXT PRIMARY KEY,
+        -- Lectura de odómetro más reciente entre todas las fuentes
+        last_km INTEGER,
+        last_km_source TEXT,
+        last_km_at TIMESTAMP,
+        -- Última carga de combustible con kilometraje y máximo registrado
+        last_fill_id INTEGER,
+        last_fill_fecha DATE,
+        last_fill_km INTEGER,
+        last_fill_litros REAL,
+        max_fill_km INTEGER,
+        -- Último viaje completado y viaje en curso (bitácora)
+        last_return_id INTEGER,
+        last_return_at DATETIME,
+        last_return_km INTEGER,
+        last_return_chofer TEXT,
+        active_trip_id INTEGER,
+        active_trip_salida DATETIME,
+        active_trip_km_salida INTEGER,
+        active_trip_chofer TEXT,
+        -- Último mantenimiento y el próximo que dejó programado
+        last_service_id INTEGER,
+        last_service_fecha DATE,
+        last_service_km INTEGER,
+        next_service_tipo TEXT,
+        next_service_fecha DATE,
+        next_service_km INTEGER,
+        -- Última revisión
+        last_revision_id INTEGER,
+        last_revision_fecha DATE,
+        last_revision_aprobado BOOLEAN,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+# Recalcular la parte del estado que depende de cada tabla. {p} es la placa: NEW.placa / OLD.placa
+# dentro de un trigger, o vehicle_state.placa para reconstruir todas las filas a la vez.
+# Cada subconsulta es una búsqueda por índice (placa, ...), no un recorrido del historial.
+REFRESH_SQL = {
+    "combustible": '''
+        UPDATE vehicle_state SET
+            (last_fill_id, last_fill_fecha, last_fill_km, last_fill_litros) = (
+                SELECT id, fecha, kilometraje, litros FROM combustible
+                WHERE placa = {p} AND kilometraje IS NOT NULL
+                ORDER BY fecha DESC, id DESC LIMIT 1
+            ),
+            max_fill_km = (SELECT MAX(kilometraje) FROM combustible WHERE placa = {p})
+        WHERE placa = {p}
+    ''',
+    "bitacora": '''
+        UPDATE vehicle_state SET
+            (last_return_id, last_return_at, last_return_km, last_return_chofer) = (
+                SELECT id, fecha_retorno, km_retorno, chofer FROM bitacora
+                WHERE placa = {p} AND estado = 'completado'
+                ORDER BY fecha_retorno DESC, id DESC LIMIT 1
+            ),
+            (active_trip_id, active_trip_salida, active_trip_km_salida, active_trip_chofer) = (
+                SELECT id, fecha_salida, km_salida, chofer FROM bitacora
+                WHERE placa = {p} AND estado = 'en_curso'
+                ORDER BY fecha_salida DESC, id DESC LIMIT 1
+            )
+        WHERE placa = {p}
+    ''',
+    "mantenimientos": '''
+        UPDATE vehicle_state SET
+            (last_service_id, last_service_fecha, last_service_km,
+             next_service_tipo, next_service_fecha, next_service_km) = (
+                SELECT id, fecha, kilometraje, tipo, proxima_fecha, proximo_km FROM mantenimientos
+                WHERE placa = {p}
+                ORDER BY fecha DESC, id DESC LIMIT 1
+            )
+        WHERE placa = {p}
+    ''',
+    "revisiones": '''
+        UPDATE vehicle_state SET
+            (last_revision_id, last_revision_fecha, last_revision_aprobado) = (
+                SELECT id, fecha, aprobado FROM revisiones
+                WHERE placa = {p}
+                ORDER BY fecha DESC, id DESC LIMIT 1
+            )
+        WHERE placa = {p}
+    ''',
+}
+
+# Kilometraje actual: la lectura con fecha más reciente entre carga, retorno, salida y mantenimiento
+LAST_KM_SQL = '''
+    UPDATE vehicle_state SET
+        (last_km, last_km_source, last_km_at) = (
+            SELECT km, source, at FROM (
+                SELECT vehicle_state.last_fill_km AS km, 'combustible' AS source, vehicle_state.last_fill_fecha AS at
+                UNION ALL
+                SELECT vehicle_state.last_return_km, 'bitacora_retorno', vehicle_state.last_return_at
+                UNION ALL
+                SELECT vehicle_state.active_trip_km_salida, 'bitacora_salida', vehicle_state.active_trip_salida
+                UNION ALL
+                SELECT vehicle_state.last_service_km, 'mantenimiento', vehicle_state.last_service_fecha
+            )
+            WHERE km IS NOT NULL AND at IS NOT NULL
+            ORDER BY at DESC LIMIT 1
+        ),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE placa = {p}
+'''
+
+TRACKED_TABLES = tuple(REFRESH_SQL)
+
+def _trigger_body(table, ref):
+    placa = f"{ref}.placa"
+    return (
+        f"INSERT OR IGNORE INTO vehicle_state (placa) VALUES ({placa});\n"
+        f"{REFRESH_SQL[table].format(p=placa)};\n"
+        f"{LAST_KM_SQL.format(p=placa)};"
+    )
+
+def create_vehicle_state_triggers(cursor):
+    """Triggers AFTER INSERT/UPDATE/DELETE que refrescan la fila de la placa afectada"""
+    for table in TRACKED_TABLES:
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_state_insert")
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_state_update")
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_state_update_old")
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_state_delete")
+
+        cursor.execute(f'''
+            CREATE TRIGGER trg_{table}_state_insert AFTER INSERT ON {table}
+            BEGIN
+                {_trigger_body(table, "NEW")}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER trg_{table}_state_update AFTER UPDATE ON {table}
+            BEGIN
+                {_trigger_body(table, "NEW")}
+            END
+        ''')
+        # Si cambió la placa del registro, también se refresca la placa anterior
+        cursor.execute(f'''
+            CREATE TRIGGER trg_{table}_state_update_old AFTER UPDATE OF placa ON {table}
+            WHEN OLD.placa IS NOT NEW.placa
+            BEGIN
+                {_trigger_body(table, "OLD")}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER trg_{table}_state_delete AFTER DELETE ON {table}
+            BEGIN
+                {_trigger_body(table, "OLD")}
+            END
+        ''')
+
+def rebuild_vehicle_state(cursor) -> int:
+    """Recalcular vehicle_state completo desde el historial. No hace commit. Devuelve las placas"""
+    cursor.execute("DELETE FROM vehicle_state")
+    cursor.execute(
+        "INSERT INTO vehicle_state (placa) "
+        + " UNION ".join(f"SELECT placa FROM {table}" for table in TRACKED_TABLES)
+    )
+    for table in TRACKED_TABLES:
+        cursor.execute(REFRESH_SQL[table].format(p="vehicle_state.placa"))
+    cursor.execute(LAST_KM_SQL.format(p="vehicle_state.placa"))
+    return cursor.execute("SELECT COUNT(*) FROM vehicle_state").fetchone()[0]
+
+def install_vehicle_state(cursor):
+    """Crear tabla, índice auxiliar y triggers, y poblarla desde el historial"""
+    cursor.execute(CREATE_TABLE_SQL)
+    # MAX(kilometraje) por placa como búsqueda en índice en lugar de recorrer las cargas
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_combustible_placa_km ON combustible (placa, kilometraje)")
+    create_vehicle_state_triggers(cursor)
+    rebuild_vehicle_state(cursor)
+
+def get_vehicle_state(conn, placa):
+    """Estado actual de un vehículo (lectura por clave primaria) o None"""
+    row = conn.execute("SELECT * FROM vehicle_state WHERE placa = ?", (placa,)).fetchone()
+    return dict(row) if row else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento de la tabla vehicle_state")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--db", default="vehicular_system.db")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    conn = sqlite3.connect(args.db, timeout=30)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        placas = rebuild_vehicle_state(conn.cursor())
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        conn.rollback()
+        print(f"❌ No se pudo reconstruir vehicle_state: {e}")
+        print("   ¿El esquema está migrado? Inicie el servidor una vez para aplicar las migraciones")
+        sys.exit(1)
+    finally:
+        conn.close()
+    print(f"✅ vehicle_state reconstruida: {placas} vehículos")
+
+if __name__ == "__main__":
+    main()